@@ -25,6 +25,10 @@ app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv(
 )
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret-key")
+# 衍生关系写入模式：implicit（由Used+WasGeneratedBy推导）或 explicit（逐对写入）
+app.config["PROVENANCE_DERIVATION_MODE"] = os.getenv(
+    "PROVENANCE_DERIVATION_MODE", "implicit"
+)
 
 # 初始化扩展
 db.init_app(app)
@@ -40,6 +44,37 @@ from app.routes import (
     workflow_template_bp,
 )
 
+from app.provenance_writer import writer as provenance_writer
+
+# 溯源后台写入器（组提交），线程在首次提交时启动
+provenance_writer.init_app(app)
+
+from app.critical_path import analysis_cache
+from app.sql_metrics import sql_metrics
+from app.template_plans import plan_cache
+from app.workflow_engine import engine as workflow_engine
+
+# 按请求统计SQL（Server-Timing响应头 + /api/metrics/sql）
+sql_metrics.init_app(app)
+
+# 流水线配置执行计划缓存，运行流水线时不重复编译
+plan_cache.init_app(app)
+
+# 流水线实例关键路径分析缓存
+analysis_cache.init_app(app)
+
+# 本地DAG执行引擎，运行流水线时在后台执行节点
+workflow_engine.init_app(app)
+
+from app.executor_backends import executors
+from app.status_consumer import status_consumer
+
+# 状态事件消息总线与消费者（合并批量写回节点/流水线状态）
+status_consumer.init_app(app)
+
+# 执行后端（本地子进程 / 模拟Argo），由 WORKFLOW_EXECUTOR_BACKEND 选择
+executors.init_app(app, bus=status_consumer.bus)
+
 # 注册蓝图
 app.register_blueprint(project_bp, url_prefix="/api/projects")
 app.register_blueprint(workflow_template_bp, url_prefix="/api/workflow-template")
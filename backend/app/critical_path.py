@@ -0,0 +1,460 @@
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.models import Action, Workflow, db
+from app.status_updates import TERMINAL_STATUSES
+
+# 增量加载时回看的时间：updated_at 在提交前取值，稍早的时间可能晚于水位线才可见
+WATERMARK_OVERLAP = timedelta(seconds=5)
+
+ACTION_COLUMNS = (
+    Action.id,
+    Action.workflow_id,
+    Action.name,
+    Action.status,
+    Action.created_at,
+    Action.started_at,
+    Action.completed_at,
+    Action.updated_at,
+    Action.config["dependencies"],
+    Action.config["spawned_by"].as_string(),
+)
+WORKFLOW_COLUMNS = (
+    Workflow.id,
+    Workflow.template_id,
+    Workflow.status,
+    Workflow.started_at,
+    Workflow.completed_at,
+    Workflow.updated_at,
+)
+
+
+@dataclass
+class _Timing:
+    """节点的时间记录（节点表中的一行）"""
+
+    id: int
+    name: str
+    status: str
+    created_at: Optional[datetime]
+    started_at: Optional[datetime]
+    completed_at: Optional[datetime]
+    dependencies: Tuple[str, ...]
+    spawned_by: Optional[str]
+
+    @property
+    def finished(self) -> bool:
+        return self.started_at is not None and self.completed_at is not None
+
+
+@dataclass
+class _RunState:
+    """一个流水线实例的增量分析状态"""
+
+    timings: Dict[int, _Timing] = field(default_factory=dict)
+    watermark: Optional[datetime] = None  # 已加载节点的最大 updated_at
+    workflow_updated_at: Optional[datetime] = None
+    analysis: Optional[Dict] = None
+
+
+def _seconds(delta: timedelta) -> float:
+    return delta.total_seconds()
+
+
+def analyze(workflow, timings: Iterable[_Timing]) -> Dict:
+    """
+    由节点时间和依赖计算流水线实例的关键路径
+
+    节点的就绪时间为其上游最晚的结束时间（没有上游时为流水线开始时间，动态
+    产生的节点不早于其创建时间），排队时间为就绪到开始，执行时间为开始到结束。
+    以“就绪到结束”为节点时长做关键路径法：最早结束时间即实际结束时间，从
+    流水线最后结束的节点反向求最迟结束时间，两者之差为松弛时间（该节点再晚
+    多久结束也不会推迟流水线结束）。关键路径是从最后结束的节点起，逐级沿最晚
+    结束的上游回溯得到的节点链，链上节点松弛为0。
+
+    只有开始和结束时间都已记录的节点参与关键路径；执行中的流水线得到的是到目前
+    为止的关键路径。时间与节点数和依赖数之和成线性关系。
+
+    Args:
+        workflow: 含 id、template_id、status、started_at、completed_at 的行
+        timings: 流水线实例的全部节点
+
+    Returns:
+        CriticalPathSchema 结构的字典
+    """
+    nodes = sorted(timings, key=lambda timing: timing.id)
+    by_name = {timing.name: timing for timing in nodes}
+    upstream: Dict[int, List[_Timing]] = {timing.id: [] for timing in nodes}
+    downstream: Dict[int, List[_Timing]] = {timing.id: [] for timing in nodes}
+
+    def link(parent: _Timing, child: _Timing) -> None:
+        upstream[child.id].append(parent)
+        downstream[parent.id].append(child)
+
+    for timing in nodes:
+        for name in set(timing.dependencies):
+            if name in by_name:
+                link(by_name[name], timing)
+    # 与执行引擎一致：动态子节点是父节点静态下游的上游
+    fan_in = {
+        timing.id: [
+            child for child in downstream[timing.id] if child.spawned_by != timing.name
+        ]
+        for timing in nodes
+    }
+    for timing in nodes:
+        parent = by_name.get(timing.spawned_by) if timing.spawned_by else None
+        if parent is not None:
+            for child in fan_in[parent.id]:
+                link(timing, child)
+
+    base = workflow.started_at
+    ready: Dict[int, Optional[datetime]] = {}
+    for timing in nodes:
+        finished = [
+            parent.completed_at for parent in upstream[timing.id] if parent.finished
+        ]
+        candidates = finished or [base or timing.created_at]
+        if timing.spawned_by:
+            candidates.append(timing.created_at)
+        candidates = [value for value in candidates if value is not None]
+        at = max(candidates) if candidates else None
+        if at is not None and timing.started_at is not None:
+            at = min(at, timing.started_at)
+        ready[timing.id] = at
+
+    finished = [timing for timing in nodes if timing.finished]
+    end = max((timing.completed_at for timing in finished), default=None)
+    slack: Dict[int, float] = {}
+    if end is not None:
+        latest = {}
+        for timing in reversed(_topological(finished, downstream)):
+            children = [
+                latest[child.id]
+                - (child.completed_at - (ready[child.id] or child.started_at))
+                for child in downstream[timing.id]
+                if child.id in latest
+            ]
+            latest[timing.id] = min(children, default=end)
+            slack[timing.id] = max(
+                0.0, _seconds(latest[timing.id] - timing.completed_at)
+            )
+
+    path: List[_Timing] = []
+    current = max(
+        finished, key=lambda timing: (timing.completed_at, timing.id), default=None
+    )
+    while current is not None:
+        path.append(current)
+        parents = [parent for parent in upstream[current.id] if parent.finished]
+        current = max(
+            parents, key=lambda timing: (timing.completed_at, timing.id), default=None
+        )
+    path.reverse()
+    critical = {timing.id for timing in path}
+
+    stages = []
+    for timing in nodes:
+        at = ready[timing.id]
+        stages.append(
+            {
+                "id": timing.id,
+                "name": timing.name,
+                "status": timing.status,
+                "ready_at": at,
+                "started_at": timing.started_at,
+                "completed_at": timing.completed_at,
+                "queue_seconds": (
+                    _seconds(timing.started_at - at)
+                    if timing.started_at is not None and at is not None
+                    else None
+                ),
+                "execution_seconds": (
+                    _seconds(timing.completed_at - timing.started_at)
+                    if timing.finished
+                    else None
+                ),
+                "slack_seconds": slack.get(timing.id),
+                "critical": timing.id in critical,
+            }
+        )
+    by_id = {stage["id"]: stage for stage in stages}
+    critical_stages = [by_id[timing.id] for timing in path]
+    bottleneck = max(
+        critical_stages, key=lambda stage: stage["execution_seconds"], default=None
+    )
+    start = base or (ready[path[0].id] if path else None)
+    finish = workflow.completed_at or end
+    return {
+        "workflow_id": workflow.id,
+        "template_id": workflow.template_id,
+        "status": workflow.status,
+        "started_at": start,
+        "completed_at": finish,
+        "wall_seconds": (
+            _seconds(finish - start)
+            if start is not None and finish is not None
+            else None
+        ),
+        "critical_path": [stage["name"] for stage in critical_stages],
+        "critical_queue_seconds": sum(
+            stage["queue_seconds"] or 0.0 for stage in critical_stages
+        ),
+        "critical_execution_seconds": sum(
+            stage["execution_seconds"] for stage in critical_stages
+        ),
+        "bottleneck": bottleneck["name"] if bottleneck else None,
+        "stages": stages,
+    }
+
+
+def _topological(
+    nodes: Sequence[_Timing], downstream: Dict[int, List[_Timing]]
+) -> List[_Timing]:
+    """Kahn算法排序；数据中出现环时（理论上不会）剩余节点按结束时间追加"""
+    members = {timing.id for timing in nodes}
+    remaining = {timing.id: 0 for timing in nodes}
+    for timing in nodes:
+        for child in downstream[timing.id]:
+            if child.id in members:
+                remaining[child.id] += 1
+    ready = deque(timing for timing in nodes if remaining[timing.id] == 0)
+    ordered = []
+    while ready:
+        timing = ready.popleft()
+        ordered.append(timing)
+        for child in downstream[timing.id]:
+            if child.id in members:
+                remaining[child.id] -= 1
+                if remaining[child.id] == 0:
+                    ready.append(child)
+    if len(ordered) != len(nodes):
+        placed = {timing.id for timing in ordered}
+        ordered.extend(
+            sorted(
+                (timing for timing in nodes if timing.id not in placed),
+                key=lambda timing: timing.completed_at,
+            )
+        )
+    return ordered
+
+
+class AnalysisCache:
+    """
+    流水线实例关键路径分析的进程内缓存
+
+    每个实例保存已加载的节点时间和水位线（已见的最大 Action.updated_at）。
+    再次分析时只加载 updated_at 不早于水位线（回看 WATERMARK_OVERLAP）的节点，
+    即上次之后开始、结束或被重试重置的节点，合并后重新计算；没有变化时直接返回
+    上次的结果。已结束且之后未再变化（Workflow.updated_at 不变）的实例只查询
+    流水线行。
+
+    配置项（app.config）：
+        WORKFLOW_ANALYSIS_CACHE_SIZE: 缓存的流水线实例数上限，超出时淘汰最久未使用的
+    """
+
+    def __init__(self, app=None):
+        self.max_size = 256
+        self._lock = threading.Lock()
+        self._states: "OrderedDict[int, _RunState]" = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.max_size = app.config.setdefault("WORKFLOW_ANALYSIS_CACHE_SIZE", 256)
+
+    def get(self, workflow_id: int) -> Optional[Dict]:
+        """
+        流水线实例的关键路径分析（需要app context，至多两次查询）
+
+        Returns:
+            分析结果；流水线实例不存在时返回None
+        """
+        workflow = (
+            db.session.query(*WORKFLOW_COLUMNS)
+            .filter(Workflow.id == workflow_id)
+            .first()
+        )
+        if workflow is None:
+            return None
+        state = self._state(workflow.id)
+        if state is not None and _settled(state, workflow):
+            return state.analysis
+        # 在副本上合并，其他线程仍可读取缓存中的上次结果
+        state = (
+            _RunState(
+                dict(state.timings),
+                state.watermark,
+                state.workflow_updated_at,
+                state.analysis,
+            )
+            if state is not None
+            else _RunState()
+        )
+        query = db.session.query(*ACTION_COLUMNS).filter(
+            Action.workflow_id == workflow.id
+        )
+        if state.watermark is not None:
+            query = query.filter(
+                Action.updated_at >= state.watermark - WATERMARK_OVERLAP
+            )
+        return self._refresh(workflow, state, query.all())
+
+    def get_many(self, workflows: Sequence) -> List[Dict]:
+        """
+        批量分析一组流水线实例（WORKFLOW_COLUMNS 的行，需要app context）
+
+        缓存中没有或已变化的实例在一次查询中加载全部节点。
+
+        Returns:
+            与 workflows 顺序一致的分析结果
+        """
+        states = {workflow.id: self._state(workflow.id) for workflow in workflows}
+        stale = [
+            workflow.id
+            for workflow in workflows
+            if states[workflow.id] is None
+            or not _settled(states[workflow.id], workflow)
+        ]
+        rows: Dict[int, List] = {workflow_id: [] for workflow_id in stale}
+        if stale:
+            for row in db.session.query(*ACTION_COLUMNS).filter(
+                Action.workflow_id.in_(stale)
+            ):
+                rows[row.workflow_id].append(row)
+        results = []
+        for workflow in workflows:
+            if workflow.id in rows:
+                # 整体重新加载，不沿用旧的节点时间
+                results.append(self._refresh(workflow, _RunState(), rows[workflow.id]))
+            else:
+                results.append(states[workflow.id].analysis)
+        return results
+
+    def _state(self, workflow_id: int) -> Optional[_RunState]:
+        with self._lock:
+            state = self._states.get(workflow_id)
+            if state is not None:
+                self._states.move_to_end(workflow_id)
+            return state
+
+    def _refresh(self, workflow, state: _RunState, rows: List) -> Dict:
+        changed = state.analysis is None
+        for row in rows:
+            timing = _Timing(
+                row.id,
+                row.name,
+                row.status,
+                row.created_at,
+                row.started_at,
+                row.completed_at,
+                tuple(row[8] or ()),
+                row[9],
+            )
+            if state.timings.get(row.id) != timing:
+                state.timings[row.id] = timing
+                changed = True
+            if state.watermark is None or row.updated_at > state.watermark:
+                state.watermark = row.updated_at
+        if changed or state.workflow_updated_at != workflow.updated_at:
+            state.analysis = analyze(workflow, state.timings.values())
+        state.workflow_updated_at = workflow.updated_at
+        with self._lock:
+            self._states[workflow.id] = state
+            self._states.move_to_end(workflow.id)
+            while len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+        return state.analysis
+
+    def clear(self) -> None:
+        with self._lock:
+            self._states.clear()
+
+
+def _settled(state: _RunState, workflow) -> bool:
+    """已结束、且上次分析之后没有再变化的流水线实例"""
+    return (
+        state.analysis is not None
+        and workflow.status in TERMINAL_STATUSES
+        and state.workflow_updated_at == workflow.updated_at
+    )
+
+
+analysis_cache = AnalysisCache()
+
+
+def template_bottlenecks(template_id: int, limit: int = 30) -> Dict:
+    """
+    汇总流水线配置最近 limit 次成功运行的关键路径（需要app context）
+
+    按阶段名统计出现在关键路径上的次数、平均排队/执行时间与平均松弛时间。
+    位于关键路径上次数最多（相同时平均执行时间最长）的阶段即限制整体耗时的
+    瓶颈。未缓存的实例一次查询加载，共至多两次查询。
+    """
+    workflows = (
+        db.session.query(*WORKFLOW_COLUMNS)
+        .filter(Workflow.template_id == template_id, Workflow.status == "completed")
+        .order_by(Workflow.created_at.desc(), Workflow.id.desc())
+        .limit(limit)
+        .all()
+    )
+    analyses = analysis_cache.get_many(workflows)
+
+    totals: Dict[str, Dict] = {}
+    for analysis in analyses:
+        for stage in analysis["stages"]:
+            if stage["execution_seconds"] is None:
+                continue
+            total = totals.setdefault(
+                stage["name"],
+                {
+                    "name": stage["name"],
+                    "runs": 0,
+                    "critical_runs": 0,
+                    "queue": 0.0,
+                    "execution": 0.0,
+                    "execution_max": 0.0,
+                    "slack": 0.0,
+                },
+            )
+            total["runs"] += 1
+            total["critical_runs"] += stage["critical"]
+            total["queue"] += stage["queue_seconds"] or 0.0
+            total["execution"] += stage["execution_seconds"]
+            total["execution_max"] = max(
+                total["execution_max"], stage["execution_seconds"]
+            )
+            total["slack"] += stage["slack_seconds"] or 0.0
+
+    stages = sorted(
+        (
+            {
+                "name": total["name"],
+                "runs": total["runs"],
+                "critical_runs": total["critical_runs"],
+                "critical_share": total["critical_runs"] / len(analyses),
+                "queue_seconds_avg": total["queue"] / total["runs"],
+                "execution_seconds_avg": total["execution"] / total["runs"],
+                "execution_seconds_max": total["execution_max"],
+                "slack_seconds_avg": total["slack"] / total["runs"],
+            }
+            for total in totals.values()
+        ),
+        key=lambda stage: (-stage["critical_runs"], -stage["execution_seconds_avg"]),
+    )
+    walls = [
+        analysis["wall_seconds"]
+        for analysis in analyses
+        if analysis["wall_seconds"] is not None
+    ]
+    return {
+        "template_id": template_id,
+        "runs": len(analyses),
+        "wall_seconds_avg": sum(walls) / len(walls) if walls else None,
+        "wall_seconds_max": max(walls, default=None),
+        "bottleneck": stages[0]["name"] if stages else None,
+        "stages": stages,
+    }
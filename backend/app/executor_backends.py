@@ -0,0 +1,500 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from app.message_bus import MessageBus
+from app.models import Action, db
+from app.status_updates import (
+    STATUS_RANK,
+    TERMINAL_STATUSES,
+    Transition,
+    apply_transitions,
+)
+from app.workflow_engine import WorkflowEngine
+from app.workflow_engine import engine as workflow_engine
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StatusEvent:
+    """执行后端报告的状态变化"""
+
+    workflow_id: int
+    action_id: Optional[int]  # None 表示流水线本身
+    status: str
+    at: datetime
+    exit_code: Optional[int] = None
+    logs: Optional[str] = None
+
+    @property
+    def routing_key(self) -> str:
+        return f"workflow.status.{self.workflow_id}"
+
+    def to_message(self) -> Dict:
+        """消息总线上的JSON消息体"""
+        return {
+            "workflow_id": self.workflow_id,
+            "action_id": self.action_id,
+            "status": self.status,
+            "at": self.at.isoformat(),
+            "exit_code": self.exit_code,
+            "logs": self.logs,
+        }
+
+    @classmethod
+    def from_message(cls, body: Dict) -> "StatusEvent":
+        """
+        解析并校验消息体
+
+        Raises:
+            ValueError: 消息体缺少字段、字段类型无效或状态未知
+        """
+        if not isinstance(body, dict):
+            raise ValueError(f"消息体必须是对象: {body!r}")
+        unknown = set(body) - set(cls.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"未知字段: {', '.join(sorted(unknown))}")
+        for key in ("workflow_id", "action_id", "exit_code"):
+            value = body.get(key)
+            required = key == "workflow_id"
+            if (value is None and required) or (
+                value is not None and type(value) is not int
+            ):
+                raise ValueError(f"{key} 必须是整数: {value!r}")
+        if body.get("status") not in STATUS_RANK:
+            raise ValueError(f"未知状态: {body.get('status')!r}")
+        logs = body.get("logs")
+        if logs is not None and not isinstance(logs, str):
+            raise ValueError("logs 必须是字符串")
+        at = body.get("at")
+        if not isinstance(at, str):
+            raise ValueError(f"at 必须是ISO时间: {at!r}")
+        return cls(**{**body, "at": datetime.fromisoformat(at)})
+
+
+class ExecutorBackend:
+    """
+    执行后端接口
+
+    run_workflow / terminate_workflow / retry_workflow 通过当前后端提交和取消
+    流水线实例；状态流和日志流供状态同步与监控使用。
+    """
+
+    name = ""
+
+    def submit(self, workflow_id: int) -> Future:
+        """
+        提交流水线实例的待执行节点
+
+        Returns:
+            执行结束后返回流水线最终状态的Future；后端负责同步状态时，
+            状态写入数据库后才返回
+        """
+        raise NotImplementedError
+
+    def cancel(self, workflow_id: int) -> bool:
+        """
+        取消流水线实例的执行：停止派发新节点并终止执行中的节点，不等待其退出
+
+        执行中的节点以 terminated 上报；未开始的节点与流水线状态由调用方更新。
+
+        Returns:
+            流水线实例是否正在由该后端执行
+        """
+        raise NotImplementedError
+
+    def status_stream(self, workflow_id: int) -> Iterator[StatusEvent]:
+        """流水线实例的状态变化，执行结束时迭代结束"""
+        raise NotImplementedError
+
+    def log_stream(self, workflow_id: int, action_id: int) -> Iterator[str]:
+        """节点的日志行"""
+        raise NotImplementedError
+
+
+class LocalBackend(ExecutorBackend):
+    """本地子进程后端：由 WorkflowEngine 在本进程中执行并写入数据库"""
+
+    name = "local"
+
+    def __init__(self, engine: WorkflowEngine):
+        self.engine = engine
+
+    def submit(self, workflow_id: int) -> Future:
+        return self.engine.submit(workflow_id)
+
+    def cancel(self, workflow_id: int) -> bool:
+        return self.engine.cancel(workflow_id)
+
+    def status_stream(self, workflow_id: int) -> Iterator[StatusEvent]:
+        """从订阅时起的状态变化；流水线实例未在执行时为空"""
+        subscriber = self.engine.subscribe(workflow_id)
+        if subscriber is None:
+            return
+        while True:
+            change = subscriber.get()
+            if change is None:
+                return
+            action_id, status, at, logs = change
+            yield StatusEvent(workflow_id, action_id, status, at, logs=logs)
+
+    def log_stream(self, workflow_id: int, action_id: int) -> Iterator[str]:
+        """节点结束时写入的日志（需要app context）"""
+        logs = (
+            db.session.query(Action.logs)
+            .filter(Action.id == action_id, Action.workflow_id == workflow_id)
+            .scalar()
+        )
+        yield from (logs or "").splitlines()
+
+
+@dataclass
+class _Pod:
+    action_id: int
+    name: str
+    downstream: List[int] = field(default_factory=list)
+    waiting: int = 0
+    status: str = "pending"
+
+
+class _SimulatedWorkflow:
+    """模拟集群中的一个流水线实例；事件历史供任意数量的状态流重放"""
+
+    def __init__(
+        self,
+        workflow_id: int,
+        pods: Dict[int, _Pod],
+        bus: Optional[MessageBus] = None,
+    ):
+        self.workflow_id = workflow_id
+        self.pods = pods
+        self.bus = bus
+        self.history: List[StatusEvent] = []
+        self.logs: Dict[int, List[str]] = {}
+        self.condition = threading.Condition()
+        self.cancelled = False
+        self.done = False
+
+    def emit(self, event: StatusEvent) -> None:
+        if self.bus is not None:
+            self.bus.publish(event.routing_key, event.to_message())
+        with self.condition:
+            self.history.append(event)
+            if event.action_id is None and event.status in TERMINAL_STATUSES:
+                self.done = True
+            self.condition.notify_all()
+
+    def read(self, offset: int) -> List[StatusEvent]:
+        """offset 之后的全部事件，没有新事件时阻塞；执行结束后返回空列表"""
+        with self.condition:
+            while len(self.history) <= offset and not self.done:
+                self.condition.wait()
+            return self.history[offset:]
+
+
+class FakeArgoBackend(ExecutorBackend):
+    """
+    模拟 Argo Workflows 的进程内后端
+
+    不执行节点命令：控制线程按依赖关系“调度”Pod，每个Pod经过随机的调度延迟
+    （pod_latency）进入 running，再经过随机的执行时间（duration）以
+    failure_rate 的概率失败，失败节点的下游保持 pending。延迟均为指数分布的
+    均值（秒），为0时不等待。另有同步线程消费状态流，每次取出积压的全部事件，
+    用批量UPDATE和一次提交写回数据库，模拟真实部署中监听Argo的状态同步；
+    sync 为假时不启动同步线程，由调用方消费状态流。指定 bus 时像真实执行器一样
+    把状态事件发布到消息总线（路由键 workflow.status.<流水线ID>），由
+    StatusConsumer 写回数据库，不启动同步线程。
+
+    用于在没有集群的环境中测试和压测提交吞吐与状态同步开销。
+    """
+
+    name = "fake-argo"
+
+    def __init__(
+        self,
+        pod_latency: float = 0.2,
+        duration: float = 0.5,
+        failure_rate: float = 0.0,
+        log_lines: int = 3,
+        sync: bool = True,
+        seed: Optional[int] = None,
+        bus: Optional[MessageBus] = None,
+    ):
+        self.app = None
+        self.pod_latency = pod_latency
+        self.duration = duration
+        self.failure_rate = failure_rate
+        self.log_lines = log_lines
+        self.sync = sync
+        self.bus = bus
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._workflows: Dict[int, _SimulatedWorkflow] = {}
+
+    def submit(self, workflow_id: int) -> Future:
+        """读取待执行节点（需要app context）后在后台模拟执行"""
+        rows = (
+            db.session.query(Action.id, Action.name, Action.status, Action.config)
+            .filter(Action.workflow_id == workflow_id)
+            .order_by(Action.id)
+            .all()
+        )
+        pods = {
+            action_id: _Pod(action_id, name, status=status)
+            for action_id, name, status, _ in rows
+        }
+        ids = {pod.name: pod.action_id for pod in pods.values()}
+        for action_id, _, _, config in rows:
+            for dependency in (config or {}).get("dependencies", []):
+                upstream = pods[ids[dependency]]
+                upstream.downstream.append(action_id)
+                if upstream.status != "completed":
+                    pods[action_id].waiting += 1
+
+        simulated = _SimulatedWorkflow(workflow_id, pods, self.bus)
+        with self._lock:
+            current = self._workflows.get(workflow_id)
+            if current is not None and not current.done:
+                raise RuntimeError(f"流水线实例 {workflow_id} 正在执行")
+            self._workflows[workflow_id] = simulated
+        future: Future = Future()
+        threading.Thread(
+            target=self._control,
+            args=(simulated, future),
+            name=f"fake-argo-{workflow_id}",
+            daemon=True,
+        ).start()
+        if self.reports_to_database:
+            threading.Thread(
+                target=self._sync,
+                args=(simulated, future),
+                name=f"fake-argo-sync-{workflow_id}",
+                daemon=True,
+            ).start()
+        return future
+
+    @property
+    def reports_to_database(self) -> bool:
+        """是否由本后端的同步线程写回数据库"""
+        return self.sync and self.bus is None
+
+    def cancel(self, workflow_id: int) -> bool:
+        with self._lock:
+            simulated = self._workflows.get(workflow_id)
+        if simulated is None or simulated.done:
+            return False
+        with simulated.condition:
+            simulated.cancelled = True
+            simulated.condition.notify_all()
+        return True
+
+    def status_stream(self, workflow_id: int) -> Iterator[StatusEvent]:
+        """从提交时起的全部状态变化"""
+        with self._lock:
+            simulated = self._workflows.get(workflow_id)
+        if simulated is None:
+            return
+        offset = 0
+        while True:
+            events = simulated.read(offset)
+            if not events:
+                return
+            offset += len(events)
+            yield from events
+
+    def log_stream(self, workflow_id: int, action_id: int) -> Iterator[str]:
+        with self._lock:
+            simulated = self._workflows.get(workflow_id)
+        if simulated is not None:
+            yield from simulated.logs.get(action_id, ())
+
+    def _delay(self, mean: float) -> float:
+        return self.random.expovariate(1 / mean) if mean > 0 else 0.0
+
+    def _control(self, simulated: _SimulatedWorkflow, future: Future) -> None:
+        """控制线程：按到期时间依次推进Pod状态"""
+        workflow_id = simulated.workflow_id
+        pods = simulated.pods
+        timers: List = []  # (到期时间, 序号, 节点ID, 下一阶段)
+        seq = itertools.count()
+        clock = time.monotonic
+
+        def schedule(pod: _Pod, phase: str, mean: float) -> None:
+            heapq.heappush(
+                timers, (clock() + self._delay(mean), next(seq), pod.action_id, phase)
+            )
+
+        simulated.emit(StatusEvent(workflow_id, None, "running", datetime.utcnow()))
+        for pod in pods.values():
+            if pod.status in ("pending", "running") and pod.waiting == 0:
+                schedule(pod, "running", self.pod_latency)
+
+        while timers:
+            due, _, action_id, phase = timers[0]
+            with simulated.condition:
+                wait = due - clock()
+                if wait > 0 and not simulated.cancelled:
+                    simulated.condition.wait(wait)
+                if simulated.cancelled:
+                    break
+            if due > clock():
+                continue
+            heapq.heappop(timers)
+            pod = pods[action_id]
+            now = datetime.utcnow()
+            if phase == "running":
+                pod.status = "running"
+                simulated.emit(StatusEvent(workflow_id, action_id, "running", now))
+                schedule(pod, "finished", self.duration)
+                continue
+            failed = self.random.random() < self.failure_rate
+            pod.status = "failed" if failed else "completed"
+            lines = [f"[{pod.name}] 模拟输出 {i + 1}" for i in range(self.log_lines)]
+            if failed:
+                lines.append(f"[{pod.name}] 模拟失败")
+            simulated.logs[action_id] = lines
+            simulated.emit(
+                StatusEvent(
+                    workflow_id,
+                    action_id,
+                    pod.status,
+                    now,
+                    exit_code=1 if failed else 0,
+                    logs="\n".join(lines),
+                )
+            )
+            if failed:
+                continue
+            for child_id in pod.downstream:
+                child = pods[child_id]
+                child.waiting -= 1
+                if child.waiting == 0:
+                    schedule(child, "running", self.pod_latency)
+
+        now = datetime.utcnow()
+        if simulated.cancelled:
+            # 终止时正在运行的Pod被删除（SIGTERM，退出码143）
+            for pod in pods.values():
+                if pod.status == "running":
+                    pod.status = "terminated"
+                    simulated.emit(
+                        StatusEvent(
+                            workflow_id,
+                            pod.action_id,
+                            "terminated",
+                            now,
+                            exit_code=143,
+                            logs="Pod已终止",
+                        )
+                    )
+            status = "terminated"
+        elif all(pod.status == "completed" for pod in pods.values()):
+            status = "completed"
+        else:
+            status = "failed"
+        simulated.emit(StatusEvent(workflow_id, None, status, now))
+        if not self.reports_to_database:
+            future.set_result(status)
+
+    def _sync(self, simulated: _SimulatedWorkflow, future: Future) -> None:
+        """同步线程：把积压的状态事件批量写回数据库"""
+        with self.app.app_context():
+            try:
+                offset, status = 0, None
+                while True:
+                    events = simulated.read(offset)
+                    if not events:
+                        break
+                    offset += len(events)
+                    status = apply_status_events(events) or status
+                future.set_result(status)
+            except Exception as e:
+                logger.exception("流水线 %s 状态同步失败", simulated.workflow_id)
+                future.set_exception(e)
+            finally:
+                db.session.remove()
+
+
+def apply_status_events(events: List[StatusEvent]) -> Optional[str]:
+    """
+    在一个事务中写入一批状态事件（需要app context）
+
+    节点与流水线的事件分别转换为状态变化，由 apply_transitions 按对象合并后
+    用 UPDATE ... FROM (VALUES ...) 批量写入：每个节点只写入最新状态，状态只能
+    前进，已处于该状态的流水线（例如终止接口已写入 terminated）不会重复计入统计。
+    事件携带的是完整日志，按偏移0写入。
+
+    Returns:
+        这批事件中流水线的最终状态，没有时返回None
+    """
+    actions, workflows = [], []
+    final = None
+    for event in events:
+        if event.action_id is None:
+            workflows.append(Transition(event.workflow_id, event.status, event.at))
+            if event.status in TERMINAL_STATUSES:
+                final = event.status
+        else:
+            actions.append(
+                Transition(
+                    event.action_id,
+                    event.status,
+                    event.at,
+                    event.exit_code,
+                    event.logs,
+                    0 if event.logs is not None else None,
+                )
+            )
+    apply_transitions(actions, workflows)
+    return final
+
+
+class ExecutorBackends:
+    """
+    执行后端注册表
+
+    配置项（app.config）：
+        WORKFLOW_EXECUTOR_BACKEND: 当前后端名（local 或 fake-argo）
+        WORKFLOW_FAKE_ARGO_OPTIONS: FakeArgoBackend 的构造参数
+        WORKFLOW_STATUS_VIA_BUS: 模拟Argo后端经消息总线上报状态
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backends: Dict[str, ExecutorBackend] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, bus: Optional[MessageBus] = None) -> None:
+        """
+        Args:
+            app: Flask应用
+            bus: 状态消息总线，WORKFLOW_STATUS_VIA_BUS 为真时使用
+        """
+        self.app = app
+        app.config.setdefault("WORKFLOW_EXECUTOR_BACKEND", LocalBackend.name)
+        options = app.config.setdefault("WORKFLOW_FAKE_ARGO_OPTIONS", {})
+        via_bus = app.config.setdefault("WORKFLOW_STATUS_VIA_BUS", False)
+        self.register(LocalBackend(workflow_engine))
+        fake_argo = FakeArgoBackend(**options, bus=bus if via_bus else None)
+        fake_argo.app = app
+        self.register(fake_argo)
+
+    def register(self, backend: ExecutorBackend) -> None:
+        self.backends[backend.name] = backend
+
+    @property
+    def backend(self) -> ExecutorBackend:
+        """当前配置的执行后端"""
+        return self.backends[self.app.config["WORKFLOW_EXECUTOR_BACKEND"]]
+
+
+executors = ExecutorBackends()
@@ -0,0 +1,153 @@
+import itertools
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, List, Optional
+
+
+@dataclass
+class Message:
+    """投递给消费者的消息"""
+
+    routing_key: str
+    body: Dict
+    delivery_tag: int = 0
+    deliveries: int = 0  # 已投递次数（含本次），对应 RabbitMQ 的 x-delivery-count
+
+
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    """
+    按 RabbitMQ topic 交换机规则匹配路由键
+
+    以 . 分隔单词，* 匹配一个单词，# 匹配零个或多个单词。
+    """
+    words = routing_key.split(".")
+    parts = pattern.split(".")
+
+    def match(i: int, j: int) -> bool:
+        if i == len(parts):
+            return j == len(words)
+        if parts[i] == "#":
+            return any(match(i + 1, k) for k in range(j, len(words) + 1))
+        if j == len(words):
+            return False
+        return parts[i] in ("*", words[j]) and match(i + 1, j + 1)
+
+    return match(0, 0)
+
+
+class MessageBus:
+    """
+    消息总线接口（语义与 RabbitMQ 的 topic 交换机 + 持久队列一致）
+
+    发布者按路由键发布；每个队列按绑定模式接收消息的一份副本。消费者批量取出
+    消息，处理成功后 ack，失败时 nack 放回队首重新投递；永远无法处理的消息
+    reject 到死信队列，不再投递。
+    """
+
+    def declare_queue(self, name: str, binding: str) -> None:
+        raise NotImplementedError
+
+    def publish(self, routing_key: str, body: Dict) -> None:
+        raise NotImplementedError
+
+    def get_batch(
+        self, queue: str, max_messages: int, timeout: Optional[float] = None
+    ) -> List[Message]:
+        """
+        取出至多 max_messages 条消息，队列为空时最多等待 timeout 秒
+
+        Returns:
+            待确认的消息，超时时为空列表
+        """
+        raise NotImplementedError
+
+    def ack(self, queue: str, delivery_tags: Iterable[int]) -> None:
+        raise NotImplementedError
+
+    def nack(self, queue: str, delivery_tags: Iterable[int]) -> None:
+        raise NotImplementedError
+
+    def reject(self, queue: str, delivery_tags: Iterable[int]) -> None:
+        """确认并移入死信队列（RabbitMQ 的 basic.reject requeue=False）"""
+        raise NotImplementedError
+
+
+class _Queue:
+    def __init__(self, binding: str):
+        self.binding = binding
+        self.ready: Deque[Message] = deque()
+        self.unacked: Dict[int, Message] = {}
+        self.dead: List[Message] = []
+
+
+class InMemoryBroker(MessageBus):
+    """进程内消息总线（线程安全），用于测试和单进程部署"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._queues: Dict[str, _Queue] = {}
+        self._tags = itertools.count(1)
+
+    def declare_queue(self, name: str, binding: str) -> None:
+        with self._condition:
+            self._queues.setdefault(name, _Queue(binding))
+
+    def publish(self, routing_key: str, body: Dict) -> None:
+        with self._condition:
+            for queue in self._queues.values():
+                if topic_matches(queue.binding, routing_key):
+                    queue.ready.append(Message(routing_key, body, next(self._tags)))
+            self._condition.notify_all()
+
+    def get_batch(
+        self, queue: str, max_messages: int, timeout: Optional[float] = None
+    ) -> List[Message]:
+        with self._condition:
+            target = self._queues[queue]
+            if not target.ready:
+                self._condition.wait_for(lambda: target.ready, timeout)
+            batch = []
+            while target.ready and len(batch) < max_messages:
+                message = target.ready.popleft()
+                message.deliveries += 1
+                target.unacked[message.delivery_tag] = message
+                batch.append(message)
+            return batch
+
+    def ack(self, queue: str, delivery_tags: Iterable[int]) -> None:
+        with self._condition:
+            unacked = self._queues[queue].unacked
+            for tag in delivery_tags:
+                unacked.pop(tag, None)
+
+    def nack(self, queue: str, delivery_tags: Iterable[int]) -> None:
+        with self._condition:
+            target = self._queues[queue]
+            requeued = [
+                target.unacked.pop(tag)
+                for tag in delivery_tags
+                if tag in target.unacked
+            ]
+            target.ready.extendleft(reversed(requeued))
+            self._condition.notify_all()
+
+    def reject(self, queue: str, delivery_tags: Iterable[int]) -> None:
+        with self._condition:
+            target = self._queues[queue]
+            target.dead.extend(
+                target.unacked.pop(tag)
+                for tag in delivery_tags
+                if tag in target.unacked
+            )
+
+    def dead_letters(self, queue: str) -> List[Message]:
+        """被拒绝的消息"""
+        with self._condition:
+            return list(self._queues[queue].dead)
+
+    def depth(self, queue: str) -> int:
+        """队列中待投递和未确认的消息数"""
+        with self._condition:
+            target = self._queues[queue]
+            return len(target.ready) + len(target.unacked)
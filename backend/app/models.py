@@ -35,7 +35,8 @@ class WorkflowTemplate(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    config = db.Column(JSON, nullable=False)  # 流水线配置JSON
+    # 大字段延迟加载，列表查询不读取
+    config = db.deferred(db.Column(JSON, nullable=False))  # 流水线配置JSON
     project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(
@@ -70,6 +71,19 @@ class Workflow(db.Model):
     # 关联关系
     actions = db.relationship("Action", backref="workflow", lazy=True)
 
+    # 列表分页索引：(过滤列, 排序列, id) 支持键集分页
+    __table_args__ = (
+        db.Index("ix_workflows_created_at_id", "created_at", "id"),
+        db.Index("ix_workflows_updated_at_id", "updated_at", "id"),
+        db.Index("ix_workflows_status_created_at", "status", "created_at", "id"),
+        db.Index(
+            "ix_workflows_project_id_created_at", "project_id", "created_at", "id"
+        ),
+        db.Index(
+            "ix_workflows_template_id_created_at", "template_id", "created_at", "id"
+        ),
+    )
+
 
 class Action(db.Model):
     """流水线节点模型"""
@@ -83,8 +97,9 @@ class Action(db.Model):
         db.String(20), default="pending"
     )  # pending, running, completed, failed
     workflow_id = db.Column(db.Integer, db.ForeignKey("workflows.id"), nullable=False)
-    config = db.Column(JSON)  # 节点配置
-    logs = db.Column(db.Text)  # 节点日志
+    config = db.deferred(db.Column(JSON))  # 节点配置
+    logs = db.deferred(db.Column(db.Text))  # 节点日志
+    exit_code = db.Column(db.Integer)  # 执行器上报的退出码
     started_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -92,6 +107,80 @@ class Action(db.Model):
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
 
+    __table_args__ = (
+        db.Index("ix_actions_workflow_id_id", "workflow_id", "id"),
+        db.Index("ix_actions_workflow_id_status", "workflow_id", "status"),
+    )
+
+
+class WorkflowStatRollup(db.Model):
+    """流水线状态统计汇总模型（按小时/天分桶）"""
+
+    __tablename__ = "workflow_stat_rollups"
+
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour, day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False)
+    template_id = db.Column(
+        db.Integer, db.ForeignKey("workflow_templates.id"), nullable=False
+    )
+    status = db.Column(db.String(20), nullable=False)  # 进入的状态
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "granularity",
+            "bucket_start",
+            "project_id",
+            "template_id",
+            "status",
+            name="uq_workflow_stat_rollups_bucket",
+        ),
+    )
+
+
+class LoopCheckpoint(db.Model):
+    """循环节点的迭代检查点（每完成一次迭代记录一行）"""
+
+    __tablename__ = "loop_checkpoints"
+
+    id = db.Column(db.Integer, primary_key=True)
+    action_id = db.Column(db.Integer, db.ForeignKey("actions.id"), nullable=False)
+    # 循环在节点内的路径，嵌套循环形如 outer/2/inner（外层第2次迭代中的inner）
+    loop_path = db.Column(db.String(500), nullable=False)
+    iteration = db.Column(db.Integer, nullable=False)
+    converged = db.Column(db.Boolean, nullable=False, default=False)
+    state = db.Column(db.Text)  # 终止条件输出，传给下一次迭代
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "action_id", "loop_path", "iteration", name="uq_loop_checkpoints_iteration"
+        ),
+    )
+
+
+class StepResult(db.Model):
+    """可缓存节点的执行结果：缓存键 -> 生成输出的溯源活动"""
+
+    __tablename__ = "step_results"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 活动描述/版本、命令、参数与输入实体校验和的SHA-256；无法确定输入时为空
+    cache_key = db.Column(db.String(64), nullable=True, index=True)
+    action_id = db.Column(
+        db.Integer, db.ForeignKey("actions.id"), nullable=False, unique=True
+    )
+    template_id = db.Column(
+        db.Integer, db.ForeignKey("workflow_templates.id"), nullable=False, index=True
+    )
+    # 生成输出的活动；缓存命中时为被复用的活动，执行后没有登记溯源时为空
+    activity_id = db.Column(db.Integer, db.ForeignKey("activity.id"), nullable=True)
+    hit = db.Column(db.Boolean, nullable=False, default=False)  # 是否由缓存命中完成
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 
 # region ivoa_provenance
 
@@ -108,6 +197,24 @@ class Entity(db.Model):
     generated_at_time = db.Column(db.DateTime, nullable=True, comment="生成时间")
     invalidated_at_time = db.Column(db.DateTime, nullable=True, comment="失效时间")
     comment = db.Column(db.String, nullable=True, comment="备注信息")
+    type = db.Column(
+        db.String(20),
+        nullable=False,
+        default="entity",
+        server_default="entity",
+        comment="实体子类型鉴别列",
+    )
+    # 自然键：外部标识，或 位置+校验和；用于重复导入时去重
+    external_id = db.Column(db.String, nullable=True, unique=True, comment="外部标识")
+    checksum = db.Column(db.String, nullable=True, comment="内容校验和")
+
+    __table_args__ = (
+        db.UniqueConstraint("location", "checksum", name="uq_entity_location_checksum"),
+    )
+
+    # 子类均使用 polymorphic_load="inline"：实体查询直接LEFT JOIN子类表，
+    # 混合类型的血统一次查询即可得到子类实例，避免逐行加载子类字段
+    __mapper_args__ = {"polymorphic_on": type, "polymorphic_identity": "entity"}
 
     # 关系定义
     was_generated_by = db.relationship(
@@ -145,15 +252,33 @@ class Entity(db.Model):
 
     @property
     def derived_from(self) -> List["Entity"]:
-        """该实体衍生自的源实体列表"""
-        return [
+        """该实体衍生自的源实体列表（显式衍生关系及经由生成活动隐含的衍生关系）"""
+        explicit = [
             derived_relation.source_entity for derived_relation in self.was_derived_from
         ]
+        implied = (
+            Entity.query.join(Used, Used.entity_id == Entity.id)
+            .join(WasGeneratedBy, WasGeneratedBy.activity_id == Used.activity_id)
+            .filter(WasGeneratedBy.entity_id == self.id)
+            .order_by(Used.id)
+            .all()
+        )
+        return list(dict.fromkeys(explicit + implied))
 
     @property
     def derived(self) -> List["Entity"]:
-        """从该实体衍生出的实体列表"""
-        return [derived_relation.entity for derived_relation in self.derived_entities]
+        """从该实体衍生出的实体列表（显式衍生关系及经由使用活动隐含的衍生关系）"""
+        explicit = [
+            derived_relation.entity for derived_relation in self.derived_entities
+        ]
+        implied = (
+            Entity.query.join(WasGeneratedBy, WasGeneratedBy.entity_id == Entity.id)
+            .join(Used, Used.activity_id == WasGeneratedBy.activity_id)
+            .filter(Used.entity_id == self.id)
+            .order_by(WasGeneratedBy.id)
+            .all()
+        )
+        return list(dict.fromkeys(explicit + implied))
 
     def __repr__(self):
         return f"Entity(name={self.name}, id={self.id})"
@@ -166,7 +291,10 @@ class Collection(Entity):
     """集合类（继承自实体，对应文档2.2.1）"""
 
     __tablename__ = "collection"
-    __mapper_args__ = {"polymorphic_identity": "collection"}
+    __mapper_args__ = {
+        "polymorphic_identity": "collection",
+        "polymorphic_load": "inline",
+    }
 
     id = db.Column(db.Integer, db.ForeignKey("entity.id"), primary_key=True)
     members = db.relationship(
@@ -193,6 +321,9 @@ class Activity(db.Model):
     start_time = db.Column(db.DateTime, nullable=False, comment="开始时间")
     end_time = db.Column(db.DateTime, nullable=True, comment="结束时间")
     comment = db.Column(db.String, nullable=True, comment="备注信息")
+    run_key = db.Column(
+        db.String, nullable=True, unique=True, comment="运行标识（重试时去重）"
+    )
 
     # 关系定义
     was_generated_by = db.relationship("WasGeneratedBy", backref="activity")
@@ -262,8 +393,12 @@ class Used(db.Model):
     __tablename__ = "used"
 
     id = db.Column(db.Integer, primary_key=True)
-    activity_id = db.Column(db.Integer, db.ForeignKey("activity.id"), nullable=False)
-    entity_id = db.Column(db.Integer, db.ForeignKey("entity.id"), nullable=False)
+    activity_id = db.Column(
+        db.Integer, db.ForeignKey("activity.id"), nullable=False, index=True
+    )
+    entity_id = db.Column(
+        db.Integer, db.ForeignKey("entity.id"), nullable=False, index=True
+    )
     role = db.Column(db.String, nullable=True, comment="实体在活动中的角色")
     time = db.Column(db.DateTime, nullable=True, comment="使用开始时间")
 
@@ -285,8 +420,12 @@ class WasGeneratedBy(db.Model):
     __tablename__ = "was_generated_by"
 
     id = db.Column(db.Integer, primary_key=True)
-    entity_id = db.Column(db.Integer, db.ForeignKey("entity.id"), nullable=False)
-    activity_id = db.Column(db.Integer, db.ForeignKey("activity.id"), nullable=False)
+    entity_id = db.Column(
+        db.Integer, db.ForeignKey("entity.id"), nullable=False, index=True
+    )
+    activity_id = db.Column(
+        db.Integer, db.ForeignKey("activity.id"), nullable=False, index=True
+    )
     role = db.Column(db.String, nullable=True, comment="实体在活动中的角色")
 
     # 关系定义
@@ -301,16 +440,27 @@ class WasGeneratedBy(db.Model):
 class WasDerivedFrom(db.Model):
     """衍生关系类（对应文档2.3.4）
     表示Entity是被另一个Entity处理生成的
+
+    默认（implicit模式）不为活动的每对输入/输出写入衍生关系，
+    查询时由 Used + WasGeneratedBy 推导；此表只保存无法推导的显式衍生关系。
     """
 
     __tablename__ = "was_derived_from"
 
     id = db.Column(db.Integer, primary_key=True)
     entity_id = db.Column(
-        db.Integer, db.ForeignKey("entity.id"), nullable=False, comment="衍生实体"
+        db.Integer,
+        db.ForeignKey("entity.id"),
+        nullable=False,
+        index=True,
+        comment="衍生实体",
     )
     source_entity_id = db.Column(
-        db.Integer, db.ForeignKey("entity.id"), nullable=False, comment="源实体"
+        db.Integer,
+        db.ForeignKey("entity.id"),
+        nullable=False,
+        index=True,
+        comment="源实体",
     )
     role = db.Column(db.String, nullable=True, comment="角色描述")
 
@@ -473,7 +623,10 @@ class DatasetEntity(Entity):
     """数据集实体（对应文档2.6.1）"""
 
     __tablename__ = "dataset_entity"
-    __mapper_args__ = {"polymorphic_identity": "dataset"}
+    __mapper_args__ = {
+        "polymorphic_identity": "dataset",
+        "polymorphic_load": "inline",
+    }
 
     id = db.Column(db.Integer, db.ForeignKey("entity.id"), primary_key=True)
     dataset_description_id = db.Column(
@@ -497,7 +650,7 @@ class ValueEntity(Entity):
     """值实体（对应文档2.6.2）"""
 
     __tablename__ = "value_entity"
-    __mapper_args__ = {"polymorphic_identity": "value"}
+    __mapper_args__ = {"polymorphic_identity": "value", "polymorphic_load": "inline"}
 
     id = db.Column(db.Integer, db.ForeignKey("entity.id"), primary_key=True)
     value = db.Column(db.String, nullable=False, comment="值")
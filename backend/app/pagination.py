@@ -0,0 +1,139 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from apiflask import abort
+from sqlalchemy import func, text, tuple_
+
+from app.extensions import db
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def expand_fields(raw: Optional[str], allowed: Iterable[str]) -> List[str]:
+    """
+    解析 ?fields= 参数（逗号分隔），返回列表查询需要额外加载的大字段
+
+    Args:
+        raw: 原始参数值
+        allowed: 可展开的字段名
+
+    Returns:
+        请求展开的字段名列表
+    """
+    if not raw:
+        return []
+    requested = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = sorted(set(requested) - set(allowed))
+    if unknown:
+        abort(400, message=f"不支持展开的字段: {', '.join(unknown)}")
+    return requested
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """
+    将(排序值, id)编码为不透明游标
+
+    Args:
+        sort_value: 排序列的值
+        row_id: 行ID（排序值相同时用于确定顺序）
+
+    Returns:
+        URL安全的base64字符串
+    """
+    if isinstance(sort_value, datetime):
+        sort_value = {"dt": sort_value.isoformat()}
+    payload = json.dumps([sort_value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """解码游标，格式错误时返回400"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value["dt"])
+        return sort_value, int(row_id)
+    except (ValueError, TypeError, KeyError):
+        abort(400, message="无效的分页游标")
+
+
+def keyset_paginate(
+    query,
+    model,
+    sort: str = "id",
+    order: str = "desc",
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_LIMIT,
+) -> Tuple[List, Optional[str]]:
+    """
+    基于(排序列, id)的键集分页
+
+    与OFFSET分页不同，翻页代价与页码无关，只依赖(排序列, id)上的索引。
+
+    Args:
+        query: 已应用过滤条件的查询
+        model: 查询的模型类（需要有id列）
+        sort: 排序列名
+        order: asc 或 desc
+        cursor: 上一页返回的next_cursor
+        limit: 每页条数
+
+    Returns:
+        (当前页记录列表, 下一页游标或None)
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    sort_column = getattr(model, sort)
+    key = tuple_(sort_column, model.id) if sort != "id" else model.id
+
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        bound = tuple_(sort_value, row_id) if sort != "id" else row_id
+        query = query.filter(key < bound if order == "desc" else key > bound)
+
+    if order == "desc":
+        query = query.order_by(sort_column.desc(), model.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), model.id.asc())
+
+    # 多取一条用于判断是否还有下一页
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort), last.id)
+    return rows, next_cursor
+
+
+def count_rows(query, model, mode: str = "exact") -> Optional[int]:
+    """
+    统计查询结果总数
+
+    Args:
+        query: 已应用过滤条件、未排序的查询
+        model: 查询的模型类
+        mode: exact（精确计数）、estimate（PostgreSQL下使用查询计划估算）或none
+
+    Returns:
+        总数；mode为none时返回None
+    """
+    if mode == "none":
+        return None
+    if mode == "estimate" and db.engine.dialect.name == "postgresql":
+        return _estimate_count(query)
+    return query.order_by(None).with_entities(func.count(model.id)).scalar()
+
+
+def _estimate_count(query) -> int:
+    """使用PostgreSQL查询计划的行数估算，避免对大表做全量COUNT"""
+    statement = query.order_by(None).statement.compile(
+        dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}
+    )
+    plan: List[Dict] = db.session.execute(
+        text(f"EXPLAIN (FORMAT JSON) {statement}")
+    ).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
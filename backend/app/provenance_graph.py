@@ -3,19 +3,148 @@ import sys
 from collections import defaultdict, deque
 from dataclasses import dataclass
 from enum import Enum
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 
 ID_BIAS = 10000000  # 由于activity和entity的id可能重复，所以给activity一个偏移量
+LOAD_CHUNK_SIZE = 5000  # 批量加载时单条IN查询的最大ID数
 from .models import (
     Activity,
+    DatasetEntity,
     Entity,
     Used,
+    ValueEntity,
     WasDerivedFrom,
     WasGeneratedBy,
     WasInformedBy,
+    db,
 )
 
 
+def _chunks(ids: List[int]) -> Iterable[List[int]]:
+    for start in range(0, len(ids), LOAD_CHUNK_SIZE):
+        yield ids[start : start + LOAD_CHUNK_SIZE]
+
+
+def load_entities(entity_ids: Iterable[int]) -> Dict[int, Entity]:
+    """
+    批量加载实体（含子类字段与子类描述）
+
+    子类以 inline 方式联结在实体查询中，一条查询即可得到子类实例；
+    数据集/值描述各用一条 IN 查询加载。
+
+    Args:
+        entity_ids: 实体ID集合
+
+    Returns:
+        实体ID到实体对象（DatasetEntity/ValueEntity等子类实例）的映射
+    """
+    entities: Dict[int, Entity] = {}
+    for chunk in _chunks(list(set(entity_ids))):
+        rows = db.session.scalars(
+            select(Entity)
+            .options(
+                selectinload(DatasetEntity.dataset_description),
+                selectinload(ValueEntity.value_description),
+            )
+            .where(Entity.id.in_(chunk))
+        ).all()
+        entities.update((entity.id, entity) for entity in rows)
+    return entities
+
+
+def load_activities(activity_ids: Iterable[int]) -> Dict[int, Activity]:
+    """批量加载活动，返回活动ID到活动对象的映射"""
+    activities: Dict[int, Activity] = {}
+    for chunk in _chunks(list(set(activity_ids))):
+        rows = Activity.query.filter(Activity.id.in_(chunk)).all()
+        activities.update((activity.id, activity) for activity in rows)
+    return activities
+
+
+def _merge_derivations(explicit, implied) -> List[Tuple[int, Optional[str], bool]]:
+    merged: Dict[int, Tuple[int, Optional[str], bool]] = {}
+    for entity_id, role in explicit:
+        merged.setdefault(entity_id, (entity_id, role, False))
+    for (entity_id,) in implied:
+        merged.setdefault(entity_id, (entity_id, None, True))
+    return list(merged.values())
+
+
+def derivation_sources(entity_id: int) -> List[Tuple[int, Optional[str], bool]]:
+    """
+    实体的衍生来源（显式 WasDerivedFrom 与经由生成活动隐含的衍生关系）
+
+    Returns:
+        (源实体ID, 角色, 是否隐含) 列表
+    """
+    explicit = (
+        db.session.query(WasDerivedFrom.source_entity_id, WasDerivedFrom.role)
+        .filter(WasDerivedFrom.entity_id == entity_id)
+        .order_by(WasDerivedFrom.id)
+    )
+    implied = (
+        db.session.query(Used.entity_id)
+        .join(WasGeneratedBy, WasGeneratedBy.activity_id == Used.activity_id)
+        .filter(WasGeneratedBy.entity_id == entity_id)
+        .order_by(Used.id)
+    )
+    return _merge_derivations(explicit, implied)
+
+
+def derivation_targets(entity_id: int) -> List[Tuple[int, Optional[str], bool]]:
+    """
+    由实体衍生出的实体（显式 WasDerivedFrom 与经由使用活动隐含的衍生关系）
+
+    Returns:
+        (衍生实体ID, 角色, 是否隐含) 列表
+    """
+    explicit = (
+        db.session.query(WasDerivedFrom.entity_id, WasDerivedFrom.role)
+        .filter(WasDerivedFrom.source_entity_id == entity_id)
+        .order_by(WasDerivedFrom.id)
+    )
+    implied = (
+        db.session.query(WasGeneratedBy.entity_id)
+        .join(Used, Used.activity_id == WasGeneratedBy.activity_id)
+        .filter(Used.entity_id == entity_id)
+        .order_by(WasGeneratedBy.id)
+    )
+    return _merge_derivations(explicit, implied)
+
+
+def entity_details(entity: Entity) -> Dict:
+    """
+    实体详细信息，包含子类字段
+
+    Args:
+        entity: 实体（可为DatasetEntity、ValueEntity等子类）
+
+    Returns:
+        详细信息字典
+    """
+    details = {
+        "entity_type": entity.type,
+        "location": entity.location,
+        "generated_at_time": (
+            entity.generated_at_time.isoformat() if entity.generated_at_time else None
+        ),
+        "comment": entity.comment,
+    }
+    if isinstance(entity, DatasetEntity):
+        description = entity.dataset_description
+        details["content_type"] = description.content_type if description else None
+    elif isinstance(entity, ValueEntity):
+        description = entity.value_description
+        details["value"] = entity.value
+        details["value_type"] = description.value_type if description else None
+        details["unit"] = description.unit if description else None
+        details["ucd"] = description.ucd if description else None
+    return details
+
+
 class NodeType(Enum):
     """节点类型枚举"""
 
@@ -42,17 +171,20 @@ class GraphEdge:
     target_id: int
     relationship_type: str
     role: Optional[str] = None
+    implied: bool = False  # 由 Used + WasGeneratedBy 推导、未存储的衍生关系
 
 
 class ProvenanceGraph:
     """来源拓扑图生成器"""
 
-    def __init__(self):
+    def __init__(self, include_implied_derivations: bool = True):
         self.nodes: Dict[int, GraphNode] = {}
         self.edges: List[GraphEdge] = []
         self.node_levels: Dict[int, int] = {}
+        self.include_implied_derivations = include_implied_derivations
         self._visited_entities: Set[int] = set()
         self._visited_activities: Set[int] = set()
+        self._activity_inputs: Dict[int, List[int]] = {}
 
     def build_graph(self, root_entity: Entity) -> Dict:
         """
@@ -69,6 +201,7 @@ class ProvenanceGraph:
         self.node_levels.clear()
         self._visited_entities.clear()
         self._visited_activities.clear()
+        self._activity_inputs.clear()
 
         # 从根实体开始构建图
         self._add_entity_node(root_entity, level=0)
@@ -115,6 +248,7 @@ class ProvenanceGraph:
         target_id: int,
         relationship_type: str,
         role: Optional[str] = None,
+        implied: bool = False,
     ) -> None:
         """添加边"""
         edge = GraphEdge(
@@ -122,6 +256,7 @@ class ProvenanceGraph:
             target_id=target_id,
             relationship_type=relationship_type,
             role=role,
+            implied=implied,
         )
         self.edges.append(edge)
 
@@ -141,6 +276,20 @@ class ProvenanceGraph:
             # 递归遍历活动
             self._traverse_activity(activity, level + 1)
 
+            # 隐含衍生关系：实体衍生自生成活动使用的每个实体
+            if self.include_implied_derivations:
+                explicit_sources = {
+                    relation.source_entity_id for relation in entity.was_derived_from
+                }
+                for source_id in self._activity_inputs.get(activity.id, []):
+                    if source_id not in explicit_sources:
+                        self._add_edge(
+                            source_id=source_id,
+                            target_id=entity.id,
+                            relationship_type="was_derived_from",
+                            implied=True,
+                        )
+
         # 2. 查找该实体的源实体（衍生关系）
         for derived_relation in entity.was_derived_from:
             source_entity = derived_relation.source_entity
@@ -158,7 +307,11 @@ class ProvenanceGraph:
     def _traverse_activity(self, activity: Activity, level: int) -> None:
         """遍历活动的来源关系"""
         # 1. 查找该活动使用的实体
-        for used_relation in Used.query.filter(Used.activity_id == activity.id).all():
+        used_relations = Used.query.filter(Used.activity_id == activity.id).all()
+        self._activity_inputs[activity.id] = [
+            used_relation.entity_id for used_relation in used_relations
+        ]
+        for used_relation in used_relations:
             entity = used_relation.entity
             self._add_entity_node(entity, level + 1)
             self._add_edge(
@@ -231,8 +384,8 @@ class ProvenanceGraph:
 
         # 按层级组织节点
         nodes_by_level = defaultdict(list)
-        for node in graph_data["nodes"]:
-            level = self.node_levels.get(node.id, 0)
+        for graph_id, node in self.nodes.items():
+            level = self.node_levels.get(graph_id, 0)
             nodes_by_level[level].append(
                 {
                     "id": node.id,
@@ -255,6 +408,7 @@ class ProvenanceGraph:
                     "target": edge.target_id,
                     "type": edge.relationship_type,
                     "role": edge.role,
+                    "implied": edge.implied,
                 }
                 for edge in graph_data["edges"]
             ],
@@ -278,6 +432,7 @@ class ProvenanceGraph:
         self.node_levels.clear()
         self._visited_entities.clear()
         self._visited_activities.clear()
+        self._activity_inputs.clear()
 
         self._add_activity_node(activity, level=0)
         self._traverse_activity(activity, level=0)
@@ -287,8 +442,8 @@ class ProvenanceGraph:
 
         # 按层级组织节点
         nodes_by_level = defaultdict(list)
-        for node in self.nodes.values():
-            level = self.node_levels.get(node.id, 0)
+        for graph_id, node in self.nodes.items():
+            level = self.node_levels.get(graph_id, 0)
             nodes_by_level[level].append(
                 {
                     "id": node.id,
@@ -316,6 +471,7 @@ class ProvenanceGraph:
                     "target": edge.target_id,
                     "type": edge.relationship_type,
                     "role": edge.role,
+                    "implied": edge.implied,
                 }
                 for edge in self.edges
             ],
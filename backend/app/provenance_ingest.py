@@ -0,0 +1,414 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from sqlalchemy import insert, select, tuple_
+
+from app.models import (
+    Activity,
+    Collection,
+    DatasetEntity,
+    Entity,
+    Used,
+    ValueEntity,
+    WasDerivedFrom,
+    WasGeneratedBy,
+    WasInformedBy,
+    db,
+)
+
+# 文档中的引用：字符串为本文档内的临时ID，整数为数据库中已有记录的ID
+Ref = Union[str, int]
+
+ENTITY_SUBCLASS_TABLES = {
+    "collection": Collection.__table__,
+    "dataset": DatasetEntity.__table__,
+    "value": ValueEntity.__table__,
+}
+
+# 自然键（按优先级）：存在自然键的记录重复导入时复用已有行
+ENTITY_NATURAL_KEYS = (("external_id",), ("location", "checksum"))
+ACTIVITY_NATURAL_KEYS = (("run_key",),)
+
+# 关系的判重列
+RELATION_KEYS = {
+    "used": ("activity_id", "entity_id", "role"),
+    "was_generated_by": ("entity_id", "activity_id", "role"),
+    "was_derived_from": ("entity_id", "source_entity_id", "role"),
+    "was_informed_by": ("informed_id", "informant_id"),
+}
+
+# 按自然键查询时每条语句的键数量（SQLite绑定参数数量有限）
+LOOKUP_CHUNK_SIZE = 500
+
+
+class IngestError(ValueError):
+    """溯源文档格式或引用错误"""
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise IngestError(f"无效的时间: {value!r}")
+
+
+def _resolve(ref: Ref, temp_ids: Dict[str, int], kind: str) -> int:
+    """将引用解析为数据库ID"""
+    if isinstance(ref, bool):
+        raise IngestError(f"无效的{kind}引用: {ref!r}")
+    if isinstance(ref, int):
+        return ref
+    if isinstance(ref, str) and ref in temp_ids:
+        return temp_ids[ref]
+    raise IngestError(f"未定义的{kind}引用: {ref!r}")
+
+
+def _insert_returning_ids(table, rows: List[Dict]) -> List[int]:
+    """
+    批量INSERT ... RETURNING，按参数顺序返回新ID
+
+    PostgreSQL下为多行VALUES批量插入；SQLite不支持有序的多行RETURNING，
+    SQLAlchemy会退化为同一事务内逐行插入。
+    """
+    if not rows:
+        return []
+    stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+    return list(db.session.execute(stmt, rows).scalars())
+
+
+def _insert_many(table, rows: List[Dict]) -> None:
+    """批量INSERT（executemany）"""
+    if rows:
+        db.session.execute(insert(table), rows)
+
+
+def _insert_ignore(table, rows: List[Dict]) -> None:
+    """
+    批量 INSERT ... ON CONFLICT DO NOTHING
+
+    PostgreSQL和SQLite下与并发写入者冲突时跳过该行；其他数据库退化为普通INSERT，
+    并发冲突时抛出IntegrityError，由调用方重试（重试是幂等的）。
+    """
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        _insert_many(table, rows)
+        return
+    db.session.execute(dialect_insert(table).on_conflict_do_nothing(), rows)
+
+
+def _natural_key(
+    row: Dict, key_specs: Sequence[Tuple[str, ...]]
+) -> Optional[Tuple[Tuple[str, ...], Tuple]]:
+    """返回行的第一个完整自然键 (列名, 值)，没有时返回None"""
+    for columns in key_specs:
+        values = tuple(row.get(column) for column in columns)
+        if all(value is not None for value in values):
+            return columns, values
+    return None
+
+
+def _lookup_ids(
+    table, columns: Tuple[str, ...], keys: Iterable[Tuple]
+) -> Dict[Tuple, int]:
+    """按自然键批量查询已有记录ID"""
+    keys = list(keys)
+    found: Dict[Tuple, int] = {}
+    key_columns = [table.c[column] for column in columns]
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        chunk = keys[start : start + LOOKUP_CHUNK_SIZE]
+        if len(columns) == 1:
+            condition = key_columns[0].in_([key[0] for key in chunk])
+        else:
+            condition = tuple_(*key_columns).in_(chunk)
+        for row in db.session.execute(
+            select(table.c.id, *key_columns).where(condition)
+        ):
+            found[tuple(row[1:])] = row[0]
+    return found
+
+
+def _write_nodes(
+    table, rows: List[Dict], key_specs: Sequence[Tuple[str, ...]]
+) -> Tuple[List[int], Set[int], Set[int]]:
+    """
+    写入实体或活动行，有自然键的行以upsert方式写入
+
+    有自然键的行：先按键批量查询已有ID，只对缺失的键执行
+    INSERT ... ON CONFLICT DO NOTHING，再按键查回新ID。同一文档内
+    自然键相同的行指向同一条记录。没有自然键的行直接批量插入。
+
+    Returns:
+        (与rows对齐的ID列表, 本次新插入行在rows中的下标, 无自然键的新记录ID)
+    """
+    ids: List[Optional[int]] = [None] * len(rows)
+    inserted: Set[int] = set()
+    keyed: Dict[Tuple[str, ...], List[Tuple[int, Tuple]]] = {}
+    plain: List[int] = []
+    for index, row in enumerate(rows):
+        key = _natural_key(row, key_specs)
+        if key is None:
+            plain.append(index)
+        else:
+            keyed.setdefault(key[0], []).append((index, key[1]))
+
+    for columns, entries in keyed.items():
+        found = _lookup_ids(table, columns, {values for _, values in entries})
+        missing: Dict[Tuple, int] = {}
+        for index, values in entries:
+            if values not in found:
+                missing.setdefault(values, index)
+        if missing:
+            _insert_ignore(table, [rows[index] for index in missing.values()])
+            found.update(_lookup_ids(table, columns, missing))
+            inserted.update(missing.values())
+        for index, values in entries:
+            if values not in found:
+                # ON CONFLICT 也会跳过与其他唯一键冲突的行
+                raise IngestError(
+                    f"记录与已有记录的唯一键冲突: {dict(zip(columns, values))}"
+                )
+            ids[index] = found[values]
+
+    plain_ids = _insert_returning_ids(table, [rows[index] for index in plain])
+    for index, new_id in zip(plain, plain_ids):
+        ids[index] = new_id
+    inserted.update(plain)
+    return ids, inserted, set(plain_ids)
+
+
+def _drop_existing_relations(
+    table, rows: List[Dict], key: Tuple[str, ...], fresh_ids: Dict[str, Set[int]]
+) -> List[Dict]:
+    """
+    去掉数据库中已存在（或本批重复）的关系行
+
+    端点中含无自然键的新记录的关系不可能已存在，无需查询；其余关系按
+    第一个键列批量查出已有关系后在内存中比对。
+
+    Args:
+        table: 关系表
+        rows: 待插入的关系行
+        key: 判重列
+        fresh_ids: 列名 -> 本次新插入且无自然键的记录ID
+    """
+    seen: Set[Tuple] = set()
+    candidates: List[Tuple[Tuple, Dict]] = []
+    result: List[Dict] = []
+    for row in rows:
+        if any(row[column] in fresh_ids.get(column, ()) for column in key):
+            result.append(row)
+            continue
+        values = tuple(row[column] for column in key)
+        if values not in seen:
+            seen.add(values)
+            candidates.append((values, row))
+    if not candidates:
+        return result
+
+    existing: Set[Tuple] = set()
+    columns = [table.c[column] for column in key]
+    first_values = list({values[0] for values, _ in candidates})
+    for start in range(0, len(first_values), LOOKUP_CHUNK_SIZE):
+        chunk = first_values[start : start + LOOKUP_CHUNK_SIZE]
+        existing.update(
+            tuple(row)
+            for row in db.session.execute(select(*columns).where(columns[0].in_(chunk)))
+        )
+    result.extend(row for values, row in candidates if values not in existing)
+    return result
+
+
+def _register_temp_ids(items: List[Dict], ids: List[int], kind: str) -> Dict[str, int]:
+    temp_ids: Dict[str, int] = {}
+    for item, new_id in zip(items, ids):
+        if item.get("id") is None:
+            continue
+        temp_id = str(item["id"])
+        if temp_id in temp_ids:
+            raise IngestError(f"重复的{kind}临时ID: {temp_id!r}")
+        temp_ids[temp_id] = new_id
+    return temp_ids
+
+
+def ingest_document(document: Dict, commit: bool = True) -> Dict:
+    """
+    在一个事务内批量写入溯源文档
+
+    文档格式::
+
+        {
+            "entities": [{"id": "e1", "name": ..., "location": ..., "type": "dataset",
+                          "external_id": ..., "checksum": ...}],
+            "activities": [{"id": "a1", "name": ..., "start_time": ..., "run_key": ...}],
+            "used": [{"activity": "a1", "entity": "e1", "role": ...}],
+            "was_generated_by": [{"entity": "e2", "activity": "a1"}],
+            "was_derived_from": [{"entity": "e2", "source": "e1"}],
+            "was_informed_by": [{"informed": "a2", "informant": "a1"}]
+        }
+
+    关系中的引用为字符串时指向本文档的临时ID，为整数时指向已有记录。
+    实体与活动使用批量 INSERT ... RETURNING 获取ID，关系使用 executemany，
+    整个文档只提交一次。
+
+    带自然键的实体（external_id，或 location+checksum）和活动（run_key）以
+    INSERT ... ON CONFLICT DO NOTHING 写入并复用已有记录，已存在的关系不再重复
+    插入，因此重复导入同一文档（如客户端重试）不会产生新行。
+
+    Args:
+        document: 溯源文档
+        commit: 是否提交事务。传False时由调用方管理事务，出错时也不回滚
+
+    Returns:
+        {"entities": 临时ID->实体ID, "activities": 临时ID->活动ID,
+         "counts": 各类记录数, "inserted": 各类实际新插入的记录数}
+
+    Raises:
+        IngestError: 文档格式错误或引用未定义
+    """
+    now = datetime.utcnow()
+    entities = document.get("entities", [])
+    activities = document.get("activities", [])
+
+    try:
+        entity_rows = [
+            {
+                "name": item.get("name"),
+                "location": item.get("location"),
+                "generated_at_time": _parse_time(item.get("generated_at_time")) or now,
+                "invalidated_at_time": _parse_time(item.get("invalidated_at_time")),
+                "comment": item.get("comment"),
+                "type": item.get("type", "entity"),
+                "external_id": item.get("external_id"),
+                "checksum": item.get("checksum"),
+            }
+            for item in entities
+        ]
+        activity_rows = [
+            {
+                "name": item.get("name"),
+                "start_time": _parse_time(item.get("start_time")) or now,
+                "end_time": _parse_time(item.get("end_time")),
+                "comment": item.get("comment"),
+                "run_key": item.get("run_key"),
+            }
+            for item in activities
+        ]
+        for row in entity_rows:
+            if row["type"] != "entity" and row["type"] not in ENTITY_SUBCLASS_TABLES:
+                raise IngestError(f"未知的实体类型: {row['type']!r}")
+
+        entity_ids, new_entities, fresh_entity_ids = _write_nodes(
+            Entity.__table__, entity_rows, ENTITY_NATURAL_KEYS
+        )
+        activity_ids, new_activities, fresh_activity_ids = _write_nodes(
+            Activity.__table__, activity_rows, ACTIVITY_NATURAL_KEYS
+        )
+        entity_temp_ids = _register_temp_ids(entities, entity_ids, "实体")
+        activity_temp_ids = _register_temp_ids(activities, activity_ids, "活动")
+
+        # 子类表（只为本次新插入的实体写入）
+        subclass_rows: Dict[str, List[Dict]] = {}
+        for index, (item, row, new_id) in enumerate(
+            zip(entities, entity_rows, entity_ids)
+        ):
+            if row["type"] == "entity" or index not in new_entities:
+                continue
+            subclass_row = {"id": new_id}
+            if row["type"] == "value":
+                if item.get("value") is None:
+                    raise IngestError("值实体缺少value字段")
+                subclass_row["value"] = str(item["value"])
+            subclass_rows.setdefault(row["type"], []).append(subclass_row)
+        for entity_type, rows in subclass_rows.items():
+            _insert_many(ENTITY_SUBCLASS_TABLES[entity_type], rows)
+
+        def entity_ref(ref: Ref) -> int:
+            return _resolve(ref, entity_temp_ids, "实体")
+
+        def activity_ref(ref: Ref) -> int:
+            return _resolve(ref, activity_temp_ids, "活动")
+
+        used_rows = [
+            {
+                "activity_id": activity_ref(item["activity"]),
+                "entity_id": entity_ref(item["entity"]),
+                "role": item.get("role"),
+                "time": _parse_time(item.get("time")) or now,
+            }
+            for item in document.get("used", [])
+        ]
+        generated_rows = [
+            {
+                "entity_id": entity_ref(item["entity"]),
+                "activity_id": activity_ref(item["activity"]),
+                "role": item.get("role"),
+            }
+            for item in document.get("was_generated_by", [])
+        ]
+        derived_rows = [
+            {
+                "entity_id": entity_ref(item["entity"]),
+                "source_entity_id": entity_ref(item["source"]),
+                "role": item.get("role"),
+            }
+            for item in document.get("was_derived_from", [])
+        ]
+        informed_rows = [
+            {
+                "informed_id": activity_ref(item["informed"]),
+                "informant_id": activity_ref(item["informant"]),
+            }
+            for item in document.get("was_informed_by", [])
+        ]
+    except KeyError as e:
+        if commit:
+            db.session.rollback()
+        raise IngestError(f"关系缺少字段: {e.args[0]}")
+    except IngestError:
+        if commit:
+            db.session.rollback()
+        raise
+
+    fresh_ids = {
+        "entity_id": fresh_entity_ids,
+        "source_entity_id": fresh_entity_ids,
+        "activity_id": fresh_activity_ids,
+        "informed_id": fresh_activity_ids,
+        "informant_id": fresh_activity_ids,
+    }
+    relations = {
+        "used": (Used.__table__, used_rows),
+        "was_generated_by": (WasGeneratedBy.__table__, generated_rows),
+        "was_derived_from": (WasDerivedFrom.__table__, derived_rows),
+        "was_informed_by": (WasInformedBy.__table__, informed_rows),
+    }
+    inserted = {"entities": len(new_entities), "activities": len(new_activities)}
+    for name, (table, rows) in relations.items():
+        rows = _drop_existing_relations(table, rows, RELATION_KEYS[name], fresh_ids)
+        _insert_many(table, rows)
+        inserted[name] = len(rows)
+
+    if commit:
+        db.session.commit()
+
+    return {
+        "entities": entity_temp_ids,
+        "activities": activity_temp_ids,
+        "counts": {
+            "entities": len(entity_rows),
+            "activities": len(activity_rows),
+            "used": len(used_rows),
+            "was_generated_by": len(generated_rows),
+            "was_derived_from": len(derived_rows),
+            "was_informed_by": len(informed_rows),
+        },
+        "inserted": inserted,
+    }
@@ -0,0 +1,668 @@
+import codecs
+import json
+from datetime import datetime
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import String, cast, func, literal, or_, select, union
+
+from app.models import (
+    Activity,
+    Entity,
+    Used,
+    ValueEntity,
+    WasDerivedFrom,
+    WasGeneratedBy,
+    WasInformedBy,
+    db,
+)
+from app.provenance_ingest import IngestError, _lookup_ids, ingest_document
+
+PREFIXES = {
+    "prov": "http://www.w3.org/ns/prov#",
+    "voprov": "http://www.ivoa.net/documents/ProvenanceDM/ns/voprov/",
+    "xsd": "http://www.w3.org/2001/XMLSchema#",
+    "nadc": "https://nadc.china-vo.org/provenance/",
+}
+
+# 实体子类型 <-> prov:type
+ENTITY_PROV_TYPES = {
+    "collection": "prov:Collection",
+    "dataset": "voprov:DatasetEntity",
+    "value": "voprov:ValueEntity",
+}
+PROV_ENTITY_TYPES = {value: key for key, value in ENTITY_PROV_TYPES.items()}
+
+# 关系记录：PROV-JSON段名 -> (文档键, {PROV属性: 文档字段})
+RELATION_SECTIONS = {
+    "used": (
+        "used",
+        {"prov:activity": "activity", "prov:entity": "entity", "prov:time": "time"},
+    ),
+    "wasGeneratedBy": (
+        "was_generated_by",
+        {"prov:entity": "entity", "prov:activity": "activity"},
+    ),
+    "wasDerivedFrom": (
+        "was_derived_from",
+        {"prov:generatedEntity": "entity", "prov:usedEntity": "source"},
+    ),
+    "wasInformedBy": (
+        "was_informed_by",
+        {"prov:informed": "informed", "prov:informant": "informant"},
+    ),
+}
+NODE_SECTIONS = ("entity", "activity")
+
+# 关系端点 -> 所指向的节点类型
+ENDPOINT_KINDS = {
+    "activity": "activity",
+    "entity": "entity",
+    "source": "entity",
+    "informed": "activity",
+    "informant": "activity",
+}
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 5000
+READ_CHUNK_SIZE = 1 << 16
+
+
+# ---------------------------------------------------------------------------
+# 导入
+# ---------------------------------------------------------------------------
+
+
+class _JsonStream:
+    """
+    增量JSON读取器
+
+    按块读取文件，只把当前记录保留在内存中：结构字符逐个消费，
+    单条记录（一个实体或关系的属性对象）用 raw_decode 解码。
+    """
+
+    def __init__(self, fp: IO, chunk_size: int = READ_CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        data = ""
+        while not data:
+            if self.eof:
+                return False
+            raw = self.fp.read(self.chunk_size)
+            # 只有底层读到空块才是文件结束；多字节字符被截断时解码结果为空串
+            self.eof = not raw
+            data = raw
+            if isinstance(raw, bytes):
+                try:
+                    data = self.text_decoder.decode(raw, final=self.eof)
+                except UnicodeDecodeError as e:
+                    raise IngestError(f"PROV-JSON编码错误：{e.reason}")
+        self.buffer = self.buffer[self.pos :] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """跳过空白，返回下一个字符（结束时为空串）"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise IngestError(f"PROV-JSON格式错误：期望 {char!r}")
+        self.pos += 1
+
+    def skip(self, char: str) -> bool:
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self):
+        """解码下一个完整的JSON值"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise IngestError("PROV-JSON格式错误：文档不完整")
+                continue
+            # 数字或字面量位于缓冲区末尾时可能被截断
+            if end == len(self.buffer) and not isinstance(obj, (dict, list, str)):
+                if self._fill():
+                    continue
+            self.pos = end
+            return obj
+
+
+def iter_prov_json(
+    fp: IO, chunk_size: int = READ_CHUNK_SIZE
+) -> Iterator[Tuple[str, str, Dict]]:
+    """
+    流式解析PROV-JSON文档
+
+    Args:
+        fp: 文本或二进制文件对象
+        chunk_size: 每次读取的字节数
+
+    Yields:
+        (段名, 记录ID, 属性)，如 ("entity", "ex:raw1", {...})。
+        prefix 等非记录段、bundle 会被跳过
+    """
+    stream = _JsonStream(fp, chunk_size)
+    stream.expect("{")
+    while not stream.skip("}"):
+        section = stream.value()
+        stream.expect(":")
+        if section in NODE_SECTIONS or section in RELATION_SECTIONS:
+            stream.expect("{")
+            while not stream.skip("}"):
+                record_id = stream.value()
+                stream.expect(":")
+                attrs = stream.value()
+                # 同一ID的多条记录以列表表示
+                for record in attrs if isinstance(attrs, list) else [attrs]:
+                    yield section, record_id, record
+                stream.skip(",")
+        else:
+            stream.value()
+        stream.skip(",")
+
+
+def _literal(value):
+    """取PROV-JSON属性值：多值取第一个，类型化字面量取 $"""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = value.get("$")
+    return value
+
+
+class _ProvImporter:
+    """
+    PROV-JSON分批导入
+
+    节点以PROV ID作为自然键（实体external_id、活动run_key）写入，因此跨批次的
+    关系引用按自然键批量查询解析，无需在内存中保留全部ID映射，重复导入也是幂等的。
+    引用了尚未出现的节点的关系推迟到文档结束后处理，届时仍未声明的节点按PROV
+    约定视为隐式声明，创建只有ID的占位记录。
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        # 本批次的节点：段名 -> PROV ID -> 属性，同一ID的多条记录合并为一条
+        self.nodes: Dict[str, Dict[str, Dict]] = {"entity": {}, "activity": {}}
+        self.relations: List[Tuple[str, Dict]] = []
+        self.deferred: List[Tuple[str, Dict]] = []
+        self.counts = {
+            "entity": 0,
+            "activity": 0,
+            **dict.fromkeys(RELATION_SECTIONS, 0),
+        }
+
+    def add(self, section: str, record_id: str, attrs: Dict) -> None:
+        attrs = {key: _literal(value) for key, value in attrs.items()}
+        if section in self.nodes:
+            nodes = self.nodes[section]
+            if record_id in nodes:
+                # 同一ID的后续记录只补充先前记录没有的属性
+                merged = nodes[record_id]
+                for key, value in attrs.items():
+                    if merged.get(key) is None:
+                        merged[key] = value
+                return
+            nodes[record_id] = attrs
+        else:
+            key, mapping = RELATION_SECTIONS[section]
+            relation = {field: attrs.get(name) for name, field in mapping.items()}
+            if attrs.get("prov:role") is not None:
+                relation["role"] = attrs["prov:role"]
+            self.relations.append((key, relation))
+        self.counts[section] += 1
+        pending = sum(map(len, self.nodes.values())) + len(self.relations)
+        if pending >= self.batch_size:
+            self.flush()
+
+    @staticmethod
+    def _entity(record_id: str, attrs: Dict) -> Dict:
+        return {
+            "id": record_id,
+            "external_id": record_id,
+            "name": attrs.get("prov:label") or attrs.get("voprov:name"),
+            "location": attrs.get("prov:location") or attrs.get("voprov:location"),
+            "generated_at_time": attrs.get("voprov:generatedAtTime"),
+            "invalidated_at_time": attrs.get("voprov:invalidatedAtTime"),
+            "comment": attrs.get("voprov:comment"),
+            "checksum": attrs.get("nadc:checksum"),
+            "type": PROV_ENTITY_TYPES.get(attrs.get("prov:type"), "entity"),
+            "value": attrs.get("prov:value"),
+        }
+
+    @staticmethod
+    def _activity(record_id: str, attrs: Dict) -> Dict:
+        return {
+            "id": record_id,
+            "run_key": record_id,
+            "name": attrs.get("prov:label") or attrs.get("voprov:name"),
+            "start_time": attrs.get("prov:startTime"),
+            "end_time": attrs.get("prov:endTime"),
+            "comment": attrs.get("voprov:comment"),
+        }
+
+    def flush(self, placeholders: bool = False) -> None:
+        """写入当前批次并提交"""
+        entities, activities = self.nodes["entity"], self.nodes["activity"]
+        nodes = ingest_document(
+            {
+                "entities": [self._entity(*item) for item in entities.items()],
+                "activities": [self._activity(*item) for item in activities.items()],
+            },
+            commit=False,
+        )
+        known = {"entity": nodes["entities"], "activity": nodes["activities"]}
+        relations, self.relations = self.relations, []
+        self.nodes = {"entity": {}, "activity": {}}
+
+        missing = self._resolve_missing(relations, known)
+        if placeholders and any(missing.values()):
+            created = ingest_document(
+                {
+                    "entities": [
+                        {"id": ref, "external_id": ref, "name": ref}
+                        for ref in sorted(missing["entity"])
+                    ],
+                    "activities": [
+                        {"id": ref, "run_key": ref, "name": ref}
+                        for ref in sorted(missing["activity"])
+                    ],
+                },
+                commit=False,
+            )
+            known["entity"].update(created["entities"])
+            known["activity"].update(created["activities"])
+
+        document: Dict[str, List[Dict]] = {}
+        for key, relation in relations:
+            refs = {
+                field: known[ENDPOINT_KINDS[field]].get(relation[field])
+                for field in relation
+                if field in ENDPOINT_KINDS
+            }
+            if None in refs.values():
+                self.deferred.append((key, relation))
+                continue
+            document.setdefault(key, []).append({**relation, **refs})
+        ingest_document(document, commit=False)
+        db.session.commit()
+
+    def _resolve_missing(
+        self, relations: List[Tuple[str, Dict]], known: Dict[str, Dict]
+    ) -> Dict[str, set]:
+        """按自然键批量查询本批次之外的关系端点，返回仍未找到的引用"""
+        refs: Dict[str, set] = {"entity": set(), "activity": set()}
+        for _, relation in relations:
+            for field, kind in ENDPOINT_KINDS.items():
+                ref = relation.get(field)
+                if field in relation and ref not in known[kind]:
+                    if ref is None:
+                        raise IngestError(f"关系缺少字段: {field}")
+                    refs[kind].add(ref)
+        for kind, table, column in (
+            ("entity", Entity.__table__, "external_id"),
+            ("activity", Activity.__table__, "run_key"),
+        ):
+            found = _lookup_ids(table, (column,), [(ref,) for ref in refs[kind]])
+            known[kind].update({key[0]: row_id for key, row_id in found.items()})
+            refs[kind] -= known[kind].keys()
+        return refs
+
+    def finish(self) -> None:
+        self.flush()
+        if self.deferred:
+            self.relations, self.deferred = self.deferred, []
+            self.flush(placeholders=True)
+
+
+def import_prov_json(
+    fp: IO,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    chunk_size: int = READ_CHUNK_SIZE,
+) -> Dict[str, int]:
+    """
+    流式导入PROV-JSON文档
+
+    文档按块读取、按批写入（每批一个事务），内存占用与批大小相关，与文档大小无关。
+    属性映射与 export_prov_json 相同，因此导出结果可以直接导入另一个实例。
+
+    Args:
+        fp: 文本或二进制文件对象（如 request.stream）
+        batch_size: 每批写入的记录数
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        各段读取的记录数；同一批次中同一ID的多条节点记录合并后计为一条
+
+    Raises:
+        IngestError: 文档格式错误。此前的批次已经提交，修正后重新导入是幂等的
+    """
+    importer = _ProvImporter(batch_size)
+    try:
+        for section, record_id, attrs in iter_prov_json(fp, chunk_size):
+            importer.add(section, record_id, attrs)
+        importer.finish()
+    except Exception:
+        db.session.rollback()
+        raise
+    return importer.counts
+
+
+# ---------------------------------------------------------------------------
+# 导出
+# ---------------------------------------------------------------------------
+
+
+# 导出直接查询表而非ORM实体：Entity 的子类为 inline 加载，ORM查询会联结全部子类表
+ENTITY = Entity.__table__
+ACTIVITY = Activity.__table__
+USED = Used.__table__
+GENERATED = WasGeneratedBy.__table__
+DERIVED = WasDerivedFrom.__table__
+INFORMED = WasInformedBy.__table__
+VALUE = ValueEntity.__table__
+
+
+def _entity_label(table):
+    """实体的PROV ID：优先使用外部标识"""
+    return func.coalesce(
+        table.c.external_id, literal("nadc:entity/") + cast(table.c.id, String)
+    )
+
+
+def _activity_label(table):
+    """活动的PROV ID：优先使用运行标识"""
+    return func.coalesce(
+        table.c.run_key, literal("nadc:activity/") + cast(table.c.id, String)
+    )
+
+
+def _time(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _stream(stmt):
+    return db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+
+def iter_prov_records(activity_ids=None) -> Iterator[Tuple[str, str, Dict]]:
+    """
+    按段流式读取溯源记录（PROV属性形式）
+
+    每段一条游标查询，按 EXPORT_BATCH_SIZE 分批取行，不构建图也不加载ORM对象。
+    关系端点的PROV ID在SQL中计算（优先使用自然键）。
+
+    Args:
+        activity_ids: 可选的活动ID子查询，只导出这些活动、与其相关的关系
+            及其使用/生成的实体
+
+    Yields:
+        (段名, 记录ID, 属性)
+    """
+    activity_filter = entity_filter = None
+    if activity_ids is not None:
+        scope = select(activity_ids.subquery().c[0])
+        activity_filter = ACTIVITY.c.id.in_(scope)
+        entity_filter = ENTITY.c.id.in_(
+            union(
+                select(USED.c.entity_id).where(USED.c.activity_id.in_(scope)),
+                select(GENERATED.c.entity_id).where(GENERATED.c.activity_id.in_(scope)),
+            )
+        )
+
+    entities = (
+        select(
+            _entity_label(ENTITY),
+            ENTITY.c.name,
+            ENTITY.c.location,
+            ENTITY.c.generated_at_time,
+            ENTITY.c.invalidated_at_time,
+            ENTITY.c.comment,
+            ENTITY.c.checksum,
+            ENTITY.c.type,
+            VALUE.c.value,
+        )
+        .select_from(ENTITY.outerjoin(VALUE, VALUE.c.id == ENTITY.c.id))
+        .order_by(ENTITY.c.id)
+    )
+    if entity_filter is not None:
+        entities = entities.where(entity_filter)
+    for row in _stream(entities):
+        (
+            label,
+            name,
+            location,
+            generated,
+            invalidated,
+            comment,
+            checksum,
+            kind,
+            value,
+        ) = row
+        yield "entity", label, {
+            "prov:label": name,
+            "prov:location": location,
+            "prov:type": ENTITY_PROV_TYPES.get(kind),
+            "prov:value": value,
+            "voprov:generatedAtTime": _time(generated),
+            "voprov:invalidatedAtTime": _time(invalidated),
+            "voprov:comment": comment,
+            "nadc:checksum": checksum,
+        }
+
+    activities = select(
+        _activity_label(ACTIVITY),
+        ACTIVITY.c.name,
+        ACTIVITY.c.start_time,
+        ACTIVITY.c.end_time,
+        ACTIVITY.c.comment,
+    ).order_by(ACTIVITY.c.id)
+    if activity_filter is not None:
+        activities = activities.where(activity_filter)
+    for label, name, start_time, end_time, comment in _stream(activities):
+        yield "activity", label, {
+            "prov:label": name,
+            "prov:startTime": _time(start_time),
+            "prov:endTime": _time(end_time),
+            "voprov:comment": comment,
+        }
+
+    used = (
+        select(
+            USED.c.id,
+            _activity_label(ACTIVITY),
+            _entity_label(ENTITY),
+            USED.c.time,
+            USED.c.role,
+        )
+        .select_from(
+            USED.join(ACTIVITY, ACTIVITY.c.id == USED.c.activity_id).join(
+                ENTITY, ENTITY.c.id == USED.c.entity_id
+            )
+        )
+        .order_by(USED.c.id)
+    )
+    if activity_filter is not None:
+        used = used.where(activity_filter)
+    for row_id, activity, entity, at, role in _stream(used):
+        yield "used", f"_:u{row_id}", {
+            "prov:activity": activity,
+            "prov:entity": entity,
+            "prov:time": _time(at),
+            "prov:role": role,
+        }
+
+    generated = (
+        select(
+            GENERATED.c.id,
+            _entity_label(ENTITY),
+            _activity_label(ACTIVITY),
+            GENERATED.c.role,
+        )
+        .select_from(
+            GENERATED.join(ACTIVITY, ACTIVITY.c.id == GENERATED.c.activity_id).join(
+                ENTITY, ENTITY.c.id == GENERATED.c.entity_id
+            )
+        )
+        .order_by(GENERATED.c.id)
+    )
+    if activity_filter is not None:
+        generated = generated.where(activity_filter)
+    for row_id, entity, activity, role in _stream(generated):
+        yield "wasGeneratedBy", f"_:g{row_id}", {
+            "prov:entity": entity,
+            "prov:activity": activity,
+            "prov:role": role,
+        }
+
+    source = ENTITY.alias("source")
+    derived = (
+        select(
+            DERIVED.c.id,
+            _entity_label(ENTITY),
+            _entity_label(source),
+            DERIVED.c.role,
+        )
+        .select_from(
+            DERIVED.join(ENTITY, ENTITY.c.id == DERIVED.c.entity_id).join(
+                source, source.c.id == DERIVED.c.source_entity_id
+            )
+        )
+        .order_by(DERIVED.c.id)
+    )
+    if entity_filter is not None:
+        derived = derived.where(entity_filter)
+    for row_id, entity, source_entity, role in _stream(derived):
+        yield "wasDerivedFrom", f"_:d{row_id}", {
+            "prov:generatedEntity": entity,
+            "prov:usedEntity": source_entity,
+            "prov:role": role,
+        }
+
+    informant = ACTIVITY.alias("informant")
+    informed = (
+        select(
+            INFORMED.c.id,
+            _activity_label(ACTIVITY),
+            _activity_label(informant),
+        )
+        .select_from(
+            INFORMED.join(ACTIVITY, ACTIVITY.c.id == INFORMED.c.informed_id).join(
+                informant, informant.c.id == INFORMED.c.informant_id
+            )
+        )
+        .order_by(INFORMED.c.id)
+    )
+    if activity_filter is not None:
+        informed = informed.where(or_(activity_filter, informant.c.id.in_(scope)))
+    for row_id, informed_activity, informant_activity in _stream(informed):
+        yield "wasInformedBy", f"_:i{row_id}", {
+            "prov:informed": informed_activity,
+            "prov:informant": informant_activity,
+        }
+
+
+def export_prov_json(activity_ids=None) -> Iterator[str]:
+    """
+    流式导出PROV-JSON文档
+
+    Args:
+        activity_ids: 可选的活动ID子查询，限定导出范围
+
+    Yields:
+        JSON文本片段，依次拼接即为完整文档
+    """
+    yield '{"prefix": ' + json.dumps(PREFIXES, ensure_ascii=False)
+    section = None
+    for record_section, record_id, attrs in iter_prov_records(activity_ids):
+        attrs = {key: value for key, value in attrs.items() if value is not None}
+        if record_section != section:
+            yield "}" if section is not None else ""
+            yield f', "{record_section}": {{'
+            section = record_section
+        else:
+            yield ", "
+        yield json.dumps(record_id) + ": " + json.dumps(attrs, ensure_ascii=False)
+    if section is not None:
+        yield "}"
+    yield "}\n"
+
+
+def _provn_value(value) -> str:
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    return f'"{value}"'
+
+
+def export_prov_n(activity_ids=None) -> Iterator[str]:
+    """
+    流式导出PROV-N文本
+
+    Args:
+        activity_ids: 可选的活动ID子查询，限定导出范围
+
+    Yields:
+        PROV-N文本行
+    """
+    yield "document\n"
+    for name, uri in PREFIXES.items():
+        yield f"  prefix {name} <{uri}>\n"
+    for section, record_id, attrs in iter_prov_records(activity_ids):
+        if section == "entity":
+            args = [record_id]
+        elif section == "activity":
+            args = [
+                record_id,
+                attrs.pop("prov:startTime") or "-",
+                attrs.pop("prov:endTime") or "-",
+            ]
+        elif section == "used":
+            args = [
+                f"{record_id}; {attrs.pop('prov:activity')}",
+                attrs.pop("prov:entity"),
+                attrs.pop("prov:time") or "-",
+            ]
+        elif section == "wasGeneratedBy":
+            args = [
+                f"{record_id}; {attrs.pop('prov:entity')}",
+                attrs.pop("prov:activity"),
+                "-",
+            ]
+        elif section == "wasDerivedFrom":
+            args = [
+                f"{record_id}; {attrs.pop('prov:generatedEntity')}",
+                attrs.pop("prov:usedEntity"),
+            ]
+        else:
+            args = [
+                f"{record_id}; {attrs.pop('prov:informed')}",
+                attrs.pop("prov:informant"),
+            ]
+        extra = ", ".join(
+            f"{key}={_provn_value(value)}"
+            for key, value in attrs.items()
+            if value is not None
+        )
+        if extra:
+            args.append(f"[{extra}]")
+        yield f"  {section}({', '.join(args)})\n"
+    yield "endDocument\n"
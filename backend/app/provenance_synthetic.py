@@ -0,0 +1,362 @@
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func, insert, select, text
+
+from app.models import (
+    Activity,
+    ActivityDescription,
+    Agent,
+    DatasetEntity,
+    Entity,
+    Parameter,
+    Used,
+    ValueEntity,
+    WasAssociatedWith,
+    WasAttributedTo,
+    WasConfiguredBy,
+    WasGeneratedBy,
+    WasInformedBy,
+    db,
+)
+
+# 预分配ID的表（写入顺序即外键依赖顺序）
+TABLES = [
+    ActivityDescription.__table__,
+    Agent.__table__,
+    Entity.__table__,
+    DatasetEntity.__table__,
+    ValueEntity.__table__,
+    Parameter.__table__,
+    Activity.__table__,
+    Used.__table__,
+    WasGeneratedBy.__table__,
+    WasInformedBy.__table__,
+    WasAssociatedWith.__table__,
+    WasAttributedTo.__table__,
+    WasConfiguredBy.__table__,
+]
+
+# 子类表的ID与实体表共用，不单独分配
+SHARED_ID_TABLES = {DatasetEntity.__table__.name, ValueEntity.__table__.name}
+
+AGENT_TYPES = ("SoftwareAgent", "Person", "Organization")
+
+
+@dataclass
+class SyntheticSpec:
+    """
+    合成溯源数据的规模参数
+
+    每个观测：fan_in 个原始帧 -> depth 个串联处理步骤，每步使用上一步全部产物、
+    若干共享定标实体和该步骤的参数值实体，生成 fan_out 个产物。
+    """
+
+    observations: int = 1000
+    depth: int = 4
+    fan_in: int = 4  # 每个观测的原始帧数
+    fan_out: int = 2  # 每个处理步骤的产物数
+    calibrations: int = 100  # 共享定标实体池大小
+    calibrations_per_step: int = 2
+    parameters_per_step: int = 2
+    agents: int = 20
+    cycle_ratio: float = 0.01  # 末步骤反向通知首步骤（重处理环）的观测比例
+    batch_size: int = 2000  # 每个事务写入的观测数
+    seed: int = 0
+
+    @property
+    def nodes_per_observation(self) -> int:
+        return self.fan_in + self.depth * (self.fan_out + 1)
+
+    @property
+    def total_nodes(self) -> int:
+        """实体与活动总数（不含共享的定标、参数实体）"""
+        return self.observations * self.nodes_per_observation
+
+
+class _IdAllocator:
+    """从各表当前最大ID之后连续分配ID，写入时显式指定主键，无需RETURNING"""
+
+    def __init__(self):
+        self.next_ids = {
+            table.name: (db.session.execute(select(func.max(table.c.id))).scalar() or 0)
+            + 1
+            for table in TABLES
+            if table.name not in SHARED_ID_TABLES
+        }
+
+    def take(self, table, count: int = 1) -> range:
+        start = self.next_ids[table.name]
+        self.next_ids[table.name] = start + count
+        return range(start, start + count)
+
+
+def _write(rows: Dict[str, List[Dict]]) -> None:
+    for table in TABLES:
+        if rows.get(table.name):
+            db.session.execute(insert(table), rows[table.name])
+
+
+def _sync_sequences() -> None:
+    """PostgreSQL下显式写入主键不会推进序列，写完后同步到当前最大ID"""
+    if db.engine.dialect.name != "postgresql":
+        return
+    for table in TABLES:
+        if table.name in SHARED_ID_TABLES:
+            continue
+        db.session.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table.name}), 1))"
+            )
+        )
+    db.session.commit()
+
+
+def generate_provenance(
+    spec: SyntheticSpec,
+    start_time: Optional[datetime] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, int]:
+    """
+    按规模参数批量生成巡天规模的合成溯源数据
+
+    ID在客户端连续分配，各表按批 executemany 写入，每 batch_size 个观测提交一次；
+    不经过ORM对象和 INSERT ... RETURNING，适合生成千万级节点。生成结果只由
+    spec（含随机种子）决定，可复现。写入期间不应有其他写入者。
+
+    Args:
+        spec: 规模参数
+        start_time: 第一个观测的时间，默认 2024-01-01
+        progress: 每提交一批后回调 (已完成观测数, 总观测数)
+
+    Returns:
+        各表写入的行数
+    """
+    rng = random.Random(spec.seed)
+    ids = _IdAllocator()
+    start_time = start_time or datetime(2024, 1, 1)
+    counts: Dict[str, int] = dict.fromkeys((table.name for table in TABLES), 0)
+
+    def flush(rows: Dict[str, List[Dict]]) -> None:
+        _write(rows)
+        db.session.commit()
+        for name, table_rows in rows.items():
+            counts[name] += len(table_rows)
+
+    # 共享数据：步骤描述、代理、定标实体、参数
+    rows: Dict[str, List[Dict]] = {table.name: [] for table in TABLES}
+    step_descriptions = list(ids.take(ActivityDescription.__table__, spec.depth))
+    for step, description_id in enumerate(step_descriptions):
+        rows["activity_description"].append(
+            {
+                "id": description_id,
+                "name": f"step{step}",
+                "version": "1.0",
+                "type": "reduction",
+            }
+        )
+    agent_ids = list(ids.take(Agent.__table__, spec.agents))
+    for index, agent_id in enumerate(agent_ids):
+        rows["agent"].append(
+            {
+                "id": agent_id,
+                "name": f"agent{index}",
+                "type": AGENT_TYPES[index % len(AGENT_TYPES)],
+            }
+        )
+    calibration_ids = list(ids.take(Entity.__table__, spec.calibrations))
+    for index, entity_id in enumerate(calibration_ids):
+        rows["entity"].append(
+            {
+                "id": entity_id,
+                "name": f"calib{index}",
+                "location": f"/survey/calib/calib{index}.fits",
+                "generated_at_time": start_time,
+                "type": "dataset",
+            }
+        )
+        rows["dataset_entity"].append({"id": entity_id})
+    step_parameters: List[List[tuple]] = []
+    for step in range(spec.depth):
+        parameters = []
+        value_ids = ids.take(Entity.__table__, spec.parameters_per_step)
+        parameter_ids = ids.take(Parameter.__table__, spec.parameters_per_step)
+        for index, (value_id, parameter_id) in enumerate(zip(value_ids, parameter_ids)):
+            value = str(rng.randint(1, 100))
+            rows["entity"].append(
+                {
+                    "id": value_id,
+                    "name": f"step{step}_param{index}",
+                    "location": None,
+                    "generated_at_time": start_time,
+                    "type": "value",
+                }
+            )
+            rows["value_entity"].append({"id": value_id, "value": value})
+            rows["parameter"].append(
+                {
+                    "id": parameter_id,
+                    "name": f"param{index}",
+                    "value": value,
+                    "value_entity_id": value_id,
+                }
+            )
+            parameters.append((value_id, parameter_id))
+        step_parameters.append(parameters)
+    flush(rows)
+
+    done = 0
+    while done < spec.observations:
+        batch = min(spec.batch_size, spec.observations - done)
+        rows = {table.name: [] for table in TABLES}
+        for observation in range(done, done + batch):
+            _generate_observation(
+                spec,
+                rng,
+                ids,
+                rows,
+                observation,
+                start_time,
+                step_descriptions,
+                agent_ids,
+                calibration_ids,
+                step_parameters,
+            )
+        flush(rows)
+        done += batch
+        if progress:
+            progress(done, spec.observations)
+
+    _sync_sequences()
+    return counts
+
+
+def _generate_observation(
+    spec: SyntheticSpec,
+    rng: random.Random,
+    ids: _IdAllocator,
+    rows: Dict[str, List[Dict]],
+    observation: int,
+    start_time: datetime,
+    step_descriptions: List[int],
+    agent_ids: List[int],
+    calibration_ids: List[int],
+    step_parameters: List[List[tuple]],
+) -> None:
+    """生成一个观测的原始帧、处理链及其关系"""
+    at = start_time + timedelta(minutes=observation)
+    inputs = list(ids.take(Entity.__table__, spec.fan_in))
+    for index, entity_id in enumerate(inputs):
+        rows["entity"].append(
+            {
+                "id": entity_id,
+                "name": f"obs{observation}_raw{index}",
+                "location": f"/survey/obs{observation}/raw{index}.fits",
+                "generated_at_time": at,
+                "type": "dataset",
+            }
+        )
+        rows["dataset_entity"].append({"id": entity_id})
+
+    activities = []
+    for step in range(spec.depth):
+        activity_id = ids.take(Activity.__table__)[0]
+        step_start = at + timedelta(seconds=10 * step)
+        step_end = step_start + timedelta(seconds=10)
+        rows["activity"].append(
+            {
+                "id": activity_id,
+                "name": f"step{step}",
+                "start_time": step_start,
+                "end_time": step_end,
+                "activity_description_id": step_descriptions[step],
+            }
+        )
+        used = [(entity_id, "input") for entity_id in inputs]
+        used += [
+            (entity_id, "calibration")
+            for entity_id in rng.sample(
+                calibration_ids, min(spec.calibrations_per_step, len(calibration_ids))
+            )
+        ]
+        used += [(value_id, "parameter") for value_id, _ in step_parameters[step]]
+        for entity_id, role in used:
+            rows["used"].append(
+                {
+                    "id": ids.take(Used.__table__)[0],
+                    "activity_id": activity_id,
+                    "entity_id": entity_id,
+                    "role": role,
+                    "time": step_start,
+                }
+            )
+        for _, parameter_id in step_parameters[step]:
+            rows["was_configured_by"].append(
+                {
+                    "id": ids.take(WasConfiguredBy.__table__)[0],
+                    "activity_id": activity_id,
+                    "artefact_type": "Parameter",
+                    "parameter_id": parameter_id,
+                }
+            )
+        rows["was_associated_with"].append(
+            {
+                "id": ids.take(WasAssociatedWith.__table__)[0],
+                "activity_id": activity_id,
+                "agent_id": rng.choice(agent_ids),
+                "role": "operator",
+            }
+        )
+        if activities:
+            rows["was_informed_by"].append(
+                {
+                    "id": ids.take(WasInformedBy.__table__)[0],
+                    "informed_id": activity_id,
+                    "informant_id": activities[-1],
+                }
+            )
+        activities.append(activity_id)
+
+        outputs = list(ids.take(Entity.__table__, spec.fan_out))
+        for index, entity_id in enumerate(outputs):
+            rows["entity"].append(
+                {
+                    "id": entity_id,
+                    "name": f"obs{observation}_step{step}_out{index}",
+                    "location": f"/survey/obs{observation}/step{step}_{index}.fits",
+                    "generated_at_time": step_end,
+                    "type": "dataset",
+                }
+            )
+            rows["dataset_entity"].append({"id": entity_id})
+            rows["was_generated_by"].append(
+                {
+                    "id": ids.take(WasGeneratedBy.__table__)[0],
+                    "entity_id": entity_id,
+                    "activity_id": activity_id,
+                    "role": "output",
+                }
+            )
+        inputs = outputs
+
+    for entity_id in inputs:
+        rows["was_attributed_to"].append(
+            {
+                "id": ids.take(WasAttributedTo.__table__)[0],
+                "entity_id": entity_id,
+                "agent_id": rng.choice(agent_ids),
+                "role": "author",
+            }
+        )
+    # 重处理：末步骤反向通知首步骤，活动依赖图中形成环
+    if len(activities) > 1 and rng.random() < spec.cycle_ratio:
+        rows["was_informed_by"].append(
+            {
+                "id": ids.take(WasInformedBy.__table__)[0],
+                "informed_id": activities[0],
+                "informant_id": activities[-1],
+            }
+        )
@@ -0,0 +1,156 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.models import db
+from app.provenance_ingest import ingest_document
+
+logger = logging.getLogger(__name__)
+
+
+class WriterBusy(RuntimeError):
+    """写入队列已满（背压），调用方应稍后重试"""
+
+
+@dataclass
+class _Event:
+    document: Dict
+    future: Future = field(default_factory=Future)
+
+
+class ProvenanceWriter:
+    """
+    溯源后台写入器（组提交）
+
+    多个调用方提交的溯源文档进入有界队列，后台线程将其合并为一个事务：
+    每个文档在独立的SAVEPOINT中写入（单个文档出错不影响同批其他文档），
+    整批只提交一次。提交成功后各自的Future返回 ingest_document 的结果，
+    作为持久化确认。
+
+    配置项（app.config）：
+        PROVENANCE_WRITER_BATCH_SIZE: 每次组提交的最大文档数
+        PROVENANCE_WRITER_MAX_LATENCY: 批次中首个文档的最长等待时间（秒）
+        PROVENANCE_WRITER_QUEUE_SIZE: 队列容量，满时 submit 阻塞或抛出 WriterBusy
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.batch_size = 500
+        self.max_latency = 0.05
+        self.queue_size = 10000
+        self.batches_committed = 0
+        self.events_committed = 0
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.batch_size = app.config.setdefault("PROVENANCE_WRITER_BATCH_SIZE", 500)
+        self.max_latency = app.config.setdefault("PROVENANCE_WRITER_MAX_LATENCY", 0.05)
+        self.queue_size = app.config.setdefault("PROVENANCE_WRITER_QUEUE_SIZE", 10000)
+        self._queue = queue.Queue(maxsize=self.queue_size)
+
+    def start(self) -> None:
+        """启动后台写入线程（首次 submit 时自动调用）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="provenance-writer", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, document: Dict, timeout: Optional[float] = None) -> Future:
+        """
+        提交溯源文档
+
+        Args:
+            document: ingest_document 格式的溯源文档
+            timeout: 队列满时最长等待秒数；None表示一直等待，0表示不等待
+
+        Returns:
+            组提交成功后返回写入结果的Future
+
+        Raises:
+            WriterBusy: 等待超时后队列仍满
+        """
+        if self._queue is None:
+            raise RuntimeError("ProvenanceWriter 未初始化，请先调用 init_app")
+        self.start()
+        event = _Event(document)
+        try:
+            self._queue.put(event, block=timeout != 0, timeout=timeout or None)
+        except queue.Full:
+            raise WriterBusy("溯源写入队列已满")
+        return event.future
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """等待已提交的文档全部写入"""
+        self.submit({}, timeout=timeout).result(timeout=timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """写完队列中剩余的文档后停止后台线程"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _collect_batch(self) -> List[_Event]:
+        """取出一批事件：达到批大小或首个事件等待超过最大延迟即返回"""
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        with self.app.app_context():
+            while not (self._stopping.is_set() and self._queue.empty()):
+                batch = self._collect_batch()
+                if batch:
+                    self._write_batch(batch)
+            db.session.remove()
+
+    def _write_batch(self, batch: List[_Event]) -> None:
+        results = []
+        for event in batch:
+            try:
+                with db.session.begin_nested():
+                    results.append((event, ingest_document(event.document, False)))
+            except Exception as e:  # 单个文档失败只影响自己的Future
+                event.future.set_exception(e)
+        try:
+            db.session.commit()
+        except Exception as e:
+            logger.exception("溯源组提交失败")
+            db.session.rollback()
+            for event, _ in results:
+                event.future.set_exception(e)
+            return
+        self.batches_committed += 1
+        self.events_committed += len(results)
+        for event, result in results:
+            event.future.set_result(result)
+
+
+writer = ProvenanceWriter()
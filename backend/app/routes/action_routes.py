@@ -1,15 +1,37 @@
-from apiflask import APIBlueprint
+from apiflask import APIBlueprint, abort
+from sqlalchemy.orm import undefer
 
 from app.models import Action
-from schemas import ActionSchema
+from app.sql_metrics import query_budget
+from app.workflow_engine import engine as workflow_engine
+from schemas import ActionSchema, ActionSpawnResponse, ActionSpawnSchema
 
 # 创建流水线节点蓝图
 bp = APIBlueprint("actions", __name__, tag="流水线节点")
 
 
 @bp.get("/<int:id>/")
+@query_budget(1)
 @bp.output(ActionSchema)
 def get_action(id):
     """获取流水线节点信息 - 根据ID获取流水线节点的详细信息，包括日志等"""
-    action = Action.query.get_or_404(id)
+    action = Action.query.options(
+        undefer(Action.config), undefer(Action.logs)
+    ).get_or_404(id)
     return action
+
+
+@bp.post("/<int:id>/spawn")
+@query_budget(1)
+@bp.input(ActionSpawnSchema)
+@bp.output(ActionSpawnResponse, 202)
+def spawn_actions(id, json_data):
+    """动态产生节点 - 运行中的节点提交新节点规格，由执行引擎分批插入并立即调度"""
+    action = Action.query.get_or_404(id)
+    try:
+        accepted = workflow_engine.spawn(
+            action.workflow_id, action.id, json_data["actions"]
+        )
+    except RuntimeError as e:
+        abort(409, str(e))
+    return {"accepted": accepted}, 202
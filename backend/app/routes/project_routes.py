@@ -2,6 +2,7 @@ from apiflask import APIBlueprint
 
 import app.models as models
 from app.models import Project
+from app.sql_metrics import query_budget
 from schemas import ProjectListResponse, ProjectSchema
 
 # 创建项目蓝图
@@ -9,10 +10,13 @@ bp = APIBlueprint("projects", __name__, tag="项目管理")
 
 
 @bp.get("/")
+@query_budget(1)
 @bp.output(ProjectListResponse)
 def get_projects():
     """获取项目列表 - 获取所有项目的列表信息"""
-    projects = Project.query.all()
+    projects = models.db.session.query(
+        Project.id, Project.name, Project.description
+    ).all()
     return {"projects": projects, "total": len(projects)}
 
 
@@ -28,6 +32,7 @@ def create_project(json_data):
 
 
 @bp.get("/<int:id>/")
+@query_budget(2)
 @bp.output(ProjectSchema)
 def get_project(id):
     """获取单个项目 - 根据ID获取单个项目的详细信息，包含流水线配置列表"""
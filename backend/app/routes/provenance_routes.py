@@ -1,6 +1,8 @@
 from datetime import datetime
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
 from app.models import (
     Activity,
@@ -15,8 +17,22 @@ from app.models import (
     WasDerivedFrom,
     WasGeneratedBy,
     WasInformedBy,
+    db,
 )
-from app.provenance_graph import ID_BIAS, ProvenanceGraph
+from app.provenance_graph import (
+    ID_BIAS,
+    ProvenanceGraph,
+    derivation_sources,
+    derivation_targets,
+    entity_details,
+    load_activities,
+    load_entities,
+)
+from app.provenance_ingest import IngestError, ingest_document
+from app.provenance_prov import export_prov_json, export_prov_n, import_prov_json
+from app.provenance_writer import WriterBusy
+from app.provenance_writer import writer as provenance_writer
+from app.sql_metrics import query_budget
 
 bp = Blueprint("provenance", __name__, url_prefix="/api/provenance")
 
@@ -175,13 +191,108 @@ def get_provenance_graph():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@bp.route("/entity/<entity_id>", methods=["GET"])
+@bp.route("/bulk", methods=["POST"])
+def bulk_ingest_provenance():
+    """
+    批量导入溯源文档（实体、活动及关系），单事务写入
+    参数 group_commit=1 时交给后台写入器与其他请求合并提交
+    """
+    try:
+        document = request.get_json(silent=True)
+        if not isinstance(document, dict):
+            return jsonify({"success": False, "error": "请求体必须是JSON对象"}), 400
+
+        if request.args.get("group_commit", type=int):
+            # 与其他请求合并提交，提交完成后返回
+            result = provenance_writer.submit(document, timeout=5).result(timeout=30)
+        else:
+            result = ingest_document(document)
+        return jsonify({"success": True, "data": result}), 201
+
+    except WriterBusy as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    except IngestError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except IntegrityError as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": str(e.orig)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@bp.route("/import", methods=["POST"])
+def import_provenance():
+    """
+    流式导入PROV-JSON文档，请求体按块读取并分批写入
+    参数 batch_size 指定每批（每个事务）的记录数
+    """
+    try:
+        batch_size = request.args.get("batch_size", 5000, type=int)
+        counts = import_prov_json(request.stream, batch_size=max(1, batch_size))
+        return jsonify({"success": True, "data": counts}), 201
+
+    except IngestError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except IntegrityError as e:
+        return jsonify({"success": False, "error": str(e.orig)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@bp.route("/export", methods=["GET"])
+def export_provenance():
+    """
+    流式导出溯源数据
+    参数 format 为 json（PROV-JSON，默认）或 provn（PROV-N）；
+    start_time/end_time 按活动开始时间限定导出范围
+    """
+    export_format = request.args.get("format", "json")
+    if export_format not in ("json", "provn"):
+        return jsonify({"success": False, "error": "format 必须是 json 或 provn"}), 400
+
+    activity_ids = None
+    start_time = request.args.get("start_time")
+    end_time = request.args.get("end_time")
+    if start_time or end_time:
+        try:
+            activity_ids = select(Activity.id)
+            if start_time:
+                activity_ids = activity_ids.where(
+                    Activity.start_time >= datetime.fromisoformat(start_time)
+                )
+            if end_time:
+                activity_ids = activity_ids.where(
+                    Activity.start_time < datetime.fromisoformat(end_time)
+                )
+        except ValueError:
+            return jsonify({"success": False, "error": "无效的时间格式"}), 400
+
+    if export_format == "provn":
+        chunks, mimetype, suffix = (
+            export_prov_n(activity_ids),
+            "text/provenance-notation",
+            "provn",
+        )
+    else:
+        chunks, mimetype, suffix = (
+            export_prov_json(activity_ids),
+            "application/json",
+            "json",
+        )
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=provenance.{suffix}"},
+    )
+
+
+@bp.route("/entity/<int:entity_id>", methods=["GET"])
 def get_entity_provenance(entity_id):
     """
     获取特定实体的溯源信息
     """
     try:
-        entity: Entity = Entity.query.get(entity_id)
+        entity: Entity = load_entities([entity_id]).get(entity_id)
         if not entity:
             return jsonify({"success": False, "error": "实体不存在"}), 404
 
@@ -217,12 +328,14 @@ def get_entity_provenance(entity_id):
                 }
             )
 
-        # 使用属性获取衍生自的实体
+        # 衍生关系（显式关系及经由活动隐含的关系），相关实体批量加载
+        sources = derivation_sources(entity.id)
+        targets = derivation_targets(entity.id)
+        related = load_entities(related_id for related_id, _, _ in sources + targets)
+
         source_entities = []
-        for source_entity in entity.derived_from:
-            derived_relation = WasDerivedFrom.query.filter_by(
-                entity_id=entity_id, source_entity_id=source_entity.id
-            ).first()
+        for source_id, role, implied in sources:
+            source_entity = related[source_id]
             source_entities.append(
                 {
                     "entity": {
@@ -230,16 +343,14 @@ def get_entity_provenance(entity_id):
                         "name": source_entity.name,
                         "location": source_entity.location,
                     },
-                    "role": derived_relation.role if derived_relation else None,
+                    "role": role,
+                    "implied": implied,
                 }
             )
 
-        # 使用属性获取衍生出的实体
         target_entities = []
-        for target_entity in entity.derived:
-            derived_relation = WasDerivedFrom.query.filter_by(
-                entity_id=target_entity.id, source_entity_id=entity_id
-            ).first()
+        for target_id, role, implied in targets:
+            target_entity = related[target_id]
             target_entities.append(
                 {
                     "entity": {
@@ -247,7 +358,8 @@ def get_entity_provenance(entity_id):
                         "name": target_entity.name,
                         "location": target_entity.location,
                     },
-                    "role": derived_relation.role if derived_relation else None,
+                    "role": role,
+                    "implied": implied,
                 }
             )
 
@@ -276,13 +388,7 @@ def get_entity_provenance(entity_id):
                     "entity": {
                         "id": entity.id,
                         "name": entity.name,
-                        "location": entity.location,
-                        "generated_at_time": (
-                            entity.generated_at_time.isoformat()
-                            if entity.generated_at_time
-                            else None
-                        ),
-                        "comment": entity.comment,
+                        **entity_details(entity),
                     },
                     "generated_by": {
                         "activity": (
@@ -485,6 +591,7 @@ def get_activity_provenance(activity_id):
 
 
 @bp.route("/search", methods=["GET"])
+@query_budget(3)
 def search_provenance():
     """
     搜索溯源信息
@@ -549,6 +656,7 @@ def search_provenance():
 
 
 @bp.route("/timeline", methods=["GET"])
+@query_budget(3)
 def get_provenance_timeline():
     """
     获取溯源时间线
@@ -638,6 +746,17 @@ def get_entity_provenance_graph(entity_id):
             },
         }
 
+        # 批量加载节点对象（含实体子类字段），避免逐个节点查询
+        all_nodes = [
+            node for nodes in lineage_data["nodes_by_level"].values() for node in nodes
+        ]
+        entity_objs = load_entities(
+            node["id"] for node in all_nodes if node["type"] == "entity"
+        )
+        activity_objs = load_activities(
+            node["id"] for node in all_nodes if node["type"] == "activity"
+        )
+
         # 添加节点详细信息
         for level, nodes in lineage_data["nodes_by_level"].items():
             for node in nodes:
@@ -646,7 +765,7 @@ def get_entity_provenance_graph(entity_id):
 
                 # 根据节点类型获取详细信息
                 if node_type == "entity":
-                    entity_obj = Entity.query.get(node_id)
+                    entity_obj = entity_objs.get(node_id)
                     if entity_obj:
                         node_detail = {
                             "graph_id": node_id,  # 用于图的连接
@@ -654,20 +773,12 @@ def get_entity_provenance_graph(entity_id):
                             "name": node["name"],
                             "type": node_type,
                             "level": level,
-                            "details": {
-                                "location": entity_obj.location,
-                                "generated_at_time": (
-                                    entity_obj.generated_at_time.isoformat()
-                                    if entity_obj.generated_at_time
-                                    else None
-                                ),
-                                "comment": entity_obj.comment,
-                            },
+                            "details": entity_details(entity_obj),
                         }
                 elif node_type == "activity":
                     # Activity ID需要减去偏移量来获取原始ID
                     original_activity_id = node_id
-                    activity_obj = Activity.query.get(original_activity_id)
+                    activity_obj = activity_objs.get(original_activity_id)
                     if activity_obj:
                         node_detail = {
                             "graph_id": node_id + ID_BIAS,  # 用于图的连接（带偏移量）
@@ -708,6 +819,7 @@ def get_entity_provenance_graph(entity_id):
                 "target": str(edge["target"]),
                 "type": edge["type"],
                 "role": edge["role"],
+                "implied": edge["implied"],
             }
             formatted_data["edges"].append(formatted_edge)
 
@@ -750,6 +862,17 @@ def get_activity_provenance_graph(activity_id):
             },
         }
 
+        # 批量加载节点对象（含实体子类字段），避免逐个节点查询
+        all_nodes = [
+            node for nodes in workflow_data["nodes_by_level"].values() for node in nodes
+        ]
+        entity_objs = load_entities(
+            node["id"] for node in all_nodes if node["type"] == "entity"
+        )
+        activity_objs = load_activities(
+            node["id"] for node in all_nodes if node["type"] == "activity"
+        )
+
         # 添加节点详细信息
         for level, nodes in workflow_data["nodes_by_level"].items():
             for node in nodes:
@@ -758,7 +881,7 @@ def get_activity_provenance_graph(activity_id):
 
                 # 根据节点类型获取详细信息
                 if node_type == "entity":
-                    entity_obj = Entity.query.get(node_id)
+                    entity_obj = entity_objs.get(node_id)
                     if entity_obj:
                         node_detail = {
                             "graph_id": node_id,  # 用于图的连接
@@ -766,23 +889,15 @@ def get_activity_provenance_graph(activity_id):
                             "name": node["name"],
                             "type": node_type,
                             "level": level,
-                            "details": {
-                                "location": entity_obj.location,
-                                "generated_at_time": (
-                                    entity_obj.generated_at_time.isoformat()
-                                    if entity_obj.generated_at_time
-                                    else None
-                                ),
-                                "comment": entity_obj.comment,
-                            },
+                            "details": entity_details(entity_obj),
                         }
                 elif node_type == "activity":
-                    # Activity ID需要减去偏移量来获取原始ID
-                    original_activity_id = node_id - ID_BIAS
-                    activity_obj = Activity.query.get(original_activity_id)
+                    # 节点ID为原始Activity ID，图中连接使用偏移后的ID
+                    original_activity_id = node_id
+                    activity_obj = activity_objs.get(original_activity_id)
                     if activity_obj:
                         node_detail = {
-                            "graph_id": node_id,  # 用于图的连接（带偏移量）
+                            "graph_id": node_id + ID_BIAS,  # 用于图的连接（带偏移量）
                             "id": original_activity_id,  # 用于API检索详细信息（原始ID）
                             "name": node["name"],
                             "type": node_type,
@@ -820,6 +935,7 @@ def get_activity_provenance_graph(activity_id):
                 "target": str(edge["target"]),
                 "type": edge["type"],
                 "role": edge["role"],
+                "implied": edge["implied"],
             }
             formatted_data["edges"].append(formatted_edge)
 
@@ -830,6 +946,7 @@ def get_activity_provenance_graph(activity_id):
 
 
 @bp.route("/graph-summary", methods=["GET"])
+@query_budget(12)
 def get_provenance_graph_summary():
     """
     获取来源图的统计摘要信息
@@ -1,29 +1,167 @@
 from datetime import datetime
 
-from apiflask import APIBlueprint
+from apiflask import APIBlueprint, abort
 
 import app.models as models
+from app.critical_path import analysis_cache
+from app.executor_backends import executors
 from app.models import Action, Workflow
+from app.pagination import count_rows, expand_fields, keyset_paginate
+from app.sql_metrics import query_budget
+from app.status_updates import (
+    TERMINAL_STATUSES,
+    Transition,
+    apply_transitions,
+    terminate_pending_actions,
+)
+from app.workflow_engine import engine as workflow_engine
+from app.workflow_retry import apply_retry, plan_retry
+from app.workflow_scheduler import queue_depth
+from app.workflow_stats import launch_count, query_rollups, record_status_change
 from schemas import (
     ActionListResponse,
+    ActionQuerySchema,
+    CriticalPathSchema,
     LogResponse,
+    RetryPlanSchema,
+    RetryQuerySchema,
+    StatusUpdateResponse,
+    StatusUpdateSchema,
+    TodayCountQuerySchema,
+    TodayCountResponse,
     WorkflowListResponse,
+    WorkflowQuerySchema,
+    WorkflowQueueResponse,
     WorkflowSchema,
+    WorkflowStatsQuerySchema,
+    WorkflowStatsResponse,
 )
 
 # 创建流水线实例蓝图
 bp = APIBlueprint("workflows", __name__, tag="流水线实例")
 
+# 列表摘要列；节点的大字段需通过 ?fields= 显式展开
+WORKFLOW_SUMMARY_COLUMNS = (
+    Workflow.id,
+    Workflow.name,
+    Workflow.status,
+    Workflow.template_id,
+    Workflow.project_id,
+    Workflow.started_at,
+    Workflow.completed_at,
+    Workflow.created_at,
+    Workflow.updated_at,
+)
+ACTION_SUMMARY_COLUMNS = (
+    Action.id,
+    Action.name,
+    Action.type,
+    Action.status,
+    Action.workflow_id,
+    Action.started_at,
+    Action.completed_at,
+    Action.exit_code,
+    Action.created_at,
+    Action.updated_at,
+)
+ACTION_EXPANDABLE_FIELDS = ("config", "logs")
+
 
 @bp.get("/")
+@query_budget(2)
+@bp.input(WorkflowQuerySchema, location="query")
 @bp.output(WorkflowListResponse)
-def get_workflows():
-    """获取流水线实例列表 - 获取所有流水线实例的列表"""
-    workflows = Workflow.query.all()
-    return {"workflows": workflows, "total": len(workflows)}
+def get_workflows(query_data):
+    """获取流水线实例列表 - 按状态、项目、配置和创建时间过滤，键集分页"""
+    query = models.db.session.query(*WORKFLOW_SUMMARY_COLUMNS)
+    if "status" in query_data:
+        query = query.filter(Workflow.status == query_data["status"])
+    if "project_id" in query_data:
+        query = query.filter(Workflow.project_id == query_data["project_id"])
+    if "template_id" in query_data:
+        query = query.filter(Workflow.template_id == query_data["template_id"])
+    if "created_after" in query_data:
+        query = query.filter(Workflow.created_at >= query_data["created_after"])
+    if "created_before" in query_data:
+        query = query.filter(Workflow.created_at < query_data["created_before"])
+
+    workflows, next_cursor = keyset_paginate(
+        query,
+        Workflow,
+        sort=query_data["sort"],
+        order=query_data["order"],
+        cursor=query_data.get("cursor"),
+        limit=query_data["limit"],
+    )
+    return {
+        "workflows": workflows,
+        "total": count_rows(query, Workflow, query_data["count"]),
+        "next_cursor": next_cursor,
+    }
+
+
+@bp.get("/stats")
+@query_budget(1)
+@bp.input(WorkflowStatsQuerySchema, location="query")
+@bp.output(WorkflowStatsResponse)
+def get_workflow_stats(query_data):
+    """流水线统计 - 按小时/天返回各状态的流水线数量，数据来自统计汇总表"""
+    buckets = query_rollups(
+        query_data["granularity"],
+        query_data["start"],
+        query_data["end"],
+        project_id=query_data.get("project_id"),
+        template_id=query_data.get("template_id"),
+        status=query_data.get("status"),
+    )
+    return {"granularity": query_data["granularity"], "buckets": buckets}
+
+
+@bp.get("/stats/today")
+@query_budget(1)
+@bp.input(TodayCountQuerySchema, location="query")
+@bp.output(TodayCountResponse)
+def get_today_workflow_count(query_data):
+    """流水线当日启动量 - 统计今天启动（含重试）的流水线数量"""
+    today = datetime.utcnow()
+    return {
+        "date": today.date(),
+        "count": launch_count(today, project_id=query_data.get("project_id")),
+    }
+
+
+@bp.post("/status")
+@bp.input(StatusUpdateSchema)
+@bp.output(StatusUpdateResponse)
+def update_statuses(json_data):
+    """
+    批量上报状态 - 执行器批量上报节点和流水线的状态变化（含时间、日志片段和退出码）
+
+    在一个事务中写入；状态只能按 pending → running → completed/failed/terminated
+    前进，不存在或不能前进的对象在 skipped 中返回。
+    """
+    actions = [Transition(**item) for item in json_data["actions"]]
+    workflows = [Transition(**item) for item in json_data["workflows"]]
+    applied = apply_transitions(actions, workflows)
+    return {
+        kind: {
+            "applied": len(applied[kind]),
+            "skipped": sorted({item.id for item in items} - set(applied[kind])),
+        }
+        for kind, items in (("actions", actions), ("workflows", workflows))
+    }
+
+
+@bp.get("/queue")
+@query_budget(1)
+@bp.output(WorkflowQueueResponse)
+def get_workflow_queue():
+    """执行队列 - 各项目排队与运行中的节点数，以及本进程调度器的状态"""
+    return {"projects": queue_depth(), "scheduler": workflow_engine.scheduler.stats()}
 
 
 @bp.get("/<int:id>/")
+@query_budget(1)
 @bp.output(WorkflowSchema)
 def get_workflow(id):
     """获取单个流水线实例 - 根据ID获取单个流水线实例的详细信息"""
@@ -34,51 +172,130 @@ def get_workflow(id):
 @bp.post("/<int:id>/terminate")
 @bp.output(WorkflowSchema)
 def terminate_workflow(id):
-    """终止流水线实例 - 终止指定ID的流水线实例"""
+    """
+    终止流水线实例 - 终止指定ID的流水线实例
+
+    执行后端立即停止派发新节点并向执行中的节点发送终止信号（不等待其退出），
+    尚未开始的节点在同一事务中批量标记为 terminated。已结束的流水线实例返回409。
+    """
     workflow = Workflow.query.get_or_404(id)
+    if workflow.status in TERMINAL_STATUSES:
+        abort(409, f"流水线实例已结束: {workflow.status}")
+    # 先停止派发，之后不会再有节点从 pending 变为 running
+    executors.backend.cancel(id)
+
+    now = datetime.utcnow()
     workflow.status = "terminated"
-    workflow.completed_at = datetime.utcnow()
-    workflow.updated_at = datetime.utcnow()
+    workflow.completed_at = now
+    workflow.updated_at = now
+    record_status_change(workflow, "terminated", now)
+    terminate_pending_actions(id, now)
     models.db.session.commit()
 
-    # TODO: 这里应该停止实际的流水线执行逻辑
-
     return workflow
 
 
+@bp.get("/<int:id>/critical-path")
+@query_budget(2)
+@bp.output(CriticalPathSchema)
+def get_critical_path(id):
+    """
+    关键路径分析 - 各节点的排队/执行时间、松弛时间和限制整体耗时的节点链
+
+    按已记录的节点开始/结束时间和依赖关系计算；执行中的流水线返回到目前为止的
+    结果。结果按流水线实例缓存，再次请求只加载之后有变化的节点。
+    """
+    analysis = analysis_cache.get(id)
+    if analysis is None:
+        abort(404)
+    return analysis
+
+
+@bp.get("/<int:id>/retry-plan")
+@query_budget(4)
+@bp.input(RetryQuerySchema, location="query")
+@bp.output(RetryPlanSchema)
+def get_retry_plan(id, query_data):
+    """
+    预览重试 - 列出重试时将重新执行的节点及原因，不做任何修改
+
+    failed 模式只重新执行失败、被终止或中断的节点，生成的实体已失效的已完成
+    节点，以及它们的下游；其余已完成节点复用已有输出。
+    """
+    Workflow.query.get_or_404(id)
+    return plan_retry(id, query_data["mode"])
+
+
 @bp.post("/<int:id>/retry")
+@bp.input(RetryQuerySchema, location="query")
 @bp.output(WorkflowSchema)
-def retry_workflow(id):
-    """重试流水线实例 - 重试指定ID的流水线实例"""
+def retry_workflow(id, query_data):
+    """
+    重试流水线实例 - 重试指定ID的流水线实例
+
+    默认（mode=failed）从失败处继续，只重新执行 retry-plan 预览中列出的节点；
+    mode=all 重新执行全部节点。
+    """
     workflow = Workflow.query.get_or_404(id)
+    if workflow.status == "running":
+        abort(409, "流水线实例正在执行")
+    now = datetime.utcnow()
+    apply_retry(plan_retry(id, query_data["mode"]), now)
     workflow.status = "pending"
     workflow.started_at = None
     workflow.completed_at = None
-    workflow.updated_at = datetime.utcnow()
+    workflow.updated_at = now
+    record_status_change(workflow, "pending", now)
     models.db.session.commit()
 
-    # TODO: 这里应该重新启动流水线执行逻辑
+    if workflow_engine.autostart:
+        executors.backend.submit(id)
 
     return workflow
 
 
 @bp.get("/<int:id>/logs")
+@query_budget(1)
 @bp.output(LogResponse)
 def get_workflow_logs(id):
     """获取流水线实例日志 - 获取指定ID的流水线实例的所有日志"""
-    actions = Action.query.filter_by(workflow_id=id).all()
+    actions = (
+        models.db.session.query(Action.name, Action.logs)
+        .filter(Action.workflow_id == id, Action.logs.isnot(None))
+        .order_by(Action.id)
+    )
 
     logs = []
-    for action in actions:
-        if action.logs:
-            logs.append(f"[{action.name}] {action.logs}")
+    for name, action_logs in actions:
+        if action_logs:
+            logs.append(f"[{name}] {action_logs}")
 
     return {"logs": "\n".join(logs), "workflow_id": id}
 
 
 @bp.get("/<int:id>/actions")
+@query_budget(2)
+@bp.input(ActionQuerySchema, location="query")
 @bp.output(ActionListResponse)
-def get_workflow_actions(id):
-    """获取流水线实例步骤列表 - 获取指定ID的流水线实例的所有步骤"""
-    actions = Action.query.filter_by(workflow_id=id).all()
-    return {"actions": actions, "total": len(actions)}
+def get_workflow_actions(id, query_data):
+    """获取流水线实例步骤列表 - 获取指定ID的流水线实例的步骤，键集分页"""
+    expand = expand_fields(query_data.get("expand"), ACTION_EXPANDABLE_FIELDS)
+    query = models.db.session.query(
+        *ACTION_SUMMARY_COLUMNS, *(getattr(Action, name) for name in expand)
+    ).filter(Action.workflow_id == id)
+    if "status" in query_data:
+        query = query.filter(Action.status == query_data["status"])
+
+    actions, next_cursor = keyset_paginate(
+        query,
+        Action,
+        sort=query_data["sort"],
+        order=query_data["order"],
+        cursor=query_data.get("cursor"),
+        limit=query_data["limit"],
+    )
+    return {
+        "actions": actions,
+        "total": count_rows(query, Action, query_data["count"]),
+        "next_cursor": next_cursor,
+    }
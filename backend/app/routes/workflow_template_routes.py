@@ -1,43 +1,126 @@
 from datetime import datetime
 
-from apiflask import APIBlueprint
+from apiflask import APIBlueprint, abort
 from flask import request
+from sqlalchemy.orm import undefer
 
 import app.models as models
+from app.critical_path import template_bottlenecks
+from app.executor_backends import executors
 from app.models import Workflow, WorkflowTemplate
-from schemas import WorkflowSchema, WorkflowTemplateListResponse, WorkflowTemplateSchema
+from app.pagination import expand_fields
+from app.sql_metrics import query_budget
+from app.step_cache import template_stats
+from app.template_plans import TemplateError, plan_cache
+from app.template_validation import parse_config, validate_template
+from app.workflow_engine import create_actions
+from app.workflow_engine import engine as workflow_engine
+from app.workflow_stats import record_status_change
+from schemas import (
+    BottleneckQuerySchema,
+    TemplateBottleneckSchema,
+    TemplateCacheStatsSchema,
+    TemplateValidateSchema,
+    TemplateValidationSchema,
+    WorkflowSchema,
+    WorkflowTemplateListResponse,
+    WorkflowTemplateSchema,
+)
 
 # 创建流水线配置蓝图
 bp = APIBlueprint("workflow_templates", __name__, tag="流水线配置")
 
+# 列表摘要列；大字段需通过 ?fields= 显式展开
+SUMMARY_COLUMNS = (
+    WorkflowTemplate.id,
+    WorkflowTemplate.name,
+    WorkflowTemplate.description,
+    WorkflowTemplate.project_id,
+)
+EXPANDABLE_FIELDS = ("config",)
+
 
 @bp.get("/")
+@query_budget(1)
 @bp.output(WorkflowTemplateListResponse)
 def get_workflow_templates():
-    """获取流水线配置列表 - 获取流水线配置列表，可选projectId参数"""
+    """获取流水线配置列表 - 获取流水线配置列表，可选projectId、fields参数"""
     project_id = request.args.get("projectId", type=int)
-    query = WorkflowTemplate.query
+    expand = expand_fields(request.args.get("fields"), EXPANDABLE_FIELDS)
+    query = models.db.session.query(
+        *SUMMARY_COLUMNS, *(getattr(WorkflowTemplate, name) for name in expand)
+    )
     if project_id:
-        query = query.filter_by(project_id=project_id)
+        query = query.filter(WorkflowTemplate.project_id == project_id)
 
     templates = query.all()
     return {"templates": templates, "total": len(templates)}
 
 
 @bp.get("/<int:id>/")
+@query_budget(1)
 @bp.output(WorkflowTemplateSchema)
 def get_workflow_template(id):
     """获取单个流水线配置 - 根据ID获取单个流水线配置的详细信息"""
-    template = WorkflowTemplate.query.get_or_404(id)
+    template = WorkflowTemplate.query.options(
+        undefer(WorkflowTemplate.config)
+    ).get_or_404(id)
     return template
 
 
+@bp.get("/<int:id>/cache-stats")
+@query_budget(2)
+@bp.output(TemplateCacheStatsSchema)
+def get_template_cache_stats(id):
+    """缓存命中统计 - 该流水线配置各阶段的步骤结果缓存命中与执行次数"""
+    WorkflowTemplate.query.get_or_404(id)
+    return template_stats(id)
+
+
+@bp.get("/<int:id>/bottlenecks")
+@query_budget(3)
+@bp.input(BottleneckQuerySchema, location="query")
+@bp.output(TemplateBottleneckSchema)
+def get_template_bottlenecks(id, query_data):
+    """瓶颈分析 - 汇总最近多次成功运行的关键路径，找出限制整体耗时的阶段"""
+    WorkflowTemplate.query.get_or_404(id)
+    return template_bottlenecks(id, query_data["limit"])
+
+
+@bp.post("/validate")
+@query_budget(0)
+@bp.input(TemplateValidateSchema)
+@bp.output(TemplateValidationSchema)
+def validate_workflow_template(json_data):
+    """校验流水线配置 - 返回配置（对象或JSON文本）中的全部错误，不保存，供编辑器实时检查"""
+    config = json_data["config"]
+    issues = []
+    if isinstance(config, str):
+        config, issues = parse_config(config)
+    if not issues:
+        issues = validate_template(config)
+    stages = config.get("stages") if isinstance(config, dict) else None
+    return {
+        "valid": not issues,
+        "stages": len(stages) if isinstance(stages, list) else 0,
+        "errors": issues,
+    }
+
+
+def _check_config(config) -> None:
+    """配置未通过校验时返回422，列出全部错误"""
+    issues = validate_template(config)
+    if issues:
+        abort(422, "流水线配置无效", detail={"config": [str(i) for i in issues]})
+
+
 @bp.post("/")
 @bp.input(WorkflowTemplateSchema)
 @bp.output(WorkflowTemplateSchema, 201)
-def create_workflow_template(data):
+def create_workflow_template(json_data):
     """创建流水线配置 - 创建新的流水线配置"""
-    template = WorkflowTemplate(**data)
+    _check_config(json_data.get("config"))
+    template = WorkflowTemplate(**json_data)
     models.db.session.add(template)
     models.db.session.commit()
     return template, 201
@@ -46,13 +129,16 @@ def create_workflow_template(data):
 @bp.put("/<int:id>/")
 @bp.input(WorkflowTemplateSchema)
 @bp.output(WorkflowTemplateSchema)
-def update_workflow_template(id, data):
+def update_workflow_template(id, json_data):
     """更新流水线配置 - 更新指定ID的流水线配置"""
     template = WorkflowTemplate.query.get_or_404(id)
-    for key, value in data.items():
+    if "config" in json_data:
+        _check_config(json_data["config"])
+    for key, value in json_data.items():
         setattr(template, key, value)
     template.updated_at = datetime.utcnow()
     models.db.session.commit()
+    plan_cache.invalidate(id)
     return template
 
 
@@ -62,14 +148,20 @@ def delete_workflow_template(id):
     template = WorkflowTemplate.query.get_or_404(id)
     models.db.session.delete(template)
     models.db.session.commit()
+    plan_cache.invalidate(id)
     return {"message": "流水线配置删除成功"}, 200
 
 
 @bp.post("/<int:id>/run")
 @bp.output(WorkflowSchema, 201)
 def run_workflow(id):
-    """运行流水线 - 根据流水线配置创建并运行新的流水线实例"""
+    """运行流水线 - 根据流水线配置创建流水线实例和节点，并交给执行引擎执行"""
+    # 配置JSON延迟加载：执行计划命中缓存时不读取
     template = WorkflowTemplate.query.get_or_404(id)
+    try:
+        plan = plan_cache.get(template.id, template.updated_at)
+    except TemplateError as e:
+        abort(400, str(e))
 
     # 创建新的流水线实例
     workflow = Workflow(
@@ -82,8 +174,12 @@ def run_workflow(id):
         status="pending",
     )
     models.db.session.add(workflow)
+    models.db.session.flush()
+    create_actions(workflow, plan)
+    record_status_change(workflow, "pending")
     models.db.session.commit()
 
-    # TODO: 这里应该启动实际的流水线执行逻辑
+    if workflow_engine.autostart:
+        executors.backend.submit(workflow.id)
 
     return workflow, 201
@@ -0,0 +1,231 @@
+import functools
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# 记录到指标中的慢语句最大长度
+STATEMENT_PREVIEW_LENGTH = 500
+
+
+class QueryBudgetExceeded(AssertionError):
+    """请求的SQL查询数超过了路由声明的预算"""
+
+
+@dataclass
+class RequestQueryStats:
+    """单个请求的SQL统计"""
+
+    queries: int = 0
+    db_time: float = 0.0  # 秒
+    rows: int = 0
+    slowest_time: float = 0.0
+    slowest_statement: Optional[str] = None
+
+    def record(self, statement: str, elapsed: float, rowcount: int) -> None:
+        self.queries += 1
+        self.db_time += elapsed
+        # SQLite等驱动对SELECT返回-1，只累计驱动报告的行数
+        if rowcount > 0:
+            self.rows += rowcount
+        if elapsed >= self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_statement = statement
+
+
+@dataclass
+class EndpointMetrics:
+    """单个路由的累计SQL指标"""
+
+    requests: int = 0
+    queries_total: int = 0
+    queries_max: int = 0
+    db_time_total_ms: float = 0.0
+    db_time_max_ms: float = 0.0
+    rows_total: int = 0
+    slowest_ms: float = 0.0
+    slowest_statement: Optional[str] = None
+    budget: Optional[int] = None
+    budget_violations: int = 0
+
+
+class MetricsRegistry:
+    """进程内按路由汇总的SQL指标（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, EndpointMetrics] = {}
+
+    def record(
+        self, endpoint: str, stats: RequestQueryStats, budget: Optional[int]
+    ) -> None:
+        db_time_ms = stats.db_time * 1000
+        with self._lock:
+            metrics = self._endpoints.setdefault(endpoint, EndpointMetrics())
+            metrics.requests += 1
+            metrics.queries_total += stats.queries
+            metrics.queries_max = max(metrics.queries_max, stats.queries)
+            metrics.db_time_total_ms += db_time_ms
+            metrics.db_time_max_ms = max(metrics.db_time_max_ms, db_time_ms)
+            metrics.rows_total += stats.rows
+            metrics.budget = budget
+            if budget is not None and stats.queries > budget:
+                metrics.budget_violations += 1
+            if stats.slowest_time * 1000 >= metrics.slowest_ms:
+                metrics.slowest_ms = stats.slowest_time * 1000
+                metrics.slowest_statement = (stats.slowest_statement or "")[
+                    :STATEMENT_PREVIEW_LENGTH
+                ]
+
+    def get(self, endpoint: str) -> Optional[EndpointMetrics]:
+        with self._lock:
+            return self._endpoints.get(endpoint)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """各路由指标的副本，附带平均查询数和平均数据库耗时"""
+        with self._lock:
+            result = {}
+            for endpoint, metrics in sorted(self._endpoints.items()):
+                data = asdict(metrics)
+                data["queries_avg"] = round(metrics.queries_total / metrics.requests, 2)
+                data["db_time_avg_ms"] = round(
+                    metrics.db_time_total_ms / metrics.requests, 3
+                )
+                result[endpoint] = data
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+
+
+registry = MetricsRegistry()
+
+
+def query_budget(max_queries: int):
+    """
+    声明路由的SQL查询预算
+
+    放在路由装饰器正下方（最外层），这样参数校验和响应序列化中的查询也计入预算。
+    超出预算时：SQL_QUERY_BUDGET_STRICT 为真（测试中）抛出 QueryBudgetExceeded，
+    否则记录警告并计入指标的 budget_violations。流式响应在视图返回后才查询，
+    不做预算检查。
+
+    Args:
+        max_queries: 单个请求允许的最大SQL查询数
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            g.sql_query_budget = max_queries
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _current_stats() -> Optional[RequestQueryStats]:
+    if not has_request_context():
+        return None
+    return g.get("sql_query_stats")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault("sql_metrics_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    starts = conn.info.get("sql_metrics_start")
+    if stats is None or not starts:
+        return
+    stats.record(statement, time.perf_counter() - starts.pop(), cursor.rowcount)
+
+
+class SqlMetrics:
+    """
+    按请求统计SQL查询
+
+    监听SQLAlchemy的 before_cursor_execute/after_cursor_execute 事件，记录每个
+    请求的查询数、数据库总耗时、最慢语句和驱动报告的行数；通过 Server-Timing
+    响应头返回给调用方，并汇总到进程内指标 registry（GET /api/metrics/sql）。
+
+    配置项（app.config）：
+        SQL_METRICS_ENABLED: 是否统计
+        SQL_QUERY_BUDGET_STRICT: 超出查询预算时抛出异常（测试中开启）
+        SQL_SLOW_QUERY_MS: 单条语句超过该耗时（毫秒）时记录警告，None表示不记录
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.registry = registry
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        app.config.setdefault("SQL_METRICS_ENABLED", True)
+        app.config.setdefault("SQL_QUERY_BUDGET_STRICT", False)
+        app.config.setdefault("SQL_SLOW_QUERY_MS", None)
+        # 监听Engine类，覆盖 Flask-SQLAlchemy 惰性创建的所有引擎
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule(
+            "/api/metrics/sql", "sql_metrics", self._metrics_view, methods=["GET"]
+        )
+
+    def _before_request(self) -> None:
+        if self.app.config["SQL_METRICS_ENABLED"]:
+            g.sql_query_stats = RequestQueryStats()
+            g.sql_request_started = time.perf_counter()
+
+    def _after_request(self, response):
+        # 外层已推送app context时多个请求共享同一个g，统计项逐请求取出
+        stats = g.pop("sql_query_stats", None)
+        budget = g.pop("sql_query_budget", None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - g.pop("sql_request_started")
+        endpoint = request.endpoint or request.path
+        self.registry.record(endpoint, stats, budget)
+
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"',
+        )
+        response.headers.add("Server-Timing", f"app;dur={elapsed * 1000:.2f}")
+
+        slow_ms = self.app.config["SQL_SLOW_QUERY_MS"]
+        if slow_ms is not None and stats.slowest_time * 1000 > slow_ms:
+            logger.warning(
+                "%s 慢查询 %.1fms: %s",
+                endpoint,
+                stats.slowest_time * 1000,
+                (stats.slowest_statement or "")[:STATEMENT_PREVIEW_LENGTH],
+            )
+        if budget is not None and not response.is_streamed and stats.queries > budget:
+            message = f"{endpoint} 执行了 {stats.queries} 条SQL，超出预算 {budget}"
+            if self.app.config["SQL_QUERY_BUDGET_STRICT"]:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def _metrics_view(self):
+        """进程内SQL指标 - 按路由返回请求数、查询数、数据库耗时和最慢语句"""
+        return jsonify({"success": True, "data": self.registry.snapshot()})
+
+
+sql_metrics = SqlMetrics()
@@ -0,0 +1,175 @@
+import logging
+import threading
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+from app.executor_backends import StatusEvent, apply_status_events
+from app.message_bus import InMemoryBroker, MessageBus
+from app.models import db
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUE = "workflow-status"
+STATUS_BINDING = "workflow.status.#"
+
+
+def create_bus(url: str) -> MessageBus:
+    """
+    按URL创建消息总线
+
+    Raises:
+        ValueError: 不支持的URL
+    """
+    if url.startswith("memory://"):
+        return InMemoryBroker()
+    raise ValueError(f"不支持的消息总线: {url}")
+
+
+@dataclass
+class ConsumerStats:
+    """状态消费者的累计计数"""
+
+    messages: int = 0
+    flushes: int = 0
+    actions_written: int = 0  # 合并后实际写入的节点行数
+    failures: int = 0
+    rejected: int = 0  # 移入死信队列的消息数
+
+
+class StatusConsumer:
+    """
+    状态事件消费者
+
+    执行器把节点/流水线状态事件发布到消息总线（路由键 workflow.status.<流水线ID>）。
+    消费者每次取出至多 STATUS_CONSUMER_BATCH_SIZE 条积压的消息作为一次刷新：
+    同一节点只写入最新状态（见 apply_status_events），一个事务提交后再确认全部
+    消息。5万节点的运行约产生10万条running/结束事件，合并后每次刷新只有一次
+    批量UPDATE和一次提交。
+
+    无法解析的消息（字段缺失、状态未知等）直接移入死信队列，不影响同批其他
+    消息；写入失败时整批放回队列重新投递，已投递 STATUS_CONSUMER_MAX_DELIVERIES
+    次的消息不再重试，同样移入死信队列，避免一条消息堵住整个队列。
+
+    配置项（app.config）：
+        MESSAGE_BUS_URL: 消息总线地址，目前支持 memory://（进程内）
+        STATUS_CONSUMER_BATCH_SIZE: 每次刷新最多处理的消息数
+        STATUS_CONSUMER_FLUSH_INTERVAL: 队列为空时的等待时间（秒）
+        STATUS_CONSUMER_MAX_DELIVERIES: 写入失败时每条消息最多投递的次数
+        STATUS_CONSUMER_AUTOSTART: 初始化时启动后台消费线程
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.bus: Optional[MessageBus] = None
+        self.queue = STATUS_QUEUE
+        self.batch_size = 5000
+        self.flush_interval = 0.05
+        self.max_deliveries = 5
+        self.stats = ConsumerStats()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.bus = create_bus(app.config.setdefault("MESSAGE_BUS_URL", "memory://"))
+        self.bus.declare_queue(self.queue, STATUS_BINDING)
+        self.batch_size = app.config.setdefault("STATUS_CONSUMER_BATCH_SIZE", 5000)
+        self.flush_interval = app.config.setdefault(
+            "STATUS_CONSUMER_FLUSH_INTERVAL", 0.05
+        )
+        self.max_deliveries = app.config.setdefault("STATUS_CONSUMER_MAX_DELIVERIES", 5)
+        if app.config.setdefault("STATUS_CONSUMER_AUTOSTART", False):
+            self.start()
+
+    def run_once(self, timeout: Optional[float] = 0) -> int:
+        """
+        处理一批积压的消息（需要app context）
+
+        Args:
+            timeout: 队列为空时的等待时间（秒）
+
+        Returns:
+            处理的消息数
+        """
+        messages = self.bus.get_batch(self.queue, self.batch_size, timeout)
+        if not messages:
+            return 0
+        events, valid, invalid = [], [], []
+        for message in messages:
+            try:
+                events.append(StatusEvent.from_message(message.body))
+            except ValueError as e:
+                logger.warning("丢弃无效的状态消息 %r: %s", message.body, e)
+                invalid.append(message.delivery_tag)
+            else:
+                valid.append(message)
+        if invalid:
+            self.bus.reject(self.queue, invalid)
+            self.stats.rejected += len(invalid)
+        if not events:
+            return len(messages)
+
+        try:
+            apply_status_events(events)
+        except Exception:
+            db.session.rollback()
+            exhausted, retry = [], []
+            for message in valid:
+                if message.deliveries >= self.max_deliveries:
+                    exhausted.append(message.delivery_tag)
+                else:
+                    retry.append(message.delivery_tag)
+            self.bus.reject(self.queue, exhausted)
+            self.bus.nack(self.queue, retry)
+            self.stats.rejected += len(exhausted)
+            self.stats.failures += 1
+            raise
+        self.bus.ack(self.queue, [message.delivery_tag for message in valid])
+        self.stats.messages += len(events)
+        self.stats.flushes += 1
+        self.stats.actions_written += len(
+            {event.action_id for event in events if event.action_id is not None}
+        )
+        return len(messages)
+
+    def drain(self) -> int:
+        """处理到队列为空（需要app context）"""
+        total = 0
+        while processed := self.run_once():
+            total += processed
+        return total
+
+    def start(self) -> None:
+        """启动后台消费线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._consume, name="status-consumer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def snapshot(self) -> Dict:
+        return asdict(self.stats)
+
+    def _consume(self) -> None:
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                try:
+                    self.run_once(self.flush_interval)
+                except Exception:
+                    logger.exception("状态事件写入失败，稍后重试")
+                    self._stopping.wait(self.flush_interval)
+                finally:
+                    db.session.remove()
+
+
+status_consumer = StatusConsumer()
@@ -0,0 +1,304 @@
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    String,
+    Text,
+    bindparam,
+    case,
+    column,
+    func,
+    text,
+    update,
+)
+
+from app.models import Action, Workflow, db
+from app.workflow_stats import record_status_changes
+
+TERMINAL_STATUSES = ("completed", "failed", "terminated")
+# 状态只能前进：pending → running → 结束状态，结束状态之间不能互相转换
+STATUS_RANK = {
+    "pending": 0,
+    "running": 1,
+    **{status: 2 for status in TERMINAL_STATUSES},
+}
+STATUSES = tuple(STATUS_RANK)
+
+# 每条UPDATE语句最多写入的行数
+CHUNK_SIZE = 10000
+PG_TYPES = {Integer: "integer", String: "varchar", Text: "text", DateTime: "timestamp"}
+
+
+@dataclass(frozen=True)
+class Transition:
+    """
+    节点或流水线的一次状态变化
+
+    logs 为从 log_offset 字符处开始的日志片段：已有日志在该位置截断后接上片段，
+    重复提交同一片段是幂等的；log_offset 为None时追加到已有日志末尾。
+    """
+
+    id: int
+    status: str
+    at: datetime
+    exit_code: Optional[int] = None
+    logs: Optional[str] = None
+    log_offset: Optional[int] = None
+
+
+@dataclass
+class _Coalesced:
+    """同一对象在一批变化中合并后的结果"""
+
+    status: str
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    exit_code: Optional[int] = None
+    logs: Optional[str] = None
+    log_offset: Optional[int] = None
+
+
+def coalesce(transitions: Iterable[Transition]) -> Dict[int, _Coalesced]:
+    """
+    按对象合并一批状态变化
+
+    状态取等级最高者（同为结束状态时保留先到的），同等级时后到的覆盖；
+    开始/结束时间分别取自 running 与结束状态的变化；日志片段按偏移依次叠加。
+    """
+    merged: Dict[int, _Coalesced] = {}
+    for item in transitions:
+        current = merged.get(item.id)
+        if current is None:
+            current = merged[item.id] = _Coalesced(item.status)
+        else:
+            rank, current_rank = STATUS_RANK[item.status], STATUS_RANK[current.status]
+            if rank > current_rank or (rank == current_rank and rank < 2):
+                current.status = item.status
+        if item.status == "running":
+            current.started_at = current.started_at or item.at
+        elif item.status in TERMINAL_STATUSES and current.status == item.status:
+            current.completed_at = current.completed_at or item.at
+        if item.exit_code is not None:
+            current.exit_code = item.exit_code
+        if item.logs is not None:
+            _merge_logs(current, item)
+    return merged
+
+
+def _merge_logs(current: _Coalesced, item: Transition) -> None:
+    if current.logs is None:
+        current.logs, current.log_offset = item.logs, item.log_offset
+    elif item.log_offset is None:
+        current.logs += item.logs
+    elif current.log_offset is not None and item.log_offset >= current.log_offset:
+        current.logs = current.logs[: item.log_offset - current.log_offset] + item.logs
+    else:
+        current.logs, current.log_offset = item.logs, item.log_offset
+
+
+def _rows(name: str, columns: Sequence[Tuple[str, type]], rows: List[Tuple]):
+    """
+    把一批行作为单个JSON绑定参数展开为子查询
+
+    每格一个绑定参数时，SQLAlchemy 编译数千个参数的语句本身就要数百毫秒；JSON
+    数组只有一个参数，语句可以缓存。SQLite 用 json_each，PostgreSQL 用
+    json_array_elements 展开。
+    """
+    payload = json.dumps([[_json_value(value) for value in row] for row in rows])
+    if db.engine.dialect.name == "sqlite":
+        select_list = ", ".join(
+            f"json_extract(value, '$[{position}]') AS {field}"
+            for position, (field, _) in enumerate(columns)
+        )
+        source = f"json_each(:{name}_rows)"
+    else:
+        select_list = ", ".join(
+            f"CAST(value->>{position} AS {PG_TYPES[type_]}) AS {field}"
+            for position, (field, type_) in enumerate(columns)
+        )
+        source = f"json_array_elements(CAST(:{name}_rows AS json)) AS {name}_rows"
+    return (
+        text(f"SELECT {select_list} FROM {source}")
+        .bindparams(bindparam(f"{name}_rows", payload, type_=Text()))
+        .columns(*[column(field, type_()) for field, type_ in columns])
+        .subquery(name)
+    )
+
+
+def _json_value(value):
+    # 与 SQLAlchemy 在 SQLite 中保存 DateTime 的格式一致
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+    return value
+
+
+def _rank(status_column):
+    return case(STATUS_RANK, value=status_column, else_=0)
+
+
+def _chunks(rows: List[Tuple]) -> Iterable[List[Tuple]]:
+    for start in range(0, len(rows), CHUNK_SIZE):
+        yield rows[start : start + CHUNK_SIZE]
+
+
+ACTION_COLUMNS = (
+    ("id", Integer),
+    ("status", String),
+    ("rank", Integer),
+    ("started_at", DateTime),
+    ("completed_at", DateTime),
+    ("exit_code", Integer),
+    ("logs", Text),
+    ("log_offset", Integer),
+)
+WORKFLOW_COLUMNS = (
+    ("id", Integer),
+    ("status", String),
+    ("rank", Integer),
+    ("started_at", DateTime),
+    ("completed_at", DateTime),
+)
+
+
+def update_actions(transitions: Iterable[Transition]) -> List[int]:
+    """
+    批量写入节点状态变化（UPDATE ... FROM (VALUES ...)，不提交）
+
+    先按节点合并，再按 CHUNK_SIZE 分块，每块一条语句。只有状态前进或与当前
+    状态相同（补充日志、退出码）的行被更新。
+
+    Returns:
+        被更新的节点ID
+    """
+    merged = coalesce(transitions)
+    rows = [
+        (
+            action_id,
+            item.status,
+            STATUS_RANK[item.status],
+            item.started_at,
+            item.completed_at,
+            item.exit_code,
+            item.logs,
+            item.log_offset,
+        )
+        for action_id, item in merged.items()
+    ]
+    applied: List[int] = []
+    now = datetime.utcnow()
+    for chunk in _chunks(rows):
+        v = _rows("v", ACTION_COLUMNS, chunk)
+        existing_logs = func.coalesce(Action.logs, "")
+        stmt = (
+            update(Action)
+            .where(
+                Action.id == v.c.id,
+                (v.c.rank > _rank(Action.status)) | (v.c.status == Action.status),
+            )
+            .values(
+                status=v.c.status,
+                started_at=func.coalesce(v.c.started_at, Action.started_at),
+                completed_at=func.coalesce(v.c.completed_at, Action.completed_at),
+                exit_code=func.coalesce(v.c.exit_code, Action.exit_code),
+                logs=case(
+                    (v.c.logs.is_(None), Action.logs),
+                    (v.c.log_offset.is_(None), existing_logs + v.c.logs),
+                    else_=func.substr(existing_logs, 1, v.c.log_offset) + v.c.logs,
+                ),
+                updated_at=now,
+            )
+            .returning(Action.id)
+            .execution_options(synchronize_session=False)
+        )
+        applied.extend(db.session.scalars(stmt))
+    return applied
+
+
+def update_workflows(transitions: Iterable[Transition]) -> List[int]:
+    """
+    批量写入流水线状态变化（不提交）
+
+    只接受状态前进的变化，同一状态不会重复计入统计；被更新的流水线在同一事务中
+    合并计入统计汇总表。
+
+    Returns:
+        被更新的流水线ID
+    """
+    transitions = list(transitions)
+    merged = coalesce(transitions)
+    rows = [
+        (
+            workflow_id,
+            item.status,
+            STATUS_RANK[item.status],
+            item.started_at,
+            item.completed_at,
+        )
+        for workflow_id, item in merged.items()
+    ]
+    applied: List[int] = []
+    changes = []
+    now = datetime.utcnow()
+    at = {
+        item.id: item.at
+        for item in transitions
+        if item.status == merged[item.id].status
+    }
+    for chunk in _chunks(rows):
+        v = _rows("v", WORKFLOW_COLUMNS, chunk)
+        stmt = (
+            update(Workflow)
+            .where(Workflow.id == v.c.id, v.c.rank > _rank(Workflow.status))
+            .values(
+                status=v.c.status,
+                started_at=func.coalesce(Workflow.started_at, v.c.started_at),
+                completed_at=v.c.completed_at,
+                updated_at=now,
+            )
+            .returning(
+                Workflow.id, Workflow.project_id, Workflow.template_id, Workflow.status
+            )
+            .execution_options(synchronize_session=False)
+        )
+        for workflow_id, project_id, template_id, status in db.session.execute(stmt):
+            applied.append(workflow_id)
+            changes.append((project_id, template_id, status, at[workflow_id]))
+    record_status_changes(changes)
+    return applied
+
+
+def apply_transitions(
+    actions: Iterable[Transition] = (), workflows: Iterable[Transition] = ()
+) -> Dict[str, List[int]]:
+    """
+    在一个事务中写入节点和流水线的状态变化并提交（需要app context）
+
+    Returns:
+        {"actions": 被更新的节点ID, "workflows": 被更新的流水线ID}
+    """
+    result = {
+        "actions": update_actions(actions),
+        "workflows": update_workflows(workflows),
+    }
+    db.session.commit()
+    return result
+
+
+def terminate_pending_actions(workflow_id: int, at: datetime) -> int:
+    """
+    把流水线实例尚未开始的节点批量标记为 terminated（一条UPDATE，不提交）
+
+    Returns:
+        被标记的节点数
+    """
+    result = db.session.execute(
+        update(Action)
+        .where(Action.workflow_id == workflow_id, Action.status == "pending")
+        .values(status="terminated", completed_at=at, updated_at=at)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
@@ -0,0 +1,286 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, exists, func, insert
+
+from app.models import (
+    Action,
+    Activity,
+    Entity,
+    StepResult,
+    WasGeneratedBy,
+    db,
+)
+from app.provenance_ingest import ingest_document
+
+# 参与缓存键的命令配置字段
+COMMAND_FIELDS = ("command", "args", "env", "workdir")
+
+
+def action_run_key(workflow_id: int, action_id: int) -> str:
+    """
+    节点溯源活动的运行标识（Activity.run_key）
+
+    节点命令可从环境变量 NADC_RUN_KEY 读取，以此（或以其为前缀）登记生成的实体；
+    循环节点每次迭代的活动以 <运行标识>/<循环路径>#<迭代序号> 登记。
+    """
+    return f"workflow/{workflow_id}/action/{action_id}"
+
+
+def cache_key(config: Dict, inputs: Iterable[str]) -> str:
+    """
+    节点的缓存键
+
+    对节点配置 cache 段声明的活动描述名称/版本与参数、节点命令，以及输入实体的
+    校验和（无校验和的实体以其ID代替）计算SHA-256。输入按内容排序，与书写顺序
+    无关。
+
+    参数取自 cache.parameters 声明的值：溯源模型中的 Parameter 行只关联
+    ValueEntity，在步骤执行后才由节点命令登记，派发前无法按节点解析。
+
+    Args:
+        config: 节点配置
+        inputs: 输入实体的校验和
+    """
+    cache = config["cache"]
+    payload = {
+        "description": cache.get("description"),
+        "version": cache.get("version"),
+        "parameters": cache.get("parameters") or {},
+        "command": {name: config.get(name) for name in COMMAND_FIELDS},
+        "inputs": sorted(inputs),
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _token(entity_id: int, checksum: Optional[str]) -> str:
+    return checksum or f"entity:{entity_id}"
+
+
+def resolve_keys(
+    workflow_id: int,
+    nodes: Sequence[Tuple[int, Dict, Sequence[int]]],
+    producers: Dict[int, int],
+) -> Dict[int, str]:
+    """
+    批量计算一批待执行节点的缓存键（需要app context）
+
+    输入实体为 cache.inputs 列出的外部标识（Entity.external_id）对应的实体，加上
+    全部上游节点生成的实体。上游节点的输出活动依次取自 producers（本次执行中的
+    缓存命中）、步骤结果表，最后是按 action_run_key 登记的活动。任一上游没有
+    溯源记录或外部标识不存在时无法确定输入，该节点不计算缓存键、照常执行。
+
+    至多四次查询，与节点数无关。
+
+    Args:
+        workflow_id: 流水线实例ID
+        nodes: (节点ID, 节点配置, 上游节点ID)
+        producers: 上游节点ID -> 已知的输出活动ID
+
+    Returns:
+        节点ID -> 缓存键，只包含能确定输入的节点
+    """
+    upstream = {parent for _, _, parents in nodes for parent in parents}
+    activities = {
+        action_id: producers[action_id]
+        for action_id in upstream
+        if action_id in producers
+    }
+    unresolved = upstream - activities.keys()
+    if unresolved:
+        activities.update(
+            db.session.query(StepResult.action_id, StepResult.activity_id).filter(
+                StepResult.action_id.in_(unresolved),
+                StepResult.activity_id.isnot(None),
+            )
+        )
+        unresolved -= activities.keys()
+    if unresolved:
+        run_keys = {
+            action_run_key(workflow_id, action_id): action_id
+            for action_id in unresolved
+        }
+        for activity_id, run_key in db.session.query(
+            Activity.id, Activity.run_key
+        ).filter(Activity.run_key.in_(run_keys)):
+            activities[run_keys[run_key]] = activity_id
+
+    outputs: Dict[int, List[str]] = {}
+    if activities:
+        rows = (
+            db.session.query(WasGeneratedBy.activity_id, Entity.id, Entity.checksum)
+            .join(Entity, Entity.id == WasGeneratedBy.entity_id)
+            .filter(WasGeneratedBy.activity_id.in_(set(activities.values())))
+        )
+        for activity_id, entity_id, checksum in rows:
+            outputs.setdefault(activity_id, []).append(_token(entity_id, checksum))
+
+    external_ids = {
+        external_id
+        for _, config, _ in nodes
+        for external_id in config["cache"].get("inputs") or ()
+    }
+    external: Dict[str, str] = {}
+    if external_ids:
+        external = {
+            external_id: _token(entity_id, checksum)
+            for external_id, entity_id, checksum in db.session.query(
+                Entity.external_id, Entity.id, Entity.checksum
+            ).filter(Entity.external_id.in_(external_ids))
+        }
+
+    keys = {}
+    for action_id, config, parents in nodes:
+        declared = config["cache"].get("inputs") or ()
+        if any(parent not in activities for parent in parents) or any(
+            external_id not in external for external_id in declared
+        ):
+            continue
+        inputs = [external[external_id] for external_id in declared]
+        for parent in set(parents):
+            inputs.extend(outputs.get(activities[parent], ()))
+        keys[action_id] = cache_key(config, inputs)
+    return keys
+
+
+def lookup(keys: Iterable[str]) -> Dict[str, Tuple[int, str]]:
+    """
+    查找缓存键对应的可复用结果（一次查询）
+
+    只复用实际执行成功的结果，且其生成的实体均未失效；同一键有多条时取最新的。
+
+    Returns:
+        缓存键 -> (输出活动ID, 该活动的运行标识)
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
+    invalidated = exists().where(
+        WasGeneratedBy.activity_id == StepResult.activity_id,
+        WasGeneratedBy.entity_id == Entity.id,
+        Entity.invalidated_at_time.isnot(None),
+    )
+    rows = (
+        db.session.query(StepResult.cache_key, StepResult.activity_id, Activity.run_key)
+        .join(Activity, Activity.id == StepResult.activity_id)
+        .filter(
+            StepResult.cache_key.in_(keys),
+            StepResult.hit.is_(False),
+            ~invalidated,
+        )
+        .order_by(StepResult.id)
+    )
+    return {key: (activity_id, run_key) for key, activity_id, run_key in rows}
+
+
+def record_results(
+    workflow_id: int,
+    template_id: int,
+    executed: List[Tuple[int, Optional[str]]],
+    hits: List[Tuple[int, str, str, int, datetime]],
+) -> None:
+    """
+    写入一批可缓存节点的结果（不提交）
+
+    每个执行成功的可缓存节点都记为未命中，按 action_run_key 找到其登记的活动；
+    没有登记溯源或无法确定缓存键的结果不带活动（或缓存键），只计入统计、不会
+    被复用。缓存命中的节点记为命中，并登记一个由被复用活动通知（WasInformedBy）
+    的活动。同一节点重新执行时覆盖旧结果。
+
+    Args:
+        executed: (节点ID, 缓存键)，缓存键无法确定时为None
+        hits: (节点ID, 节点名称, 缓存键, 被复用的活动ID, 完成时间)
+    """
+    if not executed and not hits:
+        return
+    db.session.execute(
+        delete(StepResult).where(
+            StepResult.action_id.in_(
+                [action_id for action_id, _ in executed]
+                + [action_id for action_id, *_ in hits]
+            )
+        )
+    )
+    rows = [
+        {
+            "cache_key": key,
+            "action_id": action_id,
+            "template_id": template_id,
+            "activity_id": activity_id,
+            "hit": True,
+        }
+        for action_id, _, key, activity_id, _ in hits
+    ]
+    if executed:
+        run_keys = {
+            action_run_key(workflow_id, action_id): action_id
+            for action_id, _ in executed
+        }
+        activities = {
+            run_keys[run_key]: activity_id
+            for activity_id, run_key in db.session.query(
+                Activity.id, Activity.run_key
+            ).filter(Activity.run_key.in_(run_keys))
+        }
+        rows.extend(
+            {
+                "cache_key": key,
+                "action_id": action_id,
+                "template_id": template_id,
+                "activity_id": activities.get(action_id),
+                "hit": False,
+            }
+            for action_id, key in executed
+        )
+    if rows:
+        now = datetime.utcnow()
+        for row in rows:
+            row["created_at"] = now
+        db.session.execute(insert(StepResult), rows)
+    if hits:
+        ingest_document(
+            {
+                "activities": [
+                    {
+                        "id": f"hit{action_id}",
+                        "name": name,
+                        "start_time": at,
+                        "end_time": at,
+                        "comment": f"缓存命中，复用活动 {activity_id} 的输出",
+                        "run_key": action_run_key(workflow_id, action_id),
+                    }
+                    for action_id, name, _, activity_id, at in hits
+                ],
+                "was_informed_by": [
+                    {"informed": f"hit{action_id}", "informant": activity_id}
+                    for action_id, _, _, activity_id, _ in hits
+                ],
+            },
+            commit=False,
+        )
+
+
+def template_stats(template_id: int) -> Dict:
+    """流水线配置的缓存命中统计，按阶段名汇总（一次查询）"""
+    rows = (
+        db.session.query(Action.name, StepResult.hit, func.count(StepResult.id))
+        .join(Action, Action.id == StepResult.action_id)
+        .filter(StepResult.template_id == template_id)
+        .group_by(Action.name, StepResult.hit)
+    )
+    stages: Dict[str, Dict] = {}
+    for name, hit, count in rows:
+        stage = stages.setdefault(name, {"name": name, "hits": 0, "misses": 0})
+        stage["hits" if hit else "misses"] += count
+    hits = sum(stage["hits"] for stage in stages.values())
+    misses = sum(stage["misses"] for stage in stages.values())
+    return {
+        "template_id": template_id,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "stages": sorted(stages.values(), key=lambda stage: stage["name"]),
+    }
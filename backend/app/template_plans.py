@@ -0,0 +1,273 @@
+import functools
+import logging
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.models import WorkflowTemplate, db
+from app.template_validation import TemplateIssue, validate_stage, validate_template
+from app.workflow_scheduler import DEFAULT_PRIORITY, PRIORITIES
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateError(ValueError):
+    """流水线配置无法编译为DAG，issues 为校验发现的全部错误"""
+
+    def __init__(self, message: str, issues: Sequence[TemplateIssue] = ()):
+        super().__init__(message)
+        self.issues = tuple(issues)
+
+
+@dataclass(frozen=True)
+class StageSpec:
+    """编译后的流水线阶段"""
+
+    name: str
+    type: str
+    config: Dict
+    dependencies: Tuple[str, ...]
+    loop: Optional[Dict] = None  # 循环阶段的循环体与终止条件
+
+
+@dataclass(frozen=True)
+class WorkflowPlan:
+    """
+    编译后的流水线：阶段按拓扑序排列
+
+    dependency_masks[i] 是 stages[i] 直接上游的位集（第 j 位对应 stages[j]），
+    priority 与 max_concurrency 为解析默认值后的调度选项。计划会被缓存并在多个
+    线程间共享，不应修改。
+    """
+
+    stages: Tuple[StageSpec, ...]
+    dependency_masks: Tuple[int, ...] = ()
+    priority: str = DEFAULT_PRIORITY
+    max_concurrency: Optional[int] = None
+
+    @functools.cached_property
+    def index(self) -> Dict[str, int]:
+        """阶段名 -> 在 stages 中的位置"""
+        return {stage.name: position for position, stage in enumerate(self.stages)}
+
+    @functools.cached_property
+    def action_configs(self) -> Tuple[Dict, ...]:
+        """各阶段对应节点的配置（与 stages 一一对应）"""
+        return tuple(action_config(stage) for stage in self.stages)
+
+
+def compile_template(config: Optional[Dict]) -> WorkflowPlan:
+    """
+    将流水线配置的 stages 编译为DAG
+
+    每个阶段可用 dependencies 列出上游阶段名；未声明 dependencies 的阶段依赖
+    列表中的前一个阶段（兼容按顺序书写的线性配置），dependencies 为空列表表示
+    没有上游。
+
+    带 loop 的阶段是循环阶段，循环体本身是一组阶段（可嵌套循环）::
+
+        {"name": "calibrate", "type": "loop",
+         "loop": {"stages": [...], "max_iterations": 10,
+                  "until": {"command": "check_convergence.sh"}}}
+
+    until 为终止条件命令，退出码为0表示收敛；省略时固定执行 max_iterations 次。
+
+    Args:
+        config: WorkflowTemplate.config
+
+    Returns:
+        阶段按拓扑序排列的执行计划
+
+    Raises:
+        TemplateError: 配置未通过校验（app.template_validation），错误信息为
+            第一处错误，issues 为全部错误
+    """
+    issues = validate_template(config)
+    if issues:
+        raise TemplateError(str(issues[0]), issues)
+
+    stages: List[StageSpec] = []
+    for stage in (config or {}).get("stages") or ():
+        if "dependencies" in stage:
+            dependencies = tuple(stage["dependencies"] or ())
+        else:
+            dependencies = (stages[-1].name,) if stages else ()
+        stages.append(
+            StageSpec(
+                stage["name"],
+                stage["type"],
+                dict(stage.get("config") or {}),
+                dependencies,
+                stage.get("loop"),
+            )
+        )
+    ordered = _topological_order(stages)
+    priority, max_concurrency = scheduling_options(config or {})
+    return WorkflowPlan(
+        tuple(ordered), _dependency_masks(ordered), priority, max_concurrency
+    )
+
+
+def scheduling_options(config: Dict) -> Tuple[str, Optional[int]]:
+    """流水线配置的优先级类别与并发上限，优先级无效时按默认类别"""
+    priority = config.get("priority", DEFAULT_PRIORITY)
+    if priority not in PRIORITIES:
+        logger.warning(
+            "流水线配置优先级无效: %s，按 %s 调度", priority, DEFAULT_PRIORITY
+        )
+        priority = DEFAULT_PRIORITY
+    return priority, config.get("max_concurrency")
+
+
+def spawned_stage(spec: Dict, default_name: str) -> StageSpec:
+    """校验运行时产生的节点规格，格式与配置中的阶段相同，name和type可省略"""
+    issues = validate_stage(spec)
+    name = spec.get("name") if isinstance(spec, dict) else None
+    name = name or default_name
+    if issues:
+        raise TemplateError(f"节点 {name}: {issues[0]}", issues)
+    return StageSpec(
+        name,
+        spec.get("type") or "script",
+        dict(spec.get("config") or {}),
+        tuple(spec.get("dependencies") or ()),
+        spec.get("loop"),
+    )
+
+
+def _topological_order(stages: List[StageSpec]) -> List[StageSpec]:
+    """Kahn算法排序，同层保持配置中的书写顺序"""
+    by_name = {stage.name: stage for stage in stages}
+    remaining = {stage.name: len(set(stage.dependencies)) for stage in stages}
+    downstream: Dict[str, List[str]] = {stage.name: [] for stage in stages}
+    for stage in stages:
+        for dependency in set(stage.dependencies):
+            downstream[dependency].append(stage.name)
+
+    ready = deque(stage.name for stage in stages if remaining[stage.name] == 0)
+    ordered = []
+    while ready:
+        name = ready.popleft()
+        ordered.append(by_name[name])
+        for child in downstream[name]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                ready.append(child)
+    if len(ordered) != len(stages):
+        cycle = sorted(name for name, count in remaining.items() if count > 0)
+        raise TemplateError(f"阶段依赖存在环: {', '.join(cycle)}")
+    return ordered
+
+
+def _dependency_masks(ordered: List[StageSpec]) -> Tuple[int, ...]:
+    index = {stage.name: position for position, stage in enumerate(ordered)}
+    masks = []
+    for stage in ordered:
+        mask = 0
+        for dependency in stage.dependencies:
+            mask |= 1 << index[dependency]
+        masks.append(mask)
+    return tuple(masks)
+
+
+def action_config(stage: StageSpec) -> Dict:
+    """阶段对应节点的配置：阶段配置加上 dependencies（及循环定义）"""
+    config = {**stage.config, "dependencies": list(stage.dependencies)}
+    if stage.loop is not None:
+        config["loop"] = stage.loop
+    return config
+
+
+class PlanCache:
+    """
+    流水线配置执行计划的进程内缓存
+
+    按 (配置ID, updated_at) 缓存编译结果：每个配置只保留最新版本的计划，
+    updated_at 变化（其他进程更新了配置）时自然失效，本进程更新或删除配置时
+    由路由调用 invalidate()。命中时只查询 updated_at，不加载配置JSON。
+
+    配置项（app.config）：
+        WORKFLOW_PLAN_CACHE_SIZE: 缓存的配置数上限，超出时淘汰最久未使用的
+    """
+
+    def __init__(self, app=None):
+        self.max_size = 128
+        self._lock = threading.Lock()
+        self._plans: "OrderedDict[int, Tuple[datetime, WorkflowPlan]]" = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.max_size = app.config.setdefault("WORKFLOW_PLAN_CACHE_SIZE", 128)
+
+    def get(
+        self, template_id: int, updated_at: Optional[datetime] = None
+    ) -> Optional[WorkflowPlan]:
+        """
+        取流水线配置的执行计划，未命中时加载配置并编译（需要app context）
+
+        Args:
+            template_id: 流水线配置ID
+            updated_at: 调用方已加载的配置更新时间，省略时查询
+
+        Returns:
+            执行计划；配置不存在时返回None
+
+        Raises:
+            TemplateError: 配置无法编译
+        """
+        if updated_at is None:
+            updated_at = (
+                db.session.query(WorkflowTemplate.updated_at)
+                .filter(WorkflowTemplate.id == template_id)
+                .scalar()
+            )
+        plan = self._cached(template_id, updated_at)
+        if plan is not None:
+            return plan
+
+        # 配置与更新时间一起读取，保证缓存的计划与所记录的版本一致
+        row = (
+            db.session.query(WorkflowTemplate.config, WorkflowTemplate.updated_at)
+            .filter(WorkflowTemplate.id == template_id)
+            .first()
+        )
+        if row is None:
+            return None
+        config, updated_at = row
+        plan = compile_template(config)
+        with self._lock:
+            self._plans[template_id] = (updated_at, plan)
+            self._plans.move_to_end(template_id)
+            while len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def _cached(
+        self, template_id: int, updated_at: Optional[datetime]
+    ) -> Optional[WorkflowPlan]:
+        if updated_at is None:
+            return None
+        with self._lock:
+            entry = self._plans.get(template_id)
+            if entry is None or entry[0] != updated_at:
+                return None
+            self._plans.move_to_end(template_id)
+            return entry[1]
+
+    def invalidate(self, template_id: int) -> None:
+        """丢弃流水线配置的缓存计划"""
+        with self._lock:
+            self._plans.pop(template_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._plans.clear()
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+
+plan_cache = PlanCache()
@@ -0,0 +1,310 @@
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from app.workflow_scheduler import PRIORITIES
+
+# 节点命令配置字段允许的类型
+COMMAND_TYPES = {
+    "command": (str, list),
+    "args": (list,),
+    "env": (dict,),
+    "workdir": (str,),
+    "timeout": (int, float),
+}
+
+
+@dataclass(frozen=True)
+class TemplateIssue:
+    """流水线配置中的一处错误"""
+
+    path: str  # 出错位置，如 stages[3].dependencies[0]，空串表示整个配置
+    message: str
+    line: Optional[int] = None  # 配置文本无法解析时的行号与列号
+    column: Optional[int] = None
+
+    def __str__(self) -> str:
+        return f"{self.path}: {self.message}" if self.path else self.message
+
+
+def parse_config(text: str) -> Tuple[Optional[Dict], List[TemplateIssue]]:
+    """
+    解析配置文本
+
+    Returns:
+        (配置, 错误)；无法解析时配置为None，错误带有行列号
+    """
+    try:
+        return json.loads(text), []
+    except json.JSONDecodeError as e:
+        return None, [TemplateIssue("", f"JSON格式错误: {e.msg}", e.lineno, e.colno)]
+
+
+def validate_template(config) -> List[TemplateIssue]:
+    """
+    校验流水线配置，一次返回全部错误
+
+    检查配置结构与字段类型、阶段名重复、依赖不存在的阶段，以及依赖环。
+    迭代执行只能用循环阶段（loop）表达，循环体按同样规则递归校验；循环体之外
+    的依赖环都是错误，每个环（强连通分量）报告一次。时间与阶段数和依赖数
+    之和成线性关系。
+
+    Args:
+        config: WorkflowTemplate.config
+
+    Returns:
+        错误列表，为空表示配置可以编译；先列出各阶段的字段错误，再列出依赖错误
+    """
+    validator = _Validator()
+    validator.template(config, "")
+    return validator.issues
+
+
+def validate_stage(spec) -> List[TemplateIssue]:
+    """
+    校验运行时产生的单个节点规格：name 和 type 可省略，不检查依赖是否存在
+    """
+    validator = _Validator()
+    if not isinstance(spec, dict):
+        validator.error("", f"节点规格必须是对象: {spec!r}")
+    else:
+        validator.stage(spec, "", spawned=True)
+    return validator.issues
+
+
+class _Validator:
+    def __init__(self):
+        self.issues: List[TemplateIssue] = []
+
+    def error(self, path: str, message: str) -> None:
+        self.issues.append(TemplateIssue(path, message))
+
+    def template(self, config, prefix: str, loop: bool = False) -> Optional[int]:
+        """校验一组阶段（整个配置或循环体），返回阶段数，结构无效时返回None"""
+        if config is None:
+            return 0
+        if not isinstance(config, dict):
+            self.error(prefix.rstrip("."), "配置必须是对象")
+            return None
+        if not loop:
+            self.scheduling(config)
+        raw_stages = config.get("stages")
+        if raw_stages is None:
+            return 0
+        if not isinstance(raw_stages, list):
+            self.error(f"{prefix}stages", "stages 必须是列表")
+            return None
+
+        positions: Dict[str, int] = {}  # 阶段名 -> 在 stages 中的位置
+        entries: List[Tuple[int, str, List[str]]] = []
+        previous: Optional[str] = None
+        for index, stage in enumerate(raw_stages):
+            path = f"{prefix}stages[{index}]"
+            if not isinstance(stage, dict):
+                self.error(path, "阶段必须是对象")
+                previous = None
+                continue
+            name, dependencies = self.stage(stage, path)
+            if name is None:
+                previous = None
+                continue
+            if name in positions:
+                self.error(f"{path}.name", f"阶段名重复: {name}")
+                continue
+            positions[name] = index
+            if dependencies is None:
+                # 未声明 dependencies 时依赖前一个阶段
+                dependencies = [previous] if previous is not None else []
+            entries.append((index, name, dependencies))
+            previous = name
+
+        order = {name: position for position, (_, name, _) in enumerate(entries)}
+        graph: List[List[int]] = []
+        for index, name, dependencies in entries:
+            edges = []
+            for position, dependency in enumerate(dependencies):
+                if dependency in order:
+                    edges.append(order[dependency])
+                else:
+                    self.error(
+                        f"{prefix}stages[{index}].dependencies[{position}]",
+                        f"阶段 {name} 依赖不存在的阶段 {dependency}",
+                    )
+            graph.append(edges)
+        for component in _cycles(graph):
+            index = entries[component[0]][0]
+            names = ", ".join(entries[position][1] for position in component)
+            self.error(
+                f"{prefix}stages[{index}].dependencies", f"阶段依赖存在环: {names}"
+            )
+        return len(raw_stages)
+
+    def scheduling(self, config: Dict) -> None:
+        priority = config.get("priority")
+        if priority is not None and priority not in PRIORITIES:
+            self.error(
+                "priority", f"priority 必须是 {'/'.join(PRIORITIES)} 之一: {priority}"
+            )
+        limit = config.get("max_concurrency")
+        if limit is not None and not _positive_int(limit):
+            self.error("max_concurrency", "max_concurrency 必须是正整数")
+
+    def stage(
+        self, stage: Dict, path: str, spawned: bool = False
+    ) -> Tuple[Optional[str], Optional[List[str]]]:
+        """
+        校验单个阶段的字段
+
+        Returns:
+            (阶段名, 声明的依赖)；阶段名无效时为None，未声明依赖时依赖为None
+        """
+        name = self.identifier(stage, "name", path, spawned)
+        self.identifier(stage, "type", path, spawned)
+
+        dependencies = None
+        if "dependencies" in stage:
+            dependencies = []
+            raw = stage["dependencies"]
+            at = _child(path, "dependencies")
+            if raw is not None and not isinstance(raw, list):
+                self.error(at, "dependencies 必须是阶段名列表")
+            for position, dependency in enumerate(raw if isinstance(raw, list) else ()):
+                if isinstance(dependency, str) and dependency:
+                    dependencies.append(dependency)
+                else:
+                    self.error(f"{at}[{position}]", "依赖必须是阶段名")
+
+        config = stage.get("config")
+        if config is not None:
+            if isinstance(config, dict):
+                self.command(config, _child(path, "config"))
+                self.cache(config, _child(path, "config.cache"))
+            else:
+                self.error(_child(path, "config"), "config 必须是对象")
+
+        loop = stage.get("loop")
+        if loop is not None:
+            self.loop(loop, _child(path, "loop"))
+        return name, dependencies
+
+    def identifier(
+        self, stage: Dict, key: str, path: str, optional: bool
+    ) -> Optional[str]:
+        value = stage.get(key)
+        if value is None or value == "":
+            if not optional:
+                self.error(path, f"阶段缺少 {key}")
+            return None
+        if not isinstance(value, str):
+            self.error(_child(path, key), f"{key} 必须是字符串")
+            return None
+        return value
+
+    def command(self, config: Dict, path: str) -> None:
+        for key, types in COMMAND_TYPES.items():
+            value = config.get(key)
+            if value is None:
+                continue
+            if not isinstance(value, types) or isinstance(value, bool):
+                self.error(f"{path}.{key}", f"{key} 的类型无效")
+            elif key == "command" and not value:
+                self.error(f"{path}.{key}", "command 不能为空")
+            elif key == "timeout" and value <= 0:
+                self.error(f"{path}.{key}", "timeout 必须大于0")
+
+    def cache(self, config: Dict, path: str) -> None:
+        """
+        步骤结果缓存声明::
+
+            "config": {"command": ..., "cache": {"description": "calibrate",
+                       "version": "2.1", "parameters": {"gain": 1.5},
+                       "inputs": ["flat-2025-03"]}}
+
+        inputs 为输入实体的外部标识；上游节点生成的实体自动作为输入。
+        """
+        cache = config.get("cache")
+        if cache is None:
+            return
+        if not isinstance(cache, dict) or not cache.get("description"):
+            self.error(path, "cache 必须是包含 description 的对象")
+            return
+        if not isinstance(cache.get("parameters") or {}, dict):
+            self.error(f"{path}.parameters", "cache.parameters 必须是对象")
+        if not isinstance(cache.get("inputs") or [], list):
+            self.error(f"{path}.inputs", "cache.inputs 必须是列表")
+
+    def loop(self, loop, path: str) -> None:
+        """循环定义：正整数的迭代上限、可选的终止条件命令和非空的循环体"""
+        if not isinstance(loop, dict):
+            self.error(path, "循环定义必须是对象")
+            return
+        if not _positive_int(loop.get("max_iterations")):
+            self.error(f"{path}.max_iterations", "循环必须设置正整数 max_iterations")
+        until = loop.get("until")
+        if until is not None and not (isinstance(until, dict) and until.get("command")):
+            self.error(f"{path}.until", "循环的 until 必须包含 command")
+        if self.template(loop, f"{path}.", loop=True) == 0:
+            self.error(f"{path}.stages", "循环没有阶段")
+
+
+def _child(path: str, key: str) -> str:
+    return f"{path}.{key}" if path else key
+
+
+def _positive_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 1
+
+
+def _cycles(graph: List[List[int]]) -> List[List[int]]:
+    """
+    Tarjan 强连通分量（迭代实现，不受递归深度限制）
+
+    Returns:
+        含环的分量，分量内按位置排序
+    """
+    count = len(graph)
+    index = [-1] * count
+    low = [0] * count
+    on_stack = [False] * count
+    stack: List[int] = []
+    counter = 0
+    components = []
+    for root in range(count):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, 0)]
+        while work:
+            node, position = work[-1]
+            edges = graph[node]
+            if position < len(edges):
+                work[-1] = (node, position + 1)
+                child = edges[position]
+                if index[child] == -1:
+                    index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack[child] = True
+                    work.append((child, 0))
+                elif on_stack[child]:
+                    low[node] = min(low[node], index[child])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                if len(component) > 1 or node in edges:
+                    components.append(sorted(component))
+    components.sort()
+    return components
@@ -0,0 +1,1122 @@
+import functools
+import json
+import logging
+import os
+import queue
+import signal
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import insert, update
+
+from app.models import Action, LoopCheckpoint, Workflow, WorkflowTemplate, db
+from app.provenance_ingest import ingest_document
+from app.status_updates import Transition, update_workflows
+from app.step_cache import action_run_key, lookup, record_results, resolve_keys
+from app.template_plans import (
+    StageSpec,
+    TemplateError,
+    WorkflowPlan,
+    action_config,
+    compile_template,
+    plan_cache,
+    scheduling_options,
+    spawned_stage,
+)
+from app.workflow_scheduler import DEFAULT_PRIORITY, ActionScheduler, ScheduledTask
+
+logger = logging.getLogger(__name__)
+
+
+def create_actions(workflow: Workflow, plan: WorkflowPlan) -> int:
+    """
+    按执行计划为流水线实例批量创建节点（单条 executemany）
+
+    阶段依赖写入节点配置的 dependencies 字段，执行与重试只依赖节点表。
+    与流水线实例处于同一事务中，由调用方提交。
+
+    Returns:
+        创建的节点数
+    """
+    if not plan.stages:
+        return 0
+    now = datetime.utcnow()
+    db.session.execute(
+        insert(Action),
+        [
+            {
+                "name": stage.name,
+                "type": stage.type,
+                "status": "pending",
+                "workflow_id": workflow.id,
+                "config": config,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for stage, config in zip(plan.stages, plan.action_configs)
+        ],
+    )
+    return len(plan.stages)
+
+
+class ProcessGroup:
+    """
+    一次流水线执行启动的子进程（线程安全）
+
+    子进程在新的会话中启动，终止时向整个进程组发送信号，shell 派生的子进程
+    一并结束。terminate() 之后不再启动新进程。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes: Set[subprocess.Popen] = set()
+        self.cancelled = False
+
+    def start(self, *args, **kwargs) -> Optional[subprocess.Popen]:
+        """启动子进程；已终止时返回None"""
+        with self._lock:
+            if self.cancelled:
+                return None
+            process = subprocess.Popen(
+                *args, start_new_session=os.name == "posix", **kwargs
+            )
+            self._processes.add(process)
+            return process
+
+    def finish(self, process: subprocess.Popen) -> None:
+        with self._lock:
+            self._processes.discard(process)
+
+    def terminate(self, grace: float) -> int:
+        """
+        终止全部子进程：先发送 SIGTERM，grace 秒后仍未退出的发送 SIGKILL
+
+        Returns:
+            收到信号的子进程数
+        """
+        with self._lock:
+            self.cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            _signal(process, signal.SIGTERM)
+        if processes:
+            timer = threading.Timer(grace, self._kill, (processes,))
+            timer.daemon = True
+            timer.start()
+        return len(processes)
+
+    @staticmethod
+    def _kill(processes: List[subprocess.Popen]) -> None:
+        for process in processes:
+            if process.poll() is None:
+                _signal(process, signal.SIGKILL)
+
+
+def _signal(process: subprocess.Popen, sig: int) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, sig)
+        else:
+            process.terminate()
+    except (ProcessLookupError, PermissionError):
+        pass  # 进程已退出
+
+
+def _run_process(
+    config: Dict, processes: Optional[ProcessGroup] = None
+) -> Tuple[Optional[int], str]:
+    """执行命令，返回 (退出码, 输出)；超时、被终止或无法启动时退出码为None"""
+    command = config["command"]
+    shell = isinstance(command, str)
+    if not shell:
+        command = [str(part) for part in command]
+        command += [str(arg) for arg in config.get("args") or ()]
+    env = dict(os.environ)
+    env.update({key: str(value) for key, value in (config.get("env") or {}).items()})
+    processes = processes or ProcessGroup()
+    try:
+        process = processes.start(
+            command,
+            shell=shell,
+            cwd=config.get("workdir"),
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+    except OSError as e:
+        return None, f"无法启动命令: {e}"
+    if process is None:
+        return None, "执行已终止，未启动"
+    try:
+        output, _ = process.communicate(timeout=config.get("timeout"))
+    except subprocess.TimeoutExpired as e:
+        _signal(process, signal.SIGKILL)
+        output, _ = process.communicate()
+        return None, f"{output or ''}\n执行超时（{e.timeout}s）"
+    finally:
+        processes.finish(process)
+    if processes.cancelled:
+        return None, f"{output or ''}\n执行已终止"
+    return process.returncode, output or ""
+
+
+def _with_env(config: Dict, env: Dict[str, str]) -> Dict:
+    return {**config, "env": {**(config.get("env") or {}), **env}}
+
+
+def run_command(
+    config: Dict, log_limit: int, processes: Optional[ProcessGroup] = None
+) -> Tuple[str, str]:
+    """
+    在本地子进程中执行节点命令
+
+    节点配置：command（字符串按shell执行，列表直接执行）、args、env、workdir、
+    timeout（秒）。没有 command 的节点视为占位节点，直接完成。
+
+    Returns:
+        (completed 或 failed, 日志)，日志只保留末尾 log_limit 个字符
+    """
+    if not config.get("command"):
+        return "completed", "无执行命令，跳过"
+    returncode, logs = _run_process(config, processes)
+    if returncode is None:
+        return "failed", logs[-log_limit:]
+    if returncode != 0:
+        logs += f"\n退出码 {returncode}"
+        return "failed", logs[-log_limit:]
+    return "completed", logs[-log_limit:]
+
+
+@dataclass
+class _Node:
+    id: int
+    name: str
+    config: Dict
+    status: str
+    downstream: List[int] = field(default_factory=list)
+    waiting: int = 0  # 尚未完成的上游节点数
+    spawned_by: Optional[int] = None  # 动态产生该节点的父节点ID
+    spawned: int = 0  # 已产生的子节点数
+    errors: List[str] = field(default_factory=list)  # 产生子节点时的错误
+    upstream: List[int] = field(default_factory=list)
+    cache_key: Optional[str] = None  # 可缓存节点的缓存键（见 app.step_cache）
+
+
+class _Run:
+    """一次流水线执行的协调状态；除事件队列外只在协调线程中读写"""
+
+    def __init__(self, workflow_id: int):
+        self.workflow_id = workflow_id
+        self.project_id: Optional[int] = None
+        self.template_id: Optional[int] = None
+        self.priority = DEFAULT_PRIORITY
+        self.template_limit: Optional[int] = None
+        self.nodes: Dict[int, _Node] = {}
+        self.names: Dict[str, int] = {}
+        self.max_id = 0
+        self.events: queue.Queue = queue.Queue()
+        self.in_flight = 0
+        self.cancelled = False
+        self.processes = ProcessGroup()
+        self.producers: Dict[int, int] = {}  # 缓存命中的节点 -> 被复用的活动ID
+        self.subscribers: List[queue.Queue] = []
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None  # 协调线程异常退出的原因
+
+    def load(
+        self,
+        workflow: Workflow,
+        nodes: Dict[int, _Node],
+        priority: str,
+        template_limit: Optional[int],
+    ) -> None:
+        """设置流水线开始执行时加载的调度选项和节点"""
+        self.project_id = workflow.project_id
+        self.template_id = workflow.template_id
+        self.priority = priority
+        self.template_limit = template_limit
+        self.nodes = nodes
+        self.names = {node.name: node.id for node in nodes.values()}
+        self.max_id = max(nodes, default=0)
+
+    def fan_in(self, parent: _Node) -> List[int]:
+        """父节点的静态下游：除其动态子节点外依赖父节点的节点"""
+        return [
+            child_id
+            for child_id in parent.downstream
+            if self.nodes[child_id].spawned_by != parent.id
+        ]
+
+    def checkpoint(self, action_id: int, *fields) -> Future:
+        """
+        工作线程提交循环检查点（线程安全）
+
+        Returns:
+            检查点提交后得到结果的Future；协调线程已异常退出时直接带有该异常
+        """
+        committed: Future = Future()
+        with self._lock:
+            if self._error is not None:
+                committed.set_exception(self._error)
+            else:
+                self.events.put(
+                    ("checkpoint", action_id, datetime.utcnow(), *fields, committed)
+                )
+        return committed
+
+    def abort(self, error: BaseException) -> None:
+        """协调线程异常退出：丢弃未处理的事件，等待检查点的工作线程收到异常"""
+        with self._lock:
+            self._error = error
+            pending = []
+            while True:
+                try:
+                    pending.append(self.events.get_nowait())
+                except queue.Empty:
+                    break
+        for kind, *_, committed in pending:
+            if kind == "checkpoint" and not committed.done():
+                committed.set_exception(error)
+
+
+class WorkflowEngine:
+    """
+    本地DAG执行引擎
+
+    协调线程按依赖关系把就绪节点交给调度器（ActionScheduler），调度器的有界
+    工作线程按优先级类别、项目公平分享和并发上限取节点，在本地子进程中执行。
+    工作线程只通过事件队列回报开始和结束，数据库只由协调线程写入：每轮取出
+    队列中积压的全部事件，先派发新就绪的节点，再用一次批量UPDATE和一次提交
+    持久化这批状态与时间变化。上游失败的节点保持 pending，其他独立分支继续
+    执行。
+
+    节点运行时可以产生新节点（动态扩展）：本地子进程向环境变量 NADC_SPAWN_FILE
+    指向的文件逐行写入JSON节点规格，或经 spawn() / POST /api/action/<id>/spawn
+    提交。协调线程按批插入节点表并立即派发就绪的子节点；依赖父节点的下游节点
+    等待父节点及其全部子节点完成后才执行。
+
+    循环节点在一个工作线程中按拓扑序依次执行循环体。每完成一次迭代，工作线程发出
+    检查点事件并等待协调线程提交：检查点行与该次迭代的溯源活动（经 WasInformedBy
+    关联上一次迭代）在同一事务中写入。再次执行时循环从最后一个检查点之后继续，
+    已收敛或已达上限的循环（包括嵌套的子循环）不再执行。
+
+    节点命令从环境变量 NADC_RUN_KEY 取得本节点溯源活动的运行标识（见
+    action_run_key），增量重试据此判断已完成节点的输出是否仍然有效。配置了
+    cache 的节点在派发前按活动描述/版本、参数和输入实体校验和查找已有的成功
+    结果，命中时不执行，直接复用其输出（app.step_cache）。
+
+    cancel() 停止派发新节点、把排队的节点移出调度器并终止执行中节点的子进程，
+    subscribe() 订阅持久化后的状态变化，供执行后端
+    （app.executor_backends.LocalBackend）实现取消与状态流。
+
+    流水线配置可用 priority（high/normal/low）声明优先级类别，用 max_concurrency
+    限制该配置同时执行的节点数。
+
+    配置项（app.config）：
+        WORKFLOW_ENGINE_MAX_WORKERS: 同时执行的节点数上限（所有流水线共享）
+        WORKFLOW_SCHEDULER_PROJECT_LIMIT: 每个项目同时执行的节点数上限，None表示不限制
+        WORKFLOW_SCHEDULER_PROJECT_LIMITS: 按项目ID覆盖上述上限
+        WORKFLOW_SCHEDULER_PROJECT_WEIGHTS: 按项目ID设置公平分享权重，默认1
+        WORKFLOW_SCHEDULER_TEMPLATE_LIMIT: 未声明 max_concurrency 的配置的默认上限
+        WORKFLOW_ENGINE_AUTOSTART: 运行流水线时是否立即在后台开始执行
+        WORKFLOW_ENGINE_LOG_LIMIT: 每个节点保留的日志字符数
+        WORKFLOW_ENGINE_SPAWN_BATCH_SIZE: 动态产生的节点每批插入的数量
+        WORKFLOW_ENGINE_CANCEL_GRACE: 取消时子进程收到 SIGTERM 后到 SIGKILL 的秒数
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_workers = os.cpu_count() or 4
+        self.autostart = True
+        self.log_limit = 65536
+        self.spawn_batch_size = 1000
+        self.cancel_grace = 5.0
+        self.scheduler_limits: Dict = {}
+        self._scheduler: Optional[ActionScheduler] = None
+        self._lock = threading.Lock()
+        self._runs: Dict[int, _Run] = {}  # 正在协调的流水线实例
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.max_workers = app.config.setdefault(
+            "WORKFLOW_ENGINE_MAX_WORKERS", os.cpu_count() or 4
+        )
+        self.autostart = app.config.setdefault("WORKFLOW_ENGINE_AUTOSTART", True)
+        self.log_limit = app.config.setdefault("WORKFLOW_ENGINE_LOG_LIMIT", 65536)
+        self.spawn_batch_size = app.config.setdefault(
+            "WORKFLOW_ENGINE_SPAWN_BATCH_SIZE", 1000
+        )
+        self.cancel_grace = app.config.setdefault("WORKFLOW_ENGINE_CANCEL_GRACE", 5.0)
+        self.scheduler_limits = {
+            "project_limit": app.config.setdefault(
+                "WORKFLOW_SCHEDULER_PROJECT_LIMIT", None
+            ),
+            "project_limits": app.config.setdefault(
+                "WORKFLOW_SCHEDULER_PROJECT_LIMITS", {}
+            ),
+            "project_weights": app.config.setdefault(
+                "WORKFLOW_SCHEDULER_PROJECT_WEIGHTS", {}
+            ),
+            "template_limit": app.config.setdefault(
+                "WORKFLOW_SCHEDULER_TEMPLATE_LIMIT", None
+            ),
+        }
+
+    @property
+    def scheduler(self) -> ActionScheduler:
+        with self._lock:
+            if self._scheduler is None:
+                self._scheduler = ActionScheduler(
+                    self.max_workers, **self.scheduler_limits
+                )
+            return self._scheduler
+
+    def shutdown(self) -> None:
+        """停止调度器的工作线程"""
+        with self._lock:
+            scheduler, self._scheduler = self._scheduler, None
+        if scheduler is not None:
+            scheduler.shutdown()
+
+    def submit(self, workflow_id: int) -> Future:
+        """
+        在后台协调线程中执行流水线实例
+
+        Returns:
+            执行结束后返回流水线最终状态的Future
+
+        Raises:
+            RuntimeError: 该流水线实例已在本进程中执行
+        """
+        if self.app is None:
+            raise RuntimeError("WorkflowEngine 未初始化，请先调用 init_app")
+        # 线程启动前登记：此后的 cancel() 总能找到这次执行
+        run = self._register(workflow_id)
+        future: Future = Future()
+
+        def coordinate():
+            with self.app.app_context():
+                try:
+                    future.set_result(self._drive(run))
+                except Exception as e:
+                    logger.exception("流水线 %s 执行失败", workflow_id)
+                    future.set_exception(e)
+                finally:
+                    db.session.remove()
+
+        threading.Thread(
+            target=coordinate, name=f"workflow-{workflow_id}", daemon=True
+        ).start()
+        return future
+
+    def run(self, workflow_id: int) -> str:
+        """
+        在当前线程中协调执行流水线实例，直到没有可执行的节点
+
+        执行 pending 节点；running 节点视为上次执行被中断，重新执行（循环节点从
+        检查点继续）；已完成的节点视为满足依赖。需要app context。
+
+        Returns:
+            流水线最终状态：completed、failed，被取消时为 terminated
+
+        Raises:
+            RuntimeError: 该流水线实例已在本进程中执行
+            Exception: 协调过程出错（如数据库写入失败），流水线已记为 failed
+        """
+        return self._drive(self._register(workflow_id))
+
+    def _register(self, workflow_id: int) -> _Run:
+        with self._lock:
+            if workflow_id in self._runs:
+                raise RuntimeError(f"流水线实例 {workflow_id} 正在执行")
+            run = self._runs[workflow_id] = _Run(workflow_id)
+            return run
+
+    def _drive(self, run: _Run) -> str:
+        """协调已登记的执行，结束后注销"""
+        try:
+            workflow = db.session.get(Workflow, run.workflow_id)
+            if workflow is None:
+                raise ValueError(f"流水线实例不存在: {run.workflow_id}")
+            try:
+                status = self._coordinate(workflow, run)
+            except Exception as e:
+                self._abort(run, e)
+                raise
+            self._publish(run, [(None, status, datetime.utcnow(), None)])
+            return status
+        finally:
+            with self._lock:
+                self._runs.pop(run.workflow_id, None)
+                subscribers = list(run.subscribers)
+            for subscriber in subscribers:
+                subscriber.put(None)
+
+    def _abort(self, run: _Run, error: Exception) -> None:
+        """
+        协调线程异常退出（如数据库写入失败）时停止执行并把流水线记为失败
+
+        与 cancel() 一样移出排队的节点并终止子进程，释放等待检查点的循环工作线程，
+        再在新的事务中写入 failed；已被终止等结束状态的流水线不会被覆盖。
+        """
+        run.cancelled = True
+        self.scheduler.discard(run.workflow_id)
+        run.processes.terminate(self.cancel_grace)
+        run.abort(error)
+        db.session.rollback()
+        now = datetime.utcnow()
+        try:
+            update_workflows([Transition(run.workflow_id, "failed", now)])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("流水线 %s 的失败状态写入失败", run.workflow_id)
+            return
+        self._publish(run, [(None, "failed", now, None)])
+
+    @staticmethod
+    def _scheduling(template_id: int) -> Tuple[str, Optional[int]]:
+        """流水线配置的调度选项，取自缓存的执行计划"""
+        try:
+            plan = plan_cache.get(template_id)
+        except TemplateError:
+            # 配置在创建实例后被改为无法编译：节点已在节点表中，只取调度选项
+            config = (
+                db.session.query(WorkflowTemplate.config)
+                .filter(WorkflowTemplate.id == template_id)
+                .scalar()
+            )
+            return scheduling_options(config or {})
+        if plan is None:
+            return DEFAULT_PRIORITY, None
+        return plan.priority, plan.max_concurrency
+
+    def subscribe(self, workflow_id: int) -> Optional[queue.Queue]:
+        """
+        订阅本进程中正在执行的流水线实例的状态变化
+
+        队列中依次放入持久化后的 (节点ID, 状态, 时间, 日志)，节点ID为None表示
+        流水线本身的最终状态；执行结束后放入None。
+
+        Returns:
+            状态队列；流水线实例未在本进程中执行时返回None
+        """
+        with self._lock:
+            run = self._runs.get(workflow_id)
+            if run is None:
+                return None
+            subscriber: queue.Queue = queue.Queue()
+            run.subscribers.append(subscriber)
+            return subscriber
+
+    def cancel(self, workflow_id: int) -> bool:
+        """
+        取消流水线实例的执行（线程安全，不等待节点结束）
+
+        协调线程不再派发新节点，调度器中排队的节点被移出，执行中节点的子进程
+        （含其进程组）收到 SIGTERM，WORKFLOW_ENGINE_CANCEL_GRACE 秒后仍未退出的
+        收到 SIGKILL。被终止和未能开始的节点记为 terminated；从未派发的 pending
+        节点与流水线状态由调用方负责更新（见 terminate_pending_actions），协调线程
+        结束时不再写入流水线。
+
+        已经提交但协调线程尚未开始的执行同样被取消，不会再开始。
+
+        Returns:
+            流水线实例是否已提交或正在本进程中执行
+        """
+        with self._lock:
+            run = self._runs.get(workflow_id)
+        if run is None:
+            return False
+        run.cancelled = True
+        at = datetime.utcnow()
+        for task in self.scheduler.discard(workflow_id):
+            run.events.put(("skipped", task.action_id, at))
+        run.processes.terminate(self.cancel_grace)
+        run.events.put(("cancel", None, at))
+        return True
+
+    def _publish(self, run: _Run, changes: List[Tuple]) -> None:
+        with self._lock:
+            subscribers = list(run.subscribers)
+        for subscriber in subscribers:
+            for change in changes:
+                subscriber.put(change)
+
+    def spawn(self, workflow_id: int, action_id: int, specs: Iterable[Dict]) -> int:
+        """
+        为运行中的节点动态产生新节点（线程安全）
+
+        规格按 WORKFLOW_ENGINE_SPAWN_BATCH_SIZE 分批交给协调线程，由其插入并派发。
+        规格格式与配置中的阶段相同；dependencies 只能引用已有节点或同一批中更早
+        的节点，无效规格记为父节点的错误（父节点结束时标记为失败）。
+
+        Returns:
+            提交的规格数
+
+        Raises:
+            RuntimeError: 流水线实例未在本进程中执行，或节点不在运行中
+        """
+        with self._lock:
+            run = self._runs.get(workflow_id)
+        node = run.nodes.get(action_id) if run is not None else None
+        if node is None or node.status != "running":
+            raise RuntimeError(f"节点 {action_id} 不在本进程中运行")
+        return self._queue_spawns(run, action_id, specs)
+
+    def _queue_spawns(self, run: _Run, action_id: int, specs: Iterable[Dict]) -> int:
+        total, chunk = 0, []
+        for spec in specs:
+            chunk.append(spec)
+            if len(chunk) >= self.spawn_batch_size:
+                run.events.put(("spawn", action_id, datetime.utcnow(), chunk))
+                total, chunk = total + len(chunk), []
+        if chunk:
+            run.events.put(("spawn", action_id, datetime.utcnow(), chunk))
+            total += len(chunk)
+        return total
+
+    def _coordinate(self, workflow: Workflow, run: _Run) -> str:
+        # 登记后、开始前被取消的执行不再开始，流水线状态由取消方写入
+        if run.cancelled or not self._start(run):
+            return "terminated"
+        # 节点状态在开始后加载：此前终止接口写入的 terminated 节点不会被派发
+        priority, max_concurrency = self._scheduling(workflow.template_id)
+        run.load(workflow, self._load_nodes(run.workflow_id), priority, max_concurrency)
+        nodes = run.nodes
+        if run.cancelled:
+            return "terminated"
+
+        self._dispatch_all(
+            run,
+            [
+                node
+                for node in list(nodes.values())
+                if node.status == "pending" and node.waiting == 0
+            ],
+        )
+
+        while run.in_flight:
+            batch = [run.events.get()]
+            while True:
+                try:
+                    batch.append(run.events.get_nowait())
+                except queue.Empty:
+                    break
+            started, finished, skipped, checkpoints, ready = [], [], [], [], []
+            cached: Dict[str, List] = {"executed": [], "hits": []}
+            for kind, action_id, at, *result in batch:
+                if kind == "cancel":
+                    continue
+                if kind == "skipped":
+                    # 取消后未能开始的节点（可能是上次中断时留下的 running）
+                    run.in_flight -= 1
+                    nodes[action_id].status = "terminated"
+                    skipped.append(
+                        {"id": action_id, "status": "terminated", "completed_at": at}
+                    )
+                    continue
+                if kind == "started":
+                    started.append(
+                        {"id": action_id, "status": "running", "started_at": at}
+                    )
+                    continue
+                if kind == "checkpoint":
+                    checkpoints.append((nodes[action_id], at, *result))
+                    continue
+                if kind == "spawn":
+                    # 按事件顺序处理：子节点须在父节点结束前计入下游的等待数
+                    ready.extend(self._spawn(run, nodes[action_id], result[0]))
+                    continue
+                run.in_flight -= 1
+                node = nodes[action_id]
+                if kind == "cached":
+                    activity_id = result[0]
+                    run.producers[action_id] = activity_id
+                    cached["hits"].append(
+                        (action_id, node.name, node.cache_key, activity_id, at)
+                    )
+                    started.append(
+                        {"id": action_id, "status": "running", "started_at": at}
+                    )
+                    result = ("completed", f"缓存命中，复用活动 {activity_id} 的输出")
+                status, logs = result
+                if node.errors:
+                    status = "failed"
+                    logs = (logs + "\n" + "\n".join(node.errors))[-self.log_limit :]
+                node.status = status
+                finished.append(
+                    {
+                        "id": action_id,
+                        "status": status,
+                        "logs": logs,
+                        "completed_at": at,
+                    }
+                )
+                if status != "completed":
+                    continue
+                if "cache" in node.config and kind != "cached":
+                    cached["executed"].append((action_id, node.cache_key))
+                for child_id in node.downstream:
+                    child = nodes[child_id]
+                    child.waiting -= 1
+                    if child.waiting == 0 and child.status == "pending":
+                        ready.append(child)
+            # 先派发再持久化，数据库写入不阻塞下游节点启动
+            if not run.cancelled:
+                self._dispatch_all(run, ready)
+            self._persist(run, started, finished, skipped, checkpoints, cached)
+            if run.subscribers:
+                self._publish(
+                    run,
+                    [(row["id"], "running", row["started_at"], None) for row in started]
+                    + [
+                        (row["id"], row["status"], row["completed_at"], row.get("logs"))
+                        for row in finished + skipped
+                    ],
+                )
+
+        if run.cancelled:
+            return "terminated"
+        status = (
+            "completed"
+            if all(node.status == "completed" for node in nodes.values())
+            else "failed"
+        )
+        update_workflows([Transition(run.workflow_id, status, datetime.utcnow())])
+        db.session.commit()
+        return status
+
+    @staticmethod
+    def _start(run: _Run) -> bool:
+        """
+        把流水线记为 running（状态只能前进，见 update_workflows）
+
+        Returns:
+            是否可以执行：pending 的实例被置为 running，已处于 running 的视为上次
+            执行被中断；已结束（例如已被终止）的实例不再执行
+        """
+        now = datetime.utcnow()
+        started = update_workflows([Transition(run.workflow_id, "running", now)])
+        if not started:
+            status = (
+                db.session.query(Workflow.status)
+                .filter(Workflow.id == run.workflow_id)
+                .scalar()
+            )
+            started = status == "running"
+        db.session.commit()
+        return bool(started)
+
+    def _load_nodes(self, workflow_id: int) -> Dict[int, _Node]:
+        rows = (
+            db.session.query(Action.id, Action.name, Action.status, Action.config)
+            .filter(Action.workflow_id == workflow_id)
+            .order_by(Action.id)
+            .all()
+        )
+        ids = {name: action_id for action_id, name, _, _ in rows}
+        nodes = {
+            action_id: _Node(
+                action_id,
+                name,
+                config or {},
+                "pending" if status == "running" else status,
+            )
+            for action_id, name, status, config in rows
+        }
+        for node in nodes.values():
+            if node.config.get("spawned_by"):
+                node.spawned_by = ids[node.config["spawned_by"]]
+        for node in nodes.values():
+            for dependency in set(node.config.get("dependencies") or ()):
+                self._link(nodes[ids[dependency]], node)
+        # 动态子节点同样是父节点静态下游的上游
+        fan_in = {
+            node.id: [
+                child_id
+                for child_id in node.downstream
+                if nodes[child_id].spawned_by != node.id
+            ]
+            for node in nodes.values()
+        }
+        for node in nodes.values():
+            if node.spawned_by is not None:
+                for child_id in fan_in[node.spawned_by]:
+                    self._link(node, nodes[child_id])
+        return nodes
+
+    @staticmethod
+    def _link(upstream: _Node, node: _Node) -> None:
+        upstream.downstream.append(node.id)
+        node.upstream.append(upstream.id)
+        if upstream.status != "completed":
+            node.waiting += 1
+
+    def _spawn(self, run: _Run, parent: _Node, specs: List[Dict]) -> List[_Node]:
+        """插入一批动态产生的节点并接入DAG，返回其中可立即执行的节点"""
+        if parent.status != "running":
+            logger.warning(
+                "节点 %s 已结束，忽略其产生的 %d 个节点", parent.id, len(specs)
+            )
+            return []
+        stages: List[StageSpec] = []
+        batch_names = set()
+        for spec in specs:
+            parent.spawned += 1
+            try:
+                stage = spawned_stage(spec, f"{parent.name}/{parent.spawned}")
+            except TemplateError as e:
+                parent.errors.append(str(e))
+                continue
+            existing = run.names.get(stage.name)
+            if existing is not None or stage.name in batch_names:
+                # 重新执行的父节点再次产生同名子节点时复用已有节点
+                if existing is None or run.nodes[existing].spawned_by != parent.id:
+                    parent.errors.append(f"节点名重复: {stage.name}")
+                continue
+            missing = [
+                name
+                for name in stage.dependencies
+                if name not in run.names and name not in batch_names
+            ]
+            if missing:
+                parent.errors.append(
+                    f"节点 {stage.name} 依赖不存在的节点 {', '.join(missing)}"
+                )
+                continue
+            stages.append(stage)
+            batch_names.add(stage.name)
+        if not stages:
+            return []
+
+        now = datetime.utcnow()
+        configs = [
+            {**action_config(stage), "spawned_by": parent.name} for stage in stages
+        ]
+        db.session.execute(
+            insert(Action),
+            [
+                {
+                    "name": stage.name,
+                    "type": stage.type,
+                    "status": "pending",
+                    "workflow_id": run.workflow_id,
+                    "config": config,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for stage, config in zip(stages, configs)
+            ],
+        )
+        # executemany 不返回ID，按 (workflow_id, id) 索引取回本批新行
+        new_ids = dict(
+            db.session.query(Action.name, Action.id).filter(
+                Action.workflow_id == run.workflow_id, Action.id > run.max_id
+            )
+        )
+        fan_in = run.fan_in(parent)
+        ready = []
+        for stage, config in zip(stages, configs):
+            node = _Node(new_ids[stage.name], stage.name, config, "pending")
+            node.spawned_by = parent.id
+            run.nodes[node.id] = node
+            run.names[node.name] = node.id
+            run.max_id = max(run.max_id, node.id)
+            for dependency in set(stage.dependencies):
+                self._link(run.nodes[run.names[dependency]], node)
+            for child_id in fan_in:
+                self._link(node, run.nodes[child_id])
+            if node.waiting == 0:
+                ready.append(node)
+        return ready
+
+    def _dispatch_all(self, run: _Run, ready: List[_Node]) -> None:
+        """
+        派发一批就绪节点
+
+        配置了 cache 的节点先批量计算缓存键并查找可复用的结果，命中的节点不执行，
+        直接以完成事件交给协调线程（见 app.step_cache）。
+        """
+        cacheable = [node for node in ready if "cache" in node.config]
+        hits: Dict[int, int] = {}
+        if cacheable:
+            keys = resolve_keys(
+                run.workflow_id,
+                [(node.id, node.config, node.upstream) for node in cacheable],
+                run.producers,
+            )
+            found = lookup(keys.values())
+            for node in cacheable:
+                node.cache_key = keys.get(node.id)
+                if node.cache_key in found:
+                    hits[node.id] = found[node.cache_key][0]
+        at = datetime.utcnow()
+        for node in ready:
+            if node.id in hits:
+                node.status = "running"
+                run.in_flight += 1
+                run.events.put(("cached", node.id, at, hits[node.id]))
+            else:
+                self._dispatch(run, node)
+
+    def _dispatch(self, run: _Run, node: _Node) -> None:
+        node.status = "running"
+        run.in_flight += 1
+        checkpoints = self._load_checkpoints(node.id) if "loop" in node.config else {}
+        self.scheduler.submit(
+            ScheduledTask(
+                run.project_id,
+                run.template_id,
+                functools.partial(self._execute, run, node, checkpoints),
+                run.priority,
+                run.template_limit,
+                run.workflow_id,
+                node.id,
+            )
+        )
+
+    @staticmethod
+    def _load_checkpoints(action_id: int) -> Dict[str, Tuple[int, bool, str]]:
+        """节点各循环路径最后一个检查点：路径 -> (迭代序号, 是否收敛, 状态)"""
+        rows = (
+            db.session.query(
+                LoopCheckpoint.loop_path,
+                LoopCheckpoint.iteration,
+                LoopCheckpoint.converged,
+                LoopCheckpoint.state,
+            )
+            .filter(LoopCheckpoint.action_id == action_id)
+            .order_by(LoopCheckpoint.iteration)
+        )
+        return {
+            path: (iteration, converged, state)
+            for path, iteration, converged, state in rows
+        }
+
+    def _execute(self, run: _Run, node: _Node, checkpoints: Dict) -> None:
+        events = run.events
+        if run.cancelled:
+            events.put(("skipped", node.id, datetime.utcnow()))
+            return
+        events.put(("started", node.id, datetime.utcnow()))
+        try:
+            if "loop" in node.config:
+                status, logs = self._run_loop(
+                    run, node.id, node.name, node.config["loop"], {}, checkpoints
+                )
+                logs = logs[-self.log_limit :]
+            elif node.config.get("command"):
+                status, logs = self._run_spawning(run, node)
+            else:
+                status, logs = run_command(node.config, self.log_limit)
+        except Exception as e:  # 保证协调线程总能收到结束事件
+            status, logs = "failed", f"执行异常: {e}"
+        if run.cancelled and status != "completed":
+            status = "terminated"
+        events.put(("finished", node.id, datetime.utcnow(), status, logs))
+
+    def _run_spawning(self, run: _Run, node: _Node) -> Tuple[str, str]:
+        """执行命令，成功后把命令写入 NADC_SPAWN_FILE 的节点规格交给协调线程"""
+        fd, spawn_file = tempfile.mkstemp(prefix="nadc-spawn-", suffix=".jsonl")
+        os.close(fd)
+        try:
+            config = _with_env(
+                node.config,
+                {
+                    "NADC_SPAWN_FILE": spawn_file,
+                    "NADC_ACTION_ID": str(node.id),
+                    "NADC_RUN_KEY": action_run_key(run.workflow_id, node.id),
+                },
+            )
+            status, logs = run_command(config, self.log_limit, run.processes)
+            if status != "completed":
+                return status, logs
+            with open(spawn_file, encoding="utf-8") as fp:
+                try:
+                    specs = [json.loads(line) for line in fp if line.strip()]
+                except json.JSONDecodeError as e:
+                    return "failed", f"{logs}\n节点规格不是有效的JSON: {e}"
+            if specs:
+                self._queue_spawns(run, node.id, specs)
+                logs = f"{logs}\n产生 {len(specs)} 个节点"
+            return status, logs[-self.log_limit :]
+        finally:
+            os.unlink(spawn_file)
+
+    def _run_loop(
+        self,
+        run: _Run,
+        action_id: int,
+        path: str,
+        loop: Dict,
+        env: Dict[str, str],
+        checkpoints: Dict[str, Tuple[int, bool, str]],
+    ) -> Tuple[str, str]:
+        """
+        在工作线程中执行一个循环，从该循环路径最后一个检查点之后继续
+
+        每次迭代的循环体阶段可从环境变量 NADC_ITERATION（迭代序号，从1开始）和
+        NADC_LOOP_STATE（上一次迭代终止条件的最后一行输出）读取迭代信息。
+        """
+        processes = run.processes
+        max_iterations = loop["max_iterations"]
+        iteration, converged, state = checkpoints.get(path, (0, False, None))
+        if converged or iteration >= max_iterations:
+            return "completed", f"[{path}] 已完成 {iteration} 次迭代，跳过"
+
+        body = compile_template(loop).stages
+        logs = []
+        while iteration < max_iterations:
+            iteration += 1
+            started_at = datetime.utcnow()
+            iteration_env = {
+                **env,
+                "NADC_ITERATION": str(iteration),
+                "NADC_LOOP_STATE": state or "",
+            }
+            for stage in body:
+                stage_path = f"{path}/{iteration}/{stage.name}"
+                if stage.loop is not None:
+                    status, output = self._run_loop(
+                        run,
+                        action_id,
+                        stage_path,
+                        stage.loop,
+                        iteration_env,
+                        checkpoints,
+                    )
+                else:
+                    status, output = run_command(
+                        _with_env(stage.config, iteration_env),
+                        self.log_limit,
+                        processes,
+                    )
+                logs.append(f"[{stage_path}] {output}")
+                if status != "completed":
+                    return status, "\n".join(logs)
+
+            converged, state = self._check_until(
+                loop.get("until"), iteration_env, state, processes
+            )
+            if processes.cancelled:
+                # 被终止的迭代不写检查点，再次执行时重做
+                return "terminated", "\n".join(logs)
+            # 等待检查点提交后再进入下一次迭代，中断后最多重做当前迭代
+            committed = run.checkpoint(
+                action_id, path, iteration, converged, state, started_at
+            )
+            try:
+                committed.result()
+            except Exception as e:
+                logs.append(f"[{path}] 第 {iteration} 次迭代的检查点提交失败: {e}")
+                return "failed", "\n".join(logs)
+            if converged:
+                logs.append(f"[{path}] 第 {iteration} 次迭代收敛")
+                return "completed", "\n".join(logs)
+
+        logs.append(f"[{path}] 达到最大迭代次数 {max_iterations}，未收敛")
+        status = "failed" if loop.get("fail_on_max_iterations") else "completed"
+        return status, "\n".join(logs)
+
+    @staticmethod
+    def _check_until(
+        until: Optional[Dict],
+        env: Dict[str, str],
+        state: Optional[str],
+        processes: ProcessGroup,
+    ) -> Tuple[bool, Optional[str]]:
+        """执行终止条件：退出码0表示收敛，输出的最后一行作为新的循环状态"""
+        if until is None:
+            return False, state
+        returncode, output = _run_process(_with_env(until, env), processes)
+        lines = output.strip().splitlines()
+        return returncode == 0, lines[-1] if lines else state
+
+    def _persist(
+        self,
+        run: _Run,
+        started: List[Dict],
+        finished: List[Dict],
+        skipped: List[Dict],
+        checkpoints: List[Tuple],
+        cached: Dict[str, List],
+    ) -> None:
+        """
+        提交一轮状态变化并通知等待检查点的循环工作线程
+
+        提交失败时等待中的工作线程收到异常，不会一直占用调度器的工作线程。
+        """
+        now = datetime.utcnow()
+        try:
+            for rows in (started, finished, skipped):
+                if rows:
+                    for row in rows:
+                        row["updated_at"] = now
+                    db.session.execute(update(Action), rows)
+            if checkpoints:
+                self._write_checkpoints(run.workflow_id, checkpoints)
+            record_results(
+                run.workflow_id, run.template_id, cached["executed"], cached["hits"]
+            )
+            db.session.commit()
+        except Exception as e:
+            for *_, committed in checkpoints:
+                committed.set_exception(e)
+            raise
+        for *_, committed in checkpoints:
+            committed.set_result(True)
+
+    @staticmethod
+    def _write_checkpoints(workflow_id: int, checkpoints: List[Tuple]) -> None:
+        """写入迭代检查点，每次迭代记为一个溯源活动并由上一次迭代通知"""
+        rows, activities, informed = [], {}, []
+        for node, at, path, iteration, converged, state, started_at, _ in checkpoints:
+            rows.append(
+                {
+                    "action_id": node.id,
+                    "loop_path": path,
+                    "iteration": iteration,
+                    "converged": converged,
+                    "state": state,
+                    "started_at": started_at,
+                    "completed_at": at,
+                }
+            )
+            prefix = action_run_key(workflow_id, node.id)
+            key = f"{prefix}/{path}#{iteration}"
+            activities[key] = {
+                "id": key,
+                "name": f"{path}#{iteration}",
+                "start_time": started_at,
+                "end_time": at,
+                "run_key": key,
+            }
+            if iteration > 1:
+                previous = f"{prefix}/{path}#{iteration - 1}"
+                # 上一次迭代已写入，按 run_key 复用已有活动
+                activities.setdefault(
+                    previous,
+                    {
+                        "id": previous,
+                        "name": f"{path}#{iteration - 1}",
+                        "run_key": previous,
+                    },
+                )
+                informed.append({"informed": key, "informant": previous})
+        db.session.execute(insert(LoopCheckpoint), rows)
+        ingest_document(
+            {"activities": list(activities.values()), "was_informed_by": informed},
+            commit=False,
+        )
+
+
+engine = WorkflowEngine()
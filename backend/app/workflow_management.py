@@ -1,6 +1,10 @@
+from concurrent.futures import Future
 from datetime import datetime
 from itertools import product
-from typing import List, Optional
+from typing import List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import insert
 
 from app.models import (
     Activity,
@@ -11,6 +15,8 @@ from app.models import (
     WasInformedBy,
     db,
 )
+from app.provenance_writer import ProvenanceWriter
+from app.provenance_writer import writer as provenance_writer
 
 
 def create_activity(
@@ -20,10 +26,13 @@ def create_activity(
     start_time: Optional[datetime] = None,
     end_time: Optional[datetime] = None,
     comment: Optional[str] = None,
+    run_key: Optional[str] = None,
 ) -> Activity:
     """
     创建活动并建立关系
 
+    同步写入并提交；活动结束后一次性登记时可改用 queue_run 交给后台写入器组提交。
+
     Args:
         name: 活动名称
         informers: 通知此活动的活动列表（前置依赖）
@@ -31,16 +40,24 @@ def create_activity(
         start_time: 开始时间
         end_time: 结束时间
         comment: 备注信息
+        run_key: 运行标识。已存在同一run_key的活动时直接返回该活动，
+            不重复建立关系（重试安全）
 
     Returns:
         创建的Activity对象
     """
+    if run_key is not None:
+        existing = Activity.query.filter_by(run_key=run_key).first()
+        if existing is not None:
+            return existing
+
     # 创建活动
     activity = Activity(
         name=name,
         start_time=start_time or datetime.utcnow(),
         end_time=end_time,
         comment=comment,
+        run_key=run_key,
     )
 
     # 保存活动
@@ -82,23 +99,130 @@ def run(activity: Activity) -> List[Entity]:
     pass
 
 
-def post_run(activity: Activity, outputs: List[Entity]):
+def post_run(
+    activity: Activity,
+    outputs: List[Entity],
+    derivations: Optional[List[Tuple[Entity, Entity, Optional[str]]]] = None,
+    mode: Optional[str] = None,
+):
+    """
+    活动结束后登记输出实体
+
+    同步写入并提交；需要组提交时使用 queue_run。
+
+    Args:
+        activity: 已结束的活动
+        outputs: 活动生成的实体列表
+        derivations: 需要显式保存的非平凡衍生关系 (衍生实体, 源实体, 角色)
+        mode: 衍生关系写入模式，默认取配置 PROVENANCE_DERIVATION_MODE。
+            implicit：输出衍生自全部输入的关系由 Used + WasGeneratedBy 在查询时推导，
+            不写入 WasDerivedFrom；explicit：为每对(输入, 输出)写入 WasDerivedFrom
+    """
+    mode = mode or current_app.config.get("PROVENANCE_DERIVATION_MODE", "implicit")
     activity.end_time = datetime.utcnow()
-    for output in outputs:
-        generate = WasGeneratedBy(
-            entity_id=output.id,
-            activity_id=activity.id,
+    if outputs:
+        db.session.execute(
+            insert(WasGeneratedBy.__table__),
+            [
+                {"entity_id": output.id, "activity_id": activity.id}
+                for output in outputs
+            ],
         )
-        db.session.add(generate)
-    for input, output in product(activity.used, outputs):
-        derive = WasDerivedFrom(
-            entity_id=output.id,
-            source_entity_id=input.id,
+
+    derive_rows = [
+        {"entity_id": entity.id, "source_entity_id": source.id, "role": role}
+        for entity, source, role in derivations or []
+    ]
+    if mode == "explicit":
+        input_ids = [
+            entity_id
+            for (entity_id,) in db.session.query(Used.entity_id)
+            .filter(Used.activity_id == activity.id)
+            .order_by(Used.id)
+        ]
+        derive_rows.extend(
+            {"entity_id": output.id, "source_entity_id": input_id, "role": None}
+            for input_id, output in product(input_ids, outputs)
         )
-        db.session.add(derive)
+    if derive_rows:
+        db.session.execute(insert(WasDerivedFrom.__table__), derive_rows)
     db.session.commit()
 
 
+def queue_run(
+    name: str,
+    informers: List[Activity],
+    inputs: List[Entity],
+    outputs: List[Entity],
+    derivations: Optional[List[Tuple[Entity, Entity, Optional[str]]]] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    comment: Optional[str] = None,
+    run_key: Optional[str] = None,
+    mode: Optional[str] = None,
+    writer: Optional[ProvenanceWriter] = None,
+    timeout: Optional[float] = None,
+) -> Future:
+    """
+    登记一次已结束的运行（create_activity + post_run 的组提交版本）
+
+    活动、输入输出与衍生关系组成一个溯源文档交给后台写入器，与其他调用方的文档
+    合并为一个事务提交。输入、输出实体与前置活动须已入库。
+
+    Args:
+        name: 活动名称
+        informers: 通知此活动的活动列表（前置依赖）
+        inputs: 作为输入的实体列表
+        outputs: 活动生成的实体列表
+        derivations: 需要显式保存的非平凡衍生关系 (衍生实体, 源实体, 角色)
+        start_time: 开始时间
+        end_time: 结束时间，默认为当前时间
+        comment: 备注信息
+        run_key: 运行标识，同一run_key重复登记时复用已有活动（重试安全）
+        mode: 衍生关系写入模式，含义同 post_run
+        writer: 溯源写入器，默认为应用的全局写入器
+        timeout: 写入队列满时最长等待秒数，含义同 ProvenanceWriter.submit
+
+    Returns:
+        组提交成功后返回写入结果的Future，活动ID为 result["activities"]["run"]
+
+    Raises:
+        WriterBusy: 等待超时后写入队列仍满
+    """
+    mode = mode or current_app.config.get("PROVENANCE_DERIVATION_MODE", "implicit")
+    now = datetime.utcnow()
+    derived = [
+        {"entity": entity.id, "source": source.id, "role": role}
+        for entity, source, role in derivations or []
+    ]
+    if mode == "explicit":
+        derived.extend(
+            {"entity": output.id, "source": source.id}
+            for source, output in product(inputs, outputs)
+        )
+    document = {
+        "activities": [
+            {
+                "id": "run",
+                "name": name,
+                "start_time": start_time or now,
+                "end_time": end_time or now,
+                "comment": comment,
+                "run_key": run_key,
+            }
+        ],
+        "used": [{"activity": "run", "entity": entity.id} for entity in inputs],
+        "was_generated_by": [
+            {"entity": output.id, "activity": "run"} for output in outputs
+        ],
+        "was_derived_from": derived,
+        "was_informed_by": [
+            {"informed": "run", "informant": informer.id} for informer in informers
+        ],
+    }
+    return (writer or provenance_writer).submit(document, timeout=timeout)
+
+
 def get_activity_provenance(activity_id: str) -> dict:
     """
     获取活动的完整溯源信息
@@ -151,24 +275,43 @@ def get_activity_provenance(activity_id: str) -> dict:
 
 
 def create_entity(
-    name: str, location: Optional[str] = None, comment: Optional[str] = None
+    name: str,
+    location: Optional[str] = None,
+    comment: Optional[str] = None,
+    external_id: Optional[str] = None,
+    checksum: Optional[str] = None,
 ) -> Entity:
     """
     创建实体
 
+    提供外部标识，或同时提供位置和校验和时，按该自然键查找已有实体，
+    存在则直接返回，不重复创建。
+
     Args:
         name: 实体名称
         location: 位置信息
         comment: 备注信息
+        external_id: 外部标识
+        checksum: 内容校验和
 
     Returns:
-        创建的Entity对象
+        创建的（或已存在的）Entity对象
     """
+    existing = None
+    if external_id is not None:
+        existing = Entity.query.filter_by(external_id=external_id).first()
+    elif location is not None and checksum is not None:
+        existing = Entity.query.filter_by(location=location, checksum=checksum).first()
+    if existing is not None:
+        return existing
+
     entity = Entity(
         name=name,
         location=location,
         generated_at_time=datetime.utcnow(),
         comment=comment,
+        external_id=external_id,
+        checksum=checksum,
     )
 
     db.session.add(entity)
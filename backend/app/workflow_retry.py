@@ -0,0 +1,203 @@
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import delete, update
+
+from app.models import (
+    Action,
+    Activity,
+    Entity,
+    LoopCheckpoint,
+    StepResult,
+    WasGeneratedBy,
+    db,
+)
+from app.step_cache import action_run_key
+
+# 每条 UPDATE/DELETE 语句的 IN 列表长度上限
+CHUNK_SIZE = 10000
+RETRY_MODES = ("failed", "all")
+
+# 需要重新执行的原因
+REASON_FAILED = "failed"
+REASON_TERMINATED = "terminated"
+REASON_INTERRUPTED = "interrupted"  # 上次执行中断时仍为 running
+REASON_INVALIDATED = "outputs_invalidated"  # 已完成，但生成的实体已失效
+REASON_DOWNSTREAM = "downstream"  # 上游需要重新执行
+REASON_PENDING = "pending"  # 尚未执行
+REASON_ALL = "all"
+
+SEED_REASONS = {
+    "failed": REASON_FAILED,
+    "terminated": REASON_TERMINATED,
+    "running": REASON_INTERRUPTED,
+}
+
+
+@dataclass
+class RetryAction:
+    id: int
+    name: str
+    status: str
+    reason: str
+
+
+@dataclass
+class RetryPlan:
+    """一次重试将重新执行和复用的节点"""
+
+    workflow_id: int
+    mode: str
+    rerun: List[RetryAction] = field(default_factory=list)
+    reused: int = 0  # 复用输出、不再执行的已完成节点数
+    # 重置为 pending 时需要删除循环检查点的节点（输入或输出已变化）
+    restart: Set[int] = field(default_factory=set)
+
+
+def plan_retry(workflow_id: int, mode: str = "failed") -> RetryPlan:
+    """
+    计算重试计划（只读，需要app context）
+
+    failed 模式只重新执行失败、被终止和中断的节点，已完成但生成的实体已失效
+    （invalidated_at_time 非空）的节点，以及它们的下游闭包；其余已完成节点复用
+    已有输出。下游闭包沿依赖关系展开，动态产生的节点视为父节点的下游。溯源按
+    action_run_key 关联节点：该运行标识（或以其为前缀的循环迭代活动）生成的实体。
+    all 模式重新执行全部节点。
+
+    三次查询：节点表一次，失效输出两次（自身登记的活动、缓存命中复用的活动）。
+
+    Raises:
+        ValueError: 不支持的模式
+    """
+    if mode not in RETRY_MODES:
+        raise ValueError(f"不支持的重试模式: {mode}")
+    rows = (
+        db.session.query(Action.id, Action.name, Action.status, Action.config)
+        .filter(Action.workflow_id == workflow_id)
+        .order_by(Action.id)
+        .all()
+    )
+    plan = RetryPlan(workflow_id, mode)
+    if mode == "all":
+        plan.rerun = [
+            RetryAction(action_id, name, status, REASON_ALL)
+            for action_id, name, status, _ in rows
+        ]
+        plan.restart = {action_id for action_id, *_ in rows}
+        return plan
+
+    reasons: Dict[int, str] = {}
+    for action_id, _, status, _ in rows:
+        if status in SEED_REASONS:
+            reasons[action_id] = SEED_REASONS[status]
+    for action_id in _invalidated_actions(workflow_id):
+        reasons.setdefault(action_id, REASON_INVALIDATED)
+
+    downstream = _downstream(rows)
+    queue = deque(reasons)
+    while queue:
+        for child_id in downstream.get(queue.popleft(), ()):
+            if child_id not in reasons:
+                reasons[child_id] = REASON_DOWNSTREAM
+                queue.append(child_id)
+
+    for action_id, name, status, _ in rows:
+        reason = reasons.get(action_id)
+        if reason is None and status == "pending":
+            reason = REASON_PENDING
+        if reason is None:
+            plan.reused += 1
+            continue
+        plan.rerun.append(RetryAction(action_id, name, status, reason))
+        if status == "completed":
+            plan.restart.add(action_id)
+    return plan
+
+
+def _downstream(rows) -> Dict[int, List[int]]:
+    """节点ID -> 直接下游节点ID（依赖关系，及父节点到其动态产生的节点）"""
+    ids = {name: action_id for action_id, name, _, _ in rows}
+    downstream: Dict[int, List[int]] = {}
+    for action_id, _, _, config in rows:
+        config = config or {}
+        upstream = set(config.get("dependencies") or ())
+        if config.get("spawned_by"):
+            upstream.add(config["spawned_by"])
+        for name in upstream:
+            if name in ids:
+                downstream.setdefault(ids[name], []).append(action_id)
+    return downstream
+
+
+def _invalidated_actions(workflow_id: int) -> Set[int]:
+    """生成的实体已失效的节点ID"""
+    # 节点的运行标识及其循环迭代活动都以此为前缀，见 action_run_key
+    prefix = action_run_key(workflow_id, 0).rsplit("/", 1)[0] + "/"
+    keys = (
+        db.session.query(Activity.run_key)
+        .join(WasGeneratedBy, WasGeneratedBy.activity_id == Activity.id)
+        .join(Entity, Entity.id == WasGeneratedBy.entity_id)
+        .filter(
+            Activity.run_key.startswith(prefix, autoescape=True),
+            Entity.invalidated_at_time.isnot(None),
+        )
+        .distinct()
+    )
+    actions = set()
+    for (key,) in keys:
+        action_id = key[len(prefix) :].split("/", 1)[0]
+        if action_id.isdigit():
+            actions.add(int(action_id))
+    # 缓存命中的节点复用的是其他活动的输出
+    reused = (
+        db.session.query(StepResult.action_id)
+        .join(Action, Action.id == StepResult.action_id)
+        .join(WasGeneratedBy, WasGeneratedBy.activity_id == StepResult.activity_id)
+        .join(Entity, Entity.id == WasGeneratedBy.entity_id)
+        .filter(
+            Action.workflow_id == workflow_id,
+            StepResult.hit.is_(True),
+            Entity.invalidated_at_time.isnot(None),
+        )
+        .distinct()
+    )
+    actions.update(action_id for (action_id,) in reused)
+    return actions
+
+
+def apply_retry(plan: RetryPlan, at: Optional[datetime] = None) -> int:
+    """
+    按计划把节点重置为 pending（不提交）
+
+    失败、被终止和中断的节点保留循环检查点，再次执行时从检查点继续；需要重新
+    执行的已完成节点删除检查点和步骤结果，从头执行。
+
+    Returns:
+        被重置的节点数
+    """
+    at = at or datetime.utcnow()
+    reset = [item.id for item in plan.rerun if item.status != "pending"]
+    for start in range(0, len(reset), CHUNK_SIZE):
+        db.session.execute(
+            update(Action)
+            .where(Action.id.in_(reset[start : start + CHUNK_SIZE]))
+            .values(
+                status="pending",
+                started_at=None,
+                completed_at=None,
+                exit_code=None,
+                logs=None,
+                updated_at=at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+    restart = sorted(plan.restart)
+    for start in range(0, len(restart), CHUNK_SIZE):
+        chunk = restart[start : start + CHUNK_SIZE]
+        db.session.execute(
+            delete(LoopCheckpoint).where(LoopCheckpoint.action_id.in_(chunk))
+        )
+        db.session.execute(delete(StepResult).where(StepResult.action_id.in_(chunk)))
+    return len(reset)
@@ -0,0 +1,396 @@
+import heapq
+import itertools
+import logging
+import random
+import statistics
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+
+from app.models import Action, Workflow, db
+
+logger = logging.getLogger(__name__)
+
+# 优先级类别，数值越小越先调度；同一类别内按项目公平分享
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+DEFAULT_PRIORITY = "normal"
+
+GroupKey = Tuple[int, int, int]  # (优先级, 项目ID, 流水线配置ID)
+
+
+@dataclass
+class ScheduledTask:
+    """待调度的节点执行任务"""
+
+    project_id: int
+    template_id: int
+    func: Callable[[], None]
+    priority: str = DEFAULT_PRIORITY
+    template_limit: Optional[int] = None  # 该流水线配置的并发上限
+    workflow_id: Optional[int] = None  # 所属流水线实例，用于取消时移出队列
+    action_id: Optional[int] = None
+
+
+@dataclass
+class _Group:
+    """同一优先级、项目、流水线配置下按提交顺序排队的任务"""
+
+    key: GroupKey
+    template_limit: Optional[int]
+    tasks: Deque[ScheduledTask] = field(default_factory=deque)
+    version: int = 0  # 堆中只有与当前版本一致的条目有效
+    queued: bool = False  # 是否有有效的堆条目
+    parked: bool = False  # 是否因并发上限暂停
+
+
+class SchedulerCore:
+    """
+    调度核心（非线程安全，由调用方加锁）
+
+    每个优先级类别一个堆，堆中每个任务组至多一个有效条目，按
+    (项目运行数/项目权重, 流水线配置运行数, 入堆序号) 排序：运行数少的项目先得到
+    执行槽（公平分享），同等份额下各组轮转。项目运行数变化后条目不立即更新，
+    弹出时发现份额过期再重新入堆（惰性失效）。达到项目或流水线配置并发上限的组
+    移出堆暂停，相应任务结束释放槽位时恢复。push/pop/release 均摊 O(log 组数)。
+    """
+
+    def __init__(
+        self,
+        project_limit: Optional[int] = None,
+        project_limits: Optional[Dict[int, int]] = None,
+        project_weights: Optional[Dict[int, float]] = None,
+        template_limit: Optional[int] = None,
+    ):
+        self.project_limit = project_limit
+        self.project_limits = project_limits or {}
+        self.project_weights = project_weights or {}
+        self.template_limit = template_limit
+        self.running_projects: Counter = Counter()
+        self.running_templates: Counter = Counter()
+        self.queued = 0
+        self._groups: Dict[GroupKey, _Group] = {}
+        self._heaps: List[List] = [[] for _ in PRIORITIES]
+        self._parked_projects: Dict[int, Set[GroupKey]] = {}
+        self._parked_templates: Dict[int, Set[GroupKey]] = {}
+        self._seq = itertools.count()
+
+    @property
+    def running(self) -> int:
+        return sum(self.running_projects.values())
+
+    def push(self, task: ScheduledTask) -> None:
+        """任务加入所在组的队尾"""
+        priority = PRIORITIES.get(task.priority, PRIORITIES[DEFAULT_PRIORITY])
+        key = (priority, task.project_id, task.template_id)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _Group(key, task.template_limit)
+        group.tasks.append(task)
+        self.queued += 1
+        if not group.queued and not group.parked:
+            self._enqueue(group)
+
+    def pop(self) -> Optional[ScheduledTask]:
+        """取出下一个可执行的任务并占用槽位；没有可执行任务时返回None"""
+        for heap in self._heaps:
+            while heap:
+                share, template_running, _, version, key = heap[0]
+                group = self._groups[key]
+                if version != group.version:
+                    heapq.heappop(heap)
+                    continue
+                if not group.tasks:
+                    heapq.heappop(heap)
+                    group.queued = False
+                    continue
+                if (share, template_running) != self._share(group):
+                    self._enqueue(group)  # 份额已过期，按当前份额重新入堆
+                    continue
+                if not self._admit(group):
+                    heapq.heappop(heap)
+                    group.queued = False
+                    continue
+                heapq.heappop(heap)
+                group.queued = False
+                task = group.tasks.popleft()
+                self.queued -= 1
+                _, project_id, template_id = key
+                self.running_projects[project_id] += 1
+                self.running_templates[template_id] += 1
+                if group.tasks:
+                    self._enqueue(group)
+                return task
+        return None
+
+    def release(self, task: ScheduledTask) -> None:
+        """任务结束，释放槽位并恢复因此暂停的组"""
+        self.running_projects[task.project_id] -= 1
+        if not self.running_projects[task.project_id]:
+            del self.running_projects[task.project_id]
+        self.running_templates[task.template_id] -= 1
+        if not self.running_templates[task.template_id]:
+            del self.running_templates[task.template_id]
+        for parked in (
+            self._parked_projects.pop(task.project_id, ()),
+            self._parked_templates.pop(task.template_id, ()),
+        ):
+            for key in parked:
+                group = self._groups[key]
+                group.parked = False
+                if group.tasks and not group.queued:
+                    self._enqueue(group)
+
+    def discard(self, workflow_id: int) -> List[ScheduledTask]:
+        """移出流水线实例尚未开始的任务，O(排队任务数)"""
+        removed = []
+        for group in self._groups.values():
+            if not any(task.workflow_id == workflow_id for task in group.tasks):
+                continue
+            kept = deque()
+            for task in group.tasks:
+                (removed if task.workflow_id == workflow_id else kept).append(task)
+            group.tasks = kept
+        self.queued -= len(removed)
+        return removed
+
+    def _share(self, group: _Group) -> Tuple[float, int]:
+        _, project_id, template_id = group.key
+        weight = self.project_weights.get(project_id, 1.0)
+        return (
+            self.running_projects[project_id] / weight,
+            self.running_templates[template_id],
+        )
+
+    def _enqueue(self, group: _Group) -> None:
+        group.version += 1
+        group.queued = True
+        heapq.heappush(
+            self._heaps[group.key[0]],
+            (*self._share(group), next(self._seq), group.version, group.key),
+        )
+
+    def _admit(self, group: _Group) -> bool:
+        """检查并发上限，超限时暂停该组"""
+        _, project_id, template_id = group.key
+        limit = self.project_limits.get(project_id, self.project_limit)
+        if limit is not None and self.running_projects[project_id] >= limit:
+            self._park(group, self._parked_projects, project_id)
+            return False
+        limit = group.template_limit or self.template_limit
+        if limit is not None and self.running_templates[template_id] >= limit:
+            self._park(group, self._parked_templates, template_id)
+            return False
+        return True
+
+    @staticmethod
+    def _park(group: _Group, parked: Dict[int, Set[GroupKey]], owner: int) -> None:
+        group.parked = True
+        group.version += 1
+        parked.setdefault(owner, set()).add(group.key)
+
+
+class ActionScheduler:
+    """
+    节点执行调度器
+
+    固定数量的工作线程从 SchedulerCore 取任务执行，任务结束后释放槽位。
+    工作线程在首次提交时启动。
+    """
+
+    def __init__(self, workers: int, **limits):
+        self.workers = workers
+        self.core = SchedulerCore(**limits)
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+    def submit(self, task: ScheduledTask) -> None:
+        with self._condition:
+            if not self._threads:
+                self._start()
+            self.core.push(task)
+            self._condition.notify()
+
+    def discard(self, workflow_id: int) -> List[ScheduledTask]:
+        """移出流水线实例尚未开始的任务，返回被移出的任务"""
+        with self._condition:
+            return self.core.discard(workflow_id)
+
+    def shutdown(self) -> None:
+        """执行中的任务结束后停止工作线程，未开始的任务被丢弃"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                "workers": self.workers,
+                "queued": self.core.queued,
+                "running": self.core.running,
+                "running_by_project": dict(self.core.running_projects),
+            }
+
+    def _start(self) -> None:
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"workflow-action-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                task = None
+                while not self._stopping and task is None:
+                    task = self.core.pop()
+                    if task is None:
+                        self._condition.wait()
+                if self._stopping:
+                    return
+            try:
+                task.func()
+            except Exception:
+                logger.exception("节点任务执行异常")
+            finally:
+                with self._condition:
+                    self.core.release(task)
+                    self._condition.notify_all()
+
+
+def queue_depth() -> List[Dict]:
+    """
+    各项目排队与运行中的节点数
+
+    从 pending/running 流水线出发（ix_workflows_status_created_at）按
+    (workflow_id, status) 索引统计节点，不扫描历史节点。
+    """
+    rows = (
+        db.session.query(Workflow.project_id, Action.status, func.count(Action.id))
+        .join(Action, Action.workflow_id == Workflow.id)
+        .filter(
+            Workflow.status.in_(("pending", "running")),
+            Action.status.in_(("pending", "running")),
+        )
+        .group_by(Workflow.project_id, Action.status)
+    )
+    projects: Dict[int, Dict] = {}
+    for project_id, status, count in rows:
+        entry = projects.setdefault(
+            project_id, {"project_id": project_id, "pending": 0, "running": 0}
+        )
+        entry[status] = count
+    return sorted(projects.values(), key=lambda entry: entry["project_id"])
+
+
+@dataclass
+class SimulationSpec:
+    """
+    调度仿真参数
+
+    bulk_projects 个项目在0时刻一次性提交 bulk_ratio 比例的低优先级批处理节点，
+    其余项目在 horizon 时间内陆续提交高优先级的快速查看节点。时间为虚拟时间。
+    """
+
+    actions: int = 100000
+    projects: int = 10
+    templates_per_project: int = 2
+    bulk_projects: int = 2
+    bulk_ratio: float = 0.9
+    workers: int = 64
+    project_limit: int = 48
+    template_limit: int = 0  # 0 表示不限制
+    bulk_duration: float = 5.0  # 平均执行时间
+    quicklook_duration: float = 0.5
+    horizon: float = 2000.0
+    seed: int = 0
+
+
+def simulate(spec: SimulationSpec) -> Dict:
+    """
+    离散事件仿真：用虚拟时钟重放排队节点，测量调度开销和各优先级等待时间
+
+    Returns:
+        调度操作总耗时、每个节点的平均调度开销（微秒）、完工时间、
+        各优先级等待时间分位数和各项目的最大并发数
+    """
+    rng = random.Random(spec.seed)
+    core = SchedulerCore(
+        project_limit=spec.project_limit,
+        template_limit=spec.template_limit or None,
+    )
+    bulk_count = int(spec.actions * spec.bulk_ratio)
+    events: List[Tuple] = []  # (时间, 序号, 类型, 任务)
+    seq = itertools.count()
+    arrivals: Dict[int, float] = {}
+    durations: Dict[int, float] = {}
+    for index in range(spec.actions):
+        bulk = index < bulk_count
+        if bulk:
+            project = index % spec.bulk_projects
+            at, priority, mean = 0.0, "low", spec.bulk_duration
+        else:
+            project = spec.bulk_projects + index % max(
+                spec.projects - spec.bulk_projects, 1
+            )
+            at = rng.uniform(0, spec.horizon)
+            priority, mean = "high", spec.quicklook_duration
+        template = project * spec.templates_per_project + rng.randrange(
+            spec.templates_per_project
+        )
+        task = ScheduledTask(project, template, lambda: None, priority)
+        arrivals[id(task)] = at
+        durations[id(task)] = rng.expovariate(1 / mean)
+        events.append((at, next(seq), "arrive", task))
+    heapq.heapify(events)
+
+    waits: Dict[str, List[float]] = {name: [] for name in PRIORITIES}
+    peak: Counter = Counter()
+    free = spec.workers
+    overhead = 0.0
+    now = 0.0
+    while events:
+        now, _, kind, task = heapq.heappop(events)
+        started = time.perf_counter()
+        if kind == "arrive":
+            core.push(task)
+        else:
+            core.release(task)
+            free += 1
+        overhead += time.perf_counter() - started
+        while free:
+            started = time.perf_counter()
+            next_task = core.pop()
+            overhead += time.perf_counter() - started
+            if next_task is None:
+                break
+            free -= 1
+            waits[next_task.priority].append(now - arrivals[id(next_task)])
+            peak[next_task.project_id] = max(
+                peak[next_task.project_id], core.running_projects[next_task.project_id]
+            )
+            finish = now + durations[id(next_task)]
+            heapq.heappush(events, (finish, next(seq), "finish", next_task))
+
+    return {
+        "actions": spec.actions,
+        "scheduling_seconds": round(overhead, 4),
+        "overhead_us_per_action": round(overhead / spec.actions * 1e6, 3),
+        "makespan": round(now, 3),
+        "wait": {name: _quantiles(values) for name, values in waits.items() if values},
+        "peak_running_by_project": dict(sorted(peak.items())),
+    }
+
+
+def _quantiles(values: List[float]) -> Dict[str, float]:
+    if len(values) < 2:
+        return {"p50": round(values[0], 3), "p95": round(values[0], 3)}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": round(cuts[49], 3), "p95": round(cuts[94], 3)}
@@ -0,0 +1,214 @@
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from app.models import Workflow, WorkflowStatRollup, db
+
+GRANULARITIES = ("hour", "day")
+
+# 启动流水线时进入的状态，启动量即进入该状态的次数（包括重试）
+LAUNCH_STATUS = "pending"
+
+RollupKey = Tuple[str, datetime, int, int, str]
+
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    """将时间截断到所在统计桶的起点"""
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def record_status_change(
+    workflow: Workflow, status: str, at: Optional[datetime] = None
+) -> None:
+    """
+    记录流水线进入某状态，累加所有粒度的统计桶
+
+    与流水线状态变更处于同一事务中，由调用方提交。
+
+    Args:
+        workflow: 状态发生变化的流水线实例
+        status: 进入的状态
+        at: 状态变化时间，默认当前时间
+    """
+    record_status_changes(
+        [(workflow.project_id, workflow.template_id, status, at or datetime.utcnow())]
+    )
+
+
+def record_status_changes(changes: Iterable[Tuple[int, int, str, datetime]]) -> None:
+    """
+    批量记录状态变化，所有变化合并为一次upsert
+
+    Args:
+        changes: (项目ID, 流水线配置ID, 进入的状态, 状态变化时间)
+    """
+    increments = Counter(
+        (granularity, bucket_start(at, granularity), project_id, template_id, status)
+        for project_id, template_id, status, at in changes
+        for granularity in GRANULARITIES
+    )
+    _apply_increments(increments)
+
+
+def _apply_increments(increments: Dict[RollupKey, int]) -> None:
+    """以upsert方式累加统计桶计数"""
+    if not increments:
+        return
+    rows = [
+        {
+            "granularity": granularity,
+            "bucket_start": start,
+            "project_id": project_id,
+            "template_id": template_id,
+            "status": status,
+            "count": count,
+        }
+        for (granularity, start, project_id, template_id, status), count in (
+            increments.items()
+        )
+    ]
+    dialect = db.engine.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        stmt = insert(WorkflowStatRollup.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                "granularity",
+                "bucket_start",
+                "project_id",
+                "template_id",
+                "status",
+            ],
+            set_={"count": WorkflowStatRollup.__table__.c.count + stmt.excluded.count},
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    # 其他数据库：逐桶查询后更新
+    for row in rows:
+        rollup = WorkflowStatRollup.query.filter_by(
+            granularity=row["granularity"],
+            bucket_start=row["bucket_start"],
+            project_id=row["project_id"],
+            template_id=row["template_id"],
+            status=row["status"],
+        ).first()
+        if rollup:
+            rollup.count += row["count"]
+        else:
+            db.session.add(WorkflowStatRollup(**row))
+    db.session.flush()
+
+
+def rebuild_rollups(batch_size: int = 10000) -> int:
+    """
+    根据workflows表重建统计汇总（用于首次上线或修复）
+
+    每个实例按创建时间记一次启动，当前状态不是pending时再按完成/更新时间记一次。
+
+    Returns:
+        扫描的流水线实例数
+    """
+    WorkflowStatRollup.query.delete()
+    rows: Iterable = db.session.query(
+        Workflow.project_id,
+        Workflow.template_id,
+        Workflow.status,
+        Workflow.created_at,
+        Workflow.completed_at,
+        Workflow.updated_at,
+    ).yield_per(batch_size)
+    increments: Counter = Counter()
+    scanned = 0
+    for project_id, template_id, status, created_at, completed_at, updated_at in rows:
+        scanned += 1
+        events = [(LAUNCH_STATUS, created_at)]
+        if status and status != LAUNCH_STATUS:
+            events.append((status, completed_at or updated_at or created_at))
+        for event_status, at in events:
+            if at is None:
+                continue
+            for granularity in GRANULARITIES:
+                key = (
+                    granularity,
+                    bucket_start(at, granularity),
+                    project_id,
+                    template_id,
+                    event_status,
+                )
+                increments[key] += 1
+    _apply_increments(increments)
+    db.session.commit()
+    return scanned
+
+
+def query_rollups(
+    granularity: str,
+    start: datetime,
+    end: datetime,
+    project_id: Optional[int] = None,
+    template_id: Optional[int] = None,
+    status: Optional[str] = None,
+) -> List[Dict]:
+    """
+    查询时间范围内的统计桶序列
+
+    Args:
+        granularity: hour 或 day
+        start: 起始时间（含）
+        end: 结束时间（不含）
+        project_id: 仅统计该项目
+        template_id: 仅统计该流水线配置
+        status: 仅统计该状态
+
+    Returns:
+        按桶起点排序的 {bucket, status, count} 列表
+    """
+    query = db.session.query(
+        WorkflowStatRollup.bucket_start,
+        WorkflowStatRollup.status,
+        func.sum(WorkflowStatRollup.count),
+    ).filter(
+        WorkflowStatRollup.granularity == granularity,
+        WorkflowStatRollup.bucket_start >= bucket_start(start, granularity),
+        WorkflowStatRollup.bucket_start < end,
+    )
+    if project_id is not None:
+        query = query.filter(WorkflowStatRollup.project_id == project_id)
+    if template_id is not None:
+        query = query.filter(WorkflowStatRollup.template_id == template_id)
+    if status is not None:
+        query = query.filter(WorkflowStatRollup.status == status)
+
+    rows = query.group_by(
+        WorkflowStatRollup.bucket_start, WorkflowStatRollup.status
+    ).order_by(WorkflowStatRollup.bucket_start, WorkflowStatRollup.status)
+    return [
+        {"bucket": bucket, "status": bucket_status, "count": int(count)}
+        for bucket, bucket_status, count in rows
+    ]
+
+
+def launch_count(
+    day: Optional[datetime] = None, project_id: Optional[int] = None
+) -> int:
+    """统计某天（默认今天）的流水线启动量"""
+    start = bucket_start(day or datetime.utcnow(), "day")
+    query = db.session.query(
+        func.coalesce(func.sum(WorkflowStatRollup.count), 0)
+    ).filter(
+        WorkflowStatRollup.granularity == "day",
+        WorkflowStatRollup.bucket_start == start,
+        WorkflowStatRollup.status == LAUNCH_STATUS,
+    )
+    if project_id is not None:
+        query = query.filter(WorkflowStatRollup.project_id == project_id)
+    return int(query.scalar())
@@ -27,6 +27,7 @@ from app.models import (
     WorkflowTemplate,
 )
 from app.workflow_management import create_activity, create_entity, post_run
+from app.workflow_stats import rebuild_rollups
 
 
 def create_projects():
@@ -465,6 +466,10 @@ def insert_test_data():
     print("创建动作节点模块测试数据...")
     create_actions(workflow1, workflow2, workflow4)
 
+    # 5. 根据流水线实例生成统计汇总
+    print("生成流水线统计汇总...")
+    rebuild_rollups()
+
     create_provenance_data()
 
     print("测试数据插入完成！")
@@ -0,0 +1,36 @@
+"""workflow/action list pagination indexes
+
+Revision ID: 3f2b9c1d4e5a
+Revises: 6a1d0d0f8800
+Create Date: 2026-10-19 09:12:03.114520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2b9c1d4e5a'
+down_revision = '6a1d0d0f8800'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_workflows_created_at_id', 'workflows', ['created_at', 'id'])
+    op.create_index('ix_workflows_updated_at_id', 'workflows', ['updated_at', 'id'])
+    op.create_index('ix_workflows_status_created_at', 'workflows', ['status', 'created_at', 'id'])
+    op.create_index('ix_workflows_project_id_created_at', 'workflows', ['project_id', 'created_at', 'id'])
+    op.create_index('ix_workflows_template_id_created_at', 'workflows', ['template_id', 'created_at', 'id'])
+    op.create_index('ix_actions_workflow_id_id', 'actions', ['workflow_id', 'id'])
+    op.create_index('ix_actions_workflow_id_status', 'actions', ['workflow_id', 'status'])
+
+
+def downgrade():
+    op.drop_index('ix_actions_workflow_id_status', table_name='actions')
+    op.drop_index('ix_actions_workflow_id_id', table_name='actions')
+    op.drop_index('ix_workflows_template_id_created_at', table_name='workflows')
+    op.drop_index('ix_workflows_project_id_created_at', table_name='workflows')
+    op.drop_index('ix_workflows_status_created_at', table_name='workflows')
+    op.drop_index('ix_workflows_updated_at_id', table_name='workflows')
+    op.drop_index('ix_workflows_created_at_id', table_name='workflows')
@@ -0,0 +1,43 @@
+"""provenance natural keys for idempotent ingestion
+
+Revision ID: 5e8a3c7d9b21
+Revises: d41f6b8e2c17
+Create Date: 2026-10-19 15:02:47.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8a3c7d9b21'
+down_revision = 'd41f6b8e2c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 溯源表由 db.create_all() 创建，未创建时跳过
+    if not sa.inspect(op.get_bind()).has_table('entity'):
+        return
+    with op.batch_alter_table('entity', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('external_id', sa.String(), nullable=True, comment='外部标识'))
+        batch_op.add_column(sa.Column('checksum', sa.String(), nullable=True, comment='内容校验和'))
+        batch_op.create_unique_constraint('uq_entity_external_id', ['external_id'])
+        batch_op.create_unique_constraint('uq_entity_location_checksum', ['location', 'checksum'])
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('run_key', sa.String(), nullable=True, comment='运行标识（重试时去重）'))
+        batch_op.create_unique_constraint('uq_activity_run_key', ['run_key'])
+
+
+def downgrade():
+    if not sa.inspect(op.get_bind()).has_table('entity'):
+        return
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_activity_run_key', type_='unique')
+        batch_op.drop_column('run_key')
+    with op.batch_alter_table('entity', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_entity_location_checksum', type_='unique')
+        batch_op.drop_constraint('uq_entity_external_id', type_='unique')
+        batch_op.drop_column('checksum')
+        batch_op.drop_column('external_id')
@@ -0,0 +1,33 @@
+"""entity type discriminator
+
+Revision ID: b7d15e0c9a42
+Revises: 8c4e7a2f1b90
+Create Date: 2026-10-19 11:20:45.007391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d15e0c9a42'
+down_revision = '8c4e7a2f1b90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 溯源表由 db.create_all() 创建，未创建时跳过
+    if not sa.inspect(op.get_bind()).has_table('entity'):
+        return
+    op.add_column('entity', sa.Column('type', sa.String(length=20), server_default='entity', nullable=False, comment='实体子类型鉴别列'))
+    # 回填已有子类实体的鉴别值
+    op.execute("UPDATE entity SET type = 'collection' WHERE id IN (SELECT id FROM collection)")
+    op.execute("UPDATE entity SET type = 'dataset' WHERE id IN (SELECT id FROM dataset_entity)")
+    op.execute("UPDATE entity SET type = 'value' WHERE id IN (SELECT id FROM value_entity)")
+
+
+def downgrade():
+    if not sa.inspect(op.get_bind()).has_table('entity'):
+        return
+    op.drop_column('entity', 'type')
@@ -0,0 +1,41 @@
+"""provenance relation indexes
+
+Revision ID: d41f6b8e2c17
+Revises: b7d15e0c9a42
+Create Date: 2026-10-19 13:41:12.682054
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f6b8e2c17'
+down_revision = 'b7d15e0c9a42'
+branch_labels = None
+depends_on = None
+
+# 隐含衍生关系由 Used + WasGeneratedBy 按活动联结推导，需要外键列索引
+INDEXES = [
+    ('ix_used_activity_id', 'used', ['activity_id']),
+    ('ix_used_entity_id', 'used', ['entity_id']),
+    ('ix_was_generated_by_activity_id', 'was_generated_by', ['activity_id']),
+    ('ix_was_generated_by_entity_id', 'was_generated_by', ['entity_id']),
+    ('ix_was_derived_from_entity_id', 'was_derived_from', ['entity_id']),
+    ('ix_was_derived_from_source_entity_id', 'was_derived_from', ['source_entity_id']),
+]
+
+
+def upgrade():
+    # 溯源表由 db.create_all() 创建，未创建时跳过
+    if not sa.inspect(op.get_bind()).has_table('used'):
+        return
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    if not sa.inspect(op.get_bind()).has_table('used'):
+        return
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
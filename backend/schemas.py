@@ -1,6 +1,9 @@
 import json
 
-from marshmallow import Schema, fields, validate
+from marshmallow import Schema, ValidationError, fields, missing, validate
+
+# 流水线实例与节点的状态
+STATUS_CHOICES = ["pending", "running", "completed", "failed", "terminated"]
 
 
 class ProjectSchema(Schema):
@@ -25,31 +28,54 @@ class WorkflowTemplateSchema(Schema):
     # updated_at = fields.DateTime(dump_only=True)
 
     def _serialize_config(self, obj):
-        """序列化config字段"""
-        return obj.config
+        """序列化config字段（列表摘要查询未加载时省略）"""
+        return getattr(obj, "config", missing)
 
     def _deserialize_config(self, value):
-        """反序列化config字段"""
+        """反序列化config字段（可为JSON文本），内容由路由按流水线配置规则校验"""
         if value is None:
             return {}
         if isinstance(value, str):
             try:
-                return json.loads(value)
-            except json.JSONDecodeError:
-                return {}
+                value = json.loads(value)
+            except json.JSONDecodeError as e:
+                raise ValidationError(
+                    f"JSON格式错误: {e.msg}（第 {e.lineno} 行第 {e.colno} 列）"
+                )
+        if not isinstance(value, dict):
+            raise ValidationError("配置必须是对象")
         return value
 
 
+class TemplateValidateSchema(Schema):
+    """配置校验请求体"""
+
+    config = fields.Raw(required=True)  # 配置对象或JSON文本
+
+
+class TemplateIssueSchema(Schema):
+    """配置中的一处错误"""
+
+    path = fields.Str()  # 如 stages[3].dependencies[0]，空串表示整个配置
+    message = fields.Str()
+    line = fields.Int(allow_none=True)  # JSON文本无法解析时的位置
+    column = fields.Int(allow_none=True)
+
+
+class TemplateValidationSchema(Schema):
+    """配置校验结果"""
+
+    valid = fields.Bool()
+    stages = fields.Int()  # 顶层阶段数
+    errors = fields.List(fields.Nested(TemplateIssueSchema))
+
+
 class WorkflowSchema(Schema):
     """流水线实例模式"""
 
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True, validate=validate.Length(min=1, max=100))
-    status = fields.Str(
-        validate=validate.OneOf(
-            ["pending", "running", "completed", "failed", "terminated"]
-        )
-    )
+    status = fields.Str(validate=validate.OneOf(STATUS_CHOICES))
     template_id = fields.Int(required=True)
     project_id = fields.Int(required=True)
     started_at = fields.DateTime(dump_only=True)
@@ -64,18 +90,73 @@ class ActionSchema(Schema):
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True, validate=validate.Length(min=1, max=100))
     type = fields.Str(required=True, validate=validate.Length(min=1, max=50))
-    status = fields.Str(
-        validate=validate.OneOf(["pending", "running", "completed", "failed"])
-    )
+    status = fields.Str(validate=validate.OneOf(STATUS_CHOICES))
     workflow_id = fields.Int(required=True)
     config = fields.Dict()
     logs = fields.Str(dump_only=True)
+    exit_code = fields.Int(dump_only=True)
     started_at = fields.DateTime(dump_only=True)
     completed_at = fields.DateTime(dump_only=True)
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
 
 
+# 查询参数模式
+class ListQuerySchema(Schema):
+    """列表分页查询参数"""
+
+    cursor = fields.Str()
+    limit = fields.Int(load_default=50, validate=validate.Range(min=1, max=500))
+    sort = fields.Str(
+        load_default="created_at",
+        validate=validate.OneOf(["id", "created_at", "updated_at"]),
+    )
+    order = fields.Str(load_default="desc", validate=validate.OneOf(["asc", "desc"]))
+    count = fields.Str(
+        load_default="exact", validate=validate.OneOf(["exact", "estimate", "none"])
+    )
+
+
+class WorkflowQuerySchema(ListQuerySchema):
+    """流水线实例列表查询参数"""
+
+    status = fields.Str(validate=validate.OneOf(STATUS_CHOICES))
+    project_id = fields.Int()
+    template_id = fields.Int()
+    created_after = fields.DateTime()
+    created_before = fields.DateTime()
+
+
+class ActionQuerySchema(ListQuerySchema):
+    """流水线节点列表查询参数"""
+
+    sort = fields.Str(
+        load_default="id", validate=validate.OneOf(["id", "created_at", "updated_at"])
+    )
+    order = fields.Str(load_default="asc", validate=validate.OneOf(["asc", "desc"]))
+    status = fields.Str(validate=validate.OneOf(STATUS_CHOICES))
+    expand = fields.Str(data_key="fields")  # 逗号分隔：config,logs
+
+
+class WorkflowStatsQuerySchema(Schema):
+    """流水线统计查询参数"""
+
+    granularity = fields.Str(
+        load_default="day", validate=validate.OneOf(["hour", "day"])
+    )
+    start = fields.DateTime(required=True)
+    end = fields.DateTime(required=True)
+    project_id = fields.Int()
+    template_id = fields.Int()
+    status = fields.Str()
+
+
+class TodayCountQuerySchema(Schema):
+    """当日启动量查询参数"""
+
+    project_id = fields.Int()
+
+
 # 响应模式
 class ProjectListResponse(Schema):
     """项目列表响应"""
@@ -91,18 +172,84 @@ class WorkflowTemplateListResponse(Schema):
     total = fields.Int()
 
 
+class StageCacheStatsSchema(Schema):
+    """单个阶段的步骤结果缓存统计"""
+
+    name = fields.Str()
+    hits = fields.Int()
+    misses = fields.Int()  # 实际执行的次数，含没有登记溯源、无法被复用的执行
+
+
+class TemplateCacheStatsSchema(Schema):
+    """流水线配置的步骤结果缓存统计"""
+
+    template_id = fields.Int()
+    hits = fields.Int()
+    misses = fields.Int()
+    hit_rate = fields.Float()
+    stages = fields.List(fields.Nested(StageCacheStatsSchema))
+
+
 class WorkflowListResponse(Schema):
     """流水线实例列表响应"""
 
     workflows = fields.Nested(WorkflowSchema, many=True)
-    total = fields.Int()
+    total = fields.Int(allow_none=True)
+    next_cursor = fields.Str(allow_none=True)
 
 
 class ActionListResponse(Schema):
     """流水线节点列表响应"""
 
     actions = fields.Nested(ActionSchema, many=True)
-    total = fields.Int()
+    total = fields.Int(allow_none=True)
+    next_cursor = fields.Str(allow_none=True)
+
+
+class WorkflowStatBucketSchema(Schema):
+    """流水线统计桶"""
+
+    bucket = fields.DateTime()
+    status = fields.Str()
+    count = fields.Int()
+
+
+class WorkflowStatsResponse(Schema):
+    """流水线统计响应"""
+
+    granularity = fields.Str()
+    buckets = fields.Nested(WorkflowStatBucketSchema, many=True)
+
+
+class QueueProjectSchema(Schema):
+    """项目的排队与运行中节点数"""
+
+    project_id = fields.Int()
+    pending = fields.Int()
+    running = fields.Int()
+
+
+class SchedulerStatsSchema(Schema):
+    """本进程调度器状态"""
+
+    workers = fields.Int()
+    queued = fields.Int()
+    running = fields.Int()
+    running_by_project = fields.Dict(keys=fields.Str(), values=fields.Int())
+
+
+class WorkflowQueueResponse(Schema):
+    """执行队列响应"""
+
+    projects = fields.Nested(QueueProjectSchema, many=True)
+    scheduler = fields.Nested(SchedulerStatsSchema)
+
+
+class TodayCountResponse(Schema):
+    """当日启动量响应"""
+
+    date = fields.Date()
+    count = fields.Int()
 
 
 class LogResponse(Schema):
@@ -111,3 +258,142 @@ class LogResponse(Schema):
     logs = fields.Str()
     action_id = fields.Int()
     workflow_id = fields.Int()
+
+
+class ActionSpawnSchema(Schema):
+    """动态产生节点的请求体"""
+
+    actions = fields.List(fields.Dict(), required=True, validate=validate.Length(min=1))
+
+
+class ActionSpawnResponse(Schema):
+    """动态产生节点的响应"""
+
+    accepted = fields.Int()
+
+
+class RetryQuerySchema(Schema):
+    """重试参数"""
+
+    # failed: 只重新执行失败/被终止的节点及其下游；all: 重新执行全部节点
+    mode = fields.Str(load_default="failed", validate=validate.OneOf(["failed", "all"]))
+
+
+class RetryActionSchema(Schema):
+    """重试时将重新执行的节点"""
+
+    id = fields.Int()
+    name = fields.Str()
+    status = fields.Str()  # 当前状态
+    # failed/terminated/interrupted/outputs_invalidated/downstream/pending/all
+    reason = fields.Str()
+
+
+class RetryPlanSchema(Schema):
+    """重试计划预览"""
+
+    workflow_id = fields.Int()
+    mode = fields.Str()
+    rerun = fields.List(fields.Nested(RetryActionSchema))
+    reused = fields.Int()  # 复用输出、不再执行的已完成节点数
+
+
+class StageTimingSchema(Schema):
+    """节点在一次运行中的时间"""
+
+    id = fields.Int()
+    name = fields.Str()
+    status = fields.Str()
+    ready_at = fields.DateTime(allow_none=True)  # 上游全部结束的时间
+    started_at = fields.DateTime(allow_none=True)
+    completed_at = fields.DateTime(allow_none=True)
+    queue_seconds = fields.Float(allow_none=True)  # 就绪到开始
+    execution_seconds = fields.Float(allow_none=True)  # 开始到结束
+    slack_seconds = fields.Float(allow_none=True)  # 可推迟而不影响整体结束的时间
+    critical = fields.Bool()
+
+
+class CriticalPathSchema(Schema):
+    """一次运行的关键路径分析"""
+
+    workflow_id = fields.Int()
+    template_id = fields.Int()
+    status = fields.Str()
+    started_at = fields.DateTime(allow_none=True)
+    completed_at = fields.DateTime(allow_none=True)
+    wall_seconds = fields.Float(allow_none=True)
+    critical_path = fields.List(fields.Str())  # 关键路径上的节点名，按执行顺序
+    critical_queue_seconds = fields.Float()
+    critical_execution_seconds = fields.Float()
+    bottleneck = fields.Str(allow_none=True)  # 关键路径上执行时间最长的节点
+    stages = fields.List(fields.Nested(StageTimingSchema))
+
+
+class BottleneckQuerySchema(Schema):
+    """瓶颈汇总参数"""
+
+    limit = fields.Int(load_default=30, validate=validate.Range(min=1, max=200))
+
+
+class StageBottleneckSchema(Schema):
+    """单个阶段在多次运行中的汇总"""
+
+    name = fields.Str()
+    runs = fields.Int()
+    critical_runs = fields.Int()  # 位于关键路径上的次数
+    critical_share = fields.Float()
+    queue_seconds_avg = fields.Float()
+    execution_seconds_avg = fields.Float()
+    execution_seconds_max = fields.Float()
+    slack_seconds_avg = fields.Float()
+
+
+class TemplateBottleneckSchema(Schema):
+    """流水线配置最近多次成功运行的瓶颈汇总"""
+
+    template_id = fields.Int()
+    runs = fields.Int()
+    wall_seconds_avg = fields.Float(allow_none=True)
+    wall_seconds_max = fields.Float(allow_none=True)
+    bottleneck = fields.Str(allow_none=True)
+    stages = fields.List(fields.Nested(StageBottleneckSchema))
+
+
+class StatusTransitionSchema(Schema):
+    """执行器上报的一次状态变化"""
+
+    id = fields.Int(required=True)
+    status = fields.Str(required=True, validate=validate.OneOf(STATUS_CHOICES))
+    at = fields.DateTime(required=True)
+    exit_code = fields.Int(allow_none=True)
+    logs = fields.Str(allow_none=True)
+    log_offset = fields.Int(allow_none=True, validate=validate.Range(min=0))
+
+
+class StatusUpdateSchema(Schema):
+    """批量状态变化请求体"""
+
+    actions = fields.List(
+        fields.Nested(StatusTransitionSchema),
+        load_default=list,
+        validate=validate.Length(max=50000),
+    )
+    workflows = fields.List(
+        fields.Nested(StatusTransitionSchema),
+        load_default=list,
+        validate=validate.Length(max=50000),
+    )
+
+
+class StatusUpdateResult(Schema):
+    """一类对象的写入结果"""
+
+    applied = fields.Int()
+    skipped = fields.List(fields.Int())  # 不存在或状态不能前进的对象ID
+
+
+class StatusUpdateResponse(Schema):
+    """批量状态变化响应"""
+
+    actions = fields.Nested(StatusUpdateResult)
+    workflows = fields.Nested(StatusUpdateResult)
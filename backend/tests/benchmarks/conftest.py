@@ -0,0 +1,200 @@
+"""
+性能基准公共设施
+
+运行::
+
+    python -m pytest tests/benchmarks --benchmark            # 与基准线比较
+    python -m pytest tests/benchmarks --benchmark-update     # 重新记录基准线
+
+数据库使用 DATABASE_URL 指定的本地库（会被清空重建）。BENCHMARK_SCALE 环境变量
+按倍数放大数据规模。基准线按 数据库方言-规模 分组保存在 baselines.json 中：
+SQL查询数超过基准线、p95延迟超过基准线的 --benchmark-tolerance 倍、
+或峰值内存明显增长时，对应基准失败。
+"""
+
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pytest
+from sqlalchemy import event
+
+from app import app, db
+
+BASELINE_FILE = Path(__file__).with_name("baselines.json")
+SCALE = int(os.getenv("BENCHMARK_SCALE", "1"))
+
+# 峰值内存允许的增长：相对倍数 + 绝对余量（KB）
+MEMORY_TOLERANCE = 1.5
+MEMORY_SLACK_KB = 256
+
+RESULTS: Dict[str, "BenchmarkResult"] = {}
+REGRESSIONS: Dict[str, List[str]] = {}
+
+
+@dataclass
+class BenchmarkResult:
+    """单个基准的测量结果"""
+
+    rounds: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    queries: int
+    peak_kb: float
+
+
+class BenchmarkRunner:
+    """重复执行被测函数，统计延迟分位数、SQL查询数和峰值内存并与基准线比较"""
+
+    def __init__(self, config):
+        self.update = config.getoption("--benchmark-update")
+        self.tolerance = config.getoption("--benchmark-tolerance")
+        self.scale = SCALE
+        self.group = f"{db.engine.dialect.name}-x{SCALE}"
+        self.baselines = (
+            json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+        )
+
+    def measure(
+        self,
+        name: str,
+        func: Callable[[], object],
+        rounds: int = 20,
+        warmup: int = 1,
+        setup: Optional[Callable[[], object]] = None,
+    ) -> BenchmarkResult:
+        """
+        测量被测函数
+
+        每轮执行前清空会话的identity map，保证每轮都从冷状态加载。
+
+        Args:
+            name: 基准名（基准线中的键）
+            func: 被测函数
+            rounds: 计时轮数
+            warmup: 预热轮数（不计时）
+            setup: 每轮执行前调用、不计时的准备函数
+        """
+        queries = [0]
+
+        def count(*args):
+            queries[0] += 1
+
+        def prepare() -> None:
+            if setup is not None:
+                setup()
+            db.session.expunge_all()
+
+        for _ in range(warmup):
+            prepare()
+            func()
+
+        latencies = []
+        per_round_queries = []
+        event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            for _ in range(rounds):
+                prepare()
+                queries[0] = 0
+                started = time.perf_counter()
+                func()
+                latencies.append((time.perf_counter() - started) * 1000)
+                per_round_queries.append(queries[0])
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count)
+
+        prepare()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        result = BenchmarkResult(
+            rounds=rounds,
+            p50_ms=round(cuts[49], 3),
+            p95_ms=round(cuts[94], 3),
+            p99_ms=round(cuts[98], 3),
+            max_ms=round(max(latencies), 3),
+            queries=max(per_round_queries),
+            peak_kb=round(peak / 1024, 1),
+        )
+        RESULTS[name] = result
+        self._check(name, result)
+        return result
+
+    def _check(self, name: str, result: BenchmarkResult) -> None:
+        baseline = self.baselines.get(self.group, {}).get(name)
+        if self.update or baseline is None:
+            return
+        failures = []
+        if result.queries > baseline["queries"]:
+            failures.append(
+                f"SQL查询数 {result.queries} > 基准线 {baseline['queries']}"
+            )
+        if result.p95_ms > baseline["p95_ms"] * self.tolerance:
+            failures.append(
+                f"p95 {result.p95_ms}ms > 基准线 {baseline['p95_ms']}ms x {self.tolerance}"
+            )
+        if result.peak_kb > baseline["peak_kb"] * MEMORY_TOLERANCE + MEMORY_SLACK_KB:
+            failures.append(
+                f"峰值内存 {result.peak_kb}KB > 基准线 {baseline['peak_kb']}KB"
+            )
+        if failures:
+            REGRESSIONS[name] = failures
+            pytest.fail(f"{name} 性能回退: " + "；".join(failures))
+
+    def save(self) -> None:
+        group = self.baselines.setdefault(self.group, {})
+        group.update({name: asdict(result) for name, result in RESULTS.items()})
+        self.baselines[self.group] = dict(sorted(group.items()))
+        BASELINE_FILE.write_text(
+            json.dumps(self.baselines, indent=2, ensure_ascii=False) + "\n"
+        )
+
+
+@pytest.fixture(scope="session")
+def bench(request):
+    """基准测量器，--benchmark-update 时在会话结束后写回基准线"""
+    with app.app_context():
+        runner = BenchmarkRunner(request.config)
+    yield runner
+    if runner.update and RESULTS:
+        runner.save()
+
+
+@pytest.fixture(scope="module")
+def bench_app():
+    """模块级app context，数据库在模块开始时清空重建"""
+    ctx = app.app_context()
+    ctx.push()
+    db.drop_all()
+    db.create_all()
+    yield app
+    db.session.remove()
+    ctx.pop()
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+    terminalreporter.section("性能基准")
+    header = (
+        f"{'基准':<44}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'SQL':>7}{'峰值KB':>10}"
+    )
+    terminalreporter.write_line(header)
+    for name, result in RESULTS.items():
+        flag = "  <-- 回退" if name in REGRESSIONS else ""
+        terminalreporter.write_line(
+            f"{name:<44}{result.p50_ms:>10.2f}{result.p95_ms:>10.2f}"
+            f"{result.p99_ms:>10.2f}{result.queries:>7}{result.peak_kb:>10.1f}{flag}"
+        )
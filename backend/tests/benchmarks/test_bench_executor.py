@@ -0,0 +1,168 @@
+import itertools
+from datetime import datetime
+
+import pytest
+
+from app import app
+from app.critical_path import analysis_cache
+from app.executor_backends import FakeArgoBackend, StatusEvent, apply_status_events
+from app.models import Action, Project, Workflow, WorkflowTemplate, db
+from app.status_consumer import StatusConsumer
+from app.template_plans import plan_cache
+from app.workflow_engine import compile_template, create_actions
+
+pytestmark = pytest.mark.benchmark
+
+STAGES = 2000
+PLAN_STAGES = 10000
+
+counter = itertools.count()
+
+
+def create_workflow() -> int:
+    """STAGES 个互不依赖的阶段"""
+    project = Project(name=f"bench-executor{next(counter)}")
+    db.session.add(project)
+    db.session.flush()
+    config = {
+        "stages": [
+            {"name": f"s{i}", "type": "script", "dependencies": []}
+            for i in range(STAGES)
+        ]
+    }
+    template = WorkflowTemplate(
+        name="bench-executor", config=config, project_id=project.id
+    )
+    db.session.add(template)
+    db.session.flush()
+    workflow = Workflow(
+        name="bench-executor", template_id=template.id, project_id=project.id
+    )
+    db.session.add(workflow)
+    db.session.flush()
+    create_actions(workflow, compile_template(config))
+    db.session.commit()
+    return workflow.id
+
+
+def test_fake_argo_submit(bench, bench_app):
+    # Pod不会在计时内启动，测量的是读取节点、建立依赖和启动控制线程
+    backend = FakeArgoBackend(pod_latency=3600, sync=False)
+    backend.app = app
+    workflow_ids = []
+
+    def setup():
+        for workflow_id in workflow_ids:
+            backend.cancel(workflow_id)
+        workflow_ids.append(create_workflow())
+
+    bench.measure(
+        "executor.fake_argo.submit_2k",
+        lambda: backend.submit(workflow_ids[-1]),
+        rounds=5,
+        setup=setup,
+    )
+    for workflow_id in workflow_ids:
+        backend.cancel(workflow_id)
+
+
+def test_status_sync(bench, bench_app):
+    workflow_id = create_workflow()
+    action_ids = [
+        action_id
+        for (action_id,) in db.session.query(Action.id).filter_by(
+            workflow_id=workflow_id
+        )
+    ]
+    now = datetime.utcnow()
+    events = (
+        [StatusEvent(workflow_id, None, "running", now)]
+        + [StatusEvent(workflow_id, i, "running", now) for i in action_ids]
+        + [StatusEvent(workflow_id, i, "completed", now, 0, "done") for i in action_ids]
+    )
+    bench.measure(
+        "executor.apply_status_events_4k", lambda: apply_status_events(events)
+    )
+
+
+def test_status_consumer_flush(bench, bench_app):
+    # 每个节点 running + completed 两条消息，合并后每个节点写一行
+    consumer = StatusConsumer(app)
+    workflow_id = create_workflow()
+    action_ids = [
+        action_id
+        for (action_id,) in db.session.query(Action.id).filter_by(
+            workflow_id=workflow_id
+        )
+    ]
+
+    def publish():
+        now = datetime.utcnow()
+        for action_id in action_ids:
+            for status in ("running", "completed"):
+                event = StatusEvent(workflow_id, action_id, status, now)
+                consumer.bus.publish(event.routing_key, event.to_message())
+
+    bench.measure(
+        "executor.status_consumer_flush_4k", consumer.drain, rounds=5, setup=publish
+    )
+
+
+def test_template_plan(bench, bench_app):
+    project = Project(name=f"bench-executor{next(counter)}")
+    db.session.add(project)
+    db.session.flush()
+    # 每个阶段依赖前一个阶段和前第十个阶段
+    config = {
+        "stages": [
+            {
+                "name": f"s{i}",
+                "type": "script",
+                "dependencies": [f"s{j}" for j in (i - 1, i - 10) if j >= 0],
+                "config": {"command": "run.sh", "args": [i]},
+            }
+            for i in range(PLAN_STAGES)
+        ]
+    }
+    template = WorkflowTemplate(name="bench-plan", config=config, project_id=project.id)
+    db.session.add(template)
+    db.session.commit()
+    template_id = template.id
+
+    bench.measure(
+        "executor.template_plan.compile_10k",
+        lambda: plan_cache.get(template_id),
+        rounds=5,
+        setup=lambda: plan_cache.invalidate(template_id),
+    )
+    # 命中时只查询 updated_at，不加载和编译配置
+    bench.measure(
+        "executor.template_plan.cached_10k", lambda: plan_cache.get(template_id)
+    )
+
+
+def test_critical_path(bench, bench_app):
+    workflow_id = create_workflow()
+    now = datetime.utcnow()
+    apply_status_events(
+        [StatusEvent(workflow_id, None, "running", now)]
+        + [
+            StatusEvent(workflow_id, action_id, status, now, 0)
+            for (action_id,) in db.session.query(Action.id).filter_by(
+                workflow_id=workflow_id
+            )
+            for status in ("running", "completed")
+        ]
+        + [StatusEvent(workflow_id, None, "completed", now)]
+    )
+
+    bench.measure(
+        "executor.critical_path.cold_2k",
+        lambda: analysis_cache.get(workflow_id),
+        rounds=5,
+        setup=analysis_cache.clear,
+    )
+    # 已结束的实例命中缓存时只查询流水线行
+    bench.measure(
+        "executor.critical_path.cached_2k", lambda: analysis_cache.get(workflow_id)
+    )
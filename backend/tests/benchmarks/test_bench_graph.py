@@ -0,0 +1,104 @@
+import pytest
+
+from app.models import Entity, db
+from app.provenance_graph import ProvenanceGraph, load_entities
+from app.provenance_ingest import ingest_document
+
+pytestmark = pytest.mark.benchmark
+
+
+def chain_document(length):
+    """e0 -> a1 -> e1 -> ... -> e{length}"""
+    return {
+        "entities": [{"id": f"e{i}", "name": f"chain{i}"} for i in range(length + 1)],
+        "activities": [
+            {"id": f"a{i}", "name": f"step{i}"} for i in range(1, length + 1)
+        ],
+        "used": [
+            {"activity": f"a{i}", "entity": f"e{i - 1}"} for i in range(1, length + 1)
+        ],
+        "was_generated_by": [
+            {"entity": f"e{i}", "activity": f"a{i}"} for i in range(1, length + 1)
+        ],
+    }
+
+
+def diamond_document(count):
+    """串联的菱形：e -> (split_l, split_r) -> (l, r) -> merge -> e'"""
+    document = {
+        "entities": [{"id": "d0", "name": "diamond0"}],
+        "activities": [],
+        "used": [],
+        "was_generated_by": [],
+    }
+    for i in range(1, count + 1):
+        source, target = f"d{i - 1}", f"d{i}"
+        for side in ("l", "r"):
+            document["activities"].append({"id": f"split{i}{side}", "name": "split"})
+            document["entities"].append({"id": f"{side}{i}", "name": f"{side}{i}"})
+            document["used"].append({"activity": f"split{i}{side}", "entity": source})
+            document["was_generated_by"].append(
+                {"entity": f"{side}{i}", "activity": f"split{i}{side}"}
+            )
+            document["used"].append({"activity": f"merge{i}", "entity": f"{side}{i}"})
+        document["activities"].append({"id": f"merge{i}", "name": "merge"})
+        document["entities"].append({"id": target, "name": f"diamond{i}"})
+        document["was_generated_by"].append({"entity": target, "activity": f"merge{i}"})
+    return document
+
+
+def fan_in_document(width):
+    """width 个独立处理的输入汇入一个活动"""
+    document = {
+        "entities": [{"id": "product", "name": "fan_in_product"}],
+        "activities": [{"id": "combine", "name": "combine"}],
+        "used": [],
+        "was_generated_by": [{"entity": "product", "activity": "combine"}],
+    }
+    for i in range(width):
+        document["entities"] += [{"id": f"raw{i}", "name": f"raw{i}"}, {"id": f"in{i}"}]
+        document["activities"].append({"id": f"prep{i}", "name": "prep"})
+        document["used"] += [
+            {"activity": f"prep{i}", "entity": f"raw{i}"},
+            {"activity": "combine", "entity": f"in{i}"},
+        ]
+        document["was_generated_by"].append(
+            {"entity": f"in{i}", "activity": f"prep{i}"}
+        )
+    return document
+
+
+@pytest.fixture(scope="module")
+def roots(bench_app, bench):
+    scale = bench.scale
+    shapes = {
+        "chain": (chain_document(100 * scale), f"e{100 * scale}"),
+        # 遍历没有去重，菱形的遍历量随层数指数增长，层数保持较小
+        "diamond": (diamond_document(5), "d5"),
+        "fan_in": (fan_in_document(250 * scale), "product"),
+    }
+    return {
+        shape: ingest_document(document)["entities"][root]
+        for shape, (document, root) in shapes.items()
+    }
+
+
+@pytest.mark.parametrize("shape", ["chain", "diamond", "fan_in"])
+def test_build_graph(bench, roots, shape):
+    entity_id = roots[shape]
+
+    def build():
+        root = load_entities([entity_id])[entity_id]
+        return ProvenanceGraph().build_graph(root)
+
+    result = bench.measure(f"graph.build_graph.{shape}", build, rounds=10)
+    assert result.queries > 0
+
+
+def test_entity_lineage(bench, roots):
+    entity_id = roots["chain"]
+
+    def lineage():
+        return ProvenanceGraph().get_entity_lineage(db.session.get(Entity, entity_id))
+
+    bench.measure("graph.get_entity_lineage.chain", lineage, rounds=10)
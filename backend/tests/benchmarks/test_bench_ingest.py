@@ -0,0 +1,86 @@
+import io
+import itertools
+import json
+
+import pytest
+
+from app.provenance_ingest import ingest_document
+from app.provenance_prov import export_prov_json, import_prov_json
+from app.workflow_management import create_activity, create_entity, post_run
+
+pytestmark = pytest.mark.benchmark
+
+FRAMES = 50
+PRODUCTS = 10
+
+counter = itertools.count()
+
+
+def run_document():
+    """一次处理运行：FRAMES个输入 -> 1个活动 -> PRODUCTS个产物"""
+    run = next(counter)
+    return {
+        "entities": [{"id": f"in{i}", "name": f"run{run}_in{i}"} for i in range(FRAMES)]
+        + [{"id": f"out{i}", "name": f"run{run}_out{i}"} for i in range(PRODUCTS)],
+        "activities": [{"id": "run", "name": f"run{run}"}],
+        "used": [{"activity": "run", "entity": f"in{i}"} for i in range(FRAMES)],
+        "was_generated_by": [
+            {"entity": f"out{i}", "activity": "run"} for i in range(PRODUCTS)
+        ],
+    }
+
+
+def keyed_run_document():
+    """带自然键的处理运行，重复导入时为空操作"""
+    document = run_document()
+    for item in document["entities"]:
+        item["external_id"] = item["name"].split("_", 1)[1]
+    document["activities"][0]["run_key"] = "keyed-run"
+    return document
+
+
+def test_ingest_document(bench, bench_app):
+    bench.measure("ingest.ingest_document", lambda: ingest_document(run_document()))
+
+
+def test_ingest_document_replay(bench, bench_app):
+    document = keyed_run_document()
+    ingest_document(document)
+    bench.measure("ingest.ingest_document_replay", lambda: ingest_document(document))
+
+
+def test_per_call_ingestion(bench, bench_app):
+    def per_call():
+        run = next(counter)
+        inputs = [create_entity(f"run{run}_in{i}") for i in range(FRAMES)]
+        activity = create_activity(f"run{run}", informers=[], inputs=inputs)
+        outputs = [create_entity(f"run{run}_out{i}") for i in range(PRODUCTS)]
+        post_run(activity, outputs)
+
+    bench.measure("ingest.per_call", per_call, rounds=10)
+
+
+@pytest.mark.parametrize("group_commit", [0, 1])
+def test_bulk_route(bench, bench_app, group_commit):
+    client = bench_app.test_client()
+
+    def post():
+        response = client.post(
+            f"/api/provenance/bulk?group_commit={group_commit}", json=run_document()
+        )
+        assert response.status_code == 201
+
+    bench.measure(f"ingest.bulk_route.group_commit_{group_commit}", post)
+
+
+def test_import_prov_json(bench, bench_app):
+    for _ in range(20):
+        ingest_document(run_document())
+    payload = "".join(export_prov_json()).encode()
+    # 导入到同一库时按自然键全部命中，测量的是解析和解析引用的开销
+    bench.measure(
+        "ingest.import_prov_json",
+        lambda: import_prov_json(io.BytesIO(payload)),
+        rounds=5,
+    )
+    assert json.loads(payload)["entity"]
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from app.models import (
+    Action,
+    Activity,
+    Entity,
+    Project,
+    Workflow,
+    WorkflowTemplate,
+    db,
+)
+from app.provenance_synthetic import SyntheticSpec, generate_provenance
+from app.workflow_stats import rebuild_rollups
+
+pytestmark = pytest.mark.benchmark
+
+STATUSES = ("pending", "running", "completed", "failed", "terminated")
+
+
+def create_workflow_data(workflows: int, actions_per_workflow: int = 5) -> None:
+    """批量写入项目、流水线配置、流水线实例和节点"""
+    now = datetime(2025, 1, 1)
+    projects = [Project(name=f"bench{i}", description="benchmark") for i in range(3)]
+    db.session.add_all(projects)
+    db.session.flush()
+    templates = [
+        WorkflowTemplate(
+            name=f"template{i}",
+            project_id=projects[i % 3].id,
+            config={"stages": [{"name": f"s{j}", "type": "script"} for j in range(20)]},
+        )
+        for i in range(6)
+    ]
+    db.session.add_all(templates)
+    db.session.flush()
+    db.session.execute(
+        insert(Workflow),
+        [
+            {
+                "name": f"run{i}",
+                "status": STATUSES[i % len(STATUSES)],
+                "template_id": templates[i % 6].id,
+                "project_id": templates[i % 6].project_id,
+                "created_at": now - timedelta(minutes=i),
+                "updated_at": now - timedelta(minutes=i),
+            }
+            for i in range(workflows)
+        ],
+    )
+    db.session.execute(
+        insert(Action),
+        [
+            {
+                "name": f"step{j}",
+                "type": "script",
+                "status": STATUSES[(i + j) % len(STATUSES)],
+                "workflow_id": i + 1,
+                "config": {"command": "run.sh", "args": list(range(20))},
+                "logs": "log line\n" * 200,
+            }
+            for i in range(workflows)
+            for j in range(actions_per_workflow)
+        ],
+    )
+    db.session.commit()
+    rebuild_rollups()
+
+
+@pytest.fixture(scope="module")
+def dataset(bench_app, bench):
+    spec = SyntheticSpec(observations=50 * bench.scale, cycle_ratio=0, batch_size=500)
+    # 环状的信息传递关系会使图遍历无法终止，路由基准不包含
+    generate_provenance(spec)
+    create_workflow_data(2000 * bench.scale)
+    last = spec.observations - 1
+    product = Entity.query.filter_by(name=f"obs{last}_step{spec.depth - 1}_out0").one()
+    activity = (
+        Activity.query.filter_by(name=f"step{spec.depth - 1}")
+        .order_by(Activity.id.desc())
+        .first()
+    )
+    client = bench_app.test_client()
+    cursor = client.get("/api/workflow/?limit=50").get_json()["next_cursor"]
+    return {
+        "client": client,
+        "entity": product.id,
+        "activity": activity.id,
+        "cursor": cursor,
+    }
+
+
+PROVENANCE_ROUTES = [
+    ("graph", "/api/provenance/graph"),
+    ("entity", "/api/provenance/entity/{entity}"),
+    ("activity", "/api/provenance/activity/{activity}"),
+    ("search", "/api/provenance/search?q=obs1_step3"),
+    ("timeline", "/api/provenance/timeline"),
+    ("entity_graph", "/api/provenance/graph/{entity}"),
+    ("activity_graph", "/api/provenance/activity-graph/{activity}"),
+    ("graph_summary", "/api/provenance/graph-summary"),
+    ("export_json", "/api/provenance/export"),
+    ("export_provn", "/api/provenance/export?format=provn"),
+]
+
+WORKFLOW_ROUTES = [
+    ("projects", "/api/projects/"),
+    ("templates", "/api/workflow-template/"),
+    ("workflows", "/api/workflow/?limit=50"),
+    ("workflows_page2", "/api/workflow/?limit=50&cursor={cursor}"),
+    ("workflows_status", "/api/workflow/?status=failed&limit=50&count=exact"),
+    ("workflows_no_count", "/api/workflow/?limit=50&count=none"),
+    ("workflow_actions", "/api/workflow/1/actions"),
+    ("workflow_actions_expanded", "/api/workflow/1/actions?fields=config,logs"),
+    (
+        "workflow_stats",
+        "/api/workflow/stats?start=2024-12-01T00:00:00&end=2025-01-02T00:00:00",
+    ),
+    ("workflow_today", "/api/workflow/stats/today"),
+]
+
+
+def _get(client, url):
+    response = client.get(url)
+    response.get_data()  # 消费流式响应
+    assert response.status_code == 200, response.get_data(as_text=True)[:200]
+
+
+@pytest.mark.parametrize(
+    "name, url", PROVENANCE_ROUTES, ids=[r[0] for r in PROVENANCE_ROUTES]
+)
+def test_provenance_routes(bench, dataset, name, url):
+    url = url.format(**dataset)
+    rounds = 5 if name in ("graph", "timeline", "graph_summary") else 20
+    bench.measure(
+        f"routes.provenance.{name}", lambda: _get(dataset["client"], url), rounds=rounds
+    )
+
+
+@pytest.mark.parametrize(
+    "name, url", WORKFLOW_ROUTES, ids=[r[0] for r in WORKFLOW_ROUTES]
+)
+def test_workflow_routes(bench, dataset, name, url):
+    url = url.format(**dataset)
+    bench.measure(f"routes.workflow.{name}", lambda: _get(dataset["client"], url))
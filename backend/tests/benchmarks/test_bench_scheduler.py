@@ -0,0 +1,13 @@
+import pytest
+
+from app.workflow_scheduler import SimulationSpec, simulate
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_simulate_queued_actions(bench, bench_app):
+    spec = SimulationSpec(actions=100000 * bench.scale)
+    result = bench.measure(
+        "scheduler.simulate_100k", lambda: simulate(spec), rounds=3, warmup=0
+    )
+    assert result.queries == 0
@@ -1,6 +1,49 @@
 import pytest
 
 from app import app, db
+from app.critical_path import analysis_cache
+from app.models import Project, Workflow, WorkflowTemplate
+from app.template_plans import compile_template, plan_cache
+from app.workflow_engine import create_actions
+from app.workflow_engine import engine as workflow_engine
+
+# 测试模式下异常直接抛给测试；超出路由查询预算即报错；
+# 流水线不自动执行，由测试显式驱动执行引擎
+app.config.update(TESTING=True, SQL_QUERY_BUDGET_STRICT=True)
+workflow_engine.autostart = False
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmark", "性能基准")
+    group.addoption(
+        "--benchmark",
+        action="store_true",
+        help="运行 tests/benchmarks 下的性能基准",
+    )
+    group.addoption(
+        "--benchmark-update",
+        action="store_true",
+        help="运行性能基准并用本次结果覆盖基准线",
+    )
+    group.addoption(
+        "--benchmark-tolerance",
+        type=float,
+        default=3.0,
+        help="p95延迟允许达到基准线的倍数（默认3.0）",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: 性能基准，需使用 --benchmark 运行")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark") or config.getoption("--benchmark-update"):
+        return
+    skip = pytest.mark.skip(reason="性能基准需使用 --benchmark 运行")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
 
 
 @pytest.fixture(scope="function")
@@ -10,5 +53,53 @@ def app_context():
     ctx.push()
     db.drop_all()
     db.create_all()
+    # 重建后ID会重复，缓存的执行计划和关键路径分析不能跨测试复用
+    plan_cache.clear()
+    analysis_cache.clear()
     yield
     ctx.pop()
+
+
+@pytest.fixture(scope="function")
+def client(app_context):
+    """Flask测试客户端"""
+    return app.test_client()
+
+
+@pytest.fixture
+def create_workflow(app_context):
+    """
+    创建流水线实例的工厂：create_workflow(stages, **options)
+
+    stages 为阶段配置列表，或阶段数（生成互不依赖的 s0、s1……）；options 作为
+    配置的其他字段（如 priority）。节点按编译后的执行计划插入，实例处于 pending。
+    """
+
+    def create(stages, **options):
+        if isinstance(stages, int):
+            stages = [
+                {"name": f"s{i}", "type": "script", "dependencies": []}
+                for i in range(stages)
+            ]
+        project = Project.query.filter_by(name="测试项目").first()
+        if project is None:
+            project = Project(name="测试项目")
+            db.session.add(project)
+            db.session.flush()
+        template = WorkflowTemplate(
+            name="测试模板",
+            config={"stages": stages, **options},
+            project_id=project.id,
+        )
+        db.session.add(template)
+        db.session.flush()
+        workflow = Workflow(
+            name="测试实例", template_id=template.id, project_id=project.id
+        )
+        db.session.add(workflow)
+        db.session.flush()
+        create_actions(workflow, compile_template(template.config))
+        db.session.commit()
+        return workflow
+
+    return create
@@ -0,0 +1,166 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, update
+
+from app.critical_path import analysis_cache
+from app.models import Action, Project, Workflow, WorkflowTemplate, db
+from app.status_updates import Transition, apply_transitions
+
+T0 = datetime(2025, 3, 1, 22, 0)
+
+# (名称, 依赖, 开始秒, 结束秒)：c 是关键路径上最长的阶段，b 有13秒松弛
+STAGES = [
+    ("a", [], 0, 10),
+    ("b", ["a"], 12, 17),
+    ("c", ["a"], 10, 30),
+    ("d", ["b", "c"], 31, 40),
+]
+
+
+def at(seconds):
+    return T0 + timedelta(seconds=seconds)
+
+
+def create_run(template, stages=STAGES, offset=0, finished=True):
+    workflow = Workflow(
+        name="夜间处理",
+        template_id=template.id,
+        project_id=template.project_id,
+        status="completed" if finished else "running",
+        started_at=at(offset),
+        completed_at=at(offset + stages[-1][3]) if finished else None,
+    )
+    db.session.add(workflow)
+    db.session.flush()
+    for name, dependencies, started, completed in stages:
+        db.session.add(
+            Action(
+                name=name,
+                type="script",
+                workflow_id=workflow.id,
+                status="completed",
+                config={"dependencies": dependencies},
+                started_at=at(offset + started),
+                completed_at=at(offset + completed),
+            )
+        )
+    db.session.commit()
+    return workflow
+
+
+@pytest.fixture
+def template(app_context):
+    project = Project(name="关键路径项目")
+    db.session.add(project)
+    db.session.flush()
+    template = WorkflowTemplate(name="夜间流水线", config={}, project_id=project.id)
+    db.session.add(template)
+    db.session.commit()
+    return template
+
+
+@pytest.fixture
+def queries():
+    count = [0]
+
+    def increment(*args):
+        count[0] += 1
+
+    event.listen(db.engine, "before_cursor_execute", increment)
+    yield count
+    event.remove(db.engine, "before_cursor_execute", increment)
+
+
+def test_critical_path_slack_and_queueing(template):
+    workflow = create_run(template)
+    analysis = analysis_cache.get(workflow.id)
+
+    assert analysis["critical_path"] == ["a", "c", "d"]
+    assert analysis["bottleneck"] == "c"
+    assert analysis["wall_seconds"] == 40
+    assert analysis["critical_execution_seconds"] == 39
+    assert analysis["critical_queue_seconds"] == 1
+    stages = {stage["name"]: stage for stage in analysis["stages"]}
+    assert {name: stages[name]["slack_seconds"] for name in stages} == {
+        "a": 0,
+        "b": 13,
+        "c": 0,
+        "d": 0,
+    }
+    assert (stages["b"]["queue_seconds"], stages["b"]["execution_seconds"]) == (2, 5)
+    assert stages["d"]["ready_at"] == at(30)
+    assert not stages["b"]["critical"]
+
+
+def test_analysis_is_incremental(template, queries):
+    workflow = create_run(template, STAGES[:3], finished=False)
+    db.session.execute(
+        update(Workflow).where(Workflow.id == workflow.id).values(completed_at=None)
+    )
+    pending = Action(
+        name="d",
+        type="script",
+        workflow_id=workflow.id,
+        status="pending",
+        config={"dependencies": ["b", "c"]},
+    )
+    db.session.add(pending)
+    db.session.commit()
+
+    first = analysis_cache.get(workflow.id)
+    assert first["critical_path"] == ["a", "c"]
+    assert analysis_cache.get(workflow.id) is first
+
+    apply_transitions(
+        [
+            Transition(pending.id, "running", at(31)),
+            Transition(pending.id, "completed", at(40)),
+        ],
+        [Transition(workflow.id, "completed", at(40))],
+    )
+    result = analysis_cache.get(workflow.id)
+    assert result["critical_path"] == ["a", "c", "d"]
+
+    # 已结束且未再变化的实例只查询流水线行
+    queries[0] = 0
+    assert analysis_cache.get(workflow.id) is result
+    assert queries[0] == 1
+
+
+def test_missing_workflow_returns_404(client):
+    assert client.get("/api/workflow/999/critical-path").status_code == 404
+
+
+def test_routes_and_template_aggregate(client, template):
+    first = create_run(template)
+    # 第二次运行中 b 变慢，成为关键路径
+    slow_b = [
+        ("a", [], 0, 10),
+        ("b", ["a"], 10, 45),
+        ("c", ["a"], 10, 30),
+        ("d", ["b", "c"], 45, 50),
+    ]
+    create_run(template, slow_b, offset=86400)
+    failed = create_run(template, offset=2 * 86400)
+    failed.status = "failed"
+    db.session.commit()
+
+    response = client.get(f"/api/workflow/{first.id}/critical-path")
+    assert response.status_code == 200
+    assert response.get_json()["critical_path"] == ["a", "c", "d"]
+
+    response = client.get(f"/api/workflow-template/{template.id}/bottlenecks")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["runs"] == 2
+    assert (body["wall_seconds_avg"], body["wall_seconds_max"]) == (45, 50)
+    stages = {stage["name"]: stage for stage in body["stages"]}
+    assert stages["a"]["critical_runs"] == stages["d"]["critical_runs"] == 2
+    assert stages["b"]["critical_runs"] == stages["c"]["critical_runs"] == 1
+    assert stages["b"]["execution_seconds_avg"] == 20
+    assert body["bottleneck"] == "a"
+    assert [stage["name"] for stage in body["stages"]][:2] == ["a", "d"]
+
+    response = client.get(f"/api/workflow-template/{template.id}/bottlenecks?limit=1")
+    assert response.get_json()["runs"] == 1
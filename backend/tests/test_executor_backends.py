@@ -0,0 +1,129 @@
+import sys
+import time
+
+from app import app
+from app.executor_backends import FakeArgoBackend, LocalBackend, executors
+from app.models import Action, Workflow, db
+from app.workflow_engine import WorkflowEngine
+from app.workflow_engine import engine as workflow_engine
+
+
+def fake_argo(**options):
+    backend = FakeArgoBackend(**{"pod_latency": 0, "duration": 0, **options})
+    backend.app = app
+    return backend
+
+
+def statuses(workflow_id):
+    db.session.expire_all()
+    return {a.name: a.status for a in Action.query.filter_by(workflow_id=workflow_id)}
+
+
+def test_fake_argo_runs_dag_and_syncs_statuses(app_context, create_workflow):
+    workflow = create_workflow(
+        [
+            {"name": "a", "type": "script", "dependencies": []},
+            {"name": "b", "type": "script", "dependencies": ["a"]},
+            {"name": "c", "type": "script", "dependencies": ["a"]},
+            {"name": "d", "type": "script", "dependencies": ["b", "c"]},
+        ]
+    )
+    backend = fake_argo(pod_latency=0.001, duration=0.001, seed=1)
+
+    assert backend.submit(workflow.id).result(timeout=30) == "completed"
+
+    assert set(statuses(workflow.id).values()) == {"completed"}
+    events = list(backend.status_stream(workflow.id))
+    order = [e.action_id for e in events if e.status == "completed" and e.action_id]
+    actions = {a.name: a.id for a in Action.query.filter_by(workflow_id=workflow.id)}
+    assert order[0] == actions["a"] and order[-1] == actions["d"]
+    assert events[-1].action_id is None and events[-1].status == "completed"
+    assert list(backend.log_stream(workflow.id, actions["d"]))[0] == "[d] 模拟输出 1"
+    assert db.session.get(Workflow, workflow.id).status == "completed"
+
+
+def test_fake_argo_failures_block_downstream(app_context, create_workflow):
+    workflow = create_workflow(
+        [{"name": "a", "type": "script"}, {"name": "b", "type": "script"}]
+    )
+    backend = fake_argo(failure_rate=1)
+
+    assert backend.submit(workflow.id).result(timeout=30) == "failed"
+
+    assert statuses(workflow.id) == {"a": "failed", "b": "pending"}
+    failed = [e for e in backend.status_stream(workflow.id) if e.status == "failed"]
+    assert failed[0].exit_code == 1
+
+
+def test_fake_argo_cancel_stops_scheduling(app_context, create_workflow):
+    workflow = create_workflow([{"name": f"s{i}", "type": "script"} for i in range(5)])
+    backend = fake_argo(duration=10, seed=0)
+
+    future = backend.submit(workflow.id)
+    time.sleep(0.05)
+    assert backend.cancel(workflow.id)
+
+    assert future.result(timeout=30) == "terminated"
+    result = statuses(workflow.id)
+    assert result["s0"] == "terminated"
+    assert set(result.values()) == {"terminated", "pending"}
+    assert not backend.cancel(workflow.id)
+
+
+def test_local_backend_streams_engine_status(app_context, create_workflow):
+    engine = WorkflowEngine(app)
+    backend = LocalBackend(engine)
+    workflow = create_workflow(
+        [
+            {
+                "name": "wait",
+                "type": "script",
+                "config": {
+                    "command": [
+                        sys.executable,
+                        "-c",
+                        "import time; time.sleep(0.3); print('ok')",
+                    ]
+                },
+            }
+        ]
+    )
+    assert list(backend.status_stream(workflow.id)) == []
+
+    future = backend.submit(workflow.id)
+    stream = None
+    for _ in range(500):
+        stream = engine.subscribe(workflow.id)
+        if stream is not None:
+            break
+        time.sleep(0.001)
+    assert future.result(timeout=30) == "completed"
+    engine.shutdown()
+
+    changes = []
+    while (change := stream.get()) is not None:
+        changes.append(change)
+    assert changes[-1][:2] == (None, "completed")
+    assert list(backend.log_stream(workflow.id, changes[0][0])) == ["ok"]
+
+
+def test_routes_use_configured_backend(client, monkeypatch, create_workflow):
+    workflow = create_workflow([{"name": f"s{i}", "type": "script"} for i in range(3)])
+    backend = fake_argo(duration=10, seed=0)
+    monkeypatch.setitem(executors.backends, backend.name, backend)
+    monkeypatch.setitem(app.config, "WORKFLOW_EXECUTOR_BACKEND", backend.name)
+    monkeypatch.setattr(workflow_engine, "autostart", True)
+
+    assert client.post(f"/api/workflow/{workflow.id}/retry").status_code == 200
+    time.sleep(0.05)
+    response = client.post(f"/api/workflow/{workflow.id}/terminate")
+    assert response.get_json()["status"] == "terminated"
+
+    for _ in range(500):
+        if backend._workflows[workflow.id].done:
+            break
+        time.sleep(0.01)
+    db.session.expire_all()
+    workflow = db.session.get(Workflow, workflow.id)
+    assert workflow.status == "terminated"
+    assert statuses(workflow.id)["s2"] == "terminated"
@@ -1,5 +1,20 @@
-from app.models import Activity, Entity
-from app.provenance_graph import ProvenanceGraph
+from sqlalchemy import event
+
+from app.models import (
+    Activity,
+    DatasetDescription,
+    DatasetEntity,
+    Entity,
+    ValueDescription,
+    ValueEntity,
+    db,
+)
+from app.provenance_graph import (
+    ID_BIAS,
+    ProvenanceGraph,
+    entity_details,
+    load_entities,
+)
 from app.workflow_management import create_activity, create_entity, post_run
 
 
@@ -51,3 +66,97 @@ def test_nodes(app_context):
     graph = ProvenanceGraph()
     graph.build_graph(img)
     assert das in [node.name for node in graph.nodes.values()]
+
+
+def test_polymorphic_entities_bulk_loaded(app_context):
+    dataset_description = DatasetDescription(
+        name="events", type="dataset", content_type="application/fits"
+    )
+    value_description = ValueDescription(
+        name="exposure", type="value", value_type="float", unit="s"
+    )
+    entities = [
+        DatasetEntity(name=f"evt_{i}", dataset_description=dataset_description)
+        for i in range(5)
+    ] + [
+        ValueEntity(name=f"exp_{i}", value=str(i), value_description=value_description)
+        for i in range(5)
+    ]
+    plain = create_entity("plain")
+    db.session.add_all(entities)
+    db.session.commit()
+    ids = [entity.id for entity in entities] + [plain.id]
+    db.session.expunge_all()
+
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        loaded = load_entities(ids)
+        details = [entity_details(loaded[i]) for i in ids]
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+    # 实体+子类一条联结查询，两类描述各一条
+    assert len(statements) == 3
+    assert details[0]["entity_type"] == "dataset"
+    assert details[0]["content_type"] == "application/fits"
+    assert details[5]["value"] == "0"
+    assert details[5]["unit"] == "s"
+    assert details[-1]["entity_type"] == "entity"
+    assert isinstance(Entity.query.get(ids[5]), ValueEntity)
+
+
+def test_graph_reads_implied_derivations(client):
+    create_provenance_data()
+    img = Entity.query.filter_by(name="Image").first()
+    cleaned_events = Entity.query.filter_by(name="Cleaned Events").first()
+
+    lineage = ProvenanceGraph().get_entity_lineage(img)
+    implied = [edge for edge in lineage["edges"] if edge["implied"]]
+    assert {
+        "source": cleaned_events.id,
+        "target": img.id,
+        "type": "was_derived_from",
+        "role": None,
+        "implied": True,
+    } in implied
+
+    body = client.get(f"/api/provenance/entity/{img.id}").get_json()
+    assert body["data"]["derived_from"] == [
+        {
+            "entity": {
+                "id": cleaned_events.id,
+                "name": "Cleaned Events",
+                "location": None,
+            },
+            "role": None,
+            "implied": True,
+        }
+    ]
+
+
+def test_entity_route_unknown_id_is_not_found(client):
+    assert client.get("/api/provenance/entity/999").status_code == 404
+    assert client.get("/api/provenance/entity/not-a-number").status_code == 404
+
+
+def test_activity_graph_route_uses_graph_ids(client):
+    create_provenance_data()
+    activity = Activity.query.filter_by(name="Data Analysis Software").first()
+
+    response = client.get(f"/api/provenance/activity-graph/{activity.id}")
+
+    assert response.status_code == 200
+    data = response.get_json()["data"]
+    graph_ids = {str(node["graph_id"]) for node in data["nodes"]}
+    assert len(graph_ids) == data["total_nodes"]
+    assert all(
+        edge["source"] in graph_ids and edge["target"] in graph_ids
+        for edge in data["edges"]
+    )
+    root = next(node for node in data["nodes"] if node["id"] == activity.id)
+    assert root["type"] == "activity" and root["graph_id"] == activity.id + ID_BIAS
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+from app.models import Action, Project, Workflow, WorkflowTemplate, db
+
+
+def create_workflows(count):
+    project = Project(name="分页项目")
+    db.session.add(project)
+    db.session.flush()
+    template = WorkflowTemplate(name="模板", config={}, project_id=project.id)
+    db.session.add(template)
+    db.session.flush()
+    base = datetime(2025, 1, 1)
+    workflows = [
+        Workflow(
+            name=f"wf_{i}",
+            status="failed" if i % 3 == 0 else "completed",
+            template_id=template.id,
+            project_id=project.id,
+            # 每两个实例共享一个创建时间，检验id作为次序键
+            created_at=base + timedelta(minutes=i // 2),
+        )
+        for i in range(count)
+    ]
+    db.session.add_all(workflows)
+    db.session.commit()
+    return project, template, workflows
+
+
+def test_workflows_keyset_pages_cover_all_rows(client):
+    create_workflows(25)
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 10}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/api/workflow/", query_string=params).get_json()
+        assert body["total"] == 25
+        seen.extend(w["id"] for w in body["workflows"])
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == 25
+    assert len(set(seen)) == 25
+    created = {w.id: (w.created_at, w.id) for w in Workflow.query.all()}
+    assert [created[i] for i in seen] == sorted(created.values(), reverse=True)
+
+
+def test_workflows_filters(client):
+    _, template, workflows = create_workflows(12)
+    body = client.get(
+        "/api/workflow/",
+        query_string={
+            "status": "failed",
+            "template_id": template.id,
+            "created_after": datetime(2025, 1, 1, 0, 2).isoformat(),
+            "sort": "id",
+            "order": "asc",
+        },
+    ).get_json()
+    expected = [
+        w.id
+        for w in workflows
+        if w.status == "failed" and w.created_at >= datetime(2025, 1, 1, 0, 2)
+    ]
+    assert [w["id"] for w in body["workflows"]] == expected
+    assert body["total"] == len(expected)
+
+
+def test_workflow_count_none_and_bad_cursor(client):
+    create_workflows(3)
+    body = client.get("/api/workflow/", query_string={"count": "none"}).get_json()
+    assert body["total"] is None
+    assert len(body["workflows"]) == 3
+    response = client.get("/api/workflow/", query_string={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_workflow_actions_paginated(client):
+    _, _, workflows = create_workflows(1)
+    db.session.add_all(
+        [
+            Action(name=f"a{i}", type="step", workflow_id=workflows[0].id)
+            for i in range(7)
+        ]
+    )
+    db.session.commit()
+    url = f"/api/workflow/{workflows[0].id}/actions"
+    first = client.get(url, query_string={"limit": 5}).get_json()
+    assert first["total"] == 7
+    assert [a["name"] for a in first["actions"]] == [f"a{i}" for i in range(5)]
+    second = client.get(
+        url, query_string={"limit": 5, "cursor": first["next_cursor"]}
+    ).get_json()
+    assert [a["name"] for a in second["actions"]] == ["a5", "a6"]
+    assert second["next_cursor"] is None
+
+
+def test_list_views_omit_heavy_columns_unless_expanded(client):
+    project, template, workflows = create_workflows(1)
+    template.config = {"stages": [{"name": "s", "type": "t"}] * 100}
+    db.session.add(
+        Action(name="a", type="step", workflow_id=workflows[0].id, logs="x" * 10000)
+    )
+    db.session.commit()
+
+    templates = client.get(
+        "/api/workflow-template/", query_string={"projectId": project.id}
+    ).get_json()["templates"]
+    assert templates[0]["name"] == "模板"
+    assert "config" not in templates[0]
+    templates = client.get(
+        "/api/workflow-template/", query_string={"fields": "config"}
+    ).get_json()["templates"]
+    assert len(templates[0]["config"]["stages"]) == 100
+    detail = client.get(f"/api/workflow-template/{template.id}/").get_json()
+    assert len(detail["config"]["stages"]) == 100
+
+    url = f"/api/workflow/{workflows[0].id}/actions"
+    action = client.get(url).get_json()["actions"][0]
+    assert "logs" not in action and "config" not in action
+    action = client.get(url, query_string={"fields": "logs"}).get_json()["actions"][0]
+    assert len(action["logs"]) == 10000
+    assert client.get(url, query_string={"fields": "secret"}).status_code == 400
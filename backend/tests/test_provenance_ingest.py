@@ -0,0 +1,172 @@
+import pytest
+from sqlalchemy import event
+
+from app.models import Activity, Entity, Used, ValueEntity, WasGeneratedBy, db
+from app.provenance_graph import ProvenanceGraph
+from app.provenance_ingest import IngestError, ingest_document
+from app.workflow_management import create_activity, create_entity
+
+
+def pipeline_document(frames):
+    return {
+        "entities": [{"id": f"frame{i}", "name": f"frame{i}"} for i in range(frames)]
+        + [
+            {"id": "image", "name": "Image", "type": "dataset"},
+            {"id": "exposure", "name": "exposure", "type": "value", "value": 30},
+        ],
+        "activities": [
+            {"id": "stack", "name": "stack", "start_time": "2025-01-01T00:00:00"}
+        ],
+        "used": [{"activity": "stack", "entity": f"frame{i}"} for i in range(frames)]
+        + [{"activity": "stack", "entity": "exposure", "role": "parameter"}],
+        "was_generated_by": [{"entity": "image", "activity": "stack"}],
+        "was_derived_from": [{"entity": "image", "source": "frame0"}],
+    }
+
+
+def test_ingest_document_single_transaction(app_context):
+    statements = []
+    commits = []
+
+    def on_execute(*args):
+        statements.append(args[2])
+
+    def on_commit(*args):
+        commits.append(True)
+
+    event.listen(db.engine, "before_cursor_execute", on_execute)
+    event.listen(db.engine, "commit", on_commit)
+    try:
+        result = ingest_document(pipeline_document(200))
+    finally:
+        event.remove(db.engine, "before_cursor_execute", on_execute)
+        event.remove(db.engine, "commit", on_commit)
+
+    assert result["counts"]["entities"] == 202
+    assert result["counts"]["used"] == 201
+    # 关系写入的语句数与记录数无关：每张表一批INSERT
+    # （SQLite下实体/活动为保证RETURNING顺序逐行插入，PostgreSQL下同样批量）
+    relation_statements = [
+        s
+        for s in statements
+        if not s.startswith(("INSERT INTO entity", "INSERT INTO activity"))
+    ]
+    assert len(relation_statements) < 10
+    assert len(commits) == 1
+
+    image = db.session.get(Entity, result["entities"]["image"])
+    assert image.type == "dataset"
+    assert image.generated_by.name == "stack"
+    assert isinstance(
+        db.session.get(Entity, result["entities"]["exposure"]), ValueEntity
+    )
+    graph = ProvenanceGraph()
+    graph.build_graph(image)
+    assert "frame199" in [node.name for node in graph.nodes.values()]
+
+
+def test_ingest_document_references_existing_rows(client):
+    raw = create_entity("raw")
+    response = client.post(
+        "/api/provenance/bulk",
+        json={
+            "activities": [{"id": "a", "name": "calibrate"}],
+            "entities": [{"id": "out", "name": "calibrated"}],
+            "used": [{"activity": "a", "entity": raw.id}],
+            "was_generated_by": [{"entity": "out", "activity": "a"}],
+        },
+    )
+    assert response.status_code == 201
+    data = response.get_json()["data"]
+    assert Used.query.filter_by(entity_id=raw.id).one().activity_id == (
+        data["activities"]["a"]
+    )
+
+
+def test_ingest_document_rejects_unknown_reference(client):
+    with pytest.raises(IngestError):
+        ingest_document({"used": [{"activity": "missing", "entity": "e"}]})
+    response = client.post(
+        "/api/provenance/bulk",
+        json={
+            "entities": [{"id": "e", "name": "e"}],
+            "was_generated_by": [{"entity": "e", "activity": "nope"}],
+        },
+    )
+    assert response.status_code == 400
+    assert Entity.query.count() == 0
+    assert Activity.query.count() == 0
+    assert WasGeneratedBy.query.count() == 0
+
+
+def keyed_document():
+    return {
+        "entities": [
+            {"id": "raw", "name": "raw", "external_id": "obs-001/raw"},
+            {
+                "id": "cal",
+                "name": "bias",
+                "location": "/cal/bias.fits",
+                "checksum": "sha256:ab12",
+                "type": "dataset",
+            },
+            {"id": "img", "name": "img", "external_id": "obs-001/img"},
+        ],
+        "activities": [{"id": "reduce", "name": "reduce", "run_key": "obs-001/reduce"}],
+        "used": [
+            {"activity": "reduce", "entity": "raw"},
+            {"activity": "reduce", "entity": "cal", "role": "calibration"},
+        ],
+        "was_generated_by": [{"entity": "img", "activity": "reduce"}],
+        "was_derived_from": [{"entity": "img", "source": "raw"}],
+    }
+
+
+def test_ingest_document_is_idempotent(app_context):
+    first = ingest_document(keyed_document())
+    counts = {
+        model: model.query.count() for model in (Entity, Activity, Used, WasGeneratedBy)
+    }
+
+    second = ingest_document(keyed_document())
+
+    assert second["entities"] == first["entities"]
+    assert second["activities"] == first["activities"]
+    assert set(second["inserted"].values()) == {0}
+    assert {model: model.query.count() for model in counts} == counts
+    assert first["inserted"]["used"] == 2
+
+
+def test_ingest_document_reuses_keyed_rows_in_new_runs(app_context):
+    ingest_document(keyed_document())
+    document = {
+        "entities": [
+            {"id": "bias", "location": "/cal/bias.fits", "checksum": "sha256:ab12"},
+            {"id": "img2", "name": "img2"},
+        ],
+        "activities": [
+            {"id": "reduce2", "name": "reduce", "run_key": "obs-002/reduce"}
+        ],
+        "used": [{"activity": "reduce2", "entity": "bias", "role": "calibration"}],
+        "was_generated_by": [{"entity": "img2", "activity": "reduce2"}],
+    }
+
+    result = ingest_document(document)
+
+    assert result["inserted"]["entities"] == 1
+    assert result["inserted"]["used"] == 1
+    bias = db.session.get(Entity, result["entities"]["bias"])
+    assert bias.type == "dataset"
+    assert Entity.query.filter_by(checksum="sha256:ab12").count() == 1
+
+
+def test_create_entity_and_activity_return_existing(app_context):
+    entity = create_entity("raw", external_id="obs-001/raw")
+    assert create_entity("raw again", external_id="obs-001/raw").id == entity.id
+
+    activity = create_activity("reduce", [], [entity], run_key="obs-001/reduce")
+    db.session.commit()
+    again = create_activity("reduce", [], [entity], run_key="obs-001/reduce")
+
+    assert again.id == activity.id
+    assert Used.query.filter_by(activity_id=activity.id).count() == 1
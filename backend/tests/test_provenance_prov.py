@@ -0,0 +1,146 @@
+import io
+import json
+
+import pytest
+
+from app.models import Activity, Entity, Used, WasDerivedFrom, db
+from app.provenance_prov import (
+    export_prov_json,
+    export_prov_n,
+    import_prov_json,
+    iter_prov_json,
+)
+
+PROV_DOCUMENT = {
+    "prefix": {"ex": "http://example.org/"},
+    # 关系先于被引用的节点出现
+    "wasDerivedFrom": {
+        "_:d1": {"prov:generatedEntity": "ex:image", "prov:usedEntity": "ex:raw"}
+    },
+    "entity": {
+        "ex:raw": {"prov:label": "raw", "prov:location": "/data/raw.fits"},
+        "ex:image": {
+            "prov:label": "image",
+            "prov:type": {"$": "voprov:DatasetEntity", "type": "prov:QUALIFIED_NAME"},
+        },
+        "ex:exptime": {
+            "prov:label": "exptime",
+            "prov:type": "voprov:ValueEntity",
+            "prov:value": 30,
+        },
+    },
+    "activity": {
+        "ex:reduce": {"prov:label": "reduce", "prov:startTime": "2025-01-01T00:00:00"}
+    },
+    "used": {
+        "_:u1": {"prov:activity": "ex:reduce", "prov:entity": "ex:raw"},
+        "_:u2": [
+            {
+                "prov:activity": "ex:reduce",
+                "prov:entity": "ex:exptime",
+                "prov:role": "parameter",
+            }
+        ],
+        "_:u3": {"prov:activity": "ex:reduce", "prov:entity": "ex:flat"},
+    },
+    "wasGeneratedBy": {
+        "_:g1": {"prov:entity": "ex:image", "prov:activity": "ex:reduce"}
+    },
+}
+
+
+def document_stream():
+    return io.BytesIO(json.dumps(PROV_DOCUMENT, ensure_ascii=False).encode())
+
+
+def test_iter_prov_json_small_chunks():
+    records = list(iter_prov_json(document_stream(), chunk_size=7))
+
+    assert [section for section, _, _ in records].count("used") == 3
+    assert ("entity", "ex:exptime") in [(s, r) for s, r, _ in records]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3])
+def test_iter_prov_json_splits_multibyte_characters(chunk_size):
+    document = {"entity": {"ex:raw": {"prov:label": "原始数据"}}}
+    fp = io.BytesIO(json.dumps(document, ensure_ascii=False).encode())
+
+    records = list(iter_prov_json(fp, chunk_size=chunk_size))
+    assert records == [("entity", "ex:raw", {"prov:label": "原始数据"})]
+
+
+def test_import_prov_json_batches_and_is_idempotent(app_context):
+    counts = import_prov_json(document_stream(), batch_size=2, chunk_size=16)
+
+    assert counts["entity"] == 3 and counts["used"] == 3
+    image = Entity.query.filter_by(external_id="ex:image").one()
+    raw = Entity.query.filter_by(external_id="ex:raw").one()
+    assert image.type == "dataset"
+    derivation = WasDerivedFrom.query.filter_by(entity_id=image.id).one()
+    assert derivation.source_entity_id == raw.id
+    # 未声明的实体按隐式声明创建
+    assert Entity.query.filter_by(external_id="ex:flat").count() == 1
+
+    totals = [m.query.count() for m in (Entity, Activity, Used, WasDerivedFrom)]
+    import_prov_json(document_stream(), batch_size=2)
+    assert [m.query.count() for m in (Entity, Activity, Used, WasDerivedFrom)] == totals
+
+
+def test_import_merges_records_with_the_same_id(app_context):
+    document = {
+        "entity": {
+            "ex:a": [
+                {"prov:label": "a", "nadc:checksum": "c1"},
+                {"prov:label": "其他名称", "prov:location": "/data/a.fits"},
+            ]
+        },
+        "activity": {"ex:run": [{"prov:label": "run"}, {"prov:endTime": None}]},
+        "wasGeneratedBy": {"_:g": {"prov:entity": "ex:a", "prov:activity": "ex:run"}},
+    }
+    fp = io.BytesIO(json.dumps(document, ensure_ascii=False).encode())
+
+    counts = import_prov_json(fp)
+    assert (counts["entity"], counts["activity"]) == (1, 1)
+    entity = Entity.query.filter_by(external_id="ex:a").one()
+    assert (entity.name, entity.checksum, entity.location) == (
+        "a",
+        "c1",
+        "/data/a.fits",
+    )
+    assert Activity.query.filter_by(run_key="ex:run").count() == 1
+
+
+def test_export_prov_json_round_trip(app_context):
+    import_prov_json(document_stream())
+    activity = Activity.query.filter_by(run_key="ex:reduce").one()
+    db.session.add(Activity(name="other", start_time=activity.start_time))
+    db.session.commit()
+
+    exported = json.loads("".join(export_prov_json()))
+
+    assert set(exported["entity"]) == {"ex:raw", "ex:image", "ex:exptime", "ex:flat"}
+    assert exported["entity"]["ex:exptime"]["prov:value"] == "30"
+    assert len(exported["activity"]) == 2
+    assert len(exported["used"]) == 3
+    assert list(exported["wasGeneratedBy"].values()) == [
+        {"prov:entity": "ex:image", "prov:activity": "ex:reduce"}
+    ]
+
+    scoped = json.loads(
+        "".join(export_prov_json(db.select(Activity.id).filter_by(run_key="ex:reduce")))
+    )
+    assert list(scoped["activity"]) == ["ex:reduce"]
+
+    provn = "".join(export_prov_n())
+    assert provn.startswith("document\n") and provn.endswith("endDocument\n")
+    assert "wasDerivedFrom(_:d" in provn
+
+
+def test_provenance_export_route_streams(client):
+    response = client.post("/api/provenance/import", data=document_stream().read())
+    assert response.status_code == 201
+
+    response = client.get("/api/provenance/export")
+    assert response.is_streamed
+    assert "ex:image" in json.loads(response.get_data())["entity"]
+    assert client.get("/api/provenance/export?format=xml").status_code == 400
@@ -0,0 +1,49 @@
+from app.models import Activity, DatasetEntity, Entity, Used, WasInformedBy, db
+from app.provenance_graph import ProvenanceGraph
+from app.provenance_synthetic import SyntheticSpec, generate_provenance
+from app.workflow_management import create_entity
+
+
+def test_generate_provenance_shape(app_context):
+    existing = create_entity("existing", "/existing")
+    spec = SyntheticSpec(
+        observations=7,
+        depth=3,
+        fan_in=3,
+        fan_out=2,
+        calibrations=5,
+        batch_size=3,
+        cycle_ratio=0,
+    )
+
+    counts = generate_provenance(spec)
+
+    assert Activity.query.count() == 7 * 3
+    # 原始帧 + 各步骤产物 + 共享定标实体 + 参数值实体 + 已有实体
+    assert Entity.query.count() == 7 * (3 + 3 * 2) + 5 + 3 * 2 + 1
+    assert counts["entity"] == Entity.query.count() - 1
+    # 每步：上一步全部产物 + 2个定标实体 + 2个参数
+    assert Used.query.count() == 7 * (3 + 2 + 2 + 2 * (2 + 2 + 2))
+    assert WasInformedBy.query.count() == 7 * 2
+    assert existing.id not in {row.id for row in DatasetEntity.query}
+
+    product = Entity.query.filter_by(name="obs6_step2_out0").one()
+    graph = ProvenanceGraph().build_graph(product)
+    activities = [n for n in graph["nodes"] if n.node_type.value == "activity"]
+    assert len(activities) == 3
+
+
+def test_generate_provenance_is_reproducible_and_cyclic(app_context):
+    spec = SyntheticSpec(observations=4, depth=2, cycle_ratio=1.0, seed=42)
+    generate_provenance(spec)
+    first = sorted((u.activity_id, u.entity_id) for u in Used.query)
+
+    db.drop_all()
+    db.create_all()
+    generate_provenance(spec)
+
+    assert sorted((u.activity_id, u.entity_id) for u in Used.query) == first
+    cycles = WasInformedBy.query.join(
+        Activity, Activity.id == WasInformedBy.informed_id
+    ).filter(Activity.name == "step0")
+    assert cycles.count() == 4
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from app import app
+from app.models import Entity, Used
+from app.provenance_ingest import IngestError
+from app.provenance_writer import ProvenanceWriter, WriterBusy
+
+
+def document(index):
+    return {
+        "entities": [{"id": "in", "name": f"in{index}"}],
+        "activities": [{"id": "a", "name": f"run{index}"}],
+        "used": [{"activity": "a", "entity": "in"}],
+    }
+
+
+@pytest.fixture
+def writer(app_context):
+    writer = ProvenanceWriter(app)
+    writer.max_latency = 0.2
+    yield writer
+    writer.close(timeout=5)
+
+
+def test_group_commit_from_concurrent_callers(writer):
+    futures = []
+    lock = threading.Lock()
+
+    def caller(offset):
+        for i in range(25):
+            future = writer.submit(document(offset + i))
+            with lock:
+                futures.append(future)
+
+    threads = [threading.Thread(target=caller, args=(n * 100,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = [future.result(timeout=10) for future in futures]
+    assert len({result["entities"]["in"] for result in results}) == 100
+    assert writer.events_committed == 100
+    assert writer.batches_committed < 100
+    assert Entity.query.count() == 100
+    assert Used.query.count() == 100
+
+
+def test_failed_document_only_fails_its_future(writer):
+    bad = writer.submit({"used": [{"activity": "missing", "entity": "x"}]})
+    good = writer.submit(document(1))
+    assert good.result(timeout=10)["counts"]["used"] == 1
+    with pytest.raises(IngestError):
+        bad.result(timeout=10)
+    assert Entity.query.count() == 1
+
+
+def test_backpressure_when_queue_full(app_context):
+    writer = ProvenanceWriter(app)
+    writer._queue.maxsize = 1
+    writer.start = lambda: None  # 不启动后台线程，队列不会被消费
+    writer.submit(document(0))
+    with pytest.raises(WriterBusy):
+        writer.submit(document(1), timeout=0)
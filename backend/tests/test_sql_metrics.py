@@ -0,0 +1,55 @@
+import pytest
+
+from app import app
+from app.models import Project, db
+from app.sql_metrics import QueryBudgetExceeded, query_budget, registry
+
+
+@app.get("/_test/sql-budget/<int:count>")
+@query_budget(2)
+def _budget_probe(count):
+    for _ in range(count):
+        Project.query.all()
+    return {"count": count}
+
+
+def test_server_timing_reports_request_queries(client):
+    db.session.add(Project(name="计量项目"))
+    db.session.commit()
+    registry.reset()
+
+    response = client.get("/api/projects/")
+    assert response.status_code == 200
+    timings = response.headers.getlist("Server-Timing")
+    assert timings[0].startswith("db;dur=")
+    assert timings[0].endswith('desc="1 queries"')
+    assert timings[1].startswith("app;dur=")
+
+    metrics = registry.get("projects.get_projects")
+    assert metrics.requests == 1
+    assert metrics.queries_total == 1
+    assert metrics.budget == 1
+    assert "project" in metrics.slowest_statement.lower()
+
+
+def test_query_budget_strict_mode_fails(client):
+    registry.reset()
+    assert client.get("/_test/sql-budget/2").status_code == 200
+    with pytest.raises(QueryBudgetExceeded, match="超出预算 2"):
+        client.get("/_test/sql-budget/3")
+
+
+def test_query_budget_warns_when_not_strict(client):
+    registry.reset()
+    app.config["SQL_QUERY_BUDGET_STRICT"] = False
+    try:
+        assert client.get("/_test/sql-budget/5").status_code == 200
+    finally:
+        app.config["SQL_QUERY_BUDGET_STRICT"] = True
+
+    metrics = registry.get("_budget_probe")
+    assert metrics.queries_max == 5
+    assert metrics.budget_violations == 1
+
+    body = client.get("/api/metrics/sql").get_json()
+    assert body["data"]["_budget_probe"]["queries_avg"] == 5
@@ -0,0 +1,167 @@
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app
+from app.executor_backends import FakeArgoBackend, StatusEvent
+from app.message_bus import InMemoryBroker, topic_matches
+from app.models import Action, Workflow, db
+from app.status_consumer import STATUS_QUEUE, StatusConsumer
+
+
+@pytest.fixture
+def consumer(app_context):
+    consumer = StatusConsumer(app)
+    yield consumer
+    consumer.stop()
+
+
+@pytest.mark.parametrize(
+    "pattern, key, expected",
+    [
+        ("workflow.status.#", "workflow.status.12", True),
+        ("workflow.status.#", "workflow.status", True),
+        ("workflow.*.12", "workflow.status.12", True),
+        ("workflow.*", "workflow.status.12", False),
+        ("workflow.log.#", "workflow.status.12", False),
+    ],
+)
+def test_topic_matching(pattern, key, expected):
+    assert topic_matches(pattern, key) is expected
+
+
+def test_nack_redelivers_in_order():
+    broker = InMemoryBroker()
+    broker.declare_queue("q", "a.#")
+    for i in range(3):
+        broker.publish("a.b", {"n": i})
+    broker.publish("other", {"n": 99})
+
+    first = broker.get_batch("q", 2)
+    broker.nack("q", [m.delivery_tag for m in first])
+    again = broker.get_batch("q", 10)
+    assert [m.body["n"] for m in again] == [0, 1, 2]
+    broker.ack("q", [m.delivery_tag for m in again])
+    assert broker.depth("q") == 0
+    assert broker.get_batch("q", 10, timeout=0.01) == []
+
+
+def test_consumer_writes_latest_state_per_action(consumer, create_workflow):
+    workflow = create_workflow(3)
+    ids = [a.id for a in Action.query.filter_by(workflow_id=workflow.id)]
+    start = datetime(2025, 1, 1)
+    events = [StatusEvent(workflow.id, None, "running", start)]
+    for offset, action_id in enumerate(ids):
+        events.append(StatusEvent(workflow.id, action_id, "running", start))
+        events.append(
+            StatusEvent(
+                workflow.id,
+                action_id,
+                "completed",
+                start + timedelta(seconds=offset + 1),
+                0,
+                f"log{offset}",
+            )
+        )
+    # 乱序到达的 running 不会覆盖结束状态
+    events.append(StatusEvent(workflow.id, ids[0], "running", start))
+    events.append(StatusEvent(workflow.id, None, "completed", start))
+    for event in events:
+        consumer.bus.publish(event.routing_key, event.to_message())
+
+    assert consumer.drain() == len(events)
+
+    db.session.expire_all()
+    actions = Action.query.filter_by(workflow_id=workflow.id).order_by(Action.id)
+    assert [a.status for a in actions] == ["completed"] * 3
+    assert [a.logs for a in actions] == ["log0", "log1", "log2"]
+    assert all(a.started_at == start for a in actions)
+    assert db.session.get(Workflow, workflow.id).status == "completed"
+    assert consumer.stats.flushes == 1
+    assert consumer.stats.actions_written == 3
+    assert consumer.bus.depth(STATUS_QUEUE) == 0
+
+
+def test_failed_flush_is_redelivered(consumer, monkeypatch, create_workflow):
+    workflow = create_workflow(1)
+    event = StatusEvent(workflow.id, None, "running", datetime.utcnow())
+    consumer.bus.publish(event.routing_key, event.to_message())
+
+    def fail(events):
+        raise RuntimeError("数据库不可用")
+
+    # app.status_consumer 在包上被同名实例遮蔽，经 sys.modules 取模块
+    module = sys.modules["app.status_consumer"]
+    monkeypatch.setattr(module, "apply_status_events", fail)
+    with pytest.raises(RuntimeError):
+        consumer.run_once()
+    assert consumer.stats.failures == 1
+    assert consumer.bus.depth(STATUS_QUEUE) == 1
+
+    monkeypatch.undo()
+    assert consumer.drain() == 1
+    assert db.session.get(Workflow, workflow.id).status == "running"
+
+
+def test_invalid_message_does_not_block_queue(consumer, create_workflow):
+    workflow = create_workflow(1)
+    action_id = Action.query.filter_by(workflow_id=workflow.id).one().id
+    at = datetime(2025, 1, 1).isoformat()
+    bus = consumer.bus
+    bus.publish("workflow.status.1", {"workflow_id": workflow.id})
+    bus.publish(
+        "workflow.status.1",
+        {"workflow_id": workflow.id, "action_id": None, "status": "paused", "at": at},
+    )
+    event = StatusEvent(workflow.id, action_id, "running", datetime(2025, 1, 1))
+    bus.publish(event.routing_key, event.to_message())
+
+    assert consumer.drain() == 3
+    assert db.session.get(Action, action_id).status == "running"
+    assert consumer.stats.rejected == 2
+    assert consumer.stats.messages == 1
+    assert bus.depth(STATUS_QUEUE) == 0
+    assert [m.body.get("status") for m in bus.dead_letters(STATUS_QUEUE)] == [
+        None,
+        "paused",
+    ]
+
+
+def test_write_retries_are_limited(consumer, monkeypatch, create_workflow):
+    workflow = create_workflow(1)
+    event = StatusEvent(workflow.id, None, "running", datetime.utcnow())
+    consumer.bus.publish(event.routing_key, event.to_message())
+
+    def fail(events):
+        raise RuntimeError("数据库不可用")
+
+    monkeypatch.setattr(sys.modules["app.status_consumer"], "apply_status_events", fail)
+    for _ in range(consumer.max_deliveries):
+        with pytest.raises(RuntimeError):
+            consumer.run_once()
+    assert consumer.stats.failures == consumer.max_deliveries
+    assert consumer.stats.rejected == 1
+    assert consumer.bus.depth(STATUS_QUEUE) == 0
+    assert len(consumer.bus.dead_letters(STATUS_QUEUE)) == 1
+
+
+def test_fake_argo_reports_through_bus(consumer, create_workflow):
+    workflow = create_workflow(200)
+    backend = FakeArgoBackend(pod_latency=0, duration=0, bus=consumer.bus)
+    backend.app = app
+    consumer.start()
+
+    assert backend.submit(workflow.id).result(timeout=30) == "completed"
+    for _ in range(500):
+        if consumer.bus.depth(STATUS_QUEUE) == 0:
+            break
+        consumer._stopping.wait(0.01)
+    consumer.stop()
+
+    db.session.expire_all()
+    assert db.session.get(Workflow, workflow.id).status == "completed"
+    statuses = {a.status for a in Action.query.filter_by(workflow_id=workflow.id)}
+    assert statuses == {"completed"}
+    assert consumer.stats.messages == 402
+    assert consumer.stats.actions_written < consumer.stats.messages
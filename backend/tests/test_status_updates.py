@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+from app.models import Action, Workflow, WorkflowStatRollup, db
+from app.status_updates import Transition, apply_transitions, coalesce
+
+START = datetime(2025, 3, 1, 8)
+
+
+def action_ids(workflow):
+    return sorted(a.id for a in Action.query.filter_by(workflow_id=workflow.id))
+
+
+def load(action_id):
+    db.session.expire_all()
+    return db.session.get(Action, action_id)
+
+
+def test_coalesce_keeps_first_terminal_status():
+    later = START + timedelta(seconds=5)
+    merged = coalesce(
+        [
+            Transition(1, "running", START),
+            Transition(1, "failed", later, exit_code=2),
+            Transition(1, "completed", later + timedelta(seconds=1)),
+            Transition(1, "running", later),
+        ]
+    )
+    assert merged[1].status == "failed"
+    assert merged[1].started_at == START
+    assert merged[1].completed_at == later
+    assert merged[1].exit_code == 2
+
+
+def test_transitions_only_move_forward(app_context, create_workflow):
+    workflow = create_workflow(2)
+    first, second = action_ids(workflow)
+    end = START + timedelta(minutes=1)
+    applied = apply_transitions(
+        [
+            Transition(first, "running", START),
+            Transition(first, "completed", end, exit_code=0),
+            Transition(second, "running", START),
+        ]
+    )
+    assert sorted(applied["actions"]) == [first, second]
+
+    # 乱序到达的 running 和相互冲突的结束状态都被拒绝
+    applied = apply_transitions(
+        [
+            Transition(first, "running", end),
+            Transition(first, "failed", end, exit_code=1),
+            Transition(second, "pending", end),
+        ]
+    )
+    assert applied["actions"] == []
+
+    action = load(first)
+    assert (action.status, action.exit_code) == ("completed", 0)
+    assert (action.started_at, action.completed_at) == (START, end)
+    assert load(second).status == "running"
+
+
+def test_log_chunks_are_idempotent(app_context, create_workflow):
+    workflow = create_workflow(1)
+    (action_id,) = action_ids(workflow)
+    chunk = Transition(action_id, "running", START, logs="line1\n", log_offset=0)
+    apply_transitions([chunk])
+    apply_transitions([chunk])
+    assert load(action_id).logs == "line1\n"
+
+    apply_transitions(
+        [
+            Transition(action_id, "running", START, logs="line2\n", log_offset=6),
+            Transition(
+                action_id, "running", START, logs="line2\nline3\n", log_offset=6
+            ),
+        ]
+    )
+    apply_transitions([Transition(action_id, "completed", START, logs="done")])
+    assert load(action_id).logs == "line1\nline2\nline3\ndone"
+
+
+def test_workflow_transitions_recorded_once(app_context, create_workflow):
+    workflow = create_workflow(1)
+    for _ in range(2):
+        apply_transitions(
+            workflows=[
+                Transition(workflow.id, "running", START),
+                Transition(workflow.id, "completed", START + timedelta(minutes=1)),
+            ]
+        )
+
+    db.session.expire_all()
+    assert db.session.get(Workflow, workflow.id).status == "completed"
+    counts = {
+        row.status: row.count
+        for row in WorkflowStatRollup.query.filter_by(
+            template_id=workflow.template_id, granularity="day"
+        )
+    }
+    assert counts == {"completed": 1}
+
+
+def test_status_endpoint_reports_skipped(client, create_workflow):
+    workflow = create_workflow(2)
+    first, second = action_ids(workflow)
+    apply_transitions([Transition(second, "failed", START)])
+
+    response = client.post(
+        "/api/workflow/status",
+        json={
+            "actions": [
+                {
+                    "id": first,
+                    "status": "completed",
+                    "at": START.isoformat(),
+                    "exit_code": 0,
+                },
+                {"id": second, "status": "running", "at": START.isoformat()},
+                {"id": 999999, "status": "running", "at": START.isoformat()},
+            ],
+            "workflows": [
+                {"id": workflow.id, "status": "running", "at": START.isoformat()}
+            ],
+        },
+    )
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "actions": {"applied": 1, "skipped": [second, 999999]},
+        "workflows": {"applied": 1, "skipped": []},
+    }
+    assert load(first).exit_code == 0
+
+    bad = client.post(
+        "/api/workflow/status",
+        json={"actions": [{"id": first, "status": "done", "at": START.isoformat()}]},
+    )
+    assert bad.status_code == 422
@@ -0,0 +1,184 @@
+from datetime import datetime
+
+import pytest
+
+from app import app
+from app.models import (
+    Action,
+    Activity,
+    Entity,
+    Project,
+    StepResult,
+    WasGeneratedBy,
+    WasInformedBy,
+    Workflow,
+    WorkflowTemplate,
+    db,
+)
+from app.step_cache import action_run_key, cache_key
+from app.workflow_engine import (
+    TemplateError,
+    WorkflowEngine,
+    compile_template,
+    create_actions,
+)
+
+STAGES = [
+    {
+        "name": "calibrate",
+        "type": "script",
+        "dependencies": [],
+        "config": {"cache": {"description": "calibrate", "inputs": ["calib"]}},
+    },
+    {
+        "name": "science",
+        "type": "script",
+        "dependencies": ["calibrate"],
+        "config": {"cache": {"description": "science", "parameters": {"snr": 5}}},
+    },
+    {
+        "name": "flat",
+        "type": "script",
+        "dependencies": [],
+        "config": {"cache": {"description": "flat", "inputs": ["flat"]}},
+    },
+]
+
+
+@pytest.fixture
+def engine(app_context):
+    engine = WorkflowEngine(app)
+    yield engine
+    engine.shutdown()
+
+
+def setup_template():
+    project = Project(name="缓存项目")
+    db.session.add(project)
+    db.session.flush()
+    template = WorkflowTemplate(
+        name="缓存模板", config={"stages": STAGES}, project_id=project.id
+    )
+    db.session.add_all(
+        [
+            template,
+            Entity(name="定标文件", external_id="calib", checksum="c1"),
+            Entity(name="平场文件", external_id="flat", checksum="f1"),
+        ]
+    )
+    db.session.commit()
+    return template
+
+
+def launch(template):
+    workflow = Workflow(
+        name="缓存实例", template_id=template.id, project_id=template.project_id
+    )
+    db.session.add(workflow)
+    db.session.flush()
+    create_actions(workflow, compile_template(template.config))
+    db.session.commit()
+    return workflow, {
+        a.name: a.id for a in Action.query.filter_by(workflow_id=workflow.id)
+    }
+
+
+def register_outputs(workflow_id, ids):
+    """模拟节点命令按 NADC_RUN_KEY 登记的溯源：每个节点生成一个实体"""
+    for name, action_id in ids.items():
+        activity = Activity(
+            name=name,
+            start_time=datetime.utcnow(),
+            run_key=action_run_key(workflow_id, action_id),
+        )
+        entity = Entity(name=f"{name}-out", checksum=f"{name}-{workflow_id}")
+        db.session.add_all([activity, entity])
+        db.session.flush()
+        db.session.add(WasGeneratedBy(activity_id=activity.id, entity_id=entity.id))
+    db.session.commit()
+
+
+def results(workflow_id):
+    db.session.expire_all()
+    return {
+        name: hit
+        for name, hit in db.session.query(Action.name, StepResult.hit)
+        .join(StepResult, StepResult.action_id == Action.id)
+        .filter(Action.workflow_id == workflow_id)
+    }
+
+
+def test_cache_key_depends_on_inputs_and_parameters():
+    config = STAGES[1]["config"]
+    assert cache_key(config, ["a", "b"]) == cache_key(config, ["b", "a"])
+    assert cache_key(config, ["a"]) != cache_key(config, ["b"])
+    changed = {"cache": {"description": "science", "parameters": {"snr": 3}}}
+    assert cache_key(changed, ["a"]) != cache_key(config, ["a"])
+
+    with pytest.raises(TemplateError, match="cache"):
+        compile_template(
+            {"stages": [{"name": "a", "type": "script", "config": {"cache": []}}]}
+        )
+
+
+def test_unchanged_actions_reuse_outputs(engine, client):
+    template = setup_template()
+    first, first_ids = launch(template)
+    register_outputs(first.id, first_ids)
+    assert engine.run(first.id) == "completed"
+    assert results(first.id) == {"calibrate": False, "science": False, "flat": False}
+
+    second, second_ids = launch(template)
+    assert engine.run(second.id) == "completed"
+    assert results(second.id) == {"calibrate": True, "science": True, "flat": True}
+    action = db.session.get(Action, second_ids["science"])
+    assert action.status == "completed" and "缓存命中" in action.logs
+    # 命中的节点登记了由被复用活动通知的活动
+    hit = Activity.query.filter_by(
+        run_key=action_run_key(second.id, second_ids["science"])
+    ).one()
+    source = Activity.query.filter_by(
+        run_key=action_run_key(first.id, first_ids["science"])
+    ).one()
+    assert (
+        WasInformedBy.query.filter_by(
+            informed_id=hit.id, informant_id=source.id
+        ).count()
+        == 1
+    )
+
+    # 只有定标文件变化：定标及其下游重新执行，平场分支继续命中
+    Entity.query.filter_by(external_id="calib").one().checksum = "c2"
+    db.session.commit()
+    third, third_ids = launch(template)
+    assert engine.run(third.id) == "completed"
+    # 重新执行的节点没有登记溯源：计入未命中，但结果不能被复用
+    assert results(third.id) == {"calibrate": False, "science": False, "flat": True}
+    rows = StepResult.query.filter(
+        StepResult.action_id.in_([third_ids["calibrate"], third_ids["science"]])
+    ).order_by(StepResult.action_id)
+    assert [(row.activity_id, row.cache_key is None) for row in rows] == [
+        (None, False),
+        (None, True),
+    ]
+
+    response = client.get(f"/api/workflow-template/{template.id}/cache-stats")
+    assert response.status_code == 200
+    stats = response.get_json()
+    assert (stats["hits"], stats["misses"]) == (4, 5)
+    assert stats["stages"][0] == {"name": "calibrate", "hits": 1, "misses": 2}
+
+
+def test_invalidated_outputs_are_not_reused(engine):
+    template = setup_template()
+    first, first_ids = launch(template)
+    register_outputs(first.id, first_ids)
+    engine.run(first.id)
+    Entity.query.filter_by(checksum=f"flat-{first.id}").one().invalidated_at_time = (
+        datetime.utcnow()
+    )
+    db.session.commit()
+
+    second, _ = launch(template)
+    engine.run(second.id)
+    assert results(second.id) == {"calibrate": True, "science": True, "flat": False}
@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import update
+
+import app.template_plans as template_plans
+from app.models import Action, Project, Workflow, WorkflowTemplate, db
+from app.template_plans import (
+    PlanCache,
+    TemplateError,
+    compile_template,
+    plan_cache,
+    scheduling_options,
+)
+
+STAGES = [
+    {"name": "a", "type": "script"},
+    {"name": "b", "type": "script"},
+    {"name": "c", "type": "script", "dependencies": ["a"]},
+    {"name": "d", "type": "script", "dependencies": ["b", "c"]},
+]
+
+
+def setup_template(config=None):
+    project = Project.query.filter_by(name="计划项目").first()
+    if project is None:
+        project = Project(name="计划项目")
+        db.session.add(project)
+        db.session.flush()
+    template = WorkflowTemplate(
+        name="计划模板",
+        config=config or {"stages": STAGES},
+        project_id=project.id,
+    )
+    db.session.add(template)
+    db.session.commit()
+    return template
+
+
+@pytest.fixture
+def compiles(monkeypatch):
+    """统计 compile_template 被调用的次数"""
+    calls = []
+
+    def counting(config):
+        calls.append(config)
+        return compile_template(config)
+
+    monkeypatch.setattr(template_plans, "compile_template", counting)
+    return calls
+
+
+def test_compile_resolves_defaults_and_masks():
+    plan = compile_template(
+        {"stages": STAGES, "priority": "high", "max_concurrency": 4}
+    )
+    assert [stage.name for stage in plan.stages] == ["a", "b", "c", "d"]
+    # 未声明 dependencies 的 b 依赖前一个阶段 a
+    assert plan.stages[1].dependencies == ("a",)
+    index = plan.index
+    assert plan.dependency_masks == (
+        0,
+        1 << index["a"],
+        1 << index["a"],
+        (1 << index["b"]) | (1 << index["c"]),
+    )
+    assert (plan.priority, plan.max_concurrency) == ("high", 4)
+    assert plan.action_configs[3] == {"dependencies": ["b", "c"]}
+
+
+def test_invalid_priority_rejected_but_scheduling_falls_back():
+    with pytest.raises(TemplateError, match="priority"):
+        compile_template({"stages": STAGES, "priority": "urgent"})
+    # 已保存的旧配置仍按默认类别调度
+    assert scheduling_options({"priority": "urgent"}) == ("normal", None)
+
+
+def test_cache_hit_does_not_recompile(app_context, compiles):
+    template = setup_template()
+    first = plan_cache.get(template.id)
+    assert plan_cache.get(template.id) is first
+    assert plan_cache.get(template.id, template.updated_at) is first
+    assert len(compiles) == 1
+
+
+def test_cache_misses_when_updated_elsewhere(app_context, compiles):
+    template = setup_template()
+    plan_cache.get(template.id)
+    # 其他进程更新了配置：updated_at 变化，本进程的计划自然失效
+    db.session.execute(
+        update(WorkflowTemplate)
+        .where(WorkflowTemplate.id == template.id)
+        .values(
+            config={"stages": STAGES[:2]},
+            updated_at=template.updated_at + timedelta(seconds=1),
+        )
+    )
+    db.session.commit()
+    assert [stage.name for stage in plan_cache.get(template.id).stages] == ["a", "b"]
+    assert len(compiles) == 2
+
+
+def test_cache_evicts_least_recently_used(app_context):
+    cache = PlanCache()
+    cache.max_size = 2
+    templates = [setup_template() for _ in range(3)]
+    cache.get(templates[0].id)
+    cache.get(templates[1].id)
+    cache.get(templates[0].id)
+    cache.get(templates[2].id)
+    assert len(cache) == 2
+    assert cache._cached(templates[1].id, templates[1].updated_at) is None
+    assert cache._cached(templates[0].id, templates[0].updated_at) is not None
+
+
+def test_cache_missing_template_and_errors(app_context):
+    assert plan_cache.get(999) is None
+    template = setup_template({"stages": [{"name": "a", "type": "script"}] * 2})
+    with pytest.raises(TemplateError, match="阶段名重复"):
+        plan_cache.get(template.id)
+    assert len(plan_cache) == 0
+
+
+def test_run_uses_cached_plan_and_update_invalidates(client, compiles):
+    template = setup_template()
+    for _ in range(3):
+        response = client.post(f"/api/workflow-template/{template.id}/run")
+        assert response.status_code == 201
+    assert len(compiles) == 1
+    workflow_ids = [workflow.id for workflow in Workflow.query]
+    assert Action.query.filter(Action.workflow_id.in_(workflow_ids)).count() == 12
+
+    response = client.put(
+        f"/api/workflow-template/{template.id}/",
+        json={
+            "name": "计划模板",
+            "project_id": template.project_id,
+            "config": {"stages": STAGES[:1]},
+        },
+    )
+    assert response.status_code == 200
+    assert len(plan_cache) == 0
+    response = client.post(f"/api/workflow-template/{template.id}/run")
+    workflow_id = response.get_json()["id"]
+    assert Action.query.filter_by(workflow_id=workflow_id).count() == 1
+    assert len(compiles) == 2
+
+
+def test_run_rejects_uncompilable_template(client):
+    template = setup_template(
+        {"stages": [{"name": "a", "type": "script", "dependencies": ["x"]}]}
+    )
+    response = client.post(f"/api/workflow-template/{template.id}/run")
+    assert response.status_code == 400
+    assert Workflow.query.count() == 0
@@ -0,0 +1,176 @@
+import json
+import time
+
+import pytest
+
+from app.models import Project, WorkflowTemplate, db
+from app.template_plans import TemplateError, compile_template
+from app.template_validation import validate_stage, validate_template
+
+
+def stage(name, **fields):
+    return {"name": name, "type": "script", **fields}
+
+
+def issues(config):
+    return [(issue.path, issue.message) for issue in validate_template(config)]
+
+
+def test_valid_template_has_no_issues():
+    config = {
+        "priority": "high",
+        "max_concurrency": 2,
+        "stages": [
+            stage("a", config={"command": ["run.sh"], "args": [1], "timeout": 5}),
+            stage("b"),
+            stage(
+                "c",
+                type="loop",
+                dependencies=["a", "b"],
+                loop={"max_iterations": 3, "stages": [stage("x"), stage("y")]},
+            ),
+        ],
+    }
+    assert validate_template(config) == []
+    assert validate_template(None) == []
+    assert validate_template({}) == []
+
+
+def test_reports_all_errors_with_paths():
+    config = {
+        "priority": "urgent",
+        "stages": [
+            stage("a", config={"args": "oops", "timeout": 0}),
+            {"name": "b"},
+            stage("a"),
+            stage("c", dependencies=["missing", 3]),
+            "d",
+            stage(
+                "e",
+                loop={"max_iterations": 0, "stages": [stage("f", dependencies=["g"])]},
+            ),
+        ],
+    }
+    assert issues(config) == [
+        ("priority", "priority 必须是 high/normal/low 之一: urgent"),
+        ("stages[0].config.args", "args 的类型无效"),
+        ("stages[0].config.timeout", "timeout 必须大于0"),
+        ("stages[1]", "阶段缺少 type"),
+        ("stages[2].name", "阶段名重复: a"),
+        ("stages[3].dependencies[1]", "依赖必须是阶段名"),
+        ("stages[4]", "阶段必须是对象"),
+        ("stages[5].loop.max_iterations", "循环必须设置正整数 max_iterations"),
+        ("stages[5].loop.stages[0].dependencies[0]", "阶段 f 依赖不存在的阶段 g"),
+        ("stages[3].dependencies[0]", "阶段 c 依赖不存在的阶段 missing"),
+    ]
+
+
+def test_reports_each_cycle_once():
+    config = {
+        "stages": [
+            stage("a", dependencies=["c"]),
+            stage("b", dependencies=["a"]),
+            stage("c", dependencies=["b"]),
+            stage("d", dependencies=["c"]),  # 依赖环但不在环上
+            stage("e", dependencies=["e"]),
+            stage("f", dependencies=["g"]),
+            stage("g", dependencies=["f"]),
+        ]
+    }
+    assert issues(config) == [
+        ("stages[0].dependencies", "阶段依赖存在环: a, b, c"),
+        ("stages[4].dependencies", "阶段依赖存在环: e"),
+        ("stages[5].dependencies", "阶段依赖存在环: f, g"),
+    ]
+
+
+def test_compile_raises_with_all_issues():
+    with pytest.raises(TemplateError) as error:
+        compile_template({"stages": [stage("a", dependencies=["x", "y"])]})
+    assert str(error.value) == "stages[0].dependencies[0]: 阶段 a 依赖不存在的阶段 x"
+    assert len(error.value.issues) == 2
+
+
+def test_validate_stage_allows_missing_name_and_type():
+    assert validate_stage({"dependencies": ["anything"]}) == []
+    assert [issue.path for issue in validate_stage({"config": []})] == ["config"]
+
+
+def test_large_template_validates_in_linear_time():
+    def chain(count):
+        return {
+            "stages": [
+                stage(f"s{i}", dependencies=[f"s{i - 1}"] if i else [])
+                for i in range(count)
+            ]
+            + [stage("loop0", dependencies=[f"s{count - 1}"])]
+        }
+
+    started = time.perf_counter()
+    assert validate_template(chain(5000)) == []
+    small = time.perf_counter() - started
+    # 首尾相连的长环：迭代实现不受递归深度限制
+    config = chain(50000)
+    config["stages"][0]["dependencies"] = ["loop0"]
+    started = time.perf_counter()
+    result = validate_template(config)
+    large = time.perf_counter() - started
+    assert len(result) == 1 and result[0].message.startswith("阶段依赖存在环: s0, s1")
+    assert large < small * 10 * 4
+
+
+def test_validate_endpoint(client):
+    response = client.post(
+        "/api/workflow-template/validate",
+        json={"config": {"stages": [stage("a"), stage("b", dependencies=["c"])]}},
+    )
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["valid"] is False and body["stages"] == 2
+    assert body["errors"][0]["path"] == "stages[1].dependencies[0]"
+
+    response = client.post(
+        "/api/workflow-template/validate", json={"config": '{"stages": [\n  {"name": }'}
+    )
+    body = response.get_json()
+    assert body["valid"] is False
+    assert (body["errors"][0]["line"], body["errors"][0]["column"]) == (2, 12)
+
+    response = client.post(
+        "/api/workflow-template/validate",
+        json={"config": json.dumps({"stages": [stage("a")]})},
+    )
+    assert response.get_json() == {"valid": True, "stages": 1, "errors": []}
+
+
+def test_create_and_update_reject_invalid_config(client):
+    project = Project(name="校验项目")
+    db.session.add(project)
+    db.session.commit()
+    payload = {"name": "模板", "project_id": project.id}
+
+    response = client.post(
+        "/api/workflow-template/",
+        json={**payload, "config": {"stages": [stage("a"), stage("a")]}},
+    )
+    assert response.status_code == 422
+    assert response.get_json()["detail"]["config"] == ["stages[1].name: 阶段名重复: a"]
+    response = client.post(
+        "/api/workflow-template/", json={**payload, "config": "{not json"}
+    )
+    assert response.status_code == 422
+    assert WorkflowTemplate.query.count() == 0
+
+    response = client.post(
+        "/api/workflow-template/", json={**payload, "config": {"stages": [stage("a")]}}
+    )
+    assert response.status_code == 201
+    template_id = response.get_json()["id"]
+    response = client.put(
+        f"/api/workflow-template/{template_id}/",
+        json={**payload, "config": {"stages": [stage("a", dependencies=["a"])]}},
+    )
+    assert response.status_code == 422
+    assert db.session.get(WorkflowTemplate, template_id).config == {
+        "stages": [stage("a")]
+    }
@@ -0,0 +1,525 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from app import app
+from app.models import (
+    Action,
+    Activity,
+    LoopCheckpoint,
+    WasInformedBy,
+    Workflow,
+    WorkflowTemplate,
+    db,
+)
+from app.workflow_engine import TemplateError, WorkflowEngine, compile_template
+from app.workflow_engine import engine as workflow_engine
+
+
+def stage(name, command=None, dependencies=None, **config):
+    spec = {"name": name, "type": "script", "config": dict(config)}
+    if command is not None:
+        spec["config"]["command"] = command
+    if dependencies is not None:
+        spec["dependencies"] = dependencies
+    return spec
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+def actions_by_name(workflow_id):
+    return {a.name: a for a in Action.query.filter_by(workflow_id=workflow_id)}
+
+
+@pytest.fixture
+def engine(app_context):
+    engine = WorkflowEngine(app)
+    engine.max_workers = 4
+    yield engine
+    engine.shutdown()
+
+
+def test_compile_defaults_to_sequential_and_orders_topologically():
+    plan = compile_template(
+        {
+            "stages": [
+                stage("report", dependencies=["b", "c"]),
+                stage("a", dependencies=[]),
+                stage("b", dependencies=["a"]),
+                stage("c", dependencies=["a"]),
+                stage("archive"),
+            ]
+        }
+    )
+    assert [s.name for s in plan.stages] == ["a", "b", "c", "report", "archive"]
+    assert plan.stages[-1].dependencies == ("c",)
+    assert compile_template({}).stages == ()
+
+
+@pytest.mark.parametrize(
+    "stages, message",
+    [
+        ([stage("a"), stage("a")], "重复"),
+        ([stage("a", dependencies=["missing"])], "不存在"),
+        ([stage("a", dependencies=["b"]), stage("b", dependencies=["a"])], "环"),
+        ([{"name": "a"}], "缺少"),
+        ([{"name": "a", "type": "loop", "loop": {"stages": [stage("b")]}}], "max"),
+        ([{"name": "a", "type": "loop", "loop": {"max_iterations": 2}}], "没有阶段"),
+    ],
+)
+def test_compile_rejects_invalid_templates(stages, message):
+    with pytest.raises(TemplateError, match=message):
+        compile_template({"stages": stages})
+
+
+def test_independent_stages_run_in_parallel(engine, create_workflow):
+    sleep = python("import time; time.sleep(0.5); print('done')")
+    workflow = create_workflow(
+        [
+            stage("a", python("print('hello')"), dependencies=[]),
+            stage("b", sleep, dependencies=["a"]),
+            stage("c", sleep, dependencies=["a"]),
+            stage("d", python("print('bye')"), dependencies=["b", "c"]),
+        ]
+    )
+
+    assert engine.run(workflow.id) == "completed"
+
+    actions = actions_by_name(workflow.id)
+    assert {a.status for a in actions.values()} == {"completed"}
+    assert "hello" in actions["a"].logs
+    b, c = actions["b"], actions["c"]
+    assert b.started_at < c.completed_at and c.started_at < b.completed_at
+    assert actions["d"].started_at >= max(b.completed_at, c.completed_at)
+    workflow = db.session.get(Workflow, workflow.id)
+    assert workflow.status == "completed"
+    assert workflow.started_at <= actions["a"].started_at
+
+
+def test_template_max_concurrency_serializes_stages(engine, create_workflow):
+    sleep = python("import time; time.sleep(0.2)")
+    workflow = create_workflow(
+        [stage("b", sleep, dependencies=[]), stage("c", sleep, dependencies=[])],
+        max_concurrency=1,
+        priority="high",
+    )
+
+    assert engine.run(workflow.id) == "completed"
+
+    b, c = sorted(actions_by_name(workflow.id).values(), key=lambda a: a.started_at)
+    assert c.started_at >= b.completed_at
+
+
+def test_failed_stage_blocks_only_its_downstream(engine, create_workflow):
+    workflow = create_workflow(
+        [
+            stage("fails", python("import sys; print('boom'); sys.exit(3)"), []),
+            stage("after_fail", python("print(1)"), ["fails"]),
+            stage("independent", python("print(2)"), []),
+            stage("placeholder", dependencies=["independent"]),
+        ]
+    )
+
+    assert engine.run(workflow.id) == "failed"
+
+    actions = actions_by_name(workflow.id)
+    assert actions["fails"].status == "failed"
+    assert "boom" in actions["fails"].logs and "退出码 3" in actions["fails"].logs
+    assert actions["after_fail"].status == "pending"
+    assert actions["independent"].status == "completed"
+    assert actions["placeholder"].status == "completed"
+    assert db.session.get(Workflow, workflow.id).status == "failed"
+
+
+def test_run_route_creates_actions_and_submits(client, monkeypatch, create_workflow):
+    template = db.session.get(WorkflowTemplate, create_workflow([]).template_id)
+    template.config = {
+        "stages": [stage("extract", python("print('x')")), stage("load")]
+    }
+    db.session.commit()
+    submitted = []
+    monkeypatch.setattr(workflow_engine, "autostart", True)
+    monkeypatch.setattr(workflow_engine, "submit", submitted.append)
+
+    response = client.post(f"/api/workflow-template/{template.id}/run")
+    assert response.status_code == 201
+    created = response.get_json()["id"]
+    assert submitted == [created]
+    actions = actions_by_name(created)
+    assert actions["load"].config["dependencies"] == ["extract"]
+    assert {a.status for a in actions.values()} == {"pending"}
+
+    template.config = {"stages": [stage("a", dependencies=["a"])]}
+    db.session.commit()
+    response = client.post(f"/api/workflow-template/{template.id}/run")
+    assert response.status_code == 400
+
+
+def test_submit_runs_in_background(engine, create_workflow):
+    workflow = create_workflow([stage("a", python("print('bg')"))])
+    assert engine.submit(workflow.id).result(timeout=30) == "completed"
+    db.session.expire_all()
+    assert actions_by_name(workflow.id)["a"].status == "completed"
+
+
+def test_terminated_workflow_is_not_revived(engine, create_workflow, tmp_path):
+    marker = tmp_path / "ran"
+    workflow = create_workflow([stage("a", python(f"open({str(marker)!r}, 'w')"))])
+    # 协调线程开始前已被终止接口写入 terminated
+    db.session.get(Workflow, workflow.id).status = "terminated"
+    Action.query.filter_by(workflow_id=workflow.id).update({"status": "terminated"})
+    db.session.commit()
+
+    assert engine.run(workflow.id) == "terminated"
+    db.session.expire_all()
+    assert db.session.get(Workflow, workflow.id).status == "terminated"
+    assert actions_by_name(workflow.id)["a"].status == "terminated"
+    assert not marker.exists()
+
+
+def test_terminate_between_submit_and_coordination(
+    client, tmp_path, monkeypatch, create_workflow
+):
+    marker = tmp_path / "ran"
+    workflow = create_workflow([stage("a", python(f"open({str(marker)!r}, 'w')"))])
+    gate, runs = threading.Event(), []
+    drive = workflow_engine._drive
+
+    def delayed(run):
+        runs.append(run)
+        gate.wait(10)
+        return drive(run)
+
+    # 协调线程已启动但尚未加载流水线时收到终止请求
+    monkeypatch.setattr(workflow_engine, "_drive", delayed)
+    future = workflow_engine.submit(workflow.id)
+    response = client.post(f"/api/workflow/{workflow.id}/terminate")
+    assert response.get_json()["status"] == "terminated"
+    gate.set()
+
+    assert future.result(timeout=30) == "terminated"
+    # 提交时已登记，终止接口的 cancel() 找到了这次执行
+    assert runs[0].cancelled
+    db.session.expire_all()
+    assert db.session.get(Workflow, workflow.id).status == "terminated"
+    assert actions_by_name(workflow.id)["a"].status == "terminated"
+    assert not marker.exists()
+
+
+def test_cancel_kills_running_and_drops_queued_actions(engine, create_workflow):
+    engine.max_workers = 2
+    engine.cancel_grace = 0.5
+    workflow = create_workflow(
+        [
+            # 孙进程持有输出管道，只终止shell时 communicate 不会返回
+            stage("shell", "sleep 60 & sleep 60; wait", dependencies=[]),
+            stage(
+                "stubborn",
+                python(
+                    "import signal, time; "
+                    "signal.signal(signal.SIGTERM, signal.SIG_IGN); time.sleep(60)"
+                ),
+                dependencies=[],
+            ),
+            *(stage(f"queued{i}", python("pass"), dependencies=[]) for i in range(3)),
+            stage("after", python("pass"), dependencies=["shell"]),
+        ]
+    )
+    future = engine.submit(workflow.id)
+    for _ in range(500):
+        db.session.expire_all()
+        if engine.scheduler.stats()["running"] == 2:
+            break
+        time.sleep(0.01)
+
+    started = time.monotonic()
+    assert engine.cancel(workflow.id)
+    assert future.result(timeout=30) == "terminated"
+    assert time.monotonic() - started < 10
+
+    db.session.expire_all()
+    result = {name: a.status for name, a in actions_by_name(workflow.id).items()}
+    assert result.pop("after") == "pending"
+    assert set(result.values()) == {"terminated"}
+    assert engine.scheduler.stats()["queued"] == 0
+
+
+def loop(name, stages, max_iterations, until=None, dependencies=None):
+    spec = {
+        "name": name,
+        "type": "loop",
+        "loop": {"stages": stages, "max_iterations": max_iterations},
+    }
+    if until is not None:
+        spec["loop"]["until"] = {"command": until}
+    if dependencies is not None:
+        spec["dependencies"] = dependencies
+    return spec
+
+
+def record(path, fail_unless=None, fail_iteration=None):
+    """循环体命令：把迭代序号追加到文件，可在指定迭代且标记文件不存在时失败"""
+    code = (
+        "import os, sys; i = os.environ['NADC_ITERATION']; "
+        f"open({str(path)!r}, 'a').write(i + '\\n'); "
+    )
+    if fail_unless is not None:
+        code += (
+            f"sys.exit(1 if i == {str(fail_iteration)!r} "
+            f"and not os.path.exists({str(fail_unless)!r}) else 0)"
+        )
+    return python(code)
+
+
+def lines(path):
+    return path.read_text().split()
+
+
+def checkpoints(workflow_id):
+    return (
+        LoopCheckpoint.query.join(Action)
+        .filter(Action.workflow_id == workflow_id)
+        .order_by(LoopCheckpoint.id)
+        .all()
+    )
+
+
+def test_loop_runs_until_converged_and_links_iterations(
+    engine, tmp_path, create_workflow
+):
+    until = python(
+        "import os, sys; i = int(os.environ['NADC_ITERATION']); "
+        "print(f'residual={10 - 3 * i}'); sys.exit(0 if i >= 3 else 1)"
+    )
+    workflow = create_workflow(
+        [
+            loop("calibrate", [stage("fit", record(tmp_path / "fit"))], 10, until),
+            stage("publish", python("print('published')")),
+        ]
+    )
+
+    assert engine.run(workflow.id) == "completed"
+
+    assert lines(tmp_path / "fit") == ["1", "2", "3"]
+    rows = checkpoints(workflow.id)
+    assert [(c.iteration, c.converged, c.state) for c in rows] == [
+        (1, False, "residual=7"),
+        (2, False, "residual=4"),
+        (3, True, "residual=1"),
+    ]
+    actions = actions_by_name(workflow.id)
+    assert actions["calibrate"].status == "completed"
+    assert "第 3 次迭代收敛" in actions["calibrate"].logs
+    assert actions["publish"].status == "completed"
+
+    iterations = {a.name: a.id for a in Activity.query.all()}
+    assert set(iterations) == {"calibrate#1", "calibrate#2", "calibrate#3"}
+    links = {(l.informed_id, l.informant_id) for l in WasInformedBy.query.all()}
+    assert links == {
+        (iterations["calibrate#2"], iterations["calibrate#1"]),
+        (iterations["calibrate#3"], iterations["calibrate#2"]),
+    }
+
+
+def test_interrupted_loop_resumes_from_last_checkpoint(
+    engine, tmp_path, create_workflow
+):
+    marker = tmp_path / "fixed"
+    body = record(tmp_path / "fit", fail_unless=marker, fail_iteration=3)
+    workflow = create_workflow([loop("calibrate", [stage("fit", body)], 4)])
+
+    assert engine.run(workflow.id) == "failed"
+    assert [c.iteration for c in checkpoints(workflow.id)] == [1, 2]
+
+    # 模拟进程中断：流水线和节点停留在running，重新执行时从检查点继续
+    action = actions_by_name(workflow.id)["calibrate"]
+    action.status = "running"
+    db.session.get(Workflow, workflow.id).status = "running"
+    db.session.commit()
+    marker.touch()
+    assert engine.run(workflow.id) == "completed"
+
+    assert lines(tmp_path / "fit") == ["1", "2", "3", "3", "4"]
+    assert [c.iteration for c in checkpoints(workflow.id)] == [1, 2, 3, 4]
+    links = WasInformedBy.query.count()
+    assert links == 3
+
+
+def test_failed_checkpoint_commit_releases_loop_worker(
+    engine, monkeypatch, create_workflow
+):
+    workflow = create_workflow(
+        [
+            loop("calibrate", [stage("fit", python(""))], 3),
+            stage("slow", python("import time; time.sleep(60)"), dependencies=[]),
+        ]
+    )
+
+    def fail(workflow_id, rows):
+        raise RuntimeError("数据库不可用")
+
+    monkeypatch.setattr(engine, "_write_checkpoints", fail)
+    started = time.monotonic()
+    with pytest.raises(RuntimeError):
+        engine.run(workflow.id)
+    # 工作线程收到提交失败、子进程被终止，不再占用调度器的工作线程
+    for _ in range(500):
+        if engine.scheduler.stats()["running"] == 0:
+            break
+        time.sleep(0.01)
+    assert engine.scheduler.stats()["running"] == 0
+    assert time.monotonic() - started < 30
+    db.session.expire_all()
+    assert db.session.get(Workflow, workflow.id).status == "failed"
+    assert db.session.get(Workflow, workflow.id).completed_at is not None
+
+
+def test_converged_sub_loop_is_not_rerun(engine, tmp_path, create_workflow):
+    marker = tmp_path / "fixed"
+    inner_until = python(
+        "import os, sys; sys.exit(0 if os.environ['NADC_ITERATION'] == '2' else 1)"
+    )
+    after = python(
+        "import os, sys; " f"sys.exit(1 if not os.path.exists({str(marker)!r}) else 0)"
+    )
+    workflow = create_workflow(
+        [
+            loop(
+                "outer",
+                [
+                    loop(
+                        "inner",
+                        [stage("fit", record(tmp_path / "inner"))],
+                        5,
+                        inner_until,
+                    ),
+                    stage("after", after),
+                ],
+                2,
+            )
+        ]
+    )
+
+    assert engine.run(workflow.id) == "failed"
+    assert lines(tmp_path / "inner") == ["1", "2"]
+
+    # 与重试接口一样把节点和流水线重置为 pending
+    actions_by_name(workflow.id)["outer"].status = "pending"
+    db.session.get(Workflow, workflow.id).status = "pending"
+    db.session.commit()
+    marker.touch()
+    assert engine.run(workflow.id) == "completed"
+
+    # 外层第1次迭代中已收敛的内层循环被跳过，只有第2次迭代的内层循环执行
+    assert lines(tmp_path / "inner") == ["1", "2", "1", "2"]
+    paths = [(c.loop_path, c.iteration) for c in checkpoints(workflow.id)]
+    assert paths == [
+        ("outer/1/inner", 1),
+        ("outer/1/inner", 2),
+        ("outer", 1),
+        ("outer/2/inner", 1),
+        ("outer/2/inner", 2),
+        ("outer", 2),
+    ]
+
+
+def spawner(count, command=None):
+    """向 NADC_SPAWN_FILE 写入 count 个子节点规格的命令"""
+    child = {"config": {"command": command}} if command else {}
+    return python(
+        "import json, os\n"
+        "with open(os.environ['NADC_SPAWN_FILE'], 'w') as fp:\n"
+        f"    for i in range({count}):\n"
+        f"        fp.write(json.dumps({{'name': f'source{{i}}', **{child!r}}}) + '\\n')"
+    )
+
+
+def test_spawned_actions_run_before_fan_in(engine, create_workflow):
+    workflow = create_workflow(
+        [
+            stage("detect", spawner(3, python("print('extracted')"))),
+            stage("merge", python("print('merged')")),
+        ]
+    )
+
+    assert engine.run(workflow.id) == "completed"
+
+    actions = actions_by_name(workflow.id)
+    children = [actions[f"source{i}"] for i in range(3)]
+    assert "产生 3 个节点" in actions["detect"].logs
+    for child in children:
+        assert child.status == "completed"
+        assert "extracted" in child.logs
+        assert child.config["spawned_by"] == "detect"
+    assert actions["merge"].started_at >= max(c.completed_at for c in children)
+
+
+def test_spawning_tens_of_thousands_of_actions(engine, create_workflow):
+    engine.spawn_batch_size = 2000
+    workflow = create_workflow([stage("detect", spawner(20000)), stage("merge")])
+
+    assert engine.run(workflow.id) == "completed"
+
+    assert Action.query.filter_by(workflow_id=workflow.id).count() == 20002
+    assert (
+        Action.query.filter_by(workflow_id=workflow.id, status="completed").count()
+        == 20002
+    )
+
+
+def test_invalid_spawned_specs_fail_parent(engine, create_workflow):
+    write = python(
+        "import json, os\n"
+        "with open(os.environ['NADC_SPAWN_FILE'], 'w') as fp:\n"
+        "    fp.write(json.dumps({'name': 'ok'}) + '\\n')\n"
+        "    fp.write(json.dumps({'name': 'orphan', 'dependencies': ['nope']}))"
+    )
+    workflow = create_workflow([stage("detect", write)])
+
+    assert engine.run(workflow.id) == "failed"
+
+    actions = actions_by_name(workflow.id)
+    assert actions["ok"].status == "completed"
+    assert "orphan" not in actions
+    assert actions["detect"].status == "failed"
+    assert "依赖不存在的节点 nope" in actions["detect"].logs
+
+
+def test_spawn_route_feeds_running_action(
+    client, tmp_path, monkeypatch, create_workflow
+):
+    monkeypatch.setattr(workflow_engine, "max_workers", 4)
+    marker = tmp_path / "go"
+    wait = python(
+        "import os, time\n"
+        f"while not os.path.exists({str(marker)!r}): time.sleep(0.02)"
+    )
+    workflow = create_workflow([stage("detect", wait), stage("merge")])
+    detect = actions_by_name(workflow.id)["detect"]
+
+    response = client.post(
+        f"/api/action/{detect.id}/spawn", json={"actions": [{"name": "x"}]}
+    )
+    assert response.status_code == 409
+
+    future = workflow_engine.submit(workflow.id)
+    for _ in range(500):
+        response = client.post(
+            f"/api/action/{detect.id}/spawn",
+            json={"actions": [{"name": "late0"}, {"name": "late1"}]},
+        )
+        if response.status_code == 202:
+            break
+        time.sleep(0.01)
+    assert response.get_json() == {"accepted": 2}
+    marker.touch()
+
+    assert future.result(timeout=30) == "completed"
+    db.session.expire_all()
+    actions = actions_by_name(workflow.id)
+    assert actions["late0"].status == actions["late1"].status == "completed"
+    assert actions["merge"].started_at >= actions["late1"].completed_at
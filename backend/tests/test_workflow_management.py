@@ -1,10 +1,14 @@
 from datetime import datetime
 
+from app import app, db
+from app.models import Activity, WasDerivedFrom
+from app.provenance_writer import ProvenanceWriter
 from app.workflow_management import (
     create_activity,
     create_entity,
     get_activity_provenance,
     post_run,
+    queue_run,
     run,
 )
 
@@ -115,3 +119,61 @@ def test_derive(app_context):
     assert input2.derived == [output1, output2]
     assert output1.derived_from == [input1, input2]
     assert output2.derived_from == [input1, input2]
+
+
+def test_implicit_derivation_write_amplification(app_context):
+    inputs = [create_entity(f"frame{i}") for i in range(50)]
+    outputs = [create_entity(f"product{i}") for i in range(20)]
+    activity = create_activity(name="stack", informers=[], inputs=inputs)
+
+    post_run(activity, outputs, mode="implicit")
+    assert WasDerivedFrom.query.count() == 0
+    assert outputs[0].derived_from == inputs
+    assert inputs[0].derived == outputs
+
+    explicit_activity = create_activity(name="stack", informers=[], inputs=inputs)
+    post_run(explicit_activity, [create_entity("copy")], mode="explicit")
+    assert WasDerivedFrom.query.count() == 50
+
+
+def test_explicit_non_trivial_derivation(app_context):
+    calibration = create_entity("caldb")
+    events = create_entity("events")
+    image = create_entity("image")
+    activity = create_activity(name="image", informers=[], inputs=[events])
+
+    post_run(activity, [image], derivations=[(image, calibration, "calibration")])
+    assert WasDerivedFrom.query.count() == 1
+    assert image.derived_from == [calibration, events]
+    assert calibration.derived == [image]
+
+
+def test_queue_run_through_group_commit(app_context):
+    writer = ProvenanceWriter(app)
+    events = create_entity("events")
+    calibration = create_entity("caldb")
+    image = create_entity("image")
+    informer = create_activity(name="screen", informers=[], inputs=[])
+    try:
+        result = queue_run(
+            "image",
+            [informer],
+            [events],
+            [image],
+            derivations=[(image, calibration, "calibration")],
+            run_key="obs-001/image",
+            mode="explicit",
+            writer=writer,
+        ).result(timeout=10)
+    finally:
+        writer.close(timeout=5)
+
+    db.session.expire_all()
+    activity = db.session.get(Activity, result["activities"]["run"])
+    assert activity.run_key == "obs-001/image"
+    assert activity.end_time is not None
+    assert activity.informants == [informer]
+    assert activity.used == [events]
+    assert image.generated_by == activity
+    assert image.derived_from == [calibration, events]
+    assert WasDerivedFrom.query.count() == 2
@@ -0,0 +1,176 @@
+from datetime import datetime
+
+import pytest
+
+from app import app
+from app.models import (
+    Action,
+    Activity,
+    Entity,
+    LoopCheckpoint,
+    WasGeneratedBy,
+    Workflow,
+    db,
+)
+from app.workflow_engine import WorkflowEngine, action_run_key
+from app.workflow_retry import apply_retry, plan_retry
+
+FINISHED = datetime(2025, 4, 1, 12)
+
+# a → b → c，a → d，e 独立
+STAGES = [
+    {"name": "a", "type": "script", "dependencies": []},
+    {"name": "b", "type": "script", "dependencies": ["a"]},
+    {"name": "c", "type": "script", "dependencies": ["b"]},
+    {"name": "d", "type": "script", "dependencies": ["a"]},
+    {"name": "e", "type": "script", "dependencies": []},
+]
+
+
+@pytest.fixture
+def failed_workflow(create_workflow):
+    """按 statuses 设置节点状态的失败流水线实例，返回 (实例, 节点名 -> ID)"""
+
+    def create(statuses):
+        workflow = create_workflow(STAGES)
+        workflow.status = "failed"
+        actions = {a.name: a for a in Action.query.filter_by(workflow_id=workflow.id)}
+        for name, status in statuses.items():
+            actions[name].status = status
+            if status == "completed":
+                actions[name].completed_at = FINISHED
+        db.session.commit()
+        return workflow, {name: a.id for name, a in actions.items()}
+
+    return create
+
+
+def record_output(workflow_id, action_id, invalidated=False):
+    activity = Activity(
+        name="输出",
+        start_time=FINISHED,
+        run_key=action_run_key(workflow_id, action_id),
+    )
+    entity = Entity(
+        name=f"out{action_id}", invalidated_at_time=FINISHED if invalidated else None
+    )
+    db.session.add_all([activity, entity])
+    db.session.flush()
+    db.session.add(WasGeneratedBy(activity_id=activity.id, entity_id=entity.id))
+    db.session.commit()
+
+
+def add_checkpoint(action_id):
+    db.session.add(
+        LoopCheckpoint(
+            action_id=action_id,
+            loop_path="loop",
+            iteration=1,
+            converged=False,
+            started_at=FINISHED,
+            completed_at=FINISHED,
+        )
+    )
+    db.session.commit()
+
+
+def test_plan_reruns_failures_and_invalidated_outputs(app_context, failed_workflow):
+    workflow, ids = failed_workflow(
+        {"a": "completed", "b": "failed", "d": "completed", "e": "completed"}
+    )
+    record_output(workflow.id, ids["d"], invalidated=True)
+    record_output(workflow.id, ids["e"])
+
+    plan = plan_retry(workflow.id)
+
+    assert {item.name: item.reason for item in plan.rerun} == {
+        "b": "failed",
+        "c": "downstream",
+        "d": "outputs_invalidated",
+    }
+    assert plan.reused == 2
+    assert plan.restart == {ids["d"]}
+
+    plan = plan_retry(workflow.id, "all")
+    assert len(plan.rerun) == 5 and plan.reused == 0
+
+
+def test_spawned_actions_follow_their_parent(app_context, failed_workflow):
+    workflow, ids = failed_workflow({"a": "failed"})
+    db.session.add(
+        Action(
+            name="a/1",
+            type="script",
+            status="completed",
+            workflow_id=workflow.id,
+            config={"dependencies": [], "spawned_by": "a"},
+        )
+    )
+    db.session.commit()
+
+    reasons = {item.name: item.reason for item in plan_retry(workflow.id).rerun}
+    assert reasons["a/1"] == "downstream"
+
+
+def test_apply_keeps_checkpoints_of_failed_actions(app_context, failed_workflow):
+    workflow, ids = failed_workflow(
+        {"a": "completed", "b": "failed", "c": "pending", "d": "completed"}
+    )
+    record_output(workflow.id, ids["d"], invalidated=True)
+    add_checkpoint(ids["b"])
+    add_checkpoint(ids["d"])
+
+    assert apply_retry(plan_retry(workflow.id)) == 2
+    db.session.commit()
+
+    db.session.expire_all()
+    statuses = {
+        a.name: a.status for a in Action.query.filter_by(workflow_id=workflow.id)
+    }
+    assert statuses == {
+        "a": "completed",
+        "b": "pending",
+        "c": "pending",
+        "d": "pending",
+        "e": "pending",
+    }
+    assert [c.action_id for c in LoopCheckpoint.query] == [ids["b"]]
+
+
+def test_retry_routes_preview_and_resume(client, failed_workflow):
+    workflow, ids = failed_workflow(
+        {"a": "completed", "b": "failed", "d": "completed", "e": "completed"}
+    )
+
+    response = client.get(f"/api/workflow/{workflow.id}/retry-plan")
+    assert response.status_code == 200
+    preview = response.get_json()
+    assert [item["name"] for item in preview["rerun"]] == ["b", "c"]
+    assert preview["reused"] == 3
+    assert db.session.get(Action, ids["b"]).status == "failed"
+
+    response = client.post(f"/api/workflow/{workflow.id}/retry")
+    assert response.get_json()["status"] == "pending"
+
+    engine = WorkflowEngine(app)
+    try:
+        assert engine.run(workflow.id) == "completed"
+    finally:
+        engine.shutdown()
+    db.session.expire_all()
+    completed_at = {
+        a.name: a.completed_at for a in Action.query.filter_by(workflow_id=workflow.id)
+    }
+    # 复用的节点没有重新执行
+    assert {name for name, at in completed_at.items() if at == FINISHED} == {
+        "a",
+        "d",
+        "e",
+    }
+
+    workflow = db.session.get(Workflow, workflow.id)
+    workflow.status = "running"
+    db.session.commit()
+    assert client.post(f"/api/workflow/{workflow.id}/retry").status_code == 409
+    bad = client.get(f"/api/workflow/{workflow.id}/retry-plan?mode=some")
+    assert bad.status_code == 422
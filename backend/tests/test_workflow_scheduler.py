@@ -0,0 +1,151 @@
+from app.models import Action, Project, Workflow, WorkflowTemplate, db
+from app.workflow_scheduler import (
+    ScheduledTask,
+    SchedulerCore,
+    SimulationSpec,
+    simulate,
+)
+
+
+def task(project_id, template_id=None, priority="normal", limit=None):
+    return ScheduledTask(
+        project_id,
+        template_id if template_id is not None else project_id * 10,
+        lambda: None,
+        priority,
+        limit,
+    )
+
+
+def drain(core, slots):
+    """在 slots 个空闲槽位上依次取任务"""
+    popped = []
+    for _ in range(slots):
+        next_task = core.pop()
+        if next_task is None:
+            break
+        popped.append(next_task)
+    return popped
+
+
+def test_higher_priority_class_runs_first():
+    core = SchedulerCore()
+    for _ in range(3):
+        core.push(task(1, priority="low"))
+    core.push(task(2, priority="high"))
+    core.push(task(3, priority="normal"))
+
+    assert [t.priority for t in drain(core, 5)] == [
+        "high",
+        "normal",
+        "low",
+        "low",
+        "low",
+    ]
+    assert core.pop() is None
+
+
+def test_fair_share_interleaves_projects():
+    core = SchedulerCore()
+    for _ in range(100):
+        core.push(task(1))
+    for _ in range(3):
+        core.push(task(2))
+
+    popped = drain(core, 6)
+    assert [t.project_id for t in popped].count(2) == 3
+    assert {t.project_id for t in popped[:2]} == {1, 2}
+
+
+def test_weighted_fair_share():
+    core = SchedulerCore(project_weights={1: 3})
+    for _ in range(100):
+        core.push(task(1))
+        core.push(task(2))
+
+    popped = drain(core, 8)
+    assert [t.project_id for t in popped].count(1) == 6
+
+
+def test_project_limit_parks_until_release():
+    core = SchedulerCore(project_limit=2, project_limits={2: 1})
+    for _ in range(5):
+        core.push(task(1))
+        core.push(task(2))
+
+    popped = drain(core, 10)
+    assert [t.project_id for t in popped].count(1) == 2
+    assert [t.project_id for t in popped].count(2) == 1
+    assert core.pop() is None
+    assert core.queued == 7
+
+    core.release(next(t for t in popped if t.project_id == 2))
+    resumed = core.pop()
+    assert resumed.project_id == 2
+    assert core.pop() is None
+
+
+def test_template_limit():
+    core = SchedulerCore(template_limit=3)
+    for _ in range(5):
+        core.push(task(1, template_id=1, limit=1))
+        core.push(task(1, template_id=2))
+
+    popped = drain(core, 10)
+    assert [t.template_id for t in popped].count(1) == 1
+    assert [t.template_id for t in popped].count(2) == 3
+
+
+def test_discard_removes_only_cancelled_workflow():
+    core = SchedulerCore()
+    for workflow_id in (1, 2, 1, 2):
+        core.push(ScheduledTask(1, 10, lambda: None, workflow_id=workflow_id))
+
+    assert len(core.discard(1)) == 2
+    assert core.queued == 2
+    assert [t.workflow_id for t in drain(core, 5)] == [2, 2]
+
+
+def test_simulation_protects_quick_look_latency():
+    result = simulate(
+        SimulationSpec(actions=5000, workers=16, project_limit=12, horizon=200)
+    )
+
+    assert result["actions"] == 5000
+    assert result["wait"]["high"]["p95"] < 1
+    assert result["wait"]["low"]["p50"] > 10
+    assert max(result["peak_running_by_project"].values()) <= 12
+
+
+def test_queue_route_counts_active_actions(client):
+    project = Project(name="队列项目")
+    db.session.add(project)
+    db.session.flush()
+    template = WorkflowTemplate(name="队列模板", config={}, project_id=project.id)
+    db.session.add(template)
+    db.session.flush()
+    for status in ("running", "completed"):
+        workflow = Workflow(
+            name="队列实例",
+            status=status,
+            template_id=template.id,
+            project_id=project.id,
+        )
+        db.session.add(workflow)
+        db.session.flush()
+        for action_status in ("pending", "pending", "running", "completed"):
+            db.session.add(
+                Action(
+                    name="节点",
+                    type="script",
+                    status=action_status,
+                    workflow_id=workflow.id,
+                )
+            )
+    db.session.commit()
+
+    response = client.get("/api/workflow/queue")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["projects"] == [{"project_id": project.id, "pending": 2, "running": 1}]
+    assert body["scheduler"]["queued"] == 0
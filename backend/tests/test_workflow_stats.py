@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from app.models import Project, Workflow, WorkflowTemplate, db
+from app.workflow_stats import launch_count, query_rollups, rebuild_rollups
+
+
+def create_template():
+    project = Project(name="统计项目")
+    db.session.add(project)
+    db.session.flush()
+    template = WorkflowTemplate(name="统计模板", config={}, project_id=project.id)
+    db.session.add(template)
+    db.session.commit()
+    return template
+
+
+def test_run_terminate_retry_update_rollups(client):
+    template = create_template()
+    for _ in range(3):
+        client.post(f"/api/workflow-template/{template.id}/run")
+    workflow = Workflow.query.first()
+    client.post(f"/api/workflow/{workflow.id}/terminate")
+    # 已结束的实例不能再次终止，不会重复计入统计
+    response = client.post(f"/api/workflow/{workflow.id}/terminate")
+    assert response.status_code == 409
+    client.post(f"/api/workflow/{workflow.id}/retry")
+
+    # 3次启动 + 1次重试
+    assert launch_count() == 4
+    body = client.get("/api/workflow/stats/today").get_json()
+    assert body["count"] == 4
+
+    now = datetime.utcnow()
+    body = client.get(
+        "/api/workflow/stats",
+        query_string={
+            "granularity": "hour",
+            "start": (now - timedelta(hours=1)).isoformat(),
+            "end": (now + timedelta(hours=1)).isoformat(),
+            "template_id": template.id,
+        },
+    ).get_json()
+    counts = {b["status"]: b["count"] for b in body["buckets"]}
+    assert counts == {"pending": 4, "terminated": 1}
+
+
+def test_rebuild_rollups_from_workflows(app_context):
+    template = create_template()
+    day = datetime(2025, 3, 1, 8, 30)
+    db.session.add_all(
+        [
+            Workflow(
+                name=f"wf_{i}",
+                template_id=template.id,
+                project_id=template.project_id,
+                status="completed" if i % 2 else "pending",
+                created_at=day + timedelta(days=i % 2),
+                completed_at=day + timedelta(days=i % 2, hours=1),
+            )
+            for i in range(6)
+        ]
+    )
+    db.session.commit()
+
+    assert rebuild_rollups() == 6
+    buckets = query_rollups("day", day, day + timedelta(days=2))
+    assert buckets == [
+        {"bucket": datetime(2025, 3, 1), "status": "pending", "count": 3},
+        {"bucket": datetime(2025, 3, 2), "status": "completed", "count": 3},
+        {"bucket": datetime(2025, 3, 2), "status": "pending", "count": 3},
+    ]
+    assert launch_count(day) == 3